@@ -0,0 +1,360 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+import sep
+from astropy.io import fits
+
+from diff.zogy_engine import DEFAULT_MEMORY_MB, ZogyEngine, ZogyParams, load_psfex
+from tools.stage_pipeline import PipelineStage, StagePipeline
+from tools.star_match import DEFAULT_RADIUS, fratio_match, read_psf_stars
+
+# 一晚上的批量差分 (test_diff.finp 的批量版本):
+# - 清单中每行一对 (科学图像, 参考图像), 按参考图像分组, 同一参考图像的背景/PSF/PSF 星表只读取计算一次,
+#   参考图像每块的频谱经 ZogyEngine 的频谱缓存 (磁盘目录, 各工作进程共享) 只计算一次
+# - tools/stage_pipeline 三个阶段: prepare (读图/减背景/PSF/流量比, 线程) -> subtract (ZogyEngine, 块在进程池中)
+#   -> write (D/S/Scorr 按行块流式写 FITS); 阶段之间的队列长度由内存预算决定, 读写与相减同时进行
+# - 调试用的图片 (finp 中的 dat2.jpg / ZOGY_output.png 等) 默认不画, debug_plots 为 True 时才写
+# - 结束时输出 pairs/hour 和各步骤耗时
+# 与 finp 的不同: blackout 时参考图像的背景在遮挡前计算 (同一参考图像只算一次背景), 相减前再把科学图像为 0
+# 的像素置 0; 输出文件名为 <科学图像名>_<name>_D.fits 等.
+
+DEFAULT_NAME = 'data'
+DEFAULT_CLEAN = 0.75
+BKG_BOX = 16
+WRITE_CHUNK_ROWS = 256
+OUTPUT_KINDS = ('D', 'S', 'Scorr')
+# 内存预算中块计算所占的比例, 频谱缓存占 CACHE_SHARE, 其余给排队中的帧和参考图像
+ENGINE_SHARE = 0.5
+CACHE_SHARE = 0.25
+MAX_QUEUE = 8
+# 这些卡片由数据决定, 不从科学图像的头复制; 科学图像的校验和对差分图像不成立, 也不复制
+STRUCTURE_KEYS = ('SIMPLE', 'BITPIX', 'NAXIS', 'NAXIS1', 'NAXIS2', 'NAXIS3', 'EXTEND', 'BSCALE', 'BZERO', 'BLANK',
+                  'CHECKSUM', 'DATASUM', 'ZHECKSUM', 'ZDATASUM')
+
+DiffPair = namedtuple('DiffPair', ['sci', 'ref', 'name'])
+# 与 get_psf 相同的 PSFEx/Source Extractor 文件
+PsfFiles = namedtuple('PsfFiles', ['psf', 'sexcat', 'psfcat'])
+# 参考图像: data 为减背景后的 float32, rms 为背景噪声的中值, key 为频谱缓存的 key
+RefFrame = namedtuple('RefFrame', ['path', 'data', 'rms', 'psf', 'stars', 'key'])
+PairJob = namedtuple('PairJob', ['pair', 'sci', 'ref_data', 'header', 'sci_psf', 'ref_psf', 'params', 'ref_key',
+                                 'matched'])
+PairResult = namedtuple('PairResult', ['pair', 'header', 'images'])
+
+
+def psf_files(image):
+    sexcat = image.replace('.fits', '_PSFCAT.fits')
+    return PsfFiles(sexcat.replace('.fits', '.psf'), sexcat, sexcat.replace('_PSFCAT.fits', '.psfexcat'))
+
+
+def read_manifest(path, name=DEFAULT_NAME):
+    """
+    每行 "sci ref [name]"; 只有一列时为参考图像, 科学图像为把 'ref' 换成 'sci' 的文件名 (与 finp 相同).
+    空行和 # 开头的行忽略, 相对路径相对于清单所在目录
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    pairs = []
+    with open(path) as file:
+        for line in file:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if len(fields) == 1:
+                sci, ref = fields[0].replace('ref', 'sci'), fields[0]
+            else:
+                sci, ref = fields[:2]
+            pairs.append(DiffPair(os.path.join(base, sci), os.path.join(base, ref),
+                                  fields[2] if len(fields) > 2 else name))
+    return pairs
+
+
+def group_by_ref(pairs):
+    """
+    同一参考图像的相减排在一起, 各参考图像按第一次出现的顺序
+    """
+    groups = OrderedDict()
+    for pair in pairs:
+        groups.setdefault(pair.ref, []).append(pair)
+    return [pair for group in groups.values() for pair in group]
+
+
+def output_path(pair, kind, out_dir=None, ext='.fits'):
+    stem = os.path.splitext(os.path.basename(pair.sci))[0]
+    return os.path.join(out_dir or os.path.dirname(pair.sci), f'{stem}_{pair.name}_{kind}{ext}')
+
+
+def read_image(path):
+    """
+    返回 (本机字节序 float32 数据, 头)
+    """
+    with fits.open(path, memmap=False) as hdulist:
+        return np.asarray(hdulist[0].data, dtype=np.float32), hdulist[0].header.copy()
+
+
+def subtract_background(data):
+    """
+    就地减去 sep 背景, 返回背景噪声的中值
+    """
+    bkg = sep.Background(data, bw=BKG_BOX, bh=BKG_BOX)
+    rms = float(np.median(bkg.rms()))
+    bkg.subfrom(data)
+    return rms
+
+
+def write_fits_streaming(path, data, header=None, chunk_rows=WRITE_CHUNK_ROWS):
+    """
+    用 StreamingHDU 按行块写主 HDU, 每次只把 chunk_rows 行转成大端序, 不复制整幅图像;
+    先写临时文件再改名, 已有的文件被替换
+    """
+    out_header = fits.Header()
+    out_header['SIMPLE'] = True
+    out_header['BITPIX'] = {'float32': -32, 'float64': -64}[data.dtype.name]
+    out_header['NAXIS'] = 2
+    out_header['NAXIS1'] = data.shape[1]
+    out_header['NAXIS2'] = data.shape[0]
+    if header is not None:
+        for card in header.cards:
+            if card.keyword not in STRUCTURE_KEYS:
+                out_header.append(card)
+    tmp_path = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    stream = fits.StreamingHDU(tmp_path, out_header)
+    try:
+        for y0 in range(0, data.shape[0], chunk_rows):
+            stream.write(data[y0:y0 + chunk_rows])
+    finally:
+        stream.close()
+    os.replace(tmp_path, path)
+
+
+def save_debug_image(path, image):
+    import matplotlib
+
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    plt.imsave(path, image, cmap='gray', vmin=np.percentile(image, 1), vmax=np.percentile(image, 99))
+
+
+class PhaseTimes:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = defaultdict(float)
+        self.counts = Counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.totals[name] += elapsed
+                self.counts[name] += 1
+
+    def summary(self):
+        lines = [f'{"phase":<12} {"count":>6} {"total(s)":>9} {"mean(s)":>9}']
+        for name, total in self.totals.items():
+            lines.append(f'{name:<12} {self.counts[name]:>6} {total:>9.2f} {total / self.counts[name]:>9.3f}')
+        return '\n'.join(lines)
+
+
+class RefStore:
+    def __init__(self, loader, max_refs=2):
+        """
+        loader(path) -> RefFrame; 最多保留 max_refs 个参考图像, 同一参考图像同时被多个线程请求时只读取一次
+        """
+        self.loader = loader
+        self.max_refs = max(1, max_refs)
+        self.lock = threading.Lock()
+        # path -> [lock, RefFrame]
+        self.entries = OrderedDict()
+        self.loads = 0
+
+    def get(self, path):
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                entry = self.entries[path] = [threading.Lock(), None]
+                while len(self.entries) > self.max_refs:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.move_to_end(path)
+        with entry[0]:
+            if entry[1] is None:
+                entry[1] = self.loader(path)
+                with self.lock:
+                    self.loads += 1
+            return entry[1]
+
+
+class BatchDiff:
+    def __init__(self, out_dir=None, memory_mb=DEFAULT_MEMORY_MB, workers=None, prepare_workers=2,
+                 clean_sci=DEFAULT_CLEAN, clean_ref=DEFAULT_CLEAN, blackout=False, match_radius=DEFAULT_RADIUS,
+                 mutual=False, debug_plots=False, cache_dir=None, tile_size=None):
+        """
+        out_dir         输出目录, 为 None 时写在科学图像旁边
+        memory_mb       合计内存预算: ENGINE_SHARE 给块计算, CACHE_SHARE 给各进程的频谱缓存, 其余给排队中的帧
+        workers         ZogyEngine 的进程数
+        prepare_workers 同时读图/减背景/匹配的线程数
+        clean_sci/clean_ref  PSF 的 clean_const (与 finp 的 clean_sci/clean_ref 相同)
+        blackout        参考图像中科学图像为 0 的像素置 0 (没有重叠的部分)
+        match_radius    PSF 星匹配半径 (像素), 为 None 时按 FWHM 决定
+        mutual          PSF 星只保留互为最近的一对
+        debug_plots     写调试用的图片
+        cache_dir       磁盘频谱缓存目录, 为 None 时在运行期间使用临时目录
+        """
+        self.out_dir = out_dir
+        self.memory_mb = memory_mb
+        self.workers = workers or os.cpu_count() or 1
+        self.prepare_workers = max(1, prepare_workers)
+        self.clean_sci = clean_sci
+        self.clean_ref = clean_ref
+        self.blackout = blackout
+        self.match_radius = match_radius
+        self.mutual = mutual
+        self.debug_plots = debug_plots
+        self.cache_dir = cache_dir
+        self.tile_size = tile_size
+        self.engine = None
+        self.times = PhaseTimes()
+        self.refs = RefStore(self.load_ref, max_refs=self.prepare_workers + 1)
+
+    def load_ref(self, path):
+        with self.times.phase('ref'):
+            data, _ = read_image(path)
+            np.nan_to_num(data, copy=False, nan=0, posinf=65535, neginf=0)
+            rms = subtract_background(data)
+            files = psf_files(path)
+            psf = load_psfex(files.psf, self.clean_ref)
+            stars = read_psf_stars(files.psfcat, files.sexcat)
+        if self.debug_plots:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            save_debug_image(os.path.join(self.out_dir or os.path.dirname(path), f'{stem}_sub.jpg'), data)
+        return RefFrame(path, data, rms, psf, stars, (os.path.abspath(path), os.path.getmtime(path), BKG_BOX))
+
+    def prepare(self, pair):
+        ref = self.refs.get(pair.ref)
+        with self.times.phase('read'):
+            sci, header = read_image(pair.sci)
+        if sci.shape != ref.data.shape:
+            raise ValueError(f'shape mismatch {sci.shape} {ref.data.shape}')
+        ref_data, ref_key = ref.data, ref.key
+        if self.blackout:
+            # 参考图像每对不同, 频谱缓存的 key 由内容计算
+            ref_data = ref.data.copy()
+            ref_data[sci == 0] = 0
+            ref_key = None
+        with self.times.phase('background'):
+            sn = subtract_background(sci)
+        with self.times.phase('psf'):
+            files = psf_files(pair.sci)
+            sci_psf = load_psfex(files.psf, self.clean_sci)
+            stars = read_psf_stars(files.psfcat, files.sexcat)
+        with self.times.phase('match'):
+            _, _, fratio, dx, dy = fratio_match(stars, ref.stars, radius=self.match_radius, mutual=self.mutual)
+        if len(fratio) == 0:
+            raise ValueError('no matched PSF stars')
+        f_new = 1.0
+        f_ref = f_new / float(np.median(fratio))
+        params = ZogyParams(fr=f_ref, fn=f_new, sr=ref.rms, sn=sn, dx=float(np.median(dx)), dy=float(np.median(dy)))
+        return PairJob(pair, sci, ref_data, header, sci_psf, ref.psf, params, ref_key, len(fratio))
+
+    def subtract(self, job):
+        with self.times.phase('subtract'):
+            images = self.engine.subtract(job.sci, job.ref_data, job.sci_psf, job.ref_psf, job.params, job.ref_key)
+        return PairResult(job.pair, job.header, images)
+
+    def write(self, result):
+        with self.times.phase('write'):
+            for kind, image in zip(OUTPUT_KINDS, result.images):
+                write_fits_streaming(output_path(result.pair, kind, self.out_dir), image, result.header)
+        if self.debug_plots:
+            for kind, image in zip(OUTPUT_KINDS, result.images):
+                save_debug_image(output_path(result.pair, kind, self.out_dir, '.jpg'), image)
+        return result.pair
+
+    def queue_sizes(self, pairs):
+        """
+        由第一幅科学图像的大小和内存预算决定 subtract / write 阶段的队列长度
+        """
+        header = fits.getheader(pairs[0].sci)
+        frame_mb = header['NAXIS1'] * header['NAXIS2'] * 4 / (1024 * 1024)
+        # 参考图像 (最多 prepare_workers + 1 个) 常驻
+        free_mb = self.memory_mb * (1 - ENGINE_SHARE - CACHE_SHARE) - frame_mb * (self.prepare_workers + 1)
+        job_mb = frame_mb * (2 if self.blackout else 1)
+        result_mb = frame_mb * len(OUTPUT_KINDS)
+        subtract_queue = int(min(MAX_QUEUE, max(1, free_mb / 2 / job_mb)))
+        write_queue = int(min(MAX_QUEUE, max(1, free_mb / 2 / result_mb)))
+        return subtract_queue, write_queue
+
+    def run(self, pairs):
+        """
+        处理全部 (按参考图像分组), 返回 tools.stage_pipeline.PipelineMetrics
+        """
+        pairs = group_by_ref(pairs)
+        if not pairs:
+            raise ValueError('empty manifest')
+        if self.out_dir is not None:
+            os.makedirs(self.out_dir, exist_ok=True)
+        cache_dir = self.cache_dir or tempfile.mkdtemp(prefix='batch_diff_cache_')
+        cache_mb = max(16, int(self.memory_mb * CACHE_SHARE / self.workers))
+        subtract_queue, write_queue = self.queue_sizes(pairs)
+        # 引擎的预算包括各进程的频谱缓存
+        self.engine = ZogyEngine(memory_mb=self.memory_mb * (ENGINE_SHARE + CACHE_SHARE), workers=self.workers,
+                                 tile_size=self.tile_size, cache_mb=cache_mb, cache_dir=cache_dir)
+        stages = [
+            PipelineStage('prepare', self.prepare, workers=self.prepare_workers),
+            PipelineStage('subtract', self.subtract, workers=1, queue_size=subtract_queue),
+            PipelineStage('write', self.write, workers=1, queue_size=write_queue),
+        ]
+        try:
+            with self.engine:
+                return StagePipeline(stages, key=lambda item: getattr(item, 'pair', item).sci).run(pairs)
+        finally:
+            if self.cache_dir is None:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+
+    def summary(self, metrics):
+        elapsed = metrics.finished_at - metrics.started_at
+        lines = [f'pairs {metrics.completed}/{len(metrics.latency)}  refs loaded {self.refs.loads}  '
+                 f'elapsed {elapsed:.1f}s  {metrics.completed / elapsed * 3600:.0f} pairs/hour',
+                 metrics.summary(), self.times.summary()]
+        return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('manifest', help='每行 "sci ref [name]", 或只有参考图像 (*_ref_cut*.fits)')
+    parser.add_argument('--out-dir', default=None)
+    parser.add_argument('--name', default=DEFAULT_NAME)
+    parser.add_argument('--memory-mb', type=int, default=DEFAULT_MEMORY_MB)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--prepare-workers', type=int, default=2)
+    parser.add_argument('--clean-sci', type=float, default=DEFAULT_CLEAN)
+    parser.add_argument('--clean-ref', type=float, default=DEFAULT_CLEAN)
+    parser.add_argument('--blackout', action='store_true')
+    parser.add_argument('--match-radius', type=float, default=DEFAULT_RADIUS, help='<= 0 时按 FWHM 决定')
+    parser.add_argument('--mutual', action='store_true')
+    parser.add_argument('--debug-plots', action='store_true')
+    parser.add_argument('--cache-dir', default=None)
+    args = parser.parse_args()
+
+    batch = BatchDiff(out_dir=args.out_dir, memory_mb=args.memory_mb, workers=args.workers,
+                      prepare_workers=args.prepare_workers, clean_sci=args.clean_sci, clean_ref=args.clean_ref,
+                      blackout=args.blackout, match_radius=args.match_radius if args.match_radius > 0 else None,
+                      mutual=args.mutual, debug_plots=args.debug_plots, cache_dir=args.cache_dir)
+    metrics = batch.run(read_manifest(args.manifest, args.name))
+    print(batch.summary(metrics))
+
+
+if __name__ == '__main__':
+    main()
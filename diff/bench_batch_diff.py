@@ -0,0 +1,187 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import sep
+from astropy.io import fits
+
+from diff.batch_diff import BatchDiff, output_path, psf_files, read_manifest
+from diff.bench_zogy_engine import PSF_SIZE, legacy_subtract, make_pair
+from diff.zogy_engine import ZogyParams, load_psfex
+from tools.star_match import SEX_COLUMNS, fratio_match, read_psf_stars
+
+# 合成一晚上的数据: 每个参考图像对应 --per-ref 帧科学图像 (同一天区, 噪声不同, 都有同一个暂现源),
+# 每帧带 PSFEx 的 .psf, Source Extractor 的 _PSFCAT.fits 和 .psfexcat. 对比:
+#   legacy  finp 的流程逐对执行: 每对重新读参考图像/减背景/读 PSF, 整幅 complex128 ZOGY,
+#           画 dat2*.jpg / R_and_Rhat_visualization.png / ZOGY_output.png, PrimaryHDU.writeto
+#   batch   diff/batch_diff.py: 按参考图像分组复用, ZogyEngine 分块, 不画图, 流式写 FITS
+# 并检查两者的 D/S/Scorr 一致, 暂现源在 Scorr 中位于前 0.1%
+
+
+def gaussian_psf(sigma):
+    x = np.arange(PSF_SIZE) - PSF_SIZE // 2
+    xx, yy = np.meshgrid(x, x)
+    psf = np.exp(-(xx ** 2 + yy ** 2) / (2 * sigma ** 2))
+    return (psf / psf.sum()).astype(np.float32)
+
+
+def write_psfex(image_path, sigma):
+    # PSFEx .psf: 第二个 HDU 一行, PSF_MASK 为 (系数, y, x), 常数项
+    psf = gaussian_psf(sigma)
+    column = fits.Column(name='PSF_MASK', format=f'{PSF_SIZE * PSF_SIZE}E', dim=f'({PSF_SIZE},{PSF_SIZE},1)',
+                         array=psf[np.newaxis, np.newaxis])
+    hdu = fits.BinTableHDU.from_columns([column])
+    for key, value in (('POLZERO1', 0.0), ('POLZERO2', 0.0), ('POLSCAL1', 1.0), ('POLSCAL2', 1.0), ('POLDEG1', 0),
+                       ('PSF_SAMP', 1.0), ('PSFAXIS1', PSF_SIZE)):
+        hdu.header[key] = value
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(psf_files(image_path).psf, overwrite=True)
+
+
+def write_catalogs(image_path, x, y, fwhm, norm):
+    files = psf_files(image_path)
+    columns = {'ALPHAWIN_J2000': x * 1e-4, 'DELTAWIN_J2000': y * 1e-4, 'FWHM_IMAGE': fwhm,
+               'ELONGATION': np.ones_like(x), 'X_IMAGE': x, 'Y_IMAGE': y}
+    objects = fits.BinTableHDU.from_columns([fits.Column(name=name, format='D', array=columns[name])
+                                             for name in SEX_COLUMNS])
+    fits.HDUList([fits.PrimaryHDU(), fits.BinTableHDU.from_columns([fits.Column(name='Field Header Card',
+                                                                                format='1A', array=[''])]),
+                  objects]).writeto(files.sexcat, overwrite=True)
+    with open(files.psfcat, 'w') as file:
+        for i, name in enumerate(('SOURCE_NUMBER', 'X_IMAGE', 'Y_IMAGE', 'NORM_PSF')):
+            file.write(f'# {i + 1:3d} {name}\n')
+        for n in range(len(x)):
+            file.write(f'{n + 1} {x[n]:.3f} {y[n]:.3f} {norm[n]:.3f}\n')
+
+
+def make_night(root, refs, per_ref, height, width):
+    rng = np.random.default_rng(0)
+    sci, ref, transient = make_pair(height, width, stars=height * width // 400)
+    x = rng.uniform(20, width - 20, 400)
+    y = rng.uniform(20, height - 20, 400)
+    lines = []
+    for r in range(refs):
+        ref_path = os.path.join(root, f'field{r}_ref.fits')
+        fits.writeto(ref_path, ref + 500, overwrite=True)
+        write_psfex(ref_path, 1.6)
+        write_catalogs(ref_path, x, y, np.full_like(x, 3.8), np.full_like(x, 1000.0))
+        for k in range(per_ref):
+            sci_path = os.path.join(root, f'field{r}_sci{k}.fits')
+            frame = sci + 400 + rng.normal(0, 10, sci.shape).astype(np.float32)
+            fits.writeto(sci_path, frame, fits.Header([('EXPTIME', 60.0)]), overwrite=True)
+            write_psfex(sci_path, 2.0)
+            write_catalogs(sci_path, x + rng.normal(0, 0.3, len(x)), y + rng.normal(0, 0.3, len(y)),
+                           np.full_like(x, 4.7), np.full_like(x, 900.0))
+            lines.append(f'{os.path.basename(sci_path)} {os.path.basename(ref_path)}')
+    # 清单中不同参考图像交错, batch 按参考图像分组
+    rng.shuffle(lines)
+    manifest = os.path.join(root, 'night.txt')
+    with open(manifest, 'w') as file:
+        file.write('# sci ref\n' + '\n'.join(lines) + '\n')
+    return manifest, transient
+
+
+def legacy_plots(R, D, S, S_corr, out_dir):
+    plt.figure(figsize=(12, 6))
+    plt.subplot(1, 2, 1)
+    plt.imshow(R, cmap='gray', vmin=np.percentile(R, 1), vmax=np.percentile(R, 99))
+    plt.colorbar()
+    plt.subplot(1, 2, 2)
+    log_spectrum = np.log10(np.abs(np.fft.fftshift(np.fft.fft2(R))) + 1e-10)
+    plt.imshow(log_spectrum, cmap='viridis', vmin=np.percentile(log_spectrum, 5),
+               vmax=np.percentile(log_spectrum, 95))
+    plt.colorbar()
+    plt.savefig(os.path.join(out_dir, 'R_and_Rhat_visualization.png'))
+    plt.close()
+    plt.figure(figsize=(15, 5))
+    for i, image in enumerate((D, S, S_corr)):
+        plt.subplot(1, 3, i + 1)
+        plt.imshow(image, cmap='gray', vmin=np.percentile(image, 1), vmax=np.percentile(image, 99))
+        plt.colorbar()
+    plt.savefig(os.path.join(out_dir, 'ZOGY_output.png'))
+    plt.close()
+
+
+def legacy_pair(pair, out_dir):
+    # finp (xslice = yslice = 1, blackout = False) 逐对执行
+    sci_files, ref_files = psf_files(pair.sci), psf_files(pair.ref)
+    sci_psf, ref_psf = load_psfex(sci_files.psf, 0.75), load_psfex(ref_files.psf, 0.75)
+    _, _, fratio, dx, dy = fratio_match(read_psf_stars(sci_files.psfcat, sci_files.sexcat),
+                                        read_psf_stars(ref_files.psfcat, ref_files.sexcat))
+    with fits.open(pair.sci) as hdu:
+        dat = hdu[0].data.astype(np.float64)
+        head = hdu[0].header
+    bkg = sep.Background(dat, bw=16, bh=16)
+    sub_dat = dat - bkg
+    with fits.open(pair.ref) as hdu2:
+        dat2 = np.nan_to_num(hdu2[0].data.astype(np.float64), nan=0, posinf=65535, neginf=0)
+    plt.imsave(os.path.join(out_dir, 'dat2.jpg'), dat2, cmap='gray', vmin=np.percentile(dat2, 1),
+               vmax=np.percentile(dat2, 99))
+    bkg2 = sep.Background(dat2, bw=16, bh=16)
+    plt.imsave(os.path.join(out_dir, 'dat2_bkg.jpg'), bkg2, cmap='gray')
+    sub_dat2 = dat2 - bkg2
+    plt.imsave(os.path.join(out_dir, 'dat2_sub.jpg'), sub_dat2, cmap='gray', vmin=np.percentile(sub_dat2, 1),
+               vmax=np.percentile(sub_dat2, 99))
+    f_new = 1.0
+    params = ZogyParams(fr=f_new / np.median(fratio), fn=f_new, sr=float(np.median(bkg2.rms())),
+                        sn=float(np.median(bkg.rms())), dx=float(np.median(dx)), dy=float(np.median(dy)))
+    images = legacy_subtract(sub_dat, sub_dat2, sci_psf, ref_psf, params)
+    legacy_plots(sub_dat2, *images, out_dir)
+    for kind, image in zip(('D', 'S', 'Scorr'), images):
+        fits.PrimaryHDU(image, header=head).writeto(output_path(pair, kind, out_dir), overwrite=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--refs', type=int, default=2)
+    parser.add_argument('--per-ref', type=int, default=4)
+    parser.add_argument('--height', type=int, default=2048)
+    parser.add_argument('--width', type=int, default=3072)
+    parser.add_argument('--memory-mb', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_batch_diff_')
+    try:
+        manifest, transient = make_night(root, args.refs, args.per_ref, args.height, args.width)
+        pairs = read_manifest(manifest)
+        legacy_dir = os.path.join(root, 'legacy')
+        os.makedirs(legacy_dir)
+        t0 = time.perf_counter()
+        for pair in pairs:
+            legacy_pair(pair, legacy_dir)
+        legacy_s = time.perf_counter() - t0
+
+        batch = BatchDiff(out_dir=os.path.join(root, 'batch'), memory_mb=args.memory_mb, workers=args.workers)
+        metrics = batch.run(pairs)
+        batch_s = metrics.finished_at - metrics.started_at
+        assert metrics.completed == len(pairs) and batch.refs.loads == args.refs
+
+        inner = (slice(64, -64), slice(64, -64))
+        for pair in pairs[:2]:
+            for kind in ('D', 'S', 'Scorr'):
+                a = fits.getdata(output_path(pair, kind, legacy_dir))
+                b = fits.getdata(output_path(pair, kind, batch.out_dir))
+                corr = np.corrcoef(a[inner].ravel(), b[inner].ravel())[0, 1]
+                assert corr > 0.99, (pair.sci, kind, corr)
+            scorr = fits.getdata(output_path(pair, 'Scorr', batch.out_dir))
+            assert scorr[transient] > np.percentile(scorr[inner], 99.9)
+        assert fits.getheader(output_path(pairs[0], 'D', batch.out_dir))['EXPTIME'] == 60.0
+
+        print(f'{len(pairs)} pairs  {args.refs} refs  {args.width}x{args.height}')
+        print(f'legacy  {legacy_s:6.1f}s  {len(pairs) / legacy_s * 3600:6.0f} pairs/hour')
+        print(f'batch   {batch_s:6.1f}s  {len(pairs) / batch_s * 3600:6.0f} pairs/hour  x{legacy_s / batch_s:.1f}')
+        print(batch.summary(metrics))
+        print(f'spectrum cache (main process) {batch.engine.cache_stats()}')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
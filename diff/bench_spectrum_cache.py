@@ -0,0 +1,69 @@
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from diff.bench_zogy_engine import gaussian_psf_model, make_pair, params_for
+from diff.zogy_engine import ZogyEngine
+
+# 一幅参考图像与多帧科学图像相减 (一晚上同一天区), 对比:
+#   no cache    每帧都重新计算参考图像和 PSF 的频谱
+#   memory      进程内 LRU 缓存, 第一帧之后参考图像/PSF 的频谱直接取用
+#   disk        新的 ZogyEngine (相当于另一个进程或下次运行) 从磁盘缓存读取
+# 并确认有无缓存的结果完全相同
+
+
+def run_frames(engine, frames, ref, psfs):
+    # 返回每帧耗时和第一帧的结果
+    times = []
+    first = None
+    for sci in frames:
+        t0 = time.perf_counter()
+        results = engine.subtract(sci, ref, *psfs, params_for(), ref_key='ref.fits')
+        times.append(time.perf_counter() - t0)
+        first = first or results
+    return times, first
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--height', type=int, default=3211)
+    parser.add_argument('--width', type=int, default=4800)
+    parser.add_argument('--frames', type=int, default=4)
+    parser.add_argument('--tile', type=int, default=1620)
+    args = parser.parse_args()
+
+    sci, ref, _ = make_pair(args.height, args.width)
+    rng = np.random.default_rng(1)
+    frames = [(sci + rng.normal(0, 10, sci.shape)).astype(np.float32) for _ in range(args.frames)]
+    del sci
+    psfs = (gaussian_psf_model(2.0), gaussian_psf_model(1.6))
+    cache_dir = tempfile.mkdtemp(prefix='bench_spectrum_cache_')
+    try:
+        no_cache_times, expected = run_frames(ZogyEngine(workers=1, tile_size=args.tile, cache_mb=0), frames, ref,
+                                              psfs)
+        engine = ZogyEngine(workers=1, tile_size=args.tile, cache_mb=1024, cache_dir=cache_dir)
+        memory_times, results = run_frames(engine, frames, ref, psfs)
+        assert all(np.array_equal(a, b) for a, b in zip(expected, results))
+        memory_stats = engine.cache_stats()
+        # 新的引擎, 内存缓存为空, 只有磁盘缓存
+        engine = ZogyEngine(workers=1, tile_size=args.tile, cache_mb=0, cache_dir=cache_dir)
+        disk_times, results = run_frames(engine, frames[:1], ref, psfs)
+        assert all(np.array_equal(a, b) for a, b in zip(expected, results))
+        disk_stats = engine.cache_stats()
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(f'{args.width}x{args.height}  {args.frames} frames  tile {args.tile}')
+    print('no cache  ' + '  '.join(f'{t:5.2f}s' for t in no_cache_times) +
+          f'   mean {np.mean(no_cache_times):.2f}s/frame')
+    print('memory    ' + '  '.join(f'{t:5.2f}s' for t in memory_times) +
+          f'   after first {np.mean(memory_times[1:]):.2f}s/frame  x{np.mean(no_cache_times) / np.mean(memory_times[1:]):.2f}'
+          f'  {memory_stats}')
+    print(f'disk      {disk_times[0]:5.2f}s  {disk_stats}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import time
+
+import numpy as np
+
+from tools.star_match import PsfStars, SEX_COLUMNS, fratio_match, fwhm_radius, gather_columns
+
+# 模拟密集星场的 PSF 星表 (科学图像与参考图像之间有小的平移和位置误差), 对比:
+#   legacy   原 get_fratio: 每颗科学图像上的星计算到所有参考星的距离 (O(N·M)), 逐个 append 取列
+#   kdtree   tools.star_match: cKDTree 最近邻, 一次取列
+# 并确认两者的 (x, y, fratio, dx, dy) 完全相同
+
+
+def legacy_gather(data, number):
+    columns = [[] for _ in SEX_COLUMNS]
+    for n in number:
+        for column, name in zip(columns, SEX_COLUMNS):
+            column.append(data[name][n - 1])
+    return [np.array(column) for column in columns]
+
+
+def legacy_match(sci, ref, radius):
+    x_sci_match = []
+    y_ref_match = []
+    dx = []
+    dy = []
+    fratio = []
+    for i_sci in range(len(sci.x)):
+        dist = np.sqrt((sci.x_sex[i_sci] - ref.x_sex) ** 2 + (sci.y_sex[i_sci] - ref.y_sex) ** 2)
+        dist_min, i_ref = np.amin(dist), np.argmin(dist)
+        if dist_min < radius:
+            select = max(sci.fwhm[i_sci], ref.fwhm[i_ref])
+            x_sci_match.append(sci.x[i_sci])
+            y_ref_match.append(sci.y[i_sci])
+            dx.append(select)
+            dy.append(select)
+            fratio.append(sci.norm[i_sci] / ref.norm[i_ref])
+    return (np.array(x_sci_match), np.array(y_ref_match), np.array(fratio),
+            np.array(dx), np.array(dy))
+
+
+def make_catalog(rng, count, size):
+    # Source Extractor 表 (所有源) 和其中一部分 PSF 星的 SOURCE_NUMBER
+    n_all = count * 2
+    data = {name: rng.uniform(0, size, n_all) for name in SEX_COLUMNS}
+    data['FWHM_IMAGE'] = rng.normal(3.0, 0.3, n_all)
+    number = np.sort(rng.choice(n_all, count, replace=False)) + 1
+    return data, number
+
+
+def stars(data, number, rng, shift=(0.0, 0.0)):
+    ra, dec, fwhm, elongation, x_sex, y_sex = gather_columns(data, SEX_COLUMNS, number)
+    x_sex = x_sex + shift[0] + rng.normal(0, 0.5, len(number))
+    y_sex = y_sex + shift[1] + rng.normal(0, 0.5, len(number))
+    norm = rng.uniform(100, 10000, len(number))
+    return PsfStars(number, x_sex.copy(), y_sex.copy(), norm, ra, dec, fwhm, elongation, x_sex, y_sex)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 3000, 10000, 30000, 100000])
+    parser.add_argument('--legacy-max', type=int, default=30000, help='超过此星数不运行原循环')
+    parser.add_argument('--size', type=int, default=4800)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"stars":>7} {"legacy":>9} {"kdtree":>9} {"speedup":>8} {"gather":>15} {"matched":>8} '
+          f'{"mutual":>7} {"fwhm r":>7}')
+    for count in args.counts:
+        data, number = make_catalog(rng, count, args.size)
+        sci = stars(data, number, rng)
+        # 参考图像上少一部分星, 多一部分别的星
+        ref_number = np.concatenate([number[: count * 9 // 10], make_catalog(rng, count // 10, args.size)[1]])
+        ref = stars(data, np.unique(ref_number), rng, shift=(0.3, -0.2))
+
+        t0 = time.perf_counter()
+        result = fratio_match(sci, ref)
+        kdtree_s = time.perf_counter() - t0
+        mutual = fratio_match(sci, ref, mutual=True)
+        radius = fwhm_radius(sci.fwhm, ref.fwhm)
+
+        t0 = time.perf_counter()
+        gather_columns(data, SEX_COLUMNS, number)
+        gather_s = time.perf_counter() - t0
+        legacy_s = legacy_gather_s = float('nan')
+        if count <= args.legacy_max:
+            t0 = time.perf_counter()
+            legacy_gather(data, number)
+            legacy_gather_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            expected = legacy_match(sci, ref, 5.0)
+            legacy_s = time.perf_counter() - t0
+            assert all(np.array_equal(a, b) for a, b in zip(expected, result))
+        print(f'{count:7d} {legacy_s:8.3f}s {kdtree_s:8.4f}s {legacy_s / kdtree_s:7.0f}x '
+              f'{legacy_gather_s:6.3f}/{gather_s:.4f}s {len(result[0]):8d} {len(mutual[0]):7d} {radius:7.2f}')
+
+
+if __name__ == '__main__':
+    main()
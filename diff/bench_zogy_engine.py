@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from diff.zogy_engine import PsfModel, ZogyEngine, ZogyParams, embed_psf, psf_kernel
+
+# 合成的 sci/ref 图像 (默认 4800x3211, 高斯星像 + 噪声, sci 中有一个暂现源), 对比:
+#   legacy  原 finp 的相减部分: xslice=yslice=1 整幅 ZOGY, numpy.fft complex128 (不含画图与保存 JPEG)
+#   engine  ZogyEngine 分块 rfft2, float32 / float64, 不同内存预算
+# 每种方式在单独的子进程中运行, 记录耗时和峰值 RSS; 另在小图上检查两者结果一致
+
+PSF_SIZE = 25
+
+
+def gaussian_psf_model(sigma, clean_const=0.75):
+    x = np.arange(PSF_SIZE) - PSF_SIZE // 2
+    xx, yy = np.meshgrid(x, x)
+    psf = np.exp(-(xx ** 2 + yy ** 2) / (2 * sigma ** 2))
+    header = {'POLZERO1': 0.0, 'POLZERO2': 0.0, 'POLSCAL1': 1.0, 'POLSCAL2': 1.0, 'POLDEG1': 0, 'PSF_SAMP': 1.0,
+              'PSFAXIS1': PSF_SIZE}
+    return PsfModel((psf / psf.sum())[np.newaxis], header, clean_const, 1)
+
+
+def make_pair(height, width, stars=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    points = np.zeros((height, width), dtype=np.float64)
+    ys = rng.integers(0, height, stars)
+    xs = rng.integers(0, width, stars)
+    np.add.at(points, (ys, xs), rng.pareto(1.5, stars) * 2000 + 200)
+    ref = ndimage.gaussian_filter(points, 1.6)
+    sci = ndimage.gaussian_filter(points, 2.0) * 0.9
+    transient = (height // 2 + 7, width // 3 + 11)
+    spot = np.zeros_like(points)
+    spot[transient] = 5000
+    sci += ndimage.gaussian_filter(spot, 2.0)
+    del points, spot
+    sci += rng.normal(0, 10, sci.shape)
+    ref += rng.normal(0, 8, ref.shape)
+    return sci.astype(np.float32), ref.astype(np.float32), transient
+
+
+def params_for():
+    # fr / fn 与 finp 相同 (f_new = 1, f_ref = f_new / 通量比), sr / sn 为背景噪声
+    return ZogyParams(fr=1 / 0.9, fn=1.0, sr=8.0, sn=10.0, dx=0.3, dy=0.3)
+
+
+def legacy_psf_map(model, shape):
+    # psf_map: PSF 放在整幅大小的 float32 数组中心后 fftshift
+    return embed_psf(psf_kernel(model, shape[1] / 2, shape[0] / 2), shape, np.float32)
+
+
+def legacy_zogy(R, N, Pr, Pn, sr, sn, fr, fn, Vr, Vn, dx, dy):
+    # test_diff.ZOGY 的计算部分 (去掉画图), numpy.fft, complex128
+    fft = np.fft
+    R_hat = fft.fft2(R)
+    N_hat = fft.fft2(N)
+    Pn_hat = fft.fft2(Pn)
+    Pn_hat2_abs = np.abs(Pn_hat ** 2)
+    Pr_hat = fft.fft2(Pr)
+    Pr_hat2_abs = np.abs(Pr_hat ** 2)
+    sn2 = sn ** 2
+    sr2 = sr ** 2
+    fn2 = fn ** 2
+    fr2 = fr ** 2
+    fD = fr * fn / np.sqrt(sn2 * fr2 + sr2 * fn2)
+    denom = sn2 * fr2 * Pr_hat2_abs + sr2 * fn2 * Pn_hat2_abs
+    D_hat = (fr * Pr_hat * N_hat - fn * Pn_hat * R_hat) / np.sqrt(denom)
+    D = np.real(fft.ifft2(D_hat)) / fD
+    P_D_hat = (fr * fn / fD) * (Pr_hat * Pn_hat) / np.sqrt(denom)
+    S_hat = fD * D_hat * np.conj(P_D_hat)
+    S = np.real(fft.ifft2(S_hat))
+    kr_hat = fr * fn2 * np.conj(Pr_hat) * Pn_hat2_abs / denom
+    kr = np.real(fft.ifft2(kr_hat))
+    kr2 = kr ** 2
+    kr2_hat = fft.fft2(kr2)
+    kn_hat = fn * fr2 * np.conj(Pn_hat) * Pr_hat2_abs / denom
+    kn = np.real(fft.ifft2(kn_hat))
+    kn2 = kn ** 2
+    kn2_hat = fft.fft2(kn2)
+    Vr_hat = fft.fft2(Vr)
+    Vn_hat = fft.fft2(Vn)
+    VSr = np.real(fft.ifft2(Vr_hat * kr2_hat))
+    VSn = np.real(fft.ifft2(Vn_hat * kn2_hat))
+    dx2 = dx ** 2
+    dy2 = dy ** 2
+    Sn = np.real(fft.ifft2(kn_hat * N_hat))
+    dSndy = Sn - np.roll(Sn, 1, axis=0)
+    dSndx = Sn - np.roll(Sn, 1, axis=1)
+    VSn_ast = dx2 * dSndx ** 2 + dy2 * dSndy ** 2
+    Sr = np.real(fft.ifft2(kr_hat * R_hat))
+    dSrdy = Sr - np.roll(Sr, 1, axis=0)
+    dSrdx = Sr - np.roll(Sr, 1, axis=1)
+    VSr_ast = dx2 * dSrdx ** 2 + dy2 * dSrdy ** 2
+    V_S = VSr + VSn
+    V_ast = VSr_ast + VSn_ast
+    V = V_S + V_ast
+    S_corr = np.copy(S)
+    S_corr[V > 0] /= np.sqrt(V[V > 0])
+    F_S = np.sum((fn2 * Pn_hat2_abs * fr2 * Pr_hat2_abs) / denom)
+    F_S /= R.size
+    alpha = S / F_S
+    alpha_std = np.zeros(alpha.shape)
+    alpha_std[V_S > 0] = np.sqrt(V_S[V_S > 0]) / F_S
+    return D, S, S_corr, alpha, alpha_std
+
+
+def legacy_subtract(sci, ref, sci_psf, ref_psf, params):
+    # finp 的循环, xslice = yslice = 1
+    var_sci = abs(sci - np.median(sci)) ** 2
+    var_ref = abs(ref - np.median(ref)) ** 2
+    D, S, S_corr, _, _ = legacy_zogy(ref, sci, legacy_psf_map(ref_psf, ref.shape), legacy_psf_map(sci_psf, sci.shape),
+                                     params.sr, params.sn, params.fr, params.fn, var_ref, var_sci, params.dx,
+                                     params.dy)
+    return D.astype(np.float32), S.astype(np.float32), S_corr.astype(np.float32)
+
+
+def peak_rss_mb():
+    # VmHWM 只统计本进程 exec 之后的峰值; ru_maxrss 会带上 fork 时父进程的 RSS
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_one(args):
+    sci, ref = np.load(args.sci), np.load(args.ref)
+    transient = tuple(args.transient)
+    base_mb = peak_rss_mb()
+    sci_psf, ref_psf = gaussian_psf_model(2.0), gaussian_psf_model(1.6)
+    t0 = time.perf_counter()
+    tile_size = None
+    if args.run == 'legacy':
+        D, S, S_corr = legacy_subtract(sci, ref, sci_psf, ref_psf, params_for())
+    else:
+        dtype = np.float32 if args.run == 'engine32' else np.float64
+        with ZogyEngine(memory_mb=args.memory_mb, workers=args.workers, dtype=dtype) as engine:
+            tile_size = engine.tile_size_for(sci.shape)
+            D, S, S_corr = engine.subtract(sci, ref, sci_psf, ref_psf, params_for())
+    elapsed = time.perf_counter() - t0
+    peak_mb = peak_rss_mb()
+    children_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(json.dumps({'run': args.run, 'seconds': elapsed, 'peak_mb': peak_mb, 'base_mb': base_mb,
+                      'children_peak_mb': children_mb, 'tile': tile_size,
+                      'scorr_at_transient': float(S_corr[transient])}))
+
+
+def spawn(run, args, inputs, memory_mb=None):
+    sci_path, ref_path, transient = inputs
+    command = [sys.executable, '-m', 'diff.bench_zogy_engine', '--run', run, '--sci', sci_path, '--ref', ref_path,
+               '--transient', str(transient[0]), str(transient[1]), '--memory-mb', str(memory_mb or args.memory_mb)]
+    if args.workers:
+        command += ['--workers', str(args.workers)]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def check_consistency():
+    # 小图: 分块结果与整幅 ZOGY 一致 (块边界处有渐变, 只比较远离图像边缘的部分)
+    sci, ref, transient = make_pair(900, 1300, stars=1500, seed=1)
+    sci_psf, ref_psf = gaussian_psf_model(2.0), gaussian_psf_model(1.6)
+    legacy = legacy_subtract(sci, ref, sci_psf, ref_psf, params_for())
+    inner = (slice(64, -64), slice(64, -64))
+    for dtype in (np.float64, np.float32):
+        with ZogyEngine(workers=1, dtype=dtype, tile_size=512) as engine:
+            tiled = engine.subtract(sci, ref, sci_psf, ref_psf, params_for())
+        for name, a, b in zip(('D', 'S', 'Scorr'), legacy, tiled):
+            corr = np.corrcoef(a[inner].ravel(), b[inner].ravel())[0, 1]
+            print(f'{np.dtype(dtype).name:<8} {name:<6} corr {corr:.5f}  transient legacy {a[transient]:9.2f}  '
+                  f'tiled {b[transient]:9.2f}')
+            assert corr > 0.99, (name, corr)
+        # 暂现源在 Scorr 中位于前 0.1%
+        for scorr in (legacy[2], tiled[2]):
+            assert scorr[transient] > np.percentile(scorr[inner], 99.9), scorr[transient]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--run', choices=['legacy', 'engine32', 'engine64'])
+    parser.add_argument('--height', type=int, default=3211)
+    parser.add_argument('--width', type=int, default=4800)
+    parser.add_argument('--memory-mb', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--skip-legacy', action='store_true')
+    parser.add_argument('--sci', help=argparse.SUPPRESS)
+    parser.add_argument('--ref', help=argparse.SUPPRESS)
+    parser.add_argument('--transient', type=int, nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run_one(args)
+        return
+
+    check_consistency()
+    # 输入图像只生成一次, 子进程读取 .npy, 峰值 RSS 不包含生成过程
+    root = tempfile.mkdtemp(prefix='bench_zogy_')
+    try:
+        sci, ref, transient = make_pair(args.height, args.width)
+        inputs = (os.path.join(root, 'sci.npy'), os.path.join(root, 'ref.npy'), transient)
+        np.save(inputs[0], sci)
+        np.save(inputs[1], ref)
+        del sci, ref
+        runs = [] if args.skip_legacy else [spawn('legacy', args, inputs)]
+        runs += [spawn('engine64', args, inputs), spawn('engine32', args, inputs),
+                 spawn('engine32', args, inputs, memory_mb=256)]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    print(f'{args.width}x{args.height}')
+    for result in runs:
+        extra = max(result['peak_mb'], result['children_peak_mb']) - result['base_mb']
+        print(f'{result["run"]:<9} tile {str(result["tile"]):<5} {result["seconds"]:7.2f}s  '
+              f'peak RSS {result["peak_mb"]:7.0f} MB (inputs {result["base_mb"]:.0f} MB, +{extra:.0f} MB, '
+              f'workers peak {result["children_peak_mb"]:.0f} MB)  Scorr at transient {result["scorr_at_transient"]:.1f}')
+
+
+if __name__ == '__main__':
+    main()
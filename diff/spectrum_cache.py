@@ -0,0 +1,148 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import Counter, OrderedDict, namedtuple
+
+import numpy as np
+
+# ZOGY 频谱缓存: 按 (PSFEx 模型 / 参考图像, 块的位置和大小, 精度) 缓存已经做过 rfft2 的数组
+# - PSF: Pr_hat / Pn_hat (psf_kernel + embed_psf + rfft2)
+# - 参考图像: R_hat 和方差图的 Vr_hat
+# 同一参考图像与一晚上多帧科学图像相减时, 参考图像的频谱只计算一次.
+# 内存中按字节数 LRU 淘汰; 可选磁盘目录, 每个条目一个子目录, 每个数组一个 .npy, 多个进程之间共享,
+# 写入时先写临时目录再改名.
+
+DEFAULT_CACHE_MB = 512
+
+# max_bytes 为内存中最多保留的字节数, 为 0 时不用内存缓存; cache_dir 为 None 时不用磁盘缓存
+CacheConfig = namedtuple('CacheConfig', ['max_bytes', 'cache_dir'])
+
+
+def array_digest(array):
+    """
+    数组内容的摘要 (不复制数据)
+    """
+    h = hashlib.blake2b(digest_size=16)
+    array = np.ascontiguousarray(array)
+    h.update(str((array.dtype.str, array.shape)).encode('utf-8'))
+    h.update(memoryview(array).cast('B'))
+    return h.hexdigest()
+
+
+def file_digest(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def key_name(key):
+    return hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class SpectrumCache:
+    def __init__(self, max_bytes=DEFAULT_CACHE_MB * 1024 * 1024, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        # key 名 -> {name: array}
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.stats = Counter()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def on_disk(self, key):
+        return self.cache_dir is not None and os.path.isdir(self._entry_dir(key_name(key)))
+
+    def get(self, key):
+        """
+        返回 {name: array}, 没有时返回 None; 磁盘上的条目读入后也放入内存
+        """
+        name = key_name(key)
+        with self.lock:
+            arrays = self.entries.get(name)
+            if arrays is not None:
+                self.entries.move_to_end(name)
+                self.stats['hits'] += 1
+                return arrays
+        if self.cache_dir is not None:
+            entry_dir = self._entry_dir(name)
+            try:
+                arrays = {os.path.splitext(file_name)[0]: np.load(os.path.join(entry_dir, file_name))
+                          for file_name in os.listdir(entry_dir) if file_name.endswith('.npy')}
+            except (FileNotFoundError, ValueError, OSError):
+                arrays = None
+            if arrays:
+                with self.lock:
+                    self.stats['disk_hits'] += 1
+                self._remember(name, arrays)
+                return arrays
+        with self.lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key, arrays):
+        name = key_name(key)
+        self._remember(name, arrays)
+        if self.cache_dir is not None and not os.path.isdir(self._entry_dir(name)):
+            entry_dir = self._entry_dir(name)
+            tmp_dir = f'{entry_dir}.tmp-{os.getpid()}-{threading.get_ident()}'
+            os.makedirs(tmp_dir, exist_ok=True)
+            for array_name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, f'{array_name}.npy'), array)
+            try:
+                os.rename(tmp_dir, entry_dir)
+                with self.lock:
+                    self.stats['disk_writes'] += 1
+            except OSError:
+                # 其他进程已经写入
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _remember(self, name, arrays):
+        size = sum(array.nbytes for array in arrays.values())
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if name in self.entries:
+                self.entries.move_to_end(name)
+                return
+            self.entries[name] = arrays
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= sum(array.nbytes for array in evicted.values())
+                self.stats['evictions'] += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        compute() -> {name: array}
+        """
+        arrays = self.get(key)
+        if arrays is None:
+            arrays = compute()
+            self.put(key, arrays)
+        return arrays
+
+
+_process_caches = {}
+_process_caches_lock = threading.Lock()
+
+
+def get_cache(config):
+    """
+    每个进程 (包括进程池的工作进程) 中同一配置共用一个 SpectrumCache; config 为 None 时返回 None
+    """
+    if config is None or (config.max_bytes <= 0 and config.cache_dir is None):
+        return None
+    with _process_caches_lock:
+        cache = _process_caches.get(config)
+        if cache is None:
+            cache = SpectrumCache(max(0, config.max_bytes), config.cache_dir)
+            _process_caches[config] = cache
+        return cache
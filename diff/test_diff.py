@@ -4,7 +4,6 @@ import math
 import os
 import sep
 from astropy.io import fits
-from astropy.io import ascii
 import numpy as np
 from scipy import ndimage
 import matplotlib
@@ -12,6 +11,14 @@ import matplotlib
 matplotlib.use('Agg')  # 在导入pyplot之前设置非交互式后端
 import matplotlib.pyplot as plt
 
+from tools.star_match import fratio_match, read_psf_stars
+
+# 匹配 PSF 星的半径 (像素), 为 None 时按 FWHM 决定; MATCH_MUTUAL 为 True 时只保留互为最近的一对
+MATCH_RADIUS = 5.
+MATCH_MUTUAL = False
+# 为 True 时写调试用的图片 (R_and_Rhat_visualization.png, ZOGY_output.png, dat2*.jpg, 各分块的 jpg)
+DEBUG_PLOTS = False
+
 try:
     import pyfftw.interfaces.numpy_fft as fft
 
@@ -219,78 +226,11 @@ def get_fratio(psfcat_sci, psfcat_ref, sexcat_sci, sexcat_ref):
     the error in position due to the Ful Width HalF Maximum (FWHM).
     """
 
-    def readcat(psfcat):
-        table = ascii.read(psfcat, format='sextractor')
-        number = table['SOURCE_NUMBER']
-        x = table['X_IMAGE']
-        y = table['Y_IMAGE']
-        norm = table['NORM_PSF']
-        return (number, x, y, norm)
-
-    # read in psfcat_sci
-    number_sci, x_sci, y_sci, norm_sci = readcat(psfcat_sci)
-    # read in psfcat_ref
-    number_ref, x_ref, y_ref, norm_ref = readcat(psfcat_ref)
-
-    def xy2radec(number, sexcat):
-        # read the Source Extractor fits table
-        with fits.open(sexcat) as hdulist:
-            data = hdulist[2].data
-            ra_sex = data['ALPHAWIN_J2000']
-            dec_sex = data['DELTAWIN_J2000']
-            fwhm_sex = data['FWHM_IMAGE']
-            Elon_sex = data['ELONGATION']
-            X_sex = data['X_IMAGE']
-            Y_sex = data['Y_IMAGE']
-            # record in ra, dec for each source
-            ra = []
-            dec = []
-            Y_pos = []
-            X_pos = []
-            FWHM = []
-            ELON = []
-            for n in number:
-                ra.append(ra_sex[n - 1])
-                dec.append(dec_sex[n - 1])
-                X_pos.append(X_sex[n - 1])
-                Y_pos.append(Y_sex[n - 1])
-                FWHM.append(fwhm_sex[n - 1])
-                ELON.append(Elon_sex[n - 1])
-        return (np.array(ra), np.array(dec), np.array(X_pos),
-                np.array(Y_pos), np.array(FWHM), np.array(ELON))
-
-    # get ra, dec in pixel coords
-    # PARALLEL#
-    ra_sci, dec_sci, X_pos_sci, Y_pos_sci, FWHM_sci, ELON_sci = xy2radec(number_sci, sexcat_sci)
-    ra_ref, dec_ref, X_pos_ref, Y_pos_ref, FWHM_ref, ELON_ref = xy2radec(number_ref, sexcat_ref)
-
-    # now find matching sources, this step needs improving
-    x_sci_match = []
-    y_ref_match = []
-    dx = []
-    dy = []
-    fratio = []
-    nmatch = 0
-    for i_sci in range(len(x_sci)):
-        # calculate distance to ref objects
-        dist = np.sqrt((X_pos_sci[i_sci] - X_pos_ref) ** 2 + (Y_pos_sci[i_sci] - Y_pos_ref) ** 2)
-        # minimum distance and its index
-        dist_min, i_ref = np.amin(dist), np.argmin(dist)
-
-        if dist_min < 5.:  # This min distance is dependant on your registrtion.
-            # The less confident you are in your registration the bigger it needs to be.
-
-            nmatch += 1
-            select = max(FWHM_sci[i_sci], FWHM_ref[i_ref])
-            x_sci_match.append(x_sci[i_sci])
-            y_ref_match.append(y_sci[i_sci])
-            dx.append(select)
-            dy.append(select)
-            # append ratio of normalized counts to fratios
-            fratio.append(norm_sci[i_sci] / norm_ref[i_ref])
-
-    return (np.array(x_sci_match), np.array(y_ref_match), np.array(fratio),
-            np.array(dx), np.array(dy))
+    sci = read_psf_stars(psfcat_sci, sexcat_sci)
+    ref = read_psf_stars(psfcat_ref, sexcat_ref)
+    # This match radius is dependant on your registration.
+    # The less confident you are in your registration the bigger it needs to be.
+    return fratio_match(sci, ref, radius=MATCH_RADIUS, mutual=MATCH_MUTUAL)
 
 
 
@@ -304,30 +244,31 @@ def ZOGY(R, N, Pr, Pn, sr, sn, fr, fn, Vr, Vn, dx, dy):
     R_hat = fft.fft2(R)
 
 
-    # 可视化原始输入 R
-    plt.figure(figsize=(12, 6))
+    if DEBUG_PLOTS:
+        # 可视化原始输入 R
+        plt.figure(figsize=(12, 6))
 
-    # 绘制原始 R 矩阵
-    plt.subplot(1, 2, 1)
-    plt.imshow(R, cmap='gray',
-               vmin=np.percentile(R, 1),
-               vmax=np.percentile(R, 99))
-    plt.title('Original R Image')
-    plt.colorbar()
+        # 绘制原始 R 矩阵
+        plt.subplot(1, 2, 1)
+        plt.imshow(R, cmap='gray',
+                   vmin=np.percentile(R, 1),
+                   vmax=np.percentile(R, 99))
+        plt.title('Original R Image')
+        plt.colorbar()
 
-    # 绘制 R_hat 的频谱 (对数缩放)
-    plt.subplot(1, 2, 2)
-    magnitude = np.abs(fft.fftshift(R_hat))  # 将低频移到中心
-    log_spectrum = np.log10(magnitude + 1e-10)  # 避免log(0)
-    plt.imshow(log_spectrum, cmap='viridis',
-               vmin=np.percentile(log_spectrum, 5),
-               vmax=np.percentile(log_spectrum, 95))
-    plt.title('R_hat Frequency Spectrum (log scale)')
-    plt.colorbar(label='log10(magnitude)')
+        # 绘制 R_hat 的频谱 (对数缩放)
+        plt.subplot(1, 2, 2)
+        magnitude = np.abs(fft.fftshift(R_hat))  # 将低频移到中心
+        log_spectrum = np.log10(magnitude + 1e-10)  # 避免log(0)
+        plt.imshow(log_spectrum, cmap='viridis',
+                   vmin=np.percentile(log_spectrum, 5),
+                   vmax=np.percentile(log_spectrum, 95))
+        plt.title('R_hat Frequency Spectrum (log scale)')
+        plt.colorbar(label='log10(magnitude)')
 
-    plt.tight_layout()
-    plt.savefig('R_and_Rhat_visualization.png')
-    plt.close()
+        plt.tight_layout()
+        plt.savefig('R_and_Rhat_visualization.png')
+        plt.close()
 
 
 
@@ -408,27 +349,28 @@ def ZOGY(R, N, Pr, Pn, sr, sn, fr, fn, Vr, Vn, dx, dy):
     alpha_std = np.zeros(alpha.shape)
     alpha_std[V_S > 0] = np.sqrt(V_S[V_S > 0]) / F_S
 
-    # 可视化输出
+    if DEBUG_PLOTS:
+        # 可视化输出
 
-    plt.figure(figsize=(15, 5))
+        plt.figure(figsize=(15, 5))
 
-    plt.subplot(1, 3, 1)
-    plt.imshow(D, cmap='gray', vmin=np.percentile(D, 1), vmax=np.percentile(D, 99))
-    plt.title('D Image')
-    plt.colorbar()
+        plt.subplot(1, 3, 1)
+        plt.imshow(D, cmap='gray', vmin=np.percentile(D, 1), vmax=np.percentile(D, 99))
+        plt.title('D Image')
+        plt.colorbar()
 
-    plt.subplot(1, 3, 2)
-    plt.imshow(S, cmap='gray', vmin=np.percentile(S, 1), vmax=np.percentile(S, 99))
-    plt.title('S Image')
-    plt.colorbar()
+        plt.subplot(1, 3, 2)
+        plt.imshow(S, cmap='gray', vmin=np.percentile(S, 1), vmax=np.percentile(S, 99))
+        plt.title('S Image')
+        plt.colorbar()
 
-    plt.subplot(1, 3, 3)
-    plt.imshow(S_corr, cmap='gray', vmin=np.percentile(S_corr, 1), vmax=np.percentile(S_corr, 99))
-    plt.title('Scorr Image')
-    plt.colorbar()
+        plt.subplot(1, 3, 3)
+        plt.imshow(S_corr, cmap='gray', vmin=np.percentile(S_corr, 1), vmax=np.percentile(S_corr, 99))
+        plt.title('Scorr Image')
+        plt.colorbar()
 
-    plt.savefig('ZOGY_output.png')
-    plt.close()
+        plt.savefig('ZOGY_output.png')
+        plt.close()
 
     return (D, S, S_corr, alpha, alpha_std)
 
@@ -508,16 +450,19 @@ def finp(image, name, xslice, yslice, clean_sci, clean_ref, blackout):
     dat2 = np.nan_to_num(dat2, nan=0, posinf=65535, neginf=0)
 
     # 保存dat2 图像数据
-    plt.imsave('dat2.jpg', dat2, cmap='gray', vmin=np.percentile(dat2, 1), vmax=np.percentile(dat2, 99))
+    if DEBUG_PLOTS:
+        plt.imsave('dat2.jpg', dat2, cmap='gray', vmin=np.percentile(dat2, 1), vmax=np.percentile(dat2, 99))
     if blackout == True:  # remove data where there is no overlap
         dat2[dat == 0] = 0
 
     bkg2 = sep.Background(dat2, bw=16, bh=16)
     stdb2 = bkg2.rms()
-    plt.imsave('dat2_bkg.jpg', bkg2, cmap='gray', vmin=np.percentile(bkg2, 1), vmax=np.percentile(bkg2, 99))
+    if DEBUG_PLOTS:
+        plt.imsave('dat2_bkg.jpg', bkg2, cmap='gray', vmin=np.percentile(bkg2, 1), vmax=np.percentile(bkg2, 99))
 
     sub_dat2 = dat2 - bkg2  # bkg subtracted data
-    plt.imsave('dat2_sub.jpg', sub_dat2, cmap='gray', vmin=np.percentile(sub_dat2, 1), vmax=np.percentile(sub_dat2, 99))
+    if DEBUG_PLOTS:
+        plt.imsave('dat2_sub.jpg', sub_dat2, cmap='gray', vmin=np.percentile(sub_dat2, 1), vmax=np.percentile(sub_dat2, 99))
     print(f'get_psf e')
     cdat, psf = chop_kern(sub_dat, psf_dat, psf_hed, xslice, yslice, clean_sci)
     cdat2, psf2 = chop_kern(sub_dat2, psf2_dat, psf2_hed, xslice, yslice, clean_ref)
@@ -542,14 +487,15 @@ def finp(image, name, xslice, yslice, clean_sci, clean_ref, blackout):
                    vmax=np.percentile(crop, 99),
                    format='jpg')
 
-    # 保存所有分块
-    for i in range(len(cdat)):
-        save_center_500x500(cdat[i],
-                            f'{file_prefix}_cdat_block{i + 1}.jpg')
+    if DEBUG_PLOTS:
+        # 保存所有分块
+        for i in range(len(cdat)):
+            save_center_500x500(cdat[i],
+                                f'{file_prefix}_cdat_block{i + 1}.jpg')
 
-    for i in range(len(cdat2)):
-        save_center_500x500(cdat2[i],
-                            f'{file_prefix}_cdat2_block{i + 1}.jpg')
+        for i in range(len(cdat2)):
+            save_center_500x500(cdat2[i],
+                                f'{file_prefix}_cdat2_block{i + 1}.jpg')
 
     data_D = [0] * len(cdat)  # empty frames
     data_S = [0] * len(cdat)
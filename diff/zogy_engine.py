@@ -0,0 +1,431 @@
+import math
+import os
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import scipy.fft
+from astropy.io import fits
+from scipy import ndimage
+
+from diff.spectrum_cache import CacheConfig, array_digest, file_digest, get_cache
+
+try:
+    import pyfftw
+    import pyfftw.interfaces.scipy_fft as fftw_backend
+
+    # 同一形状的 FFT 计划在进程内复用
+    pyfftw.interfaces.cache.enable()
+except ImportError:
+    fftw_backend = None
+
+# 分块 ZOGY 相减 (Zackay et al. 2016), 与 test_diff.py 中 ZOGY 的公式相同:
+# - 图像按固定大小的块处理, 块之间有 overlap 重叠, 块边缘 overlap 宽度内余弦渐变 (apodize), 只保留块中心部分拼回,
+#   所有块补齐到同一形状, 进程内复用同一个 FFT 计划 (scipy.fft / 有 pyfftw 时用 pyfftw 的缓存)
+# - 输入为实数, 用 rfft2/irfft2, 频域数组只有一半; 中间结果用完即删除; 可选 float32 (complex64)
+# - 块在进程池中并行, 进程池在多次相减之间复用; 同时在处理中的块数有上限
+# - 块大小由内存预算决定 (每个进程同时存活约 ARRAYS_PER_TILE 个块大小的数组)
+# - PSF 和参考图像每块的频谱 (Pr_hat/Pn_hat, R_hat/Vr_hat) 经 diff/spectrum_cache.py 缓存,
+#   同一参考图像与多帧科学图像相减时只计算一次
+# 只计算 D, S, Scorr (finp 不使用 alpha / alpha_std)
+
+DEFAULT_MEMORY_MB = 1024
+DEFAULT_OVERLAP = 64
+ARRAYS_PER_TILE = 24
+MIN_TILE = 256
+MAX_TILE = 4096
+# cache_mb 未指定时, 内存预算中给各进程频谱缓存的比例 (合计)
+DEFAULT_CACHE_SHARE = 0.25
+
+PSF_HEADER_KEYS = ('POLZERO1', 'POLZERO2', 'POLSCAL1', 'POLSCAL2', 'POLDEG1', 'PSF_SAMP', 'PSFAXIS1')
+
+# dat 为 PSFEx 的多项式系数图像, header 为 PSF_HEADER_KEYS 的值, slices 为 1 时只用常数项 (与 chop_kern 相同)
+# digest 为 .psf 文件的摘要, 用作缓存的 key; 为 None 时由 dat/header 计算
+PsfModel = namedtuple('PsfModel', ['dat', 'header', 'clean_const', 'slices', 'digest'], defaults=(None,))
+# 块: 中心部分 [y0:y1, x0:x1] 写回结果, 取数据的范围为中心部分向外扩 overlap (图像外补 0)
+Tile = namedtuple('Tile', ['index', 'y0', 'y1', 'x0', 'x1'])
+ZogyParams = namedtuple('ZogyParams', ['fr', 'fn', 'sr', 'sn', 'dx', 'dy'])
+
+
+def load_psfex(psf_path, clean_const, slices=1):
+    """
+    读取 PSFEx 的 .psf (与 get_psf 相同, 第二个 HDU 的第一行)
+    """
+    with fits.open(psf_path) as hdulist:
+        header = hdulist[1].header
+        dat = np.array(hdulist[1].data[0][0][:])
+    return PsfModel(dat, {key: header[key] for key in PSF_HEADER_KEYS}, clean_const, slices, file_digest(psf_path))
+
+
+def clean_norm_psf(psf_ar, clean_fact=0.25):
+    """
+    与 test_diff.clean_norm_psf 相同: 去掉圆外和小于峰值 clean_fact 倍的值后归一化
+    """
+    ysize, xsize = psf_ar.shape
+    assert ysize == xsize
+    hsize = ysize / 2
+    x = np.arange(-hsize, hsize)
+    xx, yy = np.meshgrid(x, x, sparse=True)
+    psf_ar[(xx ** 2 + yy ** 2) > hsize ** 2] = 0
+    if clean_fact != 0:
+        psf_ar[psf_ar < (np.amax(psf_ar) * clean_fact)] = 0
+    return psf_ar / np.sum(psf_ar)
+
+
+def psf_varies(model):
+    # 只有多块且多项式为 2/3 阶时 PSF 随位置变化
+    return model.slices != 1 and model.header['POLDEG1'] in (2, 3)
+
+
+def psf_kernel(model, xc, yc):
+    """
+    在 (xc, yc) 处由 PSFEx 多项式计算 PSF, 缩放到像素采样并归一化 (psf_map 中与块大小无关的部分)
+    """
+    header = model.header
+    dat = model.dat
+    psf_size_config = header['PSFAXIS1']
+    psf_size = int(np.ceil(psf_size_config * header['PSF_SAMP']))
+    if psf_size % 2 == 0:
+        psf_size += 1
+    psf_samp_update = float(psf_size) / float(psf_size_config)
+
+    x = (xc - header['POLZERO1']) / header['POLSCAL1']
+    y = (yc - header['POLZERO2']) / header['POLSCAL2']
+    if not psf_varies(model):
+        psf = dat[0]
+    elif header['POLDEG1'] == 2:
+        psf = dat[0] + dat[1] * x + dat[2] * x ** 2 + dat[3] * y + dat[4] * x * y + dat[5] * y ** 2
+    else:
+        psf = dat[0] + dat[1] * x + dat[2] * x ** 2 + dat[3] * x ** 3 + \
+              dat[4] * y + dat[5] * x * y + dat[6] * x ** 2 * y + \
+              dat[7] * y ** 2 + dat[8] * x * y ** 2 + dat[9] * y ** 3
+    return clean_norm_psf(ndimage.zoom(psf, psf_samp_update), model.clean_const)
+
+
+def embed_psf(kernel, shape, dtype=np.float32):
+    """
+    把 PSF 放在块大小数组的中心后 fftshift (与 psf_map 相同), 作为 ZOGY 的 PSF 输入
+    """
+    ysize, xsize = shape
+    psf_ima_center = np.zeros(shape, dtype=dtype)
+    psf_hsize = math.floor(kernel.shape[0] / 2)
+    ycenter, xcenter = ysize / 2, xsize / 2
+    psf_ima_center[int(ycenter - psf_hsize):int(ycenter + psf_hsize + 1),
+                   int(xcenter - psf_hsize):int(xcenter + psf_hsize + 1)] = kernel
+    return np.fft.fftshift(psf_ima_center)
+
+
+def _rfft2(a, workers):
+    if fftw_backend is not None:
+        with scipy.fft.set_backend(fftw_backend):
+            return scipy.fft.rfft2(a, workers=workers)
+    return scipy.fft.rfft2(a, workers=workers)
+
+
+def _irfft2(a, shape, workers):
+    if fftw_backend is not None:
+        with scipy.fft.set_backend(fftw_backend):
+            return scipy.fft.irfft2(a, s=shape, workers=workers)
+    return scipy.fft.irfft2(a, s=shape, workers=workers)
+
+
+def zogy_rfft(R, N, Pr, Pn, params, Vr, Vn, fft_workers=1):
+    """
+    ZOGY 的 D, S, Scorr; 参数含义与 test_diff.ZOGY 相同 (R 参考, N 科学图像, Pr/Pn 已 fftshift 的 PSF)
+    输出与输入同精度
+    """
+    spectra = [_rfft2(a, fft_workers) for a in (R, N, Pr, Pn, Vr, Vn)]
+    return zogy_spectra(*spectra, params, R.shape, R.dtype, fft_workers)
+
+
+def zogy_spectra(R_hat, N_hat, Pr_hat, Pn_hat, Vr_hat, Vn_hat, params, shape, dtype, fft_workers=1):
+    """
+    由 rfft2 后的频谱计算 ZOGY; 输入的频谱 (可能来自缓存) 不会被修改
+    """
+    fr, fn, sr, sn, dx, dy = (float(value) for value in params)
+    sn2, sr2, fn2, fr2 = sn ** 2, sr ** 2, fn ** 2, fr ** 2
+    # python float, 不把 float32 数组提升为 float64
+    fD = float(fr * fn / math.sqrt(sn2 * fr2 + sr2 * fn2))
+
+    Pr_hat2_abs = np.abs(Pr_hat) ** 2
+    Pn_hat2_abs = np.abs(Pn_hat) ** 2
+    denom = sn2 * fr2 * Pr_hat2_abs + sr2 * fn2 * Pn_hat2_abs
+    # 分母为 0 的频率 (两个 PSF 的频谱都为 0) 不参与
+    denom[denom == 0] = np.inf
+    sqrt_denom = np.sqrt(denom)
+
+    D_hat = (fr * Pr_hat * N_hat - fn * Pn_hat * R_hat) / sqrt_denom
+    D = _irfft2(D_hat, shape, fft_workers) / fD
+    # S_hat = fD * D_hat * conj(P_D_hat)
+    D_hat *= (fr * fn) * np.conj(Pr_hat * Pn_hat) / sqrt_denom
+    S = _irfft2(D_hat, shape, fft_workers)
+    del D_hat, sqrt_denom
+
+    kr_hat = fr * fn2 * np.conj(Pr_hat) * Pn_hat2_abs / denom
+    del Pn_hat2_abs
+    kn_hat = fn * fr2 * np.conj(Pn_hat) * Pr_hat2_abs / denom
+    del Pr_hat2_abs, denom
+
+    dx2 = dx ** 2
+    dy2 = dy ** 2
+    V = np.zeros(shape, dtype=dtype)
+    for k_hat, data_hat, var_hat in ((kr_hat, R_hat, Vr_hat), (kn_hat, N_hat, Vn_hat)):
+        k = _irfft2(k_hat, shape, fft_workers)
+        # 源噪声方差 VSr / VSn
+        V += _irfft2(var_hat * _rfft2(k * k, fft_workers), shape, fft_workers)
+        del k
+        # 天体测量方差
+        s = _irfft2(k_hat * data_hat, shape, fft_workers)
+        V += dx2 * (s - np.roll(s, 1, axis=1)) ** 2 + dy2 * (s - np.roll(s, 1, axis=0)) ** 2
+        del s
+    del kr_hat, kn_hat
+
+    S_corr = S.copy()
+    positive = V > 0
+    S_corr[positive] /= np.sqrt(V[positive])
+    return D.astype(dtype, copy=False), S.astype(dtype, copy=False), S_corr.astype(dtype, copy=False)
+
+
+def apodize_window(shape, overlap, dtype=np.float32):
+    """
+    块边缘 overlap 宽度内从 0 渐变到 1 的余弦窗
+    """
+    windows = []
+    for size in shape:
+        w = np.ones(size, dtype=dtype)
+        if overlap > 0:
+            ramp = 0.5 - 0.5 * np.cos(np.pi * (np.arange(overlap) + 0.5) / overlap)
+            w[:overlap] = ramp
+            w[size - overlap:] = ramp[::-1]
+        windows.append(w)
+    return np.outer(windows[0], windows[1]).astype(dtype)
+
+
+def largest_fast_len(limit):
+    n = max(1, limit)
+    while scipy.fft.next_fast_len(n, real=True) != n:
+        n -= 1
+    return n
+
+
+def tile_size_for_budget(memory_mb, workers, itemsize, image_shape=None, overlap=DEFAULT_OVERLAP):
+    """
+    由内存预算 (所有进程合计) 决定块边长: 每个进程约 ARRAYS_PER_TILE 个块大小的数组同时存活;
+    取不超过它的 FFT 快速长度, 不超过图像加重叠的大小
+    """
+    per_worker = memory_mb * 1024 * 1024 / max(1, workers)
+    side = int(math.sqrt(per_worker / (ARRAYS_PER_TILE * itemsize)))
+    side = min(max(side, MIN_TILE), MAX_TILE)
+    if image_shape is not None:
+        side = min(side, scipy.fft.next_fast_len(max(image_shape) + 2 * overlap, real=True))
+    return largest_fast_len(side)
+
+
+def plan_tiles(shape, tile_size, overlap):
+    """
+    把图像分成中心部分不重叠、覆盖全图的块, 每块取数据的大小为 tile_size x tile_size
+    """
+    core = tile_size - 2 * overlap
+    if core <= 0:
+        raise ValueError(f'tile size {tile_size} too small for overlap {overlap}')
+    tiles = []
+    for y0 in range(0, shape[0], core):
+        for x0 in range(0, shape[1], core):
+            tiles.append(Tile(len(tiles), y0, min(y0 + core, shape[0]), x0, min(x0 + core, shape[1])))
+    return tiles
+
+
+def cut_tile(data, tile, tile_size, overlap, dtype):
+    """
+    取块数据 (中心部分向外扩 overlap), 图像外补 0
+    """
+    out = np.zeros((tile_size, tile_size), dtype=dtype)
+    y0, x0 = tile.y0 - overlap, tile.x0 - overlap
+    sy0, sx0 = max(y0, 0), max(x0, 0)
+    sy1, sx1 = min(y0 + tile_size, data.shape[0]), min(x0 + tile_size, data.shape[1])
+    out[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = data[sy0:sy1, sx0:sx1]
+    return out
+
+
+def psf_model_key(model):
+    if model.digest is not None:
+        return model.digest
+    return array_digest(np.asarray(model.dat)) + repr(sorted(model.header.items()))
+
+
+def psf_spectrum(model, xc, yc, shape, dtype, fft_workers=1, cache=None):
+    """
+    (xc, yc) 处 PSF 的 rfft2; PSF 不随位置变化时所有块共用一个缓存条目
+    """
+    def compute():
+        return {'P_hat': _rfft2(embed_psf(psf_kernel(model, xc, yc), shape, dtype), fft_workers)}
+
+    if cache is None:
+        return compute()['P_hat']
+    position = (xc, yc) if psf_varies(model) else None
+    key = ('psf', psf_model_key(model), model.clean_const, model.slices, position, tuple(shape), np.dtype(dtype).str)
+    return cache.get_or_compute(key, compute)['P_hat']
+
+
+class RefSpectrumMissing(Exception):
+    """
+    没有传参考图像的块数据, 而磁盘缓存中的频谱读不到 (被删除或损坏); 主进程带上块数据重新提交
+    """
+
+
+def tile_spectra(data_tile, window, fft_workers=1):
+    """
+    块数据加窗后的频谱和方差图 ((X - median) ** 2, 与 finp 相同) 的频谱
+    """
+    X = data_tile * window
+    V = (X - np.median(X)) ** 2
+    return {'X_hat': _rfft2(X, fft_workers), 'V_hat': _rfft2(V, fft_workers)}
+
+
+def ref_tile_key(ref_key, tile, tile_size, overlap, dtype):
+    return 'ref', ref_key, tile.y0, tile.y1, tile.x0, tile.x1, tile_size, overlap, np.dtype(dtype).str
+
+
+def subtract_tile(tile, sci_tile, ref_tile, sci_psf, ref_psf, params, overlap, fft_workers=1, cache_config=None,
+                  ref_key=None):
+    """
+    一个块的 ZOGY, 在工作进程中执行; 返回 (tile, D, S, Scorr) 的中心部分
+    ref_key 不为 None 时参考图像的频谱经缓存取得; 磁盘缓存中已有时 ref_tile 可以为 None
+    """
+    cache = get_cache(cache_config)
+    shape = sci_tile.shape
+    dtype = sci_tile.dtype
+    window = apodize_window(shape, overlap, dtype)
+    # 块中心 (整幅图像的像素坐标) 处的 PSF
+    xc = (tile.x0 + tile.x1 - 1) / 2
+    yc = (tile.y0 + tile.y1 - 1) / 2
+    Pn_hat = psf_spectrum(sci_psf, xc, yc, shape, dtype, fft_workers, cache)
+    Pr_hat = psf_spectrum(ref_psf, xc, yc, shape, dtype, fft_workers, cache)
+    sci_spectra = tile_spectra(sci_tile, window, fft_workers)
+    del sci_tile
+    ref_spectra = None
+    if cache is not None and ref_key is not None:
+        key = ref_tile_key(ref_key, tile, shape[0], overlap, dtype)
+        ref_spectra = cache.get(key)
+        if ref_spectra is None and ref_tile is not None:
+            ref_spectra = tile_spectra(ref_tile, window, fft_workers)
+            cache.put(key, ref_spectra)
+    if ref_spectra is None:
+        if ref_tile is None:
+            raise RefSpectrumMissing(tile.index)
+        ref_spectra = tile_spectra(ref_tile, window, fft_workers)
+    del ref_tile, window
+    D, S, S_corr = zogy_spectra(ref_spectra['X_hat'], sci_spectra['X_hat'], Pr_hat, Pn_hat, ref_spectra['V_hat'],
+                                sci_spectra['V_hat'], params, shape, dtype, fft_workers)
+    core = (slice(overlap, overlap + tile.y1 - tile.y0), slice(overlap, overlap + tile.x1 - tile.x0))
+    return tile, D[core].copy(), S[core].copy(), S_corr[core].copy()
+
+
+class ZogyEngine:
+    def __init__(self, memory_mb=DEFAULT_MEMORY_MB, workers=None, overlap=DEFAULT_OVERLAP, dtype=np.float32,
+                 fft_workers=1, tile_size=None, cache_mb=None, cache_dir=None):
+        """
+        memory_mb   所有工作进程合计的内存预算 (包括各进程的频谱缓存), 扣除缓存后的部分决定块大小
+        workers     进程数, 默认 CPU 数; 为 1 时在当前进程中计算, 不启动进程池
+        overlap     块之间的重叠/渐变宽度, 应大于 PSF 半径
+        dtype       np.float32 或 np.float64
+        fft_workers 每个块的 FFT 线程数
+        tile_size   指定块边长时不按内存预算计算
+        cache_mb    每个进程的频谱缓存 (PSF 和参考图像) 大小, 为 0 时不用内存缓存;
+                    默认为 memory_mb 的 DEFAULT_CACHE_SHARE 平分给各进程
+        cache_dir   磁盘频谱缓存目录, 多个进程和多次运行共享; 为 None 时不用
+        """
+        self.memory_mb = memory_mb
+        self.workers = workers or os.cpu_count() or 1
+        self.overlap = overlap
+        self.dtype = np.dtype(dtype)
+        self.fft_workers = fft_workers
+        self.tile_size = tile_size
+        if cache_mb is None:
+            cache_mb = memory_mb * DEFAULT_CACHE_SHARE / self.workers
+        self.cache_mb = cache_mb
+        # 每个进程的缓存都从预算中扣除
+        self.tile_memory_mb = max(0, memory_mb - cache_mb * self.workers)
+        self.cache_config = CacheConfig(int(cache_mb * 1024 * 1024), cache_dir)
+        self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def tile_size_for(self, shape):
+        if self.tile_size is not None:
+            return self.tile_size
+        return tile_size_for_budget(self.tile_memory_mb, self.workers, self.dtype.itemsize, shape, self.overlap)
+
+    def cache_stats(self):
+        """
+        当前进程中频谱缓存的命中统计 (workers 为 1 时即全部)
+        """
+        cache = get_cache(self.cache_config)
+        return dict(cache.stats) if cache is not None else {}
+
+    def subtract(self, sci, ref, sci_psf, ref_psf, params, ref_key=None):
+        """
+        sci / ref 为已减背景、已对齐的同尺寸图像, sci_psf / ref_psf 为 PsfModel, params 为 ZogyParams
+        ref_key     参考图像的标识 (例如文件路径和修改时间), 用作频谱缓存的 key; 为 None 时由 ref 的内容计算
+        返回 (D, S, Scorr), 与输入同尺寸, dtype 为 self.dtype
+        """
+        if sci.shape != ref.shape:
+            raise ValueError(f'shape mismatch {sci.shape} {ref.shape}')
+        tile_size = self.tile_size_for(sci.shape)
+        tiles = plan_tiles(sci.shape, tile_size, self.overlap)
+        outputs = [np.zeros(sci.shape, dtype=self.dtype) for _ in range(3)]
+        cache = get_cache(self.cache_config)
+        if cache is not None and ref_key is None:
+            ref_key = array_digest(ref)
+
+        def task_args(tile, with_ref=False):
+            # 参考图像的频谱已在磁盘缓存中时不再传块数据
+            ref_tile = None
+            if with_ref or cache is None or not cache.on_disk(ref_tile_key(ref_key, tile, tile_size, self.overlap, self.dtype)):
+                ref_tile = cut_tile(ref, tile, tile_size, self.overlap, self.dtype)
+            return (tile, cut_tile(sci, tile, tile_size, self.overlap, self.dtype), ref_tile, sci_psf, ref_psf,
+                    params, self.overlap, self.fft_workers, self.cache_config, ref_key)
+
+        def store(result):
+            tile, *images = result
+            for out, image in zip(outputs, images):
+                out[tile.y0:tile.y1, tile.x0:tile.x1] = image
+
+        if self.workers == 1:
+            for tile in tiles:
+                try:
+                    result = subtract_tile(*task_args(tile))
+                except RefSpectrumMissing:
+                    result = subtract_tile(*task_args(tile, with_ref=True))
+                store(result)
+            return tuple(outputs)
+
+        def collect(future, tile):
+            try:
+                result = future.result()
+            except RefSpectrumMissing:
+                result = self.executor.submit(subtract_tile, *task_args(tile, with_ref=True)).result()
+            store(result)
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        # 同时提交的块数有上限, 块数据不会全部堆在队列里
+        pending = {}
+        for tile in tiles:
+            if len(pending) >= self.workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future, pending.pop(future))
+            pending[self.executor.submit(subtract_tile, *task_args(tile))] = tile
+        for future in wait(pending)[0]:
+            collect(future, pending[future])
+        return tuple(outputs)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志增量索引性能测试
+生成合成的 autoredux_server_*.log，对比原始逐行扫描、首次建立索引、追加内容后增量更新和无变化时的耗时
+"""
+
+import argparse
+import os
+import random
+import re
+import time
+
+from log_file_finder import LogFileFinder
+
+
+def write_log_lines(f, rng: random.Random, target_bytes: int, start_index: int) -> int:
+    """
+    写入合成日志，约每20行中有一对开始/结束记录，每50对有一行没有时间戳的开始记录
+
+    Returns:
+        int: 下一个FIT文件序号
+    """
+    written = 0
+    index = start_index
+    noise = [
+        "INFO - 任务队列长度: {n}",
+        "DEBUG - 检查目录 E:/kats_process/gy{s}/20250823/K{k:03d}/redux",
+        "INFO - 内存占用 {n} MB, CPU {s}%",
+        "WARNING - 星点数量不足 {n}, 跳过匹配",
+    ]
+    while written < target_bytes:
+        seconds = index * 7
+        timestamp = f"2025-08-{23 + seconds // 86400 % 5:02d} {seconds // 3600 % 24:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d},{rng.randint(0, 999):03d}"
+        fit_name = (f"GY{rng.randint(1, 6)}_K{rng.randint(1, 120):03d}-{rng.randint(1, 4)}_No Filter_60S_Bin2_"
+                    f"UTC20250823_{seconds // 3600 % 24:02d}{seconds // 60 % 60:02d}{seconds % 60:02d}_-20C_.fit")
+        lines = [f"{timestamp} - INFO - 开始处理 {fit_name}\n"]
+        for _ in range(18):
+            lines.append(f"{timestamp} - " + rng.choice(noise).format(n=rng.randint(0, 9999), s=rng.randint(1, 6), k=rng.randint(1, 120)) + "\n")
+        lines.append(f"{timestamp} - INFO - 结束处理 {fit_name}\n")
+        if index % 50 == 0:
+            # 没有时间戳的开始/结束行 (多行消息的续行), 原始实现不记录其中的文件名
+            lines.append(f"    开始处理 {fit_name.replace('_-20C_', '_-30C_')}\n")
+        data = ''.join(lines).encode('utf-8')
+        f.write(data)
+        written += len(data)
+        index += 1
+    return index
+
+
+def legacy_extract(log_path: str) -> dict:
+    """原始实现：逐行扫描，每个包含开始/结束的行都重新编译时间戳正则"""
+    fit_file_times = {}
+    fit_pattern = re.compile(r'GY\d_K\d{3}-.*?\.fit', re.IGNORECASE)
+    with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            if "开始" in line or "结束" in line:
+                match = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}').search(line)
+                timestamp = match.group(0) if match else None
+                if timestamp:
+                    for fit_name in fit_pattern.findall(line):
+                        fit_file_times.setdefault(fit_name, {})
+                        if "开始" in line:
+                            fit_file_times[fit_name]['start'] = timestamp
+                        elif "结束" in line:
+                            fit_file_times[fit_name]['end'] = timestamp
+            else:
+                for fit_name in fit_pattern.findall(line):
+                    fit_file_times.setdefault(fit_name, {})
+    return fit_file_times
+
+
+def timed_extract(finder: LogFileFinder, log_filename: str) -> tuple:
+    finder.fit_file_times = {}
+    start = time.perf_counter()
+    fit_files = finder.extract_fit_files_from_log(log_filename)
+    return time.perf_counter() - start, fit_files, finder.fit_file_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='日志增量索引性能测试')
+    parser.add_argument('--size-mb', type=int, default=1024, help='合成日志大小（MB）')
+    parser.add_argument('--append-mb', type=int, default=4, help='追加内容大小（MB）')
+    parser.add_argument('--dir', default='bench_logs', help='合成日志目录')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    log_filename = "autoredux_server_20250823.log"
+    log_path = os.path.join(args.dir, log_filename)
+    index_db = os.path.join(args.dir, "bench_log_index.db")
+    for path in (log_path, index_db, index_db + '-wal', index_db + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    with open(log_path, 'wb') as f:
+        next_index = write_log_lines(f, rng, args.size_mb * 1024 * 1024, 0)
+    print(f"生成日志: {os.path.getsize(log_path) / 1024 / 1024:.0f} MB, {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    legacy_times = legacy_extract(log_path)
+    legacy_time = time.perf_counter() - start
+
+    scan_finder = LogFileFinder(args.dir, use_index=False)
+    scan_time, _, scan_times = timed_extract(scan_finder, log_filename)
+
+    index_finder = LogFileFinder(args.dir, index_db=index_db)
+    build_time, _, index_times = timed_extract(index_finder, log_filename)
+    assert legacy_times == scan_times == index_times, "首次索引结果与原始实现不一致"
+
+    unchanged_time, _, _ = timed_extract(index_finder, log_filename)
+
+    with open(log_path, 'ab') as f:
+        write_log_lines(f, rng, args.append_mb * 1024 * 1024, next_index)
+    append_time, _, append_times = timed_extract(index_finder, log_filename)
+    assert append_times == legacy_extract(log_path), "增量更新结果与原始实现不一致"
+
+    print(f"FIT文件数: {len(append_times)}")
+    print(f"{'方式':<24} {'耗时(s)':>10}")
+    print(f"{'原始逐行扫描':<24} {legacy_time:>10.3f}")
+    print(f"{'预编译正则逐行扫描':<24} {scan_time:>10.3f}")
+    print(f"{'首次建立索引':<24} {build_time:>10.3f}")
+    print(f"{'无变化':<24} {unchanged_time:>10.4f}")
+    print(f"{f'追加{args.append_mb}MB后增量更新':<24} {append_time:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量执行后端性能测试
+对比原始的20线程池（每个文件一个任务）与 thread / process / hybrid 后端在不同工作数下生成预览图的耗时，
+以及 header 读取和文件名解析在各后端下的耗时
+"""
+
+import argparse
+import logging
+import os
+import time
+
+import psutil
+
+from bench_match_related_files import make_synthetic_files
+from bench_preview_render import make_synthetic_fits
+from fits_file_finder_ripgrep import FitsFileFinderRipgrep
+
+
+def set_executor(finder: FitsFileFinderRipgrep, task_kind: str, backend: str, chunk_size: int = 0) -> None:
+    executor_options = finder.config.setdefault('options', {}).setdefault('executor', {})
+    executor_options[f'{task_kind}_backend'] = backend
+    executor_options['chunk_size'] = chunk_size
+
+
+def time_images(finder: FitsFileFinderRipgrep, paths: list, backend: str, workers: int, chunk_size: int = 0) -> float:
+    set_executor(finder, 'images', backend, chunk_size)
+    start = time.perf_counter()
+    results = finder.batch_process_fits_images(paths, max_workers=workers)
+    elapsed = time.perf_counter() - start
+    assert list(results) == paths, "结果顺序与输入不一致"
+    assert all(r['thumbnail'] and r['center_crop'] for r in results.values()), "有图像生成失败"
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量执行后端性能测试')
+    parser.add_argument('--count', type=int, default=48, help='合成FITS文件数量')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16], help='测试的工作数')
+    parser.add_argument('--data-dir', default='bench_preview_fits', help='合成FITS文件目录')
+    parser.add_argument('--output-dir', default='bench_executor_dest', help='预览图输出目录')
+    parser.add_argument('--info-files', type=int, default=20000, help='文件名解析测试的.fit文件数')
+    args = parser.parse_args()
+
+    finder = FitsFileFinderRipgrep(output_dir=args.output_dir)
+    finder.logger.setLevel(logging.WARNING)
+    paths = make_synthetic_fits(args.data_dir, args.count)
+
+    print(f"CPU: 逻辑核心 {psutil.cpu_count()}, 物理核心 {psutil.cpu_count(logical=False)}, "
+          f"可用核心 {len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else psutil.cpu_count()}")
+
+    print(f"\n预览图生成 ({args.count} 个文件, 秒):")
+    legacy = time_images(finder, paths, 'thread', 20, chunk_size=1)
+    print(f"{'原始20线程':>12} {legacy:>8.2f}")
+    print(f"{'后端':>12} " + " ".join(f"{f'{w}工作':>8}" for w in args.workers))
+    for backend in ('thread', 'process', 'hybrid'):
+        times = [time_images(finder, paths, backend, workers) for workers in args.workers]
+        print(f"{backend:>12} " + " ".join(f"{t:>8.2f}" for t in times))
+
+    print(f"\nPP FITS header读取 ({args.count} 个文件, 秒):")
+    for backend in ('serial', 'thread', 'process'):
+        set_executor(finder, 'headers', backend)
+        start = time.perf_counter()
+        headers = finder.batch_read_pp_fits_headers(paths)
+        assert [h['file_path'] for h in headers] == paths, "结果顺序与输入不一致"
+        print(f"{backend:>12} {time.perf_counter() - start:>8.3f}")
+
+    fit_files = make_synthetic_files(args.info_files)['fit']
+    print(f"\n文件名解析 ({len(fit_files)} 个文件, 秒):")
+    set_executor(finder, 'fits_info', 'thread', chunk_size=1)
+    start = time.perf_counter()
+    finder.extract_batch_fits_info(fit_files, max_workers=20)
+    print(f"{'原始20线程':>12} {time.perf_counter() - start:>8.3f}")
+    for backend in ('serial', 'thread', 'process'):
+        set_executor(finder, 'fits_info', backend)
+        start = time.perf_counter()
+        infos = finder.extract_batch_fits_info(fit_files)
+        assert [i['original_path'] for i in infos] == fit_files, "结果顺序与输入不一致"
+        print(f"{backend:>12} {time.perf_counter() - start:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
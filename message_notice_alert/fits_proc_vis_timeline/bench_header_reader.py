@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PP FITS header读取性能测试
+对比 fits.open(...)[0].header 与 fits_header_reader 的2880字节块读取（合成的pp_fits文件，header约200张卡）
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+from astropy.io import fits
+
+from fits_file_finder_ripgrep import PP_FITS_HEADER_KEYS
+from fits_header_reader import read_header_keywords, read_header_keywords_batch
+
+
+def make_synthetic_pp_fits(output_dir: str, count: int, shape: tuple = (1024, 1024), seed: int = 1) -> list:
+    """
+    生成带有WCS和质量关键字的合成pp_fits文件
+
+    Returns:
+        list: FITS文件路径列表
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    data = rng.normal(1000, 30, size=shape).astype(np.float32)
+    paths = []
+    for i in range(count):
+        path = os.path.join(output_dir, f"GY1_K001-{i % 4 + 1}_No Filter_60S_Bin2_UTC20250421_{170000 + i:06d}_-20C__pp.fits")
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+        header = fits.Header()
+        header['OBJECT'] = ('K001-1', 'sky region')
+        header['DATE-OBS'] = '2025-04-21T17:00:00'
+        for j in range(180):
+            header[f'PV1_{j}'] = (float(rng.normal()), 'distortion term')
+        header['LM5SIG'] = (round(float(rng.uniform(17, 19)), 3), 'limit magnitude 5 sigma')
+        header['ELLIPTI'] = (round(float(rng.uniform(0, 0.3)), 4), 'mean ellipticity')
+        if i % 5:
+            header['FWHM'] = (round(float(rng.uniform(1.5, 4)), 3), 'mean fwhm (pixel)')
+        header['COMMENT'] = "it's a synthetic frame"
+        fits.PrimaryHDU(data, header=header).writeto(path, overwrite=True)
+    return paths
+
+
+def read_with_fits_open(path: str) -> dict:
+    """原始实现"""
+    with fits.open(path) as hdul:
+        header = hdul[0].header
+        return {key: str(header[key]) for key in PP_FITS_HEADER_KEYS if key in header}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PP FITS header读取性能测试')
+    parser.add_argument('--count', type=int, default=500, help='合成pp_fits文件数量')
+    parser.add_argument('--data-dir', default='bench_header_fits', help='合成文件目录')
+    args = parser.parse_args()
+
+    paths = make_synthetic_pp_fits(args.data_dir, args.count)
+
+    start = time.perf_counter()
+    legacy = [read_with_fits_open(path) for path in paths]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = [read_header_keywords(path, PP_FITS_HEADER_KEYS) for path in paths]
+    fast_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = read_header_keywords_batch(paths, PP_FITS_HEADER_KEYS)
+    batch_time = time.perf_counter() - start
+
+    assert legacy == fast == batch, "读取结果不一致"
+
+    print(f"{'方式':>12} {'总耗时(s)':>10} {'每文件(ms)':>10}")
+    print(f"{'fits.open':>12} {legacy_time:>10.3f} {legacy_time / len(paths) * 1000:>10.3f}")
+    print(f"{'块读取':>12} {fast_time:>10.3f} {fast_time / len(paths) * 1000:>10.3f}")
+    print(f"{'块读取批量':>12} {batch_time:>10.3f} {batch_time / len(paths) * 1000:>10.3f}")
+    print(f"加速比: {legacy_time / fast_time:.1f}x (单线程), {legacy_time / batch_time:.1f}x (批量)")
+
+
+if __name__ == "__main__":
+    main()
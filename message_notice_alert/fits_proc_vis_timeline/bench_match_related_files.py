@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+关联文件匹配性能测试
+对比原始的双重循环匹配与 match_related_files_to_fit 的字典索引匹配（使用合成文件列表，不访问磁盘）
+"""
+
+import argparse
+import logging
+import random
+import time
+from typing import Dict, List
+
+from fits_file_finder_ripgrep import FitsFileFinderRipgrep
+
+
+def make_synthetic_files(fit_count: int, seed: int = 1) -> Dict[str, List[str]]:
+    """
+    生成合成的 .fit 文件列表及每个 .fit 对应的 axy/diff1/fixedsrc/mo/pp_fits 文件
+
+    Args:
+        fit_count: .fit文件数量
+        seed: 随机种子
+
+    Returns:
+        Dict[str, List[str]]: 按文件类型分类的文件路径字典
+    """
+    rng = random.Random(seed)
+    files_by_type = {'fit': [], 'axy': [], 'diff1': [], 'fixedsrc': [], 'mo': [], 'pp_fits': []}
+    suffixes = {
+        'axy': '.fits.axy',
+        'diff1': '.diff1.fits',
+        'fixedsrc': '.fixedsrc.cat',
+        'mo': '.mo.cat',
+        'pp_fits': '_pp.fits'
+    }
+    for i in range(fit_count):
+        system_name = f"GY{rng.randint(1, 6)}"
+        k_index = f"K{rng.randint(1, 120):03d}"
+        sky_region = f"{k_index}-{rng.randint(1, 4)}"
+        seconds = i * 7
+        timestamp = f"UTC20250421_{17 + seconds // 3600 % 7:02d}{seconds // 60 % 60:02d}{seconds % 60:02d}"
+        base_name = f"{system_name}_{sky_region}_No Filter_60S_Bin2_{timestamp}_-20C_"
+        date_dir = f"E:/kats_process/{system_name.lower()}/20250421/{k_index}"
+        files_by_type['fit'].append(f"{date_dir}/{base_name}.fit")
+        for file_type, suffix in suffixes.items():
+            files_by_type[file_type].append(f"{date_dir}/redux/{base_name}{suffix}")
+
+    for file_type in suffixes:
+        rng.shuffle(files_by_type[file_type])
+    return files_by_type
+
+
+def legacy_match(finder: FitsFileFinderRipgrep, fit_files: List[str], other_files_by_type: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """
+    原始实现：每个关联文件遍历全部 .fit 文件
+
+    Returns:
+        Dict[str, List[str]]: .fit文件路径到关联文件路径列表的字典
+    """
+    fit_info_list = finder.extract_batch_fits_info(fit_files)
+    matches = {fit_file: [] for fit_file in fit_files}
+    for file_type, files in other_files_by_type.items():
+        other_info_list = finder.extract_batch_fits_info(files)
+        for j, other_file in enumerate(files):
+            other_info = other_info_list[j]
+            for i, fit_file in enumerate(fit_files):
+                if finder._files_match(fit_info_list[i], other_info):
+                    matches[fit_file].append(other_file)
+                    break
+    return matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='关联文件匹配性能测试')
+    parser.add_argument('--fits', type=int, nargs='+', default=[500, 2000, 5000],
+                        help='.fit文件数量，每个.fit对应5个关联文件')
+    parser.add_argument('--skip-legacy-above', type=int, default=5000,
+                        help='.fit文件数超过该值时跳过原始双重循环实现')
+    args = parser.parse_args()
+
+    finder = FitsFileFinderRipgrep(output_dir='bench_dest')
+    finder.logger.setLevel(logging.WARNING)
+
+    print(f"{'fit数':>8} {'关联文件数':>10} {'原始(s)':>10} {'索引(s)':>10} {'加速比':>8}")
+    for fit_count in args.fits:
+        files_by_type = make_synthetic_files(fit_count)
+        fit_files = files_by_type['fit']
+        other_files = {k: v for k, v in files_by_type.items() if k != 'fit'}
+        other_count = sum(len(v) for v in other_files.values())
+
+        start = time.perf_counter()
+        fit_matches = finder.match_related_files_to_fit(fit_files, other_files)
+        indexed_time = time.perf_counter() - start
+
+        matched = sum(len(files) for m in fit_matches.values() for files in m['related_files'].values())
+        assert matched == other_count, f"匹配数量不一致: {matched} != {other_count}"
+
+        if fit_count <= args.skip_legacy_above:
+            start = time.perf_counter()
+            legacy = legacy_match(finder, fit_files, other_files)
+            legacy_time = time.perf_counter() - start
+            for fit_file, match_info in fit_matches.items():
+                indexed_files = sorted(e['file_path'] for files in match_info['related_files'].values() for e in files)
+                assert indexed_files == sorted(legacy[fit_file]), f"匹配结果不一致: {fit_file}"
+            print(f"{fit_count:>8} {other_count:>10} {legacy_time:>10.3f} {indexed_time:>10.3f} {legacy_time / indexed_time:>7.1f}x")
+        else:
+            print(f"{fit_count:>8} {other_count:>10} {'-':>10} {indexed_time:>10.3f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FITS预览图生成性能测试
+对比原始实现（缩略图和中心区域图各打开一次文件、全分辨率百分位数）与 process_fits_image 的单次读取实现，
+每种实现在独立子进程中运行；峰值内存用 tracemalloc 统计单个文件处理期间的分配峰值（numpy数组计入），
+不受导入模块的内存和另一种实现的影响
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from astropy.io import fits
+from PIL import Image
+
+from fits_file_finder_ripgrep import FitsFileFinderRipgrep
+
+
+def make_synthetic_fits(output_dir: str, count: int, shape: tuple = (3211, 4800), seed: int = 1) -> list:
+    """
+    生成合成的16位FITS图像（天光背景 + 星点），与GY系列相机的原始帧尺寸相同
+
+    Returns:
+        list: FITS文件路径列表
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        path = os.path.join(output_dir, f"GY1_K001-{i + 1}_No Filter_60S_Bin2_UTC20250421_170000_-20C_.fit")
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+        data = rng.normal(1000, 30, size=shape)
+        ys = rng.integers(0, shape[0], 2000)
+        xs = rng.integers(0, shape[1], 2000)
+        data[ys, xs] += rng.uniform(1000, 30000, 2000)
+        data = np.clip(data, 0, 65535)
+        # 与相机输出一致: uint16 以 int16 + BZERO=32768 存储
+        hdu = fits.PrimaryHDU((data - 32768).astype(np.int16))
+        hdu.header['BSCALE'] = 1
+        hdu.header['BZERO'] = 32768
+        hdu.writeto(path, overwrite=True)
+    return paths
+
+
+def legacy_normalize(data):
+    """原始实现的归一化"""
+    data = np.nan_to_num(data)
+    min_val = np.percentile(data, 1)
+    max_val = np.percentile(data, 99)
+    if max_val <= min_val:
+        max_val = min_val + 1
+    normalized = (data - min_val) / (max_val - min_val)
+    return np.clip(normalized * 255, 0, 255).astype(np.uint8)
+
+
+def legacy_render(fits_path: str, thumbnail_path: str, crop_path: str) -> None:
+    """原始实现：缩略图和中心区域图各自打开一次文件并读取完整数据"""
+    with fits.open(fits_path) as hdul:
+        img = Image.fromarray(legacy_normalize(hdul[0].data))
+        img.resize((512, 512), Image.Resampling.LANCZOS).save(thumbnail_path)
+    with fits.open(fits_path) as hdul:
+        image_data = hdul[0].data
+        height, width = image_data.shape
+        center_y, center_x = height // 2, width // 2
+        center_data = image_data[center_y - 100:center_y + 100, center_x - 100:center_x + 100]
+        Image.fromarray(legacy_normalize(center_data)).save(crop_path)
+
+
+def run_mode(mode: str, paths: list, output_dir: str) -> dict:
+    """在当前进程中生成全部预览图，返回耗时和单个文件的峰值内存"""
+    finder = FitsFileFinderRipgrep(output_dir=output_dir)
+    finder.logger.setLevel(logging.WARNING)
+    os.makedirs(finder.image_dir, exist_ok=True)
+    def render(path):
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        thumbnail_path = os.path.join(finder.image_dir, f"{base_name}_{mode}_thumbnail.jpg")
+        crop_path = os.path.join(finder.image_dir, f"{base_name}_{mode}_center.jpg")
+        if mode == 'legacy':
+            legacy_render(path, thumbnail_path, crop_path)
+        else:
+            finder._render_previews(path, thumbnail_path, crop_path)
+
+    latencies = []
+    for path in paths:
+        start = time.perf_counter()
+        render(path)
+        latencies.append(time.perf_counter() - start)
+
+    # tracemalloc 会拖慢分配，计时之后单独统计内存
+    peak_bytes = 0
+    tracemalloc.start()
+    for path in paths:
+        tracemalloc.reset_peak()
+        render(path)
+        peak_bytes = max(peak_bytes, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    return {
+        'mode': mode,
+        'mean_ms': float(np.mean(latencies) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'peak_mb': peak_bytes / 1024 / 1024,
+        'image_dir': finder.image_dir
+    }
+
+
+def compare_images(legacy_dir: str, single_dir: str, paths: list) -> tuple:
+    """比较两种实现输出图像的平均像素差，返回各文件中的最大值"""
+    max_thumb_diff = 0
+    max_crop_diff = 0
+    for path in paths:
+        base_name = os.path.splitext(os.path.basename(path))[0]
+        for kind in ('thumbnail', 'center'):
+            old = np.asarray(Image.open(os.path.join(legacy_dir, f"{base_name}_legacy_{kind}.jpg")), dtype=np.int16)
+            new = np.asarray(Image.open(os.path.join(single_dir, f"{base_name}_single_{kind}.jpg")), dtype=np.int16)
+            diff = float(np.abs(old - new).mean())
+            if kind == 'thumbnail':
+                max_thumb_diff = max(max_thumb_diff, diff)
+            else:
+                max_crop_diff = max(max_crop_diff, diff)
+    return max_thumb_diff, max_crop_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FITS预览图生成性能测试')
+    parser.add_argument('--count', type=int, default=10, help='合成FITS文件数量')
+    parser.add_argument('--data-dir', default='bench_preview_fits', help='合成FITS文件目录')
+    parser.add_argument('--output-dir', default='bench_preview_dest', help='预览图输出目录')
+    parser.add_argument('--mode', choices=['legacy', 'single'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    paths = make_synthetic_fits(args.data_dir, args.count)
+
+    if args.mode:
+        # 子进程: 只运行一种实现，结果以JSON输出
+        print(json.dumps(run_mode(args.mode, paths, args.output_dir)))
+        return
+
+    results = {}
+    for mode in ('legacy', 'single'):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode,
+                                 '--count', str(args.count), '--data-dir', args.data_dir,
+                                 '--output-dir', args.output_dir],
+                                check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'实现':>8} {'平均(ms)':>10} {'P95(ms)':>10} {'峰值内存(MB)':>14}")
+    for mode, r in results.items():
+        print(f"{mode:>8} {r['mean_ms']:>10.1f} {r['p95_ms']:>10.1f} {r['peak_mb']:>14.1f}")
+    print(f"加速比: {results['legacy']['mean_ms'] / results['single']['mean_ms']:.1f}x")
+
+    thumb_diff, crop_diff = compare_images(results['legacy']['image_dir'], results['single']['image_dir'], paths)
+    print(f"平均像素差(0-255): 缩略图 {thumb_diff:.2f}, 中心区域图 {crop_diff:.2f}")
+
+
+if __name__ == "__main__":
+    main()
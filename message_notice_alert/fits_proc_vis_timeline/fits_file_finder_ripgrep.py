@@ -12,16 +12,22 @@ import sys
 import json
 import re
 import argparse
+import bisect
+import fnmatch
 import logging
 import shutil
 import tarfile
 from pathlib import Path
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import psutil
 
+from fits_header_reader import read_header_keywords_safe
+from fits_scan_cache import FitsScanCache
+from fits_task_executor import FitsTaskExecutor, prefetch_file
+
 try:
     import python_ripgrep as ripgrep
 except ImportError:
@@ -50,10 +56,14 @@ if PLOT_AVAILABLE:
     plt.switch_backend('Agg')
 
 
+# PP FITS header中读取的质量关键字
+PP_FITS_HEADER_KEYS = ('LM5SIG', 'ELLIPTI', 'FWHM')
+
+
 class FitsFileFinderRipgrep:
     """基于Ripgrep的FITS文件查找器类"""
     
-    def __init__(self, config_file: str = "fits_finder_config.json", date_suffix: str = None, ignore_date: bool = False, output_dir: str = None, enable_log_file: bool = False):
+    def __init__(self, config_file: str = "fits_finder_config.json", date_suffix: str = None, ignore_date: bool = False, output_dir: str = None, enable_log_file: bool = False, use_scan_cache: bool = False):
         """
         初始化文件查找器
 
@@ -63,6 +73,7 @@ class FitsFileFinderRipgrep:
             ignore_date: 是否忽略日期后缀，直接搜索基础目录
             output_dir: 输出目录路径，如果为None则默认使用"dest"目录
             enable_log_file: 是否启用日志文件输出，默认为False
+            use_scan_cache: 是否启用增量扫描缓存（输出目录下的 fits_scan_cache.db），默认为False
         """
         # 处理配置文件路径：如果是相对路径，则相对于脚本文件所在目录
         if not os.path.isabs(config_file):
@@ -72,6 +83,8 @@ class FitsFileFinderRipgrep:
         else:
             self.config_file = config_file
         self.config = {}
+        # 预编译的路径规则，加载配置后首次使用时生成
+        self._compiled_path_rules = None
         self.ignore_date = ignore_date
         self.date_suffix = date_suffix or datetime.now().strftime("%Y%m%d")
         # 如果没有指定输出目录，默认使用"dest"目录
@@ -88,6 +101,51 @@ class FitsFileFinderRipgrep:
 
         # 注意：使用 run_timestamp 来识别本次运行生成的文件，无需单独记录
 
+        # 增量扫描缓存：记录目录列表、文件解析结果、header和已生成的图像
+        self.scan_cache = None
+        if use_scan_cache:
+            self.scan_cache = FitsScanCache(os.path.join(self.output_dir, "fits_scan_cache.db"), self.logger)
+            self.scan_cache.load()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """进程池中传递查找器时不携带扫描缓存（缓存只在主进程中读写）"""
+        state = self.__dict__.copy()
+        state['scan_cache'] = None
+        return state
+
+    def _create_executor(self, task_kind: str, max_workers: Optional[int] = None) -> FitsTaskExecutor:
+        """
+        根据配置 options.executor 创建批量任务执行器
+
+        Args:
+            task_kind: 任务类型，images（缩略图，CPU密集）/ headers（PP FITS header，I/O密集）/ fits_info（文件名解析）
+            max_workers: 调用方指定的工作数，为None时使用配置，配置为0时根据CPU核心数自动确定
+
+        Returns:
+            FitsTaskExecutor: 执行器
+        """
+        executor_options = self.config.get('options', {}).get('executor', {})
+        default_backends = {'images': 'hybrid', 'headers': 'thread', 'fits_info': 'serial'}
+        backend = executor_options.get(f'{task_kind}_backend', default_backends.get(task_kind, 'thread'))
+        if max_workers is None:
+            # 图像生成的工作数总是取 cpu_workers，其他任务使用线程时取 io_workers
+            if backend == 'thread' and task_kind != 'images':
+                max_workers = executor_options.get('io_workers', 0)
+            else:
+                max_workers = executor_options.get('cpu_workers', 0)
+        return FitsTaskExecutor(backend=backend,
+                                max_workers=max_workers,
+                                io_workers=executor_options.get('io_workers', 0),
+                                chunk_size=executor_options.get('chunk_size', 0),
+                                logger=self.logger)
+
+    def _log_progress(self, completed: int, total: int, last_logged: List[int]) -> None:
+        """每完成约10%或全部完成时输出进度"""
+        step = max(10, total // 10)
+        if completed == total or completed - last_logged[0] >= step:
+            last_logged[0] = completed
+            self.logger.info(f"处理进度: {completed}/{total}")
+
     def _is_current_run_file(self, file_path: Path) -> bool:
         """
         判断文件是否是本次运行生成的
@@ -108,6 +166,15 @@ class FitsFileFinderRipgrep:
         if file_path.parent.name == f"images_{self.run_timestamp}":
             return True
 
+        # 检查是否是本次运行从缓存中复用的图像
+        if self.scan_cache is not None and self.scan_cache.reused_images:
+            try:
+                relative_path = str(file_path.relative_to(Path(self.output_dir))).replace('\\', '/')
+                if relative_path in self.scan_cache.reused_images:
+                    return True
+            except ValueError:
+                pass
+
         # 检查是否是固定的模板文件（在本次运行中拷贝的）
         template_files = ["vis.css", "vis.js", "kats_sky_region.js"]
         if file_name in template_files:
@@ -529,6 +596,7 @@ class FitsFileFinderRipgrep:
                 
             with open(self.config_file, 'r', encoding='utf-8') as f:
                 self.config = json.load(f)
+            self._compiled_path_rules = None
                 
             # 验证配置文件格式
             if not self._validate_config():
@@ -634,22 +702,42 @@ class FitsFileFinderRipgrep:
         
         return patterns
 
-    def _normalize_image_data(self, data) -> Any:
+    def _estimate_percentiles(self, data, percentiles: tuple = (1, 99), max_samples: int = 1000000) -> tuple:
+        """
+        用等间隔抽样估计图像的百分位数，避免对全分辨率图像排序
+
+        Args:
+            data: 图像数据（可以是memmap）
+            percentiles: 需要计算的百分位数
+            max_samples: 抽样像素数上限
+
+        Returns:
+            tuple: 各百分位数的值
+        """
+        step = 1
+        if data.size > max_samples:
+            step = int(np.ceil(np.sqrt(data.size / max_samples)))
+        sample = np.nan_to_num(np.asarray(data[::step, ::step], dtype=np.float32))
+        return tuple(np.percentile(sample, percentiles))
+
+    def _normalize_image_data(self, data, limits: tuple = None) -> Any:
         """
         对FITS图像数据进行归一化处理
         
         Args:
             data: 原始FITS图像数据
+            limits: 预先计算的 (最小值, 最大值)，为None时按1%/99%百分位数估计
         
         Returns:
             np.ndarray: 归一化后的图像数据 (0-255范围的uint8)
         """
         # 移除NaN和无穷大值
-        data = np.nan_to_num(data)
+        data = np.nan_to_num(np.asarray(data, dtype=np.float32))
         
         # 计算数据的最小值和最大值（排除异常值）
-        min_val = np.percentile(data, 1)
-        max_val = np.percentile(data, 99)
+        if limits is None:
+            limits = self._estimate_percentiles(data)
+        min_val, max_val = limits
         
         # 确保最大值大于最小值
         if max_val <= min_val:
@@ -661,6 +749,177 @@ class FitsFileFinderRipgrep:
         
         return normalized
 
+    def _decimate_image_data(self, data, size: tuple) -> Any:
+        """
+        按整数倍块平均缩小图像，保留约2倍于目标尺寸的分辨率供后续LANCZOS重采样
+
+        Args:
+            data: 图像数据（可以是memmap）
+            size: 目标尺寸 (宽, 高)
+
+        Returns:
+            np.ndarray: 缩小后的float32图像
+        """
+        height, width = data.shape
+        factor = max(1, min(height // (2 * size[1]), width // (2 * size[0])))
+        if factor == 1:
+            return np.nan_to_num(np.asarray(data, dtype=np.float32))
+
+        out_height, out_width = height // factor, width // factor
+        decimated = np.zeros((out_height, out_width), dtype=np.float32)
+        # 逐个偏移累加跨步视图，不需要复制整幅图像
+        for dy in range(factor):
+            for dx in range(factor):
+                decimated += np.nan_to_num(data[dy:out_height * factor:factor, dx:out_width * factor:factor])
+        decimated /= factor * factor
+        return decimated
+
+    def _resize_image(self, img, size: tuple):
+        """兼容不同版本Pillow的LANCZOS缩放"""
+        try:
+            # Pillow >= 10.0.0
+            return img.resize(size, Image.Resampling.LANCZOS)
+        except AttributeError:
+            # Pillow < 10.0.0
+            return img.resize(size, Image.LANCZOS)
+
+    def _open_preview_data(self, hdul) -> Optional[Any]:
+        """
+        从已打开的HDUList中取出二维图像数据
+
+        以 do_not_scale_image_data 打开时直接使用原始整数数据（memmap），BSCALE为正时线性缩放不改变归一化结果
+
+        Args:
+            hdul: fits.open 返回的HDUList
+
+        Returns:
+            Optional[np.ndarray]: 二维图像数据，没有数据时返回None
+        """
+        if len(hdul) == 0:
+            return None
+        hdu = hdul[0]
+        image_data = hdu.data
+        if image_data is None:
+            return None
+        bscale = hdu.header.get('BSCALE', 1)
+        if bscale <= 0:
+            # 非正的缩放系数会改变像素大小顺序，只能使用缩放后的数据
+            image_data = np.asarray(image_data, dtype=np.float32) * bscale + hdu.header.get('BZERO', 0)
+        # 如果是3D数据（例如带有颜色通道），取第一个通道
+        if len(image_data.shape) > 2:
+            image_data = image_data[0]
+        return image_data
+
+    def _render_thumbnail(self, image_data, thumbnail_path: str, size: tuple = (512, 512)) -> Optional[str]:
+        """
+        从已读取的图像数据生成缩略图：抽样估计百分位数，先块平均缩小再LANCZOS重采样
+
+        Args:
+            image_data: 二维图像数据
+            thumbnail_path: 缩略图保存路径
+            size: 缩略图尺寸
+
+        Returns:
+            Optional[str]: 缩略图保存路径，如果创建失败返回None
+        """
+        limits = self._estimate_percentiles(image_data)
+        decimated = self._decimate_image_data(image_data, size)
+        img = Image.fromarray(self._normalize_image_data(decimated, limits))
+        thumbnail_img = self._resize_image(img, size)
+
+        # 确保图像目录存在
+        if not self._ensure_image_dir_exists():
+            return None
+
+        thumbnail_img.save(thumbnail_path)
+        self.logger.debug(f"已生成缩略图: {thumbnail_path}")
+        return thumbnail_path
+
+    def _render_center_crop(self, image_data, crop_path: str, size: tuple = (200, 200)) -> Optional[str]:
+        """
+        从已读取的图像数据提取中心区域并保存（memmap时只读取中心区域的数据）
+
+        Args:
+            image_data: 二维图像数据
+            crop_path: 中心区域图保存路径
+            size: 中心区域图尺寸
+
+        Returns:
+            Optional[str]: 中心区域图保存路径，如果创建失败返回None
+        """
+        # 计算中心坐标
+        height, width = image_data.shape
+        center_y, center_x = height // 2, width // 2
+
+        # 计算裁剪区域，确保在图像范围内
+        crop_height, crop_width = size
+        half_height, half_width = crop_height // 2, crop_width // 2
+        start_y = max(0, center_y - half_height)
+        end_y = min(height, center_y + half_height)
+        start_x = max(0, center_x - half_width)
+        end_x = min(width, center_x + half_width)
+
+        center_data = np.asarray(image_data[start_y:end_y, start_x:end_x], dtype=np.float32)
+        img = Image.fromarray(self._normalize_image_data(center_data))
+
+        # 如果裁剪区域小于目标尺寸，调整大小
+        if img.size != size:
+            img = self._resize_image(img, size)
+
+        # 确保图像目录存在
+        if not self._ensure_image_dir_exists():
+            return None
+
+        img.save(crop_path)
+        self.logger.debug(f"已生成中心区域图: {crop_path}")
+        return crop_path
+
+    def _render_previews(self, fits_path: str, thumbnail_path: Optional[str], crop_path: Optional[str],
+                         thumbnail_size: tuple = (512, 512), crop_size: tuple = (200, 200)) -> Tuple[Optional[str], Optional[str]]:
+        """
+        只打开一次FITS文件（memmap），从同一份数据生成缩略图和中心区域图
+
+        Args:
+            fits_path: FITS文件路径
+            thumbnail_path: 缩略图保存路径，为None时不生成
+            crop_path: 中心区域图保存路径，为None时不生成
+            thumbnail_size: 缩略图尺寸
+            crop_size: 中心区域图尺寸
+
+        Returns:
+            Tuple[Optional[str], Optional[str]]: (缩略图路径, 中心区域图路径)，失败的项为None
+        """
+        if not PLOT_AVAILABLE:
+            self.logger.warning("图像处理库未安装，跳过图像生成")
+            return None, None
+
+        thumbnail_result = None
+        crop_result = None
+        try:
+            with fits.open(fits_path, memmap=True, do_not_scale_image_data=True) as hdul:
+                image_data = self._open_preview_data(hdul)
+                if image_data is None:
+                    self.logger.warning(f"FITS文件中没有图像数据: {fits_path}")
+                    return None, None
+
+                if thumbnail_path:
+                    try:
+                        thumbnail_result = self._render_thumbnail(image_data, thumbnail_path, thumbnail_size)
+                    except Exception as e:
+                        self.logger.error(f"生成缩略图失败 {fits_path}: {e}")
+
+                if crop_path:
+                    try:
+                        crop_result = self._render_center_crop(image_data, crop_path, crop_size)
+                    except Exception as e:
+                        self.logger.error(f"生成中心区域图失败 {fits_path}: {e}")
+
+                del image_data
+        except Exception as e:
+            self.logger.error(f"读取FITS文件失败 {fits_path}: {e}")
+
+        return thumbnail_result, crop_result
+
     def _create_thumbnail(self, fits_path: str, thumbnail_path: str, size: tuple = (512, 512)) -> Optional[str]:
         """
         为FITS文件创建缩略图
@@ -673,58 +932,7 @@ class FitsFileFinderRipgrep:
         Returns:
             Optional[str]: 缩略图保存路径，如果创建失败返回None
         """
-        if not PLOT_AVAILABLE:
-            self.logger.warning("图像处理库未安装，跳过缩略图生成")
-            return None
-        
-        try:
-            # 打开FITS文件并读取数据
-            with fits.open(fits_path) as hdul:
-                # 假设第一个HDU包含图像数据
-                if len(hdul) > 0:
-                    image_data = hdul[0].data
-                    
-                    # 检查数据类型
-                    if image_data is None:
-                        self.logger.warning(f"FITS文件中没有图像数据: {fits_path}")
-                        return None
-                    
-                    # 如果是3D数据（例如带有颜色通道），取第一个通道
-                    if len(image_data.shape) > 2:
-                        image_data = image_data[0]
-                    
-                    # 归一化图像数据
-                    normalized_data = self._normalize_image_data(image_data)
-                    
-                    # 创建PIL图像
-                    img = Image.fromarray(normalized_data)
-                    
-                    # 调整大小为缩略图尺寸
-                    # 兼容不同版本的Pillow
-                    try:
-                        # Pillow >= 10.0.0
-                        thumbnail_img = img.resize(size, Image.Resampling.LANCZOS)
-                    except AttributeError:
-                        # Pillow < 10.0.0
-                        thumbnail_img = img.resize(size, Image.LANCZOS)
-                    
-                    # 确保图像目录存在
-                    if not self._ensure_image_dir_exists():
-                        return None
-                    
-                    # 保存缩略图
-                    thumbnail_img.save(thumbnail_path)
-
-                    # 图像文件已生成，将通过 run_timestamp 识别
-
-                    self.logger.debug(f"已生成缩略图: {thumbnail_path}")
-                    return thumbnail_path
-                else:
-                    self.logger.warning(f"FITS文件为空: {fits_path}")
-                    return None
-        except Exception as e:
-            self.logger.error(f"生成缩略图失败 {fits_path}: {e}")
-            return None
+        return self._render_previews(fits_path, thumbnail_path, None, thumbnail_size=size)[0]
 
     def _create_center_crop(self, fits_path: str, crop_path: str, size: tuple = (200, 200)) -> Optional[str]:
         """
@@ -738,81 +946,36 @@ class FitsFileFinderRipgrep:
         Returns:
             Optional[str]: 中心区域图保存路径，如果创建失败返回None
         """
-        if not PLOT_AVAILABLE:
-            self.logger.warning("图像处理库未安装，跳过中心区域图生成")
-            return None
-        
-        try:
-            # 打开FITS文件并读取数据
-            with fits.open(fits_path) as hdul:
-                # 假设第一个HDU包含图像数据
-                if len(hdul) > 0:
-                    image_data = hdul[0].data
-                    
-                    # 检查数据类型
-                    if image_data is None:
-                        self.logger.warning(f"FITS文件中没有图像数据: {fits_path}")
-                        return None
-                    
-                    # 如果是3D数据（例如带有颜色通道），取第一个通道
-                    if len(image_data.shape) > 2:
-                        image_data = image_data[0]
-                    
-                    # 计算中心坐标
-                    height, width = image_data.shape
-                    center_y, center_x = height // 2, width // 2
-                    
-                    # 计算裁剪区域
-                    crop_height, crop_width = size
-                    half_height, half_width = crop_height // 2, crop_width // 2
-                    
-                    # 确保裁剪区域在图像范围内
-                    start_y = max(0, center_y - half_height)
-                    end_y = min(height, center_y + half_height)
-                    start_x = max(0, center_x - half_width)
-                    end_x = min(width, center_x + half_width)
-                    
-                    # 提取中心区域
-                    center_data = image_data[start_y:end_y, start_x:end_x]
-                    
-                    # 归一化图像数据
-                    normalized_data = self._normalize_image_data(center_data)
-                    
-                    # 创建PIL图像
-                    img = Image.fromarray(normalized_data)
-                    
-                    # 如果裁剪区域小于目标尺寸，调整大小
-                    if img.size != size:
-                        # 兼容不同版本的Pillow
-                        try:
-                            # Pillow >= 10.0.0
-                            img = img.resize(size, Image.Resampling.LANCZOS)
-                        except AttributeError:
-                            # Pillow < 10.0.0
-                            img = img.resize(size, Image.LANCZOS)
-                    
-                    # 确保图像目录存在
-                    if not self._ensure_image_dir_exists():
-                        return None
-                    
-                    # 保存中心区域图
-                    img.save(crop_path)
-
-                    # 图像文件已生成，将通过 run_timestamp 识别
-
-                    self.logger.debug(f"已生成中心区域图: {crop_path}")
-                    return crop_path
-                else:
-                    self.logger.warning(f"FITS文件为空: {fits_path}")
-                    return None
-        except Exception as e:
-            self.logger.error(f"生成中心区域图失败 {fits_path}: {e}")
-            return None
+        return self._render_previews(fits_path, None, crop_path, crop_size=size)[1]
 
     def process_fits_image(self, fits_path: str, create_thumbnail: bool = True, create_center_crop: bool = True) -> Dict[str, Optional[str]]:
         """
         处理单个FITS文件，生成缩略图和中心区域图
 
+        Args:
+            fits_path: FITS文件路径
+            create_thumbnail: 是否创建缩略图
+            create_center_crop: 是否创建中心区域图
+
+        Returns:
+            Dict[str, Optional[str]]: 包含图像路径的字典，包含绝对路径和相对路径
+        """
+        if self.scan_cache is not None:
+            cached_images = self.scan_cache.get_images(fits_path, self.output_dir, create_thumbnail, create_center_crop)
+            if cached_images is not None:
+                return cached_images
+
+        result = self._render_fits_image(fits_path, create_thumbnail, create_center_crop)
+
+        if self.scan_cache is not None:
+            self.scan_cache.put_images(fits_path, result)
+
+        return result
+
+    def _render_fits_image(self, fits_path: str, create_thumbnail: bool = True, create_center_crop: bool = True) -> Dict[str, Optional[str]]:
+        """
+        生成缩略图和中心区域图（不读写扫描缓存，可以在工作进程中执行）
+
         Args:
             fits_path: FITS文件路径
             create_thumbnail: 是否创建缩略图
@@ -832,10 +995,17 @@ class FitsFileFinderRipgrep:
         file_name = Path(fits_path).stem
         base_name = f"{file_name}"
 
+        thumbnail_path = os.path.join(self.image_dir, f"{base_name}_thumbnail.jpg") if create_thumbnail else None
+        center_crop_path = os.path.join(self.image_dir, f"{base_name}_center.jpg") if create_center_crop else None
+        if not thumbnail_path and not center_crop_path:
+            return result
+
+        # 只读取一次FITS文件，同时生成缩略图和中心区域图
+        thumbnail_absolute, center_crop_absolute = self._render_previews(fits_path, thumbnail_path, center_crop_path)
+
         # 生成缩略图
         if create_thumbnail:
-            thumbnail_path = os.path.join(self.image_dir, f"{base_name}_thumbnail.jpg")
-            absolute_path = self._create_thumbnail(fits_path, thumbnail_path)
+            absolute_path = thumbnail_absolute
             if absolute_path:
                 result['thumbnail'] = absolute_path
                 # 生成相对于输出目录的相对路径
@@ -850,8 +1020,7 @@ class FitsFileFinderRipgrep:
 
         # 生成中心区域图
         if create_center_crop:
-            center_crop_path = os.path.join(self.image_dir, f"{base_name}_center.jpg")
-            absolute_path = self._create_center_crop(fits_path, center_crop_path)
+            absolute_path = center_crop_absolute
             if absolute_path:
                 result['center_crop'] = absolute_path
                 # 生成相对于输出目录的相对路径
@@ -866,86 +1035,84 @@ class FitsFileFinderRipgrep:
 
         return result
 
-    def batch_process_fits_images(self, fits_files: List[str], create_thumbnail: bool = True, create_center_crop: bool = True, max_workers: int = 20) -> Dict[str, Dict[str, Optional[str]]]:
+    def _run_batch(self, executor: FitsTaskExecutor, func, items: List[str], get_cached=None, put_cached=None,
+                   on_error=None, prefetch=None, progress=None) -> List[Any]:
+        """
+        用执行器批量处理，结果按输入顺序返回
+
+        工作进程中没有扫描缓存，process/hybrid 模式下在主进程中先查缓存、只把未命中的文件交给进程池，再写回缓存
+
+        Args:
+            executor: 批量任务执行器
+            func: 处理单个文件的函数（process/hybrid 模式下需要可以pickle）
+            items: 文件路径列表
+            get_cached: 主进程中查询缓存的函数，未命中返回None
+            put_cached: 主进程中写入缓存的函数
+            on_error: 单个文件出错时生成结果的函数 on_error(文件路径, 错误信息)
+            prefetch: hybrid 模式下I/O线程预读文件的函数
+            progress: 进度回调 progress(已完成数, 总数)
+
+        Returns:
+            List[Any]: 与 items 顺序一致的结果列表
+        """
+        if self.scan_cache is None or get_cached is None or executor.backend in ('serial', 'thread'):
+            return executor.map(func, items, on_error=on_error, prefetch=prefetch, progress=progress)
+
+        results = [get_cached(item) for item in items]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            self.logger.info(f"缓存命中 {len(items) - len(missing)} 个文件，需要处理 {len(missing)} 个文件")
+            computed = executor.map(func, [items[i] for i in missing], on_error=on_error, prefetch=prefetch, progress=progress)
+            for i, result in zip(missing, computed):
+                results[i] = result
+                if put_cached is not None and result is not None:
+                    put_cached(items[i], result)
+        return results
+
+    def batch_process_fits_images(self, fits_files: List[str], create_thumbnail: bool = True, create_center_crop: bool = True, max_workers: Optional[int] = None) -> Dict[str, Dict[str, Optional[str]]]:
         """
-        批量处理FITS文件，为每个文件生成缩略图和中心区域图（多线程版本）
+        批量处理FITS文件，为每个文件生成缩略图和中心区域图
+
+        执行方式由配置 options.executor.images_backend 决定（默认 hybrid：I/O线程预读文件，CPU进程生成图像）
 
         Args:
             fits_files: FITS文件路径列表
             create_thumbnail: 是否创建缩略图
             create_center_crop: 是否创建中心区域图
-            max_workers: 最大线程数，默认为20
+            max_workers: 最大工作数，默认None表示使用配置（配置为0时按物理核心数自动确定）
 
         Returns:
-            Dict[str, Dict[str, Optional[str]]]: 以FITS文件路径为键，包含图像路径的字典
+            Dict[str, Dict[str, Optional[str]]]: 以FITS文件路径为键（与输入顺序一致），包含图像路径的字典
         """
-        results = {}
-
         total_files = len(fits_files)
-        self.logger.info(f"开始批量处理 {total_files} 个FITS文件的图像（使用 {max_workers} 个线程）")
+        executor = self._create_executor('images', max_workers)
+        self.logger.info(f"开始批量处理 {total_files} 个FITS文件的图像（使用 {executor.describe()}）")
 
         # 确保图像目录存在
         if not self._ensure_image_dir_exists():
             self.logger.error("无法创建图像目录，跳过图像生成")
             return {}
 
-        # 使用线程锁保护进度计数器
-        progress_lock = threading.Lock()
-        completed_count = [0]  # 使用列表以便在闭包中修改
-
-        def process_single_image(fits_file: str) -> Tuple[str, Dict[str, Optional[str]]]:
-            """处理单个FITS文件图像的内部函数"""
-            try:
-                image_paths = self.process_fits_image(fits_file, create_thumbnail, create_center_crop)
-
-                # 更新进度
-                with progress_lock:
-                    completed_count[0] += 1
-                    current_count = completed_count[0]
-                    if current_count % 10 == 0 or current_count == total_files:
-                        self.logger.info(f"处理进度: {current_count}/{total_files}")
-
-                return fits_file, image_paths
-            except Exception as e:
-                self.logger.error(f"处理图像文件 {fits_file} 时出错: {e}")
-                # 返回空结果
-                empty_result = {
-                    'thumbnail': None,
-                    'center_crop': None,
-                    'thumbnail_relative': None,
-                    'center_crop_relative': None
-                }
-
-                # 更新进度
-                with progress_lock:
-                    completed_count[0] += 1
-                    current_count = completed_count[0]
-                    if current_count % 10 == 0 or current_count == total_files:
-                        self.logger.info(f"处理进度: {current_count}/{total_files}")
-
-                return fits_file, empty_result
-
-        # 使用ThreadPoolExecutor进行多线程处理
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
-            future_to_file = {executor.submit(process_single_image, fits_file): fits_file
-                             for fits_file in fits_files}
+        def empty_result(fits_file: str, error: str) -> Dict[str, Optional[str]]:
+            return {
+                'thumbnail': None,
+                'center_crop': None,
+                'thumbnail_relative': None,
+                'center_crop_relative': None
+            }
 
-            # 收集结果
-            for future in as_completed(future_to_file):
-                try:
-                    fits_file, image_paths = future.result()
-                    results[fits_file] = image_paths
-                except Exception as e:
-                    fits_file = future_to_file[future]
-                    self.logger.error(f"获取文件 {fits_file} 处理结果时出错: {e}")
-                    # 添加空结果
-                    results[fits_file] = {
-                        'thumbnail': None,
-                        'center_crop': None,
-                        'thumbnail_relative': None,
-                        'center_crop_relative': None
-                    }
+        last_logged = [0]
+        image_results = self._run_batch(
+            executor,
+            partial(self.process_fits_image if executor.backend in ('serial', 'thread') else self._render_fits_image,
+                    create_thumbnail=create_thumbnail, create_center_crop=create_center_crop),
+            fits_files,
+            get_cached=lambda fits_file: self.scan_cache.get_images(fits_file, self.output_dir, create_thumbnail, create_center_crop),
+            put_cached=self.scan_cache.put_images if self.scan_cache is not None else None,
+            on_error=empty_result,
+            prefetch=prefetch_file,
+            progress=lambda completed, total: self._log_progress(completed, total, last_logged))
+        results = dict(zip(fits_files, image_results))
 
         # 统计结果
         success_thumbnails = sum(1 for paths in results.values() if paths['thumbnail'] is not None)
@@ -955,6 +1122,76 @@ class FitsFileFinderRipgrep:
 
         return results
     
+    def _compile_path_rules(self, rules: List[Dict[str, Any]]) -> List[Tuple[str, Any, str, str, bool]]:
+        """
+        预编译路径规则（path_filters / path_includes），避免每个文件重复编译正则
+
+        Args:
+            rules: 配置中的规则列表
+
+        Returns:
+            List[Tuple[str, Any, str, str, bool]]: (规则类型, 编译后的匹配器, 文件类型, 原始模式, 是否区分大小写) 列表
+                - regex/glob: 编译后的正则表达式，不区分大小写时使用 re.IGNORECASE
+                - contains: 匹配用的字符串，不区分大小写时为小写
+        """
+        compiled_rules = []
+        for rule in rules:
+            rule_type = rule.get('type', 'regex')
+            pattern = rule.get('pattern', '')
+            case_sensitive = rule.get('case_sensitive', False)
+            file_type = rule.get('file_type', 'unknown')
+            flags = 0 if case_sensitive else re.IGNORECASE
+
+            try:
+                if rule_type == 'regex':
+                    matcher = re.compile(pattern, flags)
+                elif rule_type == 'glob':
+                    matcher = re.compile(fnmatch.translate(pattern), flags)
+                elif rule_type == 'contains':
+                    matcher = pattern if case_sensitive else pattern.lower()
+                else:
+                    continue
+            except re.error as e:
+                self.logger.error(f"路径规则编译失败 {pattern}: {e}")
+                continue
+
+            compiled_rules.append((rule_type, matcher, file_type, pattern, case_sensitive))
+        return compiled_rules
+
+    def _get_compiled_path_rules(self) -> Dict[str, List[Tuple[str, Any, str, str, bool]]]:
+        """
+        获取预编译的路径规则，配置加载后只编译一次
+
+        Returns:
+            Dict[str, List[Tuple[str, Any, str, str, bool]]]: 包含 'filters' 和 'includes' 两组规则
+        """
+        if self._compiled_path_rules is None:
+            options = self.config.get('options', {})
+            self._compiled_path_rules = {
+                'filters': self._compile_path_rules(options.get('path_filters', [])),
+                'includes': self._compile_path_rules(options.get('path_includes', []))
+            }
+        return self._compiled_path_rules
+
+    def _match_path_rule(self, rule: Tuple[str, Any, str, str, bool], normalized_path: str, lower_path: str) -> bool:
+        """
+        用单条预编译规则匹配路径
+
+        Args:
+            rule: _compile_path_rules 生成的规则
+            normalized_path: 使用 / 分隔的路径
+            lower_path: 小写的 normalized_path
+
+        Returns:
+            bool: 是否匹配
+        """
+        rule_type, matcher, _, _, case_sensitive = rule
+        if rule_type == 'regex':
+            return matcher.search(normalized_path) is not None
+        if rule_type == 'glob':
+            return matcher.match(normalized_path) is not None
+        return matcher in (normalized_path if case_sensitive else lower_path)
+
     def _should_filter_path(self, path: str) -> bool:
         """
         检查路径是否应该被过滤掉
@@ -965,45 +1202,19 @@ class FitsFileFinderRipgrep:
         Returns:
             bool: 如果路径应该被过滤返回True，否则返回False
         """
-        path_filters = self.config.get('options', {}).get('path_filters', [])
+        path_filters = self._get_compiled_path_rules()['filters']
         
         if not path_filters:
             return False
         
         # 标准化路径用于匹配
         normalized_path = path.replace('\\', '/')
+        lower_path = normalized_path.lower()
         
-        for filter_config in path_filters:
-            filter_type = filter_config.get('type', 'regex')
-            filter_pattern = filter_config.get('pattern', '')
-            case_sensitive = filter_config.get('case_sensitive', False)
-            
-            if not case_sensitive:
-                normalized_path_check = normalized_path.lower()
-                filter_pattern_check = filter_pattern.lower()
-            else:
-                normalized_path_check = normalized_path
-                filter_pattern_check = filter_pattern
-            
-            try:
-                if filter_type == 'regex':
-                    flags = 0 if case_sensitive else re.IGNORECASE
-                    if re.search(filter_pattern_check, normalized_path_check, flags):
-                        self.logger.debug(f"路径被过滤: {path} (匹配规则: {filter_pattern})")
-                        return True
-                elif filter_type == 'contains':
-                    if filter_pattern_check in normalized_path_check:
-                        self.logger.debug(f"路径被过滤: {path} (包含: {filter_pattern})")
-                        return True
-                elif filter_type == 'glob':
-                    import fnmatch
-                    if fnmatch.fnmatch(normalized_path_check, filter_pattern_check):
-                        self.logger.debug(f"路径被过滤: {path} (glob匹配: {filter_pattern})")
-                        return True
-                        
-            except Exception as e:
-                self.logger.error(f"路径过滤规则错误: {e}")
-                continue
+        for rule in path_filters:
+            if self._match_path_rule(rule, normalized_path, lower_path):
+                self.logger.debug(f"路径被过滤: {path} (匹配规则: {rule[3]})")
+                return True
         
         return False
     
@@ -1017,40 +1228,15 @@ class FitsFileFinderRipgrep:
         Returns:
             str: 文件类型标识
         """
-        path_includes = self.config.get('options', {}).get('path_includes', [])
+        path_includes = self._get_compiled_path_rules()['includes']
 
         # 标准化路径用于匹配
         normalized_path = path.replace('\\', '/')
+        lower_path = normalized_path.lower()
 
-        for include_config in path_includes:
-            include_type = include_config.get('type', 'regex')
-            include_pattern = include_config.get('pattern', '')
-            case_sensitive = include_config.get('case_sensitive', False)
-            file_type = include_config.get('file_type', 'unknown')
-
-            if not case_sensitive:
-                normalized_path_check = normalized_path.lower()
-                include_pattern_check = include_pattern.lower()
-            else:
-                normalized_path_check = normalized_path
-                include_pattern_check = include_pattern
-
-            try:
-                if include_type == 'regex':
-                    flags = 0 if case_sensitive else re.IGNORECASE
-                    if re.search(include_pattern_check, normalized_path_check, flags):
-                        return file_type
-                elif include_type == 'contains':
-                    if include_pattern_check in normalized_path_check:
-                        return file_type
-                elif include_type == 'glob':
-                    import fnmatch
-                    if fnmatch.fnmatch(normalized_path_check, include_pattern_check):
-                        return file_type
-
-            except Exception as e:
-                self.logger.error(f"文件类型判断规则错误: {e}")
-                continue
+        for rule in path_includes:
+            if self._match_path_rule(rule, normalized_path, lower_path):
+                return rule[2]
 
         return 'unknown'
 
@@ -1064,7 +1250,7 @@ class FitsFileFinderRipgrep:
         Returns:
             bool: 如果路径应该被包含返回True，否则返回False
         """
-        path_includes = self.config.get('options', {}).get('path_includes', [])
+        path_includes = self._get_compiled_path_rules()['includes']
         
         # 如果没有配置包含规则，则包含所有路径
         if not path_includes:
@@ -1072,38 +1258,12 @@ class FitsFileFinderRipgrep:
         
         # 标准化路径用于匹配
         normalized_path = path.replace('\\', '/')
+        lower_path = normalized_path.lower()
         
-        for include_config in path_includes:
-            include_type = include_config.get('type', 'regex')
-            include_pattern = include_config.get('pattern', '')
-            case_sensitive = include_config.get('case_sensitive', False)
-            
-            if not case_sensitive:
-                normalized_path_check = normalized_path.lower()
-                include_pattern_check = include_pattern.lower()
-            else:
-                normalized_path_check = normalized_path
-                include_pattern_check = include_pattern
-            
-            try:
-                if include_type == 'regex':
-                    flags = 0 if case_sensitive else re.IGNORECASE
-                    if re.search(include_pattern_check, normalized_path_check, flags):
-                        self.logger.debug(f"路径被包含: {path} (匹配规则: {include_pattern})")
-                        return True
-                elif include_type == 'contains':
-                    if include_pattern_check in normalized_path_check:
-                        self.logger.debug(f"路径被包含: {path} (包含: {include_pattern})")
-                        return True
-                elif include_type == 'glob':
-                    import fnmatch
-                    if fnmatch.fnmatch(normalized_path_check, include_pattern_check):
-                        self.logger.debug(f"路径被包含: {path} (glob匹配: {include_pattern})")
-                        return True
-                        
-            except Exception as e:
-                self.logger.error(f"路径包含规则错误: {e}")
-                continue
+        for rule in path_includes:
+            if self._match_path_rule(rule, normalized_path, lower_path):
+                self.logger.debug(f"路径被包含: {path} (匹配规则: {rule[3]})")
+                return True
         
         # 如果有包含规则但都不匹配，则不包含此路径
         return False
@@ -1122,6 +1282,11 @@ class FitsFileFinderRipgrep:
                 - timestamp: 时间戳 (如 UTC20250421_170640)
                 - original_path: 原始路径
         """
+        if self.scan_cache is not None:
+            cached_info = self.scan_cache.get_fits_info(file_path)
+            if cached_info is not None:
+                return cached_info
+
         result = {
             'sky_region': None,
             'system_name': None,
@@ -1173,6 +1338,9 @@ class FitsFileFinderRipgrep:
         except Exception as e:
             self.logger.error(f"提取文件信息时出错 {file_path}: {e}")
 
+        if self.scan_cache is not None:
+            self.scan_cache.put_fits_info(file_path, result)
+
         return result
 
     def cluster_data_by_region_and_time(self, extracted_info: List[Dict[str, Optional[str]]], time_threshold_minutes: int = 30) -> List[Dict[str, Any]]:
@@ -1339,13 +1507,15 @@ class FitsFileFinderRipgrep:
 
         return file_lists
 
-    def extract_batch_fits_info(self, file_paths: List[str], max_workers: int = 20) -> List[Dict[str, Optional[str]]]:
+    def extract_batch_fits_info(self, file_paths: List[str], max_workers: Optional[int] = None) -> List[Dict[str, Optional[str]]]:
         """
-        批量提取FITS文件信息（多线程版本）
+        批量提取FITS文件信息
+
+        解析文件名是纯Python的轻量计算，默认串行执行（options.executor.fits_info_backend）
 
         Args:
             file_paths: FITS文件路径列表
-            max_workers: 最大线程数，默认为20
+            max_workers: 最大工作数，默认None表示使用配置
 
         Returns:
             List[Dict[str, Optional[str]]]: 提取信息的列表
@@ -1355,44 +1525,28 @@ class FitsFileFinderRipgrep:
         if total_files == 0:
             return []
 
-        # 如果文件数量较少，直接使用单线程处理
-        if total_files < max_workers:
-            results = []
-            for file_path in file_paths:
-                info = self.extract_fits_info(file_path)
-                results.append(info)
-            return results
-
-        self.logger.info(f"开始批量提取 {total_files} 个FITS文件信息（使用 {max_workers} 个线程）")
-
-        # 使用ThreadPoolExecutor进行多线程处理
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
-            future_to_file = {executor.submit(self.extract_fits_info, file_path): file_path
-                             for file_path in file_paths}
-
-            # 收集结果，保持原始顺序
-            file_to_result = {}
-            for future in as_completed(future_to_file):
-                file_path = future_to_file[future]
-                try:
-                    result = future.result()
-                    file_to_result[file_path] = result
-                except Exception as e:
-                    self.logger.error(f"提取文件信息 {file_path} 时出错: {e}")
-                    # 创建错误结果
-                    error_result = {
-                        'sky_region': None,
-                        'system_name': None,
-                        'timestamp': None,
-                        'original_path': file_path
-                    }
-                    file_to_result[file_path] = error_result
+        executor = self._create_executor('fits_info', max_workers)
+        if executor.backend != 'serial':
+            self.logger.info(f"开始批量提取 {total_files} 个FITS文件信息（使用 {executor.describe()}）")
 
-        # 按原始顺序重新排列结果
-        results = [file_to_result[file_path] for file_path in file_paths]
+        def error_result(file_path: str, error: str) -> Dict[str, Optional[str]]:
+            return {
+                'sky_region': None,
+                'system_name': None,
+                'timestamp': None,
+                'original_path': file_path
+            }
+
+        results = self._run_batch(
+            executor,
+            self.extract_fits_info,
+            file_paths,
+            get_cached=self.scan_cache.get_fits_info if self.scan_cache is not None else None,
+            put_cached=self.scan_cache.put_fits_info if self.scan_cache is not None else None,
+            on_error=error_result)
 
-        self.logger.info(f"批量提取完成，共处理 {len(results)} 个文件")
+        if executor.backend != 'serial':
+            self.logger.info(f"批量提取完成，共处理 {len(results)} 个文件")
         return results
 
     def read_pp_fits_header(self, fits_path: str) -> Dict[str, Optional[str]]:
@@ -1405,6 +1559,11 @@ class FitsFileFinderRipgrep:
         Returns:
             包含header信息的字典
         """
+        if self.scan_cache is not None:
+            cached_header = self.scan_cache.get_header(fits_path)
+            if cached_header is not None:
+                return cached_header
+
         result = {
             'file_path': fits_path,
             'file_name': Path(fits_path).name,
@@ -1415,86 +1574,62 @@ class FitsFileFinderRipgrep:
         }
 
         try:
-            with fits.open(fits_path) as hdul:
-                header = hdul[0].header
+            # 只读取主header的2880字节块，格式异常时回退到astropy
+            header = read_header_keywords_safe(fits_path, PP_FITS_HEADER_KEYS)
 
-                # 读取指定的header字段
-                for key in ['LM5SIG', 'ELLIPTI', 'FWHM']:
-                    if key in header:
-                        result[key] = str(header[key])
-                    else:
-                        result[key] = 'N/A'
+            # 读取指定的header字段
+            for key in PP_FITS_HEADER_KEYS:
+                result[key] = header.get(key, 'N/A')
 
-                self.logger.debug(f"成功读取 {Path(fits_path).name} 的header信息")
+            self.logger.debug(f"成功读取 {Path(fits_path).name} 的header信息")
 
         except Exception as e:
             error_msg = f"读取失败: {str(e)}"
             result['error'] = error_msg
             self.logger.error(f"{Path(fits_path).name} - {error_msg}")
 
+        if self.scan_cache is not None:
+            self.scan_cache.put_header(fits_path, result)
+
         return result
 
-    def batch_read_pp_fits_headers(self, pp_fits_files: List[str], max_workers: int = 20) -> List[Dict[str, Optional[str]]]:
+    def batch_read_pp_fits_headers(self, pp_fits_files: List[str], max_workers: Optional[int] = None) -> List[Dict[str, Optional[str]]]:
         """
-        批量读取PP FITS文件的header信息（多线程版本）
+        批量读取PP FITS文件的header信息
+
+        读取header是I/O密集任务，默认使用线程（options.executor.headers_backend），线程数按逻辑核心数自动确定
 
         Args:
             pp_fits_files: PP FITS文件路径列表
-            max_workers: 最大线程数，默认为20
+            max_workers: 最大工作数，默认None表示使用配置
 
         Returns:
             包含所有文件header信息的列表
         """
-        results = []
         total_files = len(pp_fits_files)
+        executor = self._create_executor('headers', max_workers)
+
+        self.logger.info(f"开始批量读取 {total_files} 个PP FITS文件的header信息（使用 {executor.describe()}）")
+
+        def error_result(fits_file: str, error: str) -> Dict[str, Optional[str]]:
+            return {
+                'file_path': fits_file,
+                'file_name': Path(fits_file).name,
+                'LM5SIG': None,
+                'ELLIPTI': None,
+                'FWHM': None,
+                'error': f"批量处理错误: {error}"
+            }
 
-        self.logger.info(f"开始批量读取 {total_files} 个PP FITS文件的header信息（使用 {max_workers} 个线程）")
-
-        # 使用线程锁保护进度计数器
-        progress_lock = threading.Lock()
-        completed_count = [0]  # 使用列表以便在闭包中修改
-
-        def process_single_file(fits_file: str) -> Dict[str, Optional[str]]:
-            """处理单个文件的内部函数"""
-            header_info = self.read_pp_fits_header(fits_file)
-
-            # 更新进度
-            with progress_lock:
-                completed_count[0] += 1
-                current_count = completed_count[0]
-                if current_count % 10 == 0 or current_count == total_files:
-                    self.logger.info(f"处理进度: {current_count}/{total_files}")
-
-            return header_info
-
-        # 使用ThreadPoolExecutor进行多线程处理
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有任务
-            future_to_file = {executor.submit(process_single_file, fits_file): fits_file
-                             for fits_file in pp_fits_files}
-
-            # 收集结果，保持原始顺序
-            file_to_result = {}
-            for future in as_completed(future_to_file):
-                fits_file = future_to_file[future]
-                try:
-                    result = future.result()
-                    file_to_result[fits_file] = result
-                except Exception as e:
-                    self.logger.error(f"处理文件 {fits_file} 时出错: {e}")
-                    # 创建错误结果
-                    error_result = {
-                        'file_path': fits_file,
-                        'file_name': Path(fits_file).name,
-                        'LM5SIG': None,
-                        'ELLIPTI': None,
-                        'FWHM': None,
-                        'error': f"多线程处理错误: {str(e)}"
-                    }
-                    file_to_result[fits_file] = error_result
-
-        # 按原始顺序重新排列结果
-        results = [file_to_result[fits_file] for fits_file in pp_fits_files]
+        last_logged = [0]
+        results = self._run_batch(
+            executor,
+            self.read_pp_fits_header,
+            pp_fits_files,
+            get_cached=self.scan_cache.get_header if self.scan_cache is not None else None,
+            put_cached=self.scan_cache.put_header if self.scan_cache is not None else None,
+            on_error=error_result,
+            progress=lambda completed, total: self._log_progress(completed, total, last_logged))
 
         self.logger.info(f"批量读取完成，共处理 {len(results)} 个文件")
         return results
@@ -1554,9 +1689,183 @@ class FitsFileFinderRipgrep:
             self.logger.error(f"创建压缩包失败: {e}")
             return None
 
+    def _build_file_name_matcher(self) -> Optional[re.Pattern]:
+        """
+        将 file_patterns 中的 glob/regex/exact/contains 模式合并为一个正则表达式，用于单次遍历时匹配文件名
+
+        Returns:
+            Optional[re.Pattern]: 编译后的正则表达式，没有有效模式时返回None
+        """
+        parts = []
+        for pattern_config in self.config.get('file_patterns', []):
+            pattern_type = pattern_config.get('type', 'glob')
+            pattern_value = pattern_config.get('pattern', '')
+            case_sensitive = pattern_config.get('case_sensitive', False)
+
+            if not pattern_value:
+                continue
+            if pattern_type == 'glob':
+                part = f"^{fnmatch.translate(pattern_value)}"
+            elif pattern_type == 'regex':
+                part = pattern_value
+            elif pattern_type == 'exact':
+                part = f"^{re.escape(pattern_value)}$"
+            elif pattern_type == 'contains':
+                part = re.escape(pattern_value)
+            else:
+                continue
+            parts.append(f"(?:{part})" if case_sensitive else f"(?i:{part})")
+
+        if not parts:
+            return None
+
+        try:
+            return re.compile('|'.join(parts))
+        except re.error as e:
+            self.logger.error(f"文件匹配模式编译失败: {e}")
+            return None
+
+    def _crawl_directory(self, directory: str, name_matcher: re.Pattern, recursive: bool = True) -> List[str]:
+        """
+        单次遍历目录，用合并后的正则匹配文件名
+
+        启用扫描缓存时，mtime 未变化的目录直接使用缓存的列表，只对变化的目录执行 scandir
+
+        Args:
+            directory: 搜索目录
+            name_matcher: _build_file_name_matcher 生成的正则表达式
+            recursive: 是否递归子目录
+
+        Returns:
+            List[str]: 匹配的文件路径列表
+        """
+        found_files = []
+        pending_dirs = [directory]
+
+        while pending_dirs:
+            current_dir = pending_dirs.pop()
+
+            if self.scan_cache is not None:
+                try:
+                    dir_mtime_ns = os.stat(current_dir).st_mtime_ns
+                except OSError as e:
+                    self.logger.warning(f"无法读取目录 {current_dir}: {e}")
+                    continue
+                cached_listing = self.scan_cache.get_dir(current_dir, dir_mtime_ns)
+                if cached_listing is not None:
+                    subdirs, file_names = cached_listing
+                    if recursive:
+                        pending_dirs.extend(subdirs)
+                    found_files.extend(os.path.join(current_dir, name) for name in file_names if name_matcher.search(name))
+                    continue
+
+            subdirs = []
+            file_names = []
+            try:
+                with os.scandir(current_dir) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                            elif entry.is_file(follow_symlinks=False):
+                                file_names.append(entry.name)
+                                if name_matcher.search(entry.name):
+                                    found_files.append(entry.path)
+                                    if self.scan_cache is not None:
+                                        entry_stat = entry.stat(follow_symlinks=False)
+                                        self.scan_cache.set_stat(entry.path, entry_stat.st_mtime_ns, entry_stat.st_size)
+                        except OSError as e:
+                            self.logger.debug(f"无法读取目录项 {entry.path}: {e}")
+                            continue
+            except OSError as e:
+                self.logger.warning(f"无法读取目录 {current_dir}: {e}")
+                continue
+
+            if recursive:
+                pending_dirs.extend(subdirs)
+            if self.scan_cache is not None:
+                self.scan_cache.put_dir(current_dir, dir_mtime_ns, subdirs, file_names)
+
+        return found_files
+
+    def _ripgrep_directory(self, directory: str) -> List[str]:
+        """
+        使用ripgrep搜索目录，每个 file_patterns 模式调用一次 ripgrep.files
+
+        Args:
+            directory: 搜索目录
+
+        Returns:
+            List[str]: 匹配的文件路径列表（可能包含重复项）
+        """
+        found_files = []
+        file_patterns = self.config.get('file_patterns', [])
+
+        for pattern_config in file_patterns:
+            pattern = pattern_config.get('pattern', '')
+            pattern_type = pattern_config.get('type', 'glob')
+
+            self.logger.debug(f"使用模式搜索: {pattern} (类型: {pattern_type})")
+
+            try:
+                # 使用python-ripgrep的files函数搜索文件
+                files_result = ripgrep.files(
+                    patterns=[pattern],
+                    paths=[directory],
+                    globs=[pattern] if pattern_type == 'glob' else None
+                )
+
+                for file_info in files_result:
+                    if isinstance(file_info, str):
+                        file_path = file_info
+                    elif isinstance(file_info, dict):
+                        file_path = file_info.get('path', '')
+                    else:
+                        continue
+
+                    if file_path:
+                        found_files.append(file_path)
+
+            except Exception as e:
+                self.logger.error(f"执行ripgrep时出错: {e}")
+                continue
+
+        return found_files
+
+    def _classify_found_files(self, file_paths: List[str], files_by_type: Dict[str, List[str]], seen_files: set) -> None:
+        """
+        对找到的文件应用路径过滤、包含规则并按类型分类，使用集合去重
+
+        Args:
+            file_paths: 文件路径列表
+            files_by_type: 按类型分类的结果字典（原地更新）
+            seen_files: 已处理过的文件路径集合（原地更新）
+        """
+        for file_path in file_paths:
+            if file_path in seen_files:
+                continue
+            seen_files.add(file_path)
+
+            # 应用路径过滤
+            if self._should_filter_path(file_path):
+                continue
+
+            # 应用路径包含过滤
+            if not self._should_include_path(file_path):
+                continue
+
+            # 确定文件类型并按类型分类存储
+            file_type = self._get_file_type_from_path(file_path)
+            files_by_type.setdefault(file_type, []).append(file_path)
+            self.logger.debug(f"找到匹配文件 ({file_type}): {file_path}")
+
     def find_files_by_type(self) -> Dict[str, List[str]]:
         """
-        使用ripgrep查找匹配的文件，按文件类型分类返回
+        查找匹配的文件，按文件类型分类返回
+
+        搜索方式由配置 options.crawl_mode 决定：
+            - single_pass（默认）: 每个目录只遍历一次，所有模式合并为一个正则，目录间用线程池并行（options.crawl_workers）
+            - ripgrep: 每个 (目录, 模式) 调用一次 ripgrep.files
 
         Returns:
             Dict[str, List[str]]: 按文件类型分类的文件路径字典
@@ -1566,6 +1875,7 @@ class FitsFileFinderRipgrep:
             return {}
 
         files_by_type = {}
+        seen_files = set()
         search_directories = self._get_search_directories_with_date()
         patterns = self._build_ripgrep_patterns()
 
@@ -1573,12 +1883,17 @@ class FitsFileFinderRipgrep:
             self.logger.warning("没有找到有效的搜索模式")
             return {}
 
-        self.logger.info(f"开始搜索，目录数量: {len(search_directories)}, 模式数量: {len(patterns)}")
+        options = self.config.get('options', {})
+        crawl_mode = options.get('crawl_mode', 'single_pass')
+        recursive = options.get('recursive_search', True)
+
+        self.logger.info(f"开始搜索，目录数量: {len(search_directories)}, 模式数量: {len(patterns)}, 搜索方式: {crawl_mode}")
         if self.ignore_date:
             self.logger.info("忽略日期后缀，搜索所有基础目录")
         else:
             self.logger.info(f"使用日期后缀: {self.date_suffix}")
 
+        existing_directories = []
         for directory in search_directories:
             normalized_dir = self._normalize_path(directory)
 
@@ -1587,66 +1902,39 @@ class FitsFileFinderRipgrep:
                 continue
 
             self.logger.info(f"搜索目录: {normalized_dir}")
+            existing_directories.append(normalized_dir)
 
-            try:
-                # 使用ripgrep搜索文件
-                file_patterns = self.config.get('file_patterns', [])
-                recursive = self.config.get('options', {}).get('recursive_search', True)
-
-                for pattern_config in file_patterns:
-                    pattern = pattern_config.get('pattern', '')
-                    pattern_type = pattern_config.get('type', 'glob')
-
-                    self.logger.debug(f"使用模式搜索: {pattern} (类型: {pattern_type})")
-
-                    try:
-                        # 使用python-ripgrep的files函数搜索文件
-                        files_result = ripgrep.files(
-                            patterns=[pattern],
-                            paths=[normalized_dir],
-                            globs=[pattern] if pattern_type == 'glob' else None
-                        )
-
-                        for file_info in files_result:
-                            if isinstance(file_info, str):
-                                file_path = file_info
-                            elif isinstance(file_info, dict):
-                                file_path = file_info.get('path', '')
-                            else:
-                                continue
-
-                            if not file_path:
-                                continue
-
-                            # 应用路径过滤
-                            if self._should_filter_path(file_path):
-                                continue
-
-                            # 应用路径包含过滤
-                            if not self._should_include_path(file_path):
-                                continue
-
-                            # 确定文件类型
-                            file_type = self._get_file_type_from_path(file_path)
-
-                            # 按类型分类存储
-                            if file_type not in files_by_type:
-                                files_by_type[file_type] = []
-
-                            if file_path not in files_by_type[file_type]:
-                                files_by_type[file_type].append(file_path)
-                                self.logger.debug(f"找到匹配文件 ({file_type}): {file_path}")
-
-                    except Exception as e:
-                        self.logger.error(f"执行ripgrep时出错: {e}")
-                        continue
-
-            except Exception as e:
-                self.logger.error(f"搜索目录时出错 {normalized_dir}: {e}")
-                continue
+        # 完整搜索过的目录，用于清理扫描缓存中已不存在的文件
+        scanned_directories = list(existing_directories)
+        if crawl_mode == 'ripgrep':
+            for normalized_dir in existing_directories:
+                try:
+                    self._classify_found_files(self._ripgrep_directory(normalized_dir), files_by_type, seen_files)
+                except Exception as e:
+                    self.logger.error(f"搜索目录时出错 {normalized_dir}: {e}")
+                    scanned_directories.remove(normalized_dir)
+                    continue
+        else:
+            name_matcher = self._build_file_name_matcher()
+            if name_matcher is None:
+                self.logger.warning("没有找到有效的搜索模式")
+                return {}
+
+            crawl_workers = max(1, min(options.get('crawl_workers', 6), len(existing_directories) or 1))
+            # 网络共享目录以IO等待为主，各目录用线程并行遍历，结果按目录顺序合并
+            with ThreadPoolExecutor(max_workers=crawl_workers) as executor:
+                crawl_results = executor.map(lambda d: self._crawl_directory(d, name_matcher, recursive), existing_directories)
+                for normalized_dir, found_files in zip(existing_directories, crawl_results):
+                    self._classify_found_files(found_files, files_by_type, seen_files)
+                    self.logger.debug(f"目录 {normalized_dir} 匹配 {len(found_files)} 个文件")
+
+        if self.scan_cache is not None:
+            removed_count = self.scan_cache.prune_files(scanned_directories, seen_files)
+            if removed_count:
+                self.logger.info(f"扫描缓存中删除已不存在的文件 {removed_count} 个")
 
         # 应用最大结果数限制
-        max_results = self.config.get('options', {}).get('max_results', 10000)
+        max_results = options.get('max_results', 10000)
         total_files = sum(len(files) for files in files_by_type.values())
 
         if total_files > max_results:
@@ -1696,6 +1984,17 @@ class FitsFileFinderRipgrep:
         """
         return self.find_files_by_type()
     
+    def save_scan_cache(self) -> bool:
+        """
+        保存增量扫描缓存（未启用缓存时直接返回True）
+
+        Returns:
+            bool: 保存成功返回True，失败返回False
+        """
+        if self.scan_cache is None:
+            return True
+        return self.scan_cache.save()
+
     def save_results(self, files: List[str], output_file: str = None, include_extracted_info: bool = True, use_clustering: bool = True, time_threshold_minutes: int = 30) -> bool:
         """
         保存搜索结果到文件
@@ -1779,7 +2078,7 @@ class FitsFileFinderRipgrep:
             self.logger.error(f"保存结果失败: {e}")
             return False
 
-    def save_results_by_type(self, files_by_type: Dict[str, List[str]], output_file: str = None, include_extracted_info: bool = True, use_clustering: bool = True, time_threshold_minutes: int = 30, save_text_file: bool = False, generate_images: bool = False) -> dict:
+    def save_results_by_type(self, files_by_type: Dict[str, List[str]], output_file: str = None, include_extracted_info: bool = True, use_clustering: bool = True, time_threshold_minutes: int = 30, save_text_file: bool = False, generate_images: bool = False, match_tolerance_seconds: int = 0) -> dict:
         """
         保存按类型分类的搜索结果到文件
 
@@ -1791,6 +2090,7 @@ class FitsFileFinderRipgrep:
             time_threshold_minutes: 时间阈值（分钟）
             save_text_file: 是否保存文本文件，默认为False
             generate_images: 是否为FITS文件生成缩略图和中心区域图，默认为False
+            match_tolerance_seconds: 关联文件时间戳容差匹配（秒），默认为0即只做精确匹配
 
         Returns:
             dict: 包含保存结果信息，格式为 {"success": bool, "js_filename": str}
@@ -1908,7 +2208,7 @@ class FitsFileFinderRipgrep:
 
                 # 匹配其他类型文件到.fit文件
                 other_files = {k: v for k, v in files_by_type.items() if k != 'fit'}
-                fit_matches = self.match_related_files_to_fit(fit_files, other_files, generate_images)
+                fit_matches = self.match_related_files_to_fit(fit_files, other_files, generate_images, match_tolerance_seconds)
 
                 # 将图像信息添加到fit_matches中
                 if image_results:
@@ -2346,14 +2646,17 @@ class FitsFileFinderRipgrep:
 
         return timeline_data
 
-    def match_related_files_to_fit(self, fit_files: List[str], other_files_by_type: Dict[str, List[str]], generate_images: bool = False) -> Dict[str, Dict[str, Any]]:
+    def match_related_files_to_fit(self, fit_files: List[str], other_files_by_type: Dict[str, List[str]], generate_images: bool = False, timestamp_tolerance_seconds: int = 0) -> Dict[str, Dict[str, Any]]:
         """
         将其他类型的文件匹配到对应的.fit文件
 
+        匹配通过 (sky_region, system_name, timestamp) 字典完成，整体为线性复杂度
+
         Args:
             fit_files: .fit文件列表
             other_files_by_type: 其他类型文件的字典
             generate_images: 是否生成图像和读取PP FITS header信息
+            timestamp_tolerance_seconds: 精确匹配失败时允许的时间戳误差（秒），默认为0即只做精确匹配
 
         Returns:
             Dict[str, Dict[str, Any]]: 以.fit文件路径为键的匹配结果
@@ -2382,6 +2685,12 @@ class FitsFileFinderRipgrep:
                 }
             }
 
+        # 建立 (sky_region, system_name, timestamp) -> .fit文件 的索引，重复键保留第一个
+        fit_index = self._build_fit_match_index(fit_file_matches)
+        fuzzy_index = None
+        if timestamp_tolerance_seconds > 0:
+            fuzzy_index = self._build_fit_time_index(fit_file_matches)
+
         # 匹配其他类型的文件
         for file_type, files in other_files_by_type.items():
             if file_type == 'fit_files':  # 跳过.fit文件本身
@@ -2404,22 +2713,28 @@ class FitsFileFinderRipgrep:
 
                 # 寻找完全匹配的.fit文件（sky_region、system_name、timestamp 三个字段必须完全相同）
                 matched_fit_file = None
+                match_score = 100  # 完全匹配给予满分
+                time_offset = 0
 
-                for fit_file, fit_match in fit_file_matches.items():
-                    # 三个字段必须完全相同
-                    if (other_sky_region and fit_match['sky_region'] and other_sky_region == fit_match['sky_region'] and
-                        other_system_name and fit_match['system_name'] and other_system_name == fit_match['system_name'] and
-                        other_timestamp and fit_match['timestamp'] and other_timestamp == fit_match['timestamp']):
-                        matched_fit_file = fit_file
-                        break
+                if other_sky_region and other_system_name and other_timestamp:
+                    matched_fit_file = fit_index.get((other_sky_region, other_system_name, other_timestamp))
 
-                # 如果找到完全匹配，添加到相关文件列表
+                    # 精确匹配失败时按时间戳误差查找最近的.fit文件
+                    if matched_fit_file is None and fuzzy_index is not None:
+                        matched_fit_file, time_offset = self._find_nearest_fit(
+                            fuzzy_index, other_sky_region, other_system_name, other_timestamp, timestamp_tolerance_seconds)
+                        if matched_fit_file:
+                            match_score = max(1, int(100 - 50 * time_offset / timestamp_tolerance_seconds))
+
+                # 如果找到匹配，添加到相关文件列表
                 if matched_fit_file:
                     file_entry = {
                         'file_path': other_file,
                         'file_info': other_info,
-                        'match_score': 100  # 完全匹配给予满分
+                        'match_score': match_score
                     }
+                    if time_offset:
+                        file_entry['time_offset_seconds'] = time_offset
 
                     # 对于pp_fits文件，只有在generate_images为True时才添加header信息
                     if short_type == 'pp_fits' and generate_images:
@@ -2435,6 +2750,83 @@ class FitsFileFinderRipgrep:
 
         return fit_file_matches
 
+    def _build_fit_match_index(self, fit_file_matches: Dict[str, Dict[str, Any]]) -> Dict[Tuple[str, str, str], str]:
+        """
+        建立 (sky_region, system_name, timestamp) 到.fit文件的精确匹配索引
+
+        Args:
+            fit_file_matches: 以.fit文件路径为键的匹配记录
+
+        Returns:
+            Dict[Tuple[str, str, str], str]: 三元组到.fit文件路径的字典，重复的键保留第一个文件
+        """
+        fit_index = {}
+        for fit_file, fit_match in fit_file_matches.items():
+            if fit_match['sky_region'] and fit_match['system_name'] and fit_match['timestamp']:
+                key = (fit_match['sky_region'], fit_match['system_name'], fit_match['timestamp'])
+                fit_index.setdefault(key, fit_file)
+        return fit_index
+
+    def _build_fit_time_index(self, fit_file_matches: Dict[str, Dict[str, Any]]) -> Dict[Tuple[str, str], Tuple[List[float], List[str]]]:
+        """
+        建立按 (sky_region, system_name) 分组、按时间排序的二级索引，用于时间戳容差匹配
+
+        Args:
+            fit_file_matches: 以.fit文件路径为键的匹配记录
+
+        Returns:
+            Dict[Tuple[str, str], Tuple[List[float], List[str]]]: 分组键到 (排序后的时间秒数列表, 对应.fit文件列表) 的字典
+        """
+        grouped = {}
+        for fit_file, fit_match in fit_file_matches.items():
+            if not (fit_match['sky_region'] and fit_match['system_name'] and fit_match['timestamp']):
+                continue
+            fit_time = self._parse_timestamp(fit_match['timestamp'])
+            if fit_time is None:
+                continue
+            key = (fit_match['sky_region'], fit_match['system_name'])
+            grouped.setdefault(key, []).append((fit_time.timestamp(), fit_file))
+
+        time_index = {}
+        for key, items in grouped.items():
+            # 稳定排序，相同时间保留原始顺序
+            items.sort(key=lambda item: item[0])
+            time_index[key] = ([item[0] for item in items], [item[1] for item in items])
+        return time_index
+
+    def _find_nearest_fit(self, time_index: Dict[Tuple[str, str], Tuple[List[float], List[str]]], sky_region: str, system_name: str, timestamp: str, tolerance_seconds: int) -> Tuple[Optional[str], float]:
+        """
+        在二级索引中用二分查找时间最接近的.fit文件
+
+        Args:
+            time_index: _build_fit_time_index 生成的索引
+            sky_region: 天区索引
+            system_name: 系统名称
+            timestamp: 时间戳字符串
+            tolerance_seconds: 允许的最大时间误差（秒）
+
+        Returns:
+            Tuple[Optional[str], float]: (匹配的.fit文件路径, 时间误差秒数)，没有匹配时返回 (None, 0)
+        """
+        group = time_index.get((sky_region, system_name))
+        target_time = self._parse_timestamp(timestamp)
+        if group is None or target_time is None:
+            return None, 0
+
+        times, fit_paths = group
+        target_seconds = target_time.timestamp()
+        pos = bisect.bisect_left(times, target_seconds)
+
+        best_file = None
+        best_offset = 0
+        for candidate in (pos - 1, pos):
+            if 0 <= candidate < len(times):
+                offset = abs(times[candidate] - target_seconds)
+                if offset <= tolerance_seconds and (best_file is None or offset < best_offset):
+                    best_file = fit_paths[candidate]
+                    best_offset = offset
+        return best_file, best_offset
+
     def _files_match(self, fit_file_info: Dict[str, Any], related_file_info: Dict[str, Any]) -> bool:
         """
         判断.fit文件和关联文件是否匹配
@@ -2745,11 +3137,21 @@ def main():
                        help='只生成缩略图（需与--generate-images一起使用）')
     parser.add_argument('--center-only', action='store_true',
                        help='只生成中心区域图（需与--generate-images一起使用）')
+    parser.add_argument('--incremental', action='store_true',
+                       help='启用增量扫描缓存，只处理新增或变化的文件（缓存保存在输出目录的 fits_scan_cache.db）')
+    parser.add_argument('--crawl-mode', choices=['single_pass', 'ripgrep'],
+                       help='文件搜索方式，覆盖配置文件中的 options.crawl_mode (默认: single_pass)')
+    parser.add_argument('--executor', choices=['serial', 'thread', 'process', 'hybrid'],
+                       help='图像生成的执行方式，覆盖配置文件中的 options.executor.images_backend (默认: hybrid)')
+    parser.add_argument('--workers', type=int,
+                       help='图像生成的工作进程/线程数，覆盖配置文件中的 options.executor.cpu_workers (默认按物理核心数)')
+    parser.add_argument('--match-tolerance', type=int, default=0,
+                       help='关联文件与.fit文件时间戳允许的误差（秒），默认0只做精确匹配')
 
     args = parser.parse_args()
 
     # 创建查找器实例
-    finder = FitsFileFinderRipgrep(args.config, args.date, args.all, args.output_dir, args.enable_log_file)
+    finder = FitsFileFinderRipgrep(args.config, args.date, args.all, args.output_dir, args.enable_log_file, args.incremental)
     
     # 设置日志级别
     if args.verbose:
@@ -2760,6 +3162,13 @@ def main():
         print(f"错误: 无法加载配置文件 {args.config}")
         sys.exit(1)
     
+    if args.crawl_mode:
+        finder.config.setdefault('options', {})['crawl_mode'] = args.crawl_mode
+    if args.executor:
+        finder.config.setdefault('options', {}).setdefault('executor', {})['images_backend'] = args.executor
+    if args.workers:
+        finder.config.setdefault('options', {}).setdefault('executor', {})['cpu_workers'] = args.workers
+
     # 拷贝HTML模板文件到输出目录
     output_dir_display = args.output_dir or "dest (默认)"
     print(f"\n拷贝HTML模板文件到输出目录: {output_dir_display}")
@@ -2825,7 +3234,8 @@ def main():
             use_clustering,
             args.time_threshold,
             args.save_text,
-            args.generate_images  # 传递图像生成参数
+            args.generate_images,  # 传递图像生成参数
+            args.match_tolerance
         )
 
         # 如果成功生成了JS文件且有HTML文件信息，更新HTML文件引用
@@ -2840,6 +3250,9 @@ def main():
 
             finder._update_html_file_references(html_file_path, js_filename, css_filename, vis_js_filename, sky_region_js_filename)
 
+        # 保存增量扫描缓存
+        finder.save_scan_cache()
+
         # 输出分类列表信息供后续使用
         print(f"\n文件分类列表已准备完成:")
         print(f"  axy_files: {len(files_by_type.get('axy', []))} 个 .fits.axy 文件 (关联到.fit文件)")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FITS主header快速读取
+功能：按2880字节块读取主header直到END卡，只解析需要的关键字，不读取数据区；
+      header格式异常时回退到 astropy
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from fits_task_executor import FitsTaskExecutor
+
+BLOCK_SIZE = 2880
+CARD_SIZE = 80
+# 主header最多读取的块数（约14400张卡），防止把非FITS文件整个读进来
+MAX_HEADER_BLOCKS = 180
+
+logger = logging.getLogger('FitsHeaderReader')
+
+
+class FitsHeaderError(ValueError):
+    """header不符合FITS标准，需要回退到astropy"""
+
+
+def _parse_card_value(raw: str) -> str:
+    """
+    把卡片的值字段转换为与 str(astropy header[key]) 相同的字符串
+
+    Args:
+        raw: 卡片第11列开始的内容（值和注释）
+
+    Returns:
+        str: 值的字符串形式
+    """
+    raw = raw.strip()
+    if raw.startswith("'"):
+        # 字符串值，'' 表示单引号，结尾空格不计
+        chars = []
+        i = 1
+        while i < len(raw):
+            if raw[i] == "'":
+                if i + 1 < len(raw) and raw[i + 1] == "'":
+                    chars.append("'")
+                    i += 2
+                    continue
+                return ''.join(chars).rstrip()
+            chars.append(raw[i])
+            i += 1
+        raise FitsHeaderError(f"字符串值缺少结束引号: {raw}")
+
+    value = raw.split('/', 1)[0].strip()
+    if value == 'T':
+        return 'True'
+    if value == 'F':
+        return 'False'
+    if not value:
+        raise FitsHeaderError("值为空")
+    try:
+        return str(int(value))
+    except ValueError:
+        pass
+    try:
+        return str(float(value.replace('D', 'E')))
+    except ValueError:
+        # 复数等其他格式交给astropy
+        raise FitsHeaderError(f"无法解析的值: {value}")
+
+
+def read_header_keywords(fits_path: str, keywords: Iterable[str]) -> Dict[str, str]:
+    """
+    只读取主header，提取指定关键字
+
+    Args:
+        fits_path: FITS文件路径
+        keywords: 需要的关键字（大写）
+
+    Returns:
+        Dict[str, str]: 找到的关键字及其值的字符串形式，不存在的关键字不包含在结果中
+
+    Raises:
+        FitsHeaderError: header格式异常
+        OSError: 文件无法读取
+    """
+    wanted = {keyword.upper() for keyword in keywords}
+    result = {}
+    with open(fits_path, 'rb') as f:
+        for block_index in range(MAX_HEADER_BLOCKS):
+            block = f.read(BLOCK_SIZE)
+            if len(block) < BLOCK_SIZE:
+                raise FitsHeaderError("文件在END卡之前结束")
+            try:
+                text = block.decode('ascii')
+            except UnicodeDecodeError:
+                raise FitsHeaderError("header包含非ASCII字符")
+            if block_index == 0 and not text.startswith('SIMPLE  ='):
+                raise FitsHeaderError("缺少SIMPLE关键字")
+
+            for offset in range(0, BLOCK_SIZE, CARD_SIZE):
+                card = text[offset:offset + CARD_SIZE]
+                keyword = card[:8].rstrip()
+                if keyword == 'END':
+                    return result
+                # 同一关键字重复出现时与astropy一致取第一个
+                if keyword in wanted and keyword not in result and card[8:10] == '= ':
+                    result[keyword] = _parse_card_value(card[10:])
+    raise FitsHeaderError(f"前 {MAX_HEADER_BLOCKS} 个块中没有END卡")
+
+
+def _read_with_astropy(fits_path: str, keywords: Iterable[str]) -> Dict[str, str]:
+    """astropy回退路径，返回格式与 read_header_keywords 相同"""
+    from astropy.io import fits
+
+    header = fits.getheader(fits_path, 0)
+    return {keyword: str(header[keyword]) for keyword in keywords if keyword in header}
+
+
+def read_header_keywords_safe(fits_path: str, keywords: Iterable[str]) -> Dict[str, str]:
+    """
+    读取指定关键字，header格式异常时回退到astropy
+
+    Args:
+        fits_path: FITS文件路径
+        keywords: 需要的关键字（大写）
+
+    Returns:
+        Dict[str, str]: 找到的关键字及其值的字符串形式
+
+    Raises:
+        Exception: astropy也无法读取时抛出其异常
+    """
+    keywords = list(keywords)
+    try:
+        return read_header_keywords(fits_path, keywords)
+    except FitsHeaderError as e:
+        logger.debug(f"快速读取header失败，使用astropy: {fits_path} ({e})")
+        return _read_with_astropy(fits_path, keywords)
+
+
+def read_header_keywords_batch(fits_paths: List[str], keywords: Iterable[str], max_workers: int = 0) -> List[Optional[Dict[str, str]]]:
+    """
+    批量读取多个文件的指定关键字，使用有限数量的线程，结果按输入顺序返回
+
+    Args:
+        fits_paths: FITS文件路径列表
+        keywords: 需要的关键字（大写）
+        max_workers: 线程数，0表示按逻辑核心数自动确定
+
+    Returns:
+        List[Optional[Dict[str, str]]]: 与输入顺序一致的结果，读取失败的文件为None
+    """
+    keywords = list(keywords)
+    executor = FitsTaskExecutor(backend='thread', max_workers=max_workers, logger=logger)
+    return executor.map(lambda path: read_header_keywords_safe(path, keywords), fits_paths)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FITS文件扫描缓存
+功能：在输出目录中用SQLite记录目录列表、文件 mtime/size、文件名解析结果、PP FITS header 和已生成的图像路径，
+      使 fits_file_finder_ripgrep.py 重复运行时只处理新增或变化的文件
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class FitsScanCache:
+    """基于SQLite的增量扫描缓存"""
+
+    def __init__(self, db_path: str, logger: Optional[logging.Logger] = None):
+        """
+        初始化扫描缓存
+
+        Args:
+            db_path: 缓存数据库路径，一般位于输出目录下
+            logger: 日志记录器
+        """
+        self.db_path = db_path
+        self.logger = logger or logging.getLogger('FitsScanCache')
+        self._lock = threading.Lock()
+
+        # 目录缓存: path -> (mtime_ns, 子目录列表, 文件名列表)
+        self.dirs: Dict[str, Tuple[int, List[str], List[str]]] = {}
+        # 文件缓存: path -> {'mtime_ns', 'size', 'fits_info', 'header', 'images'}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self._dirty_dirs = set()
+        self._dirty_files = set()
+        # 本次运行已经 stat 过的文件，其余文件的记录可能已过期
+        self._fresh_files = set()
+        # 本次扫描中已不存在的文件，保存时从数据库删除
+        self._removed_files = set()
+
+        # 本次运行复用的图像（相对输出目录的路径），用于打包
+        self.reused_images = set()
+        self.stats = {'dir_hits': 0, 'dir_scans': 0, 'header_hits': 0, 'image_hits': 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS scan_dirs ('
+                     'path TEXT PRIMARY KEY, mtime_ns INTEGER, subdirs TEXT, files TEXT)')
+        conn.execute('CREATE TABLE IF NOT EXISTS scan_files ('
+                     'path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, '
+                     'fits_info TEXT, header TEXT, images TEXT)')
+        return conn
+
+    def load(self) -> bool:
+        """
+        从数据库加载缓存到内存
+
+        Returns:
+            bool: 加载成功返回True，失败返回False
+        """
+        try:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            conn = self._connect()
+            for path, mtime_ns, subdirs, files in conn.execute('SELECT path, mtime_ns, subdirs, files FROM scan_dirs'):
+                self.dirs[path] = (mtime_ns, json.loads(subdirs), json.loads(files))
+            for path, mtime_ns, size, fits_info, header, images in conn.execute(
+                    'SELECT path, mtime_ns, size, fits_info, header, images FROM scan_files'):
+                self.files[path] = {
+                    'mtime_ns': mtime_ns,
+                    'size': size,
+                    'fits_info': json.loads(fits_info) if fits_info else None,
+                    'header': json.loads(header) if header else None,
+                    'images': json.loads(images) if images else None
+                }
+            conn.close()
+            self.logger.info(f"已加载扫描缓存: {self.db_path} (目录 {len(self.dirs)}, 文件 {len(self.files)})")
+            return True
+        except Exception as e:
+            self.logger.error(f"加载扫描缓存失败: {e}")
+            self.dirs = {}
+            self.files = {}
+            return False
+
+    def save(self) -> bool:
+        """
+        把本次运行新增或变化的记录写回数据库
+
+        Returns:
+            bool: 保存成功返回True，失败返回False
+        """
+        with self._lock:
+            dir_rows = [(path, self.dirs[path][0], json.dumps(self.dirs[path][1]), json.dumps(self.dirs[path][2]))
+                        for path in self._dirty_dirs]
+            file_rows = []
+            for path in self._dirty_files:
+                record = self.files[path]
+                file_rows.append((path, record['mtime_ns'], record['size'],
+                                  json.dumps(record['fits_info']) if record['fits_info'] else None,
+                                  json.dumps(record['header']) if record['header'] else None,
+                                  json.dumps(record['images']) if record['images'] else None))
+            removed_rows = [(path,) for path in self._removed_files]
+            self._dirty_dirs = set()
+            self._dirty_files = set()
+            self._removed_files = set()
+
+        try:
+            conn = self._connect()
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO scan_dirs (path, mtime_ns, subdirs, files) VALUES (?, ?, ?, ?)',
+                                 dir_rows)
+                conn.executemany('INSERT OR REPLACE INTO scan_files (path, mtime_ns, size, fits_info, header, images) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)', file_rows)
+                conn.executemany('DELETE FROM scan_files WHERE path = ?', removed_rows)
+            conn.close()
+            self.logger.info(f"扫描缓存已保存: 更新目录 {len(dir_rows)}, 更新文件 {len(file_rows)}, 删除文件 {len(removed_rows)}, "
+                             f"目录命中 {self.stats['dir_hits']}, 重新扫描 {self.stats['dir_scans']}, "
+                             f"header命中 {self.stats['header_hits']}, 图像命中 {self.stats['image_hits']}")
+            return True
+        except Exception as e:
+            self.logger.error(f"保存扫描缓存失败: {e}")
+            return False
+
+    def get_dir(self, path: str, mtime_ns: int) -> Optional[Tuple[List[str], List[str]]]:
+        """
+        获取目录的缓存列表，目录 mtime 未变化时有效
+
+        Args:
+            path: 目录路径
+            mtime_ns: 目录当前的 mtime（纳秒）
+
+        Returns:
+            Optional[Tuple[List[str], List[str]]]: (子目录路径列表, 文件名列表)，缓存无效时返回None
+        """
+        cached = self.dirs.get(path)
+        if cached is None or cached[0] != mtime_ns:
+            self.stats['dir_scans'] += 1
+            return None
+        self.stats['dir_hits'] += 1
+        return cached[1], cached[2]
+
+    def put_dir(self, path: str, mtime_ns: int, subdirs: List[str], files: List[str]) -> None:
+        """记录目录列表"""
+        with self._lock:
+            self.dirs[path] = (mtime_ns, subdirs, files)
+            self._dirty_dirs.add(path)
+
+    def _get_record(self, path: str) -> Dict[str, Any]:
+        record = self.files.get(path)
+        if record is None:
+            record = {'mtime_ns': None, 'size': None, 'fits_info': None, 'header': None, 'images': None}
+            self.files[path] = record
+        return record
+
+    def set_stat(self, path: str, mtime_ns: int, size: int) -> None:
+        """
+        记录文件的 mtime/size，文件变化时丢弃依赖文件内容的缓存（header、图像）
+
+        Args:
+            path: 文件路径
+            mtime_ns: 文件 mtime（纳秒）
+            size: 文件大小
+        """
+        with self._lock:
+            self._fresh_files.add(path)
+            record = self._get_record(path)
+            if record['mtime_ns'] == mtime_ns and record['size'] == size:
+                return
+            record['mtime_ns'] = mtime_ns
+            record['size'] = size
+            record['header'] = None
+            record['images'] = None
+            self._dirty_files.add(path)
+
+    def ensure_stat(self, path: str) -> bool:
+        """
+        确保文件的 mtime/size 记录是本次运行的（ripgrep模式或目录列表命中缓存时没有 stat 信息，调用 os.stat），
+        文件被修改或替换时丢弃旧的 header、图像缓存
+
+        Returns:
+            bool: 文件存在返回True
+        """
+        if path in self._fresh_files:
+            return True
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        self.set_stat(path, st.st_mtime_ns, st.st_size)
+        return True
+
+    def prune_files(self, directories: List[str], found_paths: set) -> int:
+        """
+        删除 directories 下本次扫描没有找到的文件记录
+
+        Args:
+            directories: 本次完整扫描过的目录
+            found_paths: 本次扫描找到的文件路径
+
+        Returns:
+            int: 删除的记录数
+        """
+        prefixes = tuple(os.path.join(directory, '') for directory in directories)
+        if not prefixes:
+            return 0
+        with self._lock:
+            removed = [path for path in self.files if path.startswith(prefixes) and path not in found_paths]
+            for path in removed:
+                del self.files[path]
+                self._dirty_files.discard(path)
+                self._fresh_files.discard(path)
+                self._removed_files.add(path)
+        return len(removed)
+
+    def get_fits_info(self, path: str) -> Optional[Dict[str, Optional[str]]]:
+        """获取缓存的文件名解析结果"""
+        record = self.files.get(path)
+        if record is None or record['fits_info'] is None:
+            return None
+        return dict(record['fits_info'])
+
+    def put_fits_info(self, path: str, fits_info: Dict[str, Optional[str]]) -> None:
+        """记录文件名解析结果"""
+        with self._lock:
+            self._get_record(path)['fits_info'] = dict(fits_info)
+            self._dirty_files.add(path)
+
+    def get_header(self, path: str) -> Optional[Dict[str, Optional[str]]]:
+        """获取缓存的PP FITS header信息，文件未变化时有效"""
+        if not self.ensure_stat(path):
+            return None
+        record = self.files.get(path)
+        if record['header'] is None:
+            return None
+        self.stats['header_hits'] += 1
+        return dict(record['header'])
+
+    def put_header(self, path: str, header: Dict[str, Optional[str]]) -> None:
+        """记录PP FITS header信息（读取出错的结果不缓存）"""
+        if header.get('error') or not self.ensure_stat(path):
+            return
+        with self._lock:
+            self._get_record(path)['header'] = dict(header)
+            self._dirty_files.add(path)
+
+    def get_images(self, path: str, output_dir: str, create_thumbnail: bool, create_center_crop: bool) -> Optional[Dict[str, Optional[str]]]:
+        """
+        获取已生成的图像路径，文件未变化且图像文件仍然存在时有效
+
+        Args:
+            path: FITS文件路径
+            output_dir: 输出目录，用于检查相对路径对应的图像文件是否存在
+            create_thumbnail: 是否需要缩略图
+            create_center_crop: 是否需要中心区域图
+
+        Returns:
+            Optional[Dict[str, Optional[str]]]: 与 process_fits_image 返回格式相同的字典，缓存无效时返回None
+        """
+        if not self.ensure_stat(path):
+            return None
+        images = self.files[path]['images']
+        if images is None:
+            return None
+
+        needed = []
+        if create_thumbnail:
+            needed.append('thumbnail_relative')
+        if create_center_crop:
+            needed.append('center_crop_relative')
+        for key in needed:
+            relative_path = images.get(key)
+            if not relative_path or not os.path.exists(os.path.join(output_dir, relative_path)):
+                return None
+
+        with self._lock:
+            for key in needed:
+                self.reused_images.add(images[key])
+            self.stats['image_hits'] += 1
+        return dict(images)
+
+    def put_images(self, path: str, images: Dict[str, Optional[str]]) -> None:
+        """记录已生成的图像路径"""
+        if not self.ensure_stat(path):
+            return
+        with self._lock:
+            record = self._get_record(path)
+            merged = dict(record['images'] or {})
+            merged.update({key: value for key, value in images.items() if value})
+            record['images'] = merged
+            self._dirty_files.add(path)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FITS批量任务执行器
+功能：为 fits_file_finder_ripgrep.py 的批量处理提供可配置的执行后端（串行、线程、进程、I/O线程+CPU进程混合），
+      按块提交任务，根据 psutil.cpu_count 自动确定工作数，结果按输入顺序返回
+"""
+
+import logging
+import math
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Optional, Sequence
+
+import psutil
+
+
+BACKENDS = ('serial', 'thread', 'process', 'hybrid')
+
+
+def cpu_worker_count() -> int:
+    """CPU密集任务的工作进程数：物理核心数（取不到时用逻辑核心数）"""
+    return psutil.cpu_count(logical=False) or psutil.cpu_count() or 1
+
+
+def io_worker_count() -> int:
+    """I/O密集任务的线程数：与 concurrent.futures 的默认值一致，逻辑核心数+4，最多32"""
+    return min(32, (psutil.cpu_count() or 1) + 4)
+
+
+def prefetch_file(path: str, block_size: int = 1 << 20) -> None:
+    """顺序读取文件，使其进入系统页缓存（混合模式下由I/O线程执行）"""
+    try:
+        with open(path, 'rb') as f:
+            while f.read(block_size):
+                pass
+    except OSError:
+        # 读取失败交给处理函数报告
+        pass
+
+
+def _run_chunk(func: Callable[[Any], Any], chunk: Sequence[Any]) -> List[tuple]:
+    """
+    在工作线程/进程中处理一块任务，单个任务出错不影响同一块的其他任务
+
+    Returns:
+        List[tuple]: 每个任务的 (是否成功, 结果或错误信息)
+    """
+    results = []
+    for item in chunk:
+        try:
+            results.append((True, func(item)))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def _prefetch_chunk(prefetch: Callable[[Any], Any], chunk: Sequence[Any]) -> None:
+    for item in chunk:
+        prefetch(item)
+
+
+class FitsTaskExecutor:
+    """按块提交、保持顺序的批量任务执行器"""
+
+    def __init__(self, backend: str = 'thread', max_workers: int = 0, io_workers: int = 0, chunk_size: int = 0,
+                 logger: Optional[logging.Logger] = None):
+        """
+        初始化执行器
+
+        Args:
+            backend: 执行后端，serial / thread / process / hybrid
+            max_workers: 工作数，0表示自动（thread 按I/O任务、process/hybrid 按CPU任务确定）
+            io_workers: hybrid 模式下预读文件的线程数，0表示自动
+            chunk_size: 每次提交的任务数，0表示自动（每个工作约4块）
+            logger: 日志记录器
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"不支持的执行后端: {backend}，可选: {', '.join(BACKENDS)}")
+        self.backend = backend
+        self.logger = logger or logging.getLogger('FitsTaskExecutor')
+
+        if backend == 'serial':
+            self.max_workers = 1
+        elif max_workers and max_workers > 0:
+            self.max_workers = max_workers
+        elif backend == 'thread':
+            self.max_workers = io_worker_count()
+        else:
+            self.max_workers = cpu_worker_count()
+        self.io_workers = io_workers if io_workers and io_workers > 0 else io_worker_count()
+        self.chunk_size = chunk_size
+
+    def describe(self) -> str:
+        """用于日志的执行方式描述"""
+        if self.backend == 'serial':
+            return "串行"
+        if self.backend == 'thread':
+            return f"{self.max_workers} 个线程"
+        if self.backend == 'process':
+            return f"{self.max_workers} 个进程"
+        return f"{self.io_workers} 个I/O线程 + {self.max_workers} 个进程"
+
+    def _split_chunks(self, items: Sequence[Any]) -> List[Sequence[Any]]:
+        chunk_size = self.chunk_size
+        if not chunk_size or chunk_size <= 0:
+            chunk_size = max(1, math.ceil(len(items) / (self.max_workers * 4)))
+        return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    def map(self, func: Callable[[Any], Any], items: Sequence[Any],
+            on_error: Optional[Callable[[Any, str], Any]] = None,
+            prefetch: Optional[Callable[[Any], Any]] = None,
+            progress: Optional[Callable[[int, int], None]] = None) -> List[Any]:
+        """
+        对每个任务调用 func，按输入顺序返回结果
+
+        process/hybrid 模式下 func 必须可以pickle（模块级函数、绑定方法或 functools.partial）
+
+        Args:
+            func: 处理单个任务的函数
+            items: 任务列表
+            on_error: 任务出错时调用 on_error(任务, 错误信息)，返回值作为该任务的结果；为None时结果为None
+            prefetch: hybrid 模式下在I/O线程中预先执行的函数（如 prefetch_file），其他模式忽略
+            progress: 每完成一块调用 progress(已完成任务数, 总任务数)
+
+        Returns:
+            List[Any]: 与 items 顺序一致的结果列表
+        """
+        items = list(items)
+        total = len(items)
+        if total == 0:
+            return []
+
+        chunks = self._split_chunks(items)
+        chunk_results: List[Optional[List[tuple]]] = [None] * len(chunks)
+        completed = [0]
+
+        def collect(index: int, result: List[tuple]) -> None:
+            chunk_results[index] = result
+            completed[0] += len(result)
+            if progress is not None:
+                progress(completed[0], total)
+
+        if self.backend == 'serial' or (self.backend == 'thread' and len(chunks) == 1):
+            for index, chunk in enumerate(chunks):
+                collect(index, _run_chunk(func, chunk))
+        elif self.backend == 'thread':
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+                futures = {executor.submit(_run_chunk, func, chunk): index for index, chunk in enumerate(chunks)}
+                self._collect_futures(futures, chunks, collect)
+        elif self.backend == 'process' or prefetch is None:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+                futures = {executor.submit(_run_chunk, func, chunk): index for index, chunk in enumerate(chunks)}
+                self._collect_futures(futures, chunks, collect)
+        else:
+            self._run_hybrid(func, prefetch, chunks, collect)
+
+        results = []
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            for item, (ok, value) in zip(chunk, chunk_result):
+                if ok:
+                    results.append(value)
+                else:
+                    self.logger.error(f"处理 {item} 时出错: {value}")
+                    results.append(on_error(item, value) if on_error is not None else None)
+        return results
+
+    def _collect_futures(self, futures: dict, chunks: List[Sequence[Any]], collect: Callable[[int, List[tuple]], None]) -> None:
+        """等待全部块完成；整块失败（如进程崩溃、无法pickle）时把错误记到块内每个任务上"""
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                try:
+                    collect(index, future.result())
+                except Exception as e:
+                    collect(index, [(False, f"{type(e).__name__}: {e}")] * len(chunks[index]))
+
+    def _run_hybrid(self, func: Callable[[Any], Any], prefetch: Callable[[Any], Any], chunks: List[Sequence[Any]],
+                    collect: Callable[[int, List[tuple]], None]) -> None:
+        """
+        I/O线程按顺序预读后续的块，预读完成的块再提交给CPU进程池
+
+        进程池中最多保持 2*max_workers 个块，预读窗口同样大小，避免一次把所有文件读入页缓存
+        """
+        window = self.max_workers * 2
+        with ThreadPoolExecutor(max_workers=self.io_workers) as io_pool, \
+                ProcessPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as cpu_pool:
+            prefetch_futures = deque()
+            next_prefetch = 0
+            cpu_futures = {}
+
+            for index, chunk in enumerate(chunks):
+                while next_prefetch < len(chunks) and next_prefetch < index + window:
+                    prefetch_futures.append(io_pool.submit(_prefetch_chunk, prefetch, chunks[next_prefetch]))
+                    next_prefetch += 1
+                try:
+                    prefetch_futures.popleft().result()
+                except Exception as e:
+                    self.logger.debug(f"预读失败: {e}")
+
+                # 进程池已满时先收集完成的块
+                while len(cpu_futures) >= window:
+                    done, _ = wait(cpu_futures, return_when=FIRST_COMPLETED)
+                    self._collect_futures({future: cpu_futures.pop(future) for future in done}, chunks, collect)
+
+                cpu_futures[cpu_pool.submit(_run_chunk, func, chunk)] = index
+
+            self._collect_futures(cpu_futures, chunks, collect)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志处理事件列式表
+把每个FIT文件的开始/结束时间保存为 numpy datetime64 数组，系统名、天区索引和文件名保存为分类编码数组，
+处理时长、分组统计、百分位数和每小时吞吐量都用向量化运算得到，并可以导出为CSV
+"""
+
+import csv
+import os
+import re
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+# 与 LogFileFinder 中从文件名提取系统名、天区索引和UTC时间的正则相同
+SYSTEM_PATTERN = re.compile(r'GY\d{1}', re.IGNORECASE)
+K_INDEX_PATTERN = re.compile(r'K\d{3}-\d{1}', re.IGNORECASE)
+UTC_PATTERN = re.compile(r'UTC(\d{4})(\d{2})(\d{2})_(\d{2})(\d{2})(\d{2})', re.IGNORECASE)
+DEFAULT_PERCENTILES = (50, 95, 99)
+
+
+def _to_datetime64(iso_strings: List[str], unit: str) -> np.ndarray:
+    """把ISO格式字符串列表转换为datetime64数组，'NaT' 或格式错误的值为NaT"""
+    values = np.array(iso_strings, dtype=object)
+    try:
+        return values.astype(f'datetime64[{unit}]')
+    except ValueError:
+        # 存在格式错误的值时逐个转换
+        result = np.empty(len(values), dtype=f'datetime64[{unit}]')
+        for i, value in enumerate(values):
+            try:
+                result[i] = np.datetime64(value, unit)
+            except ValueError:
+                result[i] = np.datetime64('NaT')
+        return result
+
+
+def _log_timestamps_to_datetime64(timestamps: Sequence[Optional[str]]) -> np.ndarray:
+    """把 '2025-08-23 03:00:15,978' 格式的时间戳转换为 datetime64[ms]，缺失或格式错误为NaT"""
+    return _to_datetime64([t.replace(' ', 'T', 1).replace(',', '.') if t else 'NaT' for t in timestamps], 'ms')
+
+
+def _categorize(values: List[str]) -> tuple:
+    """返回 (分类值数组, 编码数组)，分类值[编码] 还原为原值"""
+    # 分类数很少，用字典编码比对object数组排序快
+    categories = sorted(set(values))
+    index = {value: code for code, value in enumerate(categories)}
+    codes = np.fromiter(map(index.__getitem__, values), dtype=np.intp, count=len(values))
+    return np.array(categories, dtype=object), codes
+
+
+class LogEventTable:
+    """FIT文件处理事件的列式表"""
+
+    def __init__(self, fit_file_times: Dict[str, Dict[str, str]], fit_files: Optional[Sequence[str]] = None):
+        """
+        从 LogFileFinder.fit_file_times 构建列式表
+
+        Args:
+            fit_file_times: FIT文件名 -> {'start': 开始时间, 'end': 结束时间}
+            fit_files: 需要包含的FIT文件名，为None时包含 fit_file_times 中的全部文件
+        """
+        names = list(fit_files) if fit_files is not None else list(fit_file_times)
+        self.file = np.array(names, dtype=object)
+
+        systems = []
+        k_indices = []
+        utc = []
+        starts = []
+        ends = []
+        for name in names:
+            match = SYSTEM_PATTERN.search(name)
+            systems.append(match.group(0).upper() if match else 'N/A')
+            match = K_INDEX_PATTERN.search(name)
+            k_indices.append(match.group(0).upper() if match else 'N/A')
+            match = UTC_PATTERN.search(name)
+            utc.append('{}-{}-{}T{}:{}:{}'.format(*match.groups()) if match else 'NaT')
+            time_info = fit_file_times.get(name, {})
+            starts.append(time_info.get('start'))
+            ends.append(time_info.get('end'))
+
+        # 分类编码: categories[codes] 还原为原值
+        self.system_categories, self.system_codes = _categorize(systems)
+        self.k_index_categories, self.k_index_codes = _categorize(k_indices)
+        self.utc = _to_datetime64(utc, 's')
+        self.start_raw = np.array(starts, dtype=object)
+        self.end_raw = np.array(ends, dtype=object)
+        self.start = _log_timestamps_to_datetime64(starts)
+        self.end = _log_timestamps_to_datetime64(ends)
+
+    def __len__(self) -> int:
+        return len(self.file)
+
+    @property
+    def system(self) -> np.ndarray:
+        return self.system_categories[self.system_codes]
+
+    @property
+    def k_index(self) -> np.ndarray:
+        return self.k_index_categories[self.k_index_codes]
+
+    @property
+    def durations(self) -> np.ndarray:
+        """处理时长（秒），没有完整开始/结束时间的为NaN"""
+        return (self.end - self.start) / np.timedelta64(1, 's')
+
+    @property
+    def complete(self) -> np.ndarray:
+        """有完整开始/结束时间的事件"""
+        return ~(np.isnat(self.start) | np.isnat(self.end))
+
+    def duration_percentiles(self, percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> Dict[float, float]:
+        """所有完整事件处理时长的百分位数（秒）"""
+        durations = self.durations[self.complete]
+        if len(durations) == 0:
+            return {p: float('nan') for p in percentiles}
+        return dict(zip(percentiles, np.percentile(durations, percentiles).tolist()))
+
+    def aggregate_durations(self, by: str, percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> List[Dict[str, object]]:
+        """
+        按系统或天区索引分组统计处理时长
+
+        Args:
+            by: 'system' 或 'k_index'
+            percentiles: 需要的百分位数
+
+        Returns:
+            每组一个字典: 分组值、文件数、完整事件数、总/平均/最短/最长时长及各百分位数（秒）
+        """
+        categories = getattr(self, f'{by}_categories')
+        codes = getattr(self, f'{by}_codes')
+        complete = self.complete
+        durations = self.durations
+
+        file_counts = np.bincount(codes, minlength=len(categories))
+        # 按分组编码排序后一次切分，每组内已经排好顺序
+        complete_codes = codes[complete]
+        complete_durations = durations[complete]
+        order = np.lexsort((complete_durations, complete_codes))
+        sorted_codes = complete_codes[order]
+        sorted_durations = complete_durations[order]
+        bounds = np.searchsorted(sorted_codes, np.arange(len(categories) + 1))
+
+        rows = []
+        for code, category in enumerate(categories):
+            group = sorted_durations[bounds[code]:bounds[code + 1]]
+            row = {by: category, 'files': int(file_counts[code]), 'complete': len(group)}
+            if len(group):
+                row.update({'total_s': float(group.sum()), 'mean_s': float(group.mean()),
+                            'min_s': float(group[0]), 'max_s': float(group[-1])})
+                for p, value in zip(percentiles, np.percentile(group, percentiles)):
+                    row[f'p{p:g}_s'] = float(value)
+            rows.append(row)
+        return rows
+
+    def hourly_throughput(self) -> List[Dict[str, object]]:
+        """每小时（按结束时间）完成的文件数及平均处理时长"""
+        complete = self.complete
+        hours = self.end[complete].astype('datetime64[h]')
+        if len(hours) == 0:
+            return []
+        unique_hours, inverse, counts = np.unique(hours, return_inverse=True, return_counts=True)
+        mean_durations = np.bincount(inverse, weights=self.durations[complete]) / counts
+        return [{'hour': str(hour).replace('T', ' ') + ':00', 'completed': int(count), 'mean_s': float(mean)}
+                for hour, count, mean in zip(unique_hours, counts, mean_durations)]
+
+    def sorted_by_utc(self) -> np.ndarray:
+        """有UTC时间的事件按UTC时间排序后的下标"""
+        indices = np.flatnonzero(~np.isnat(self.utc))
+        return indices[np.argsort(self.utc[indices], kind='stable')]
+
+    def sorted_by_duration(self) -> np.ndarray:
+        """完整事件按处理时长排序后的下标"""
+        indices = np.flatnonzero(self.complete)
+        return indices[np.argsort(self.durations[indices], kind='stable')]
+
+    def export_csv(self, output_dir: str, prefix: str = "log_events") -> List[str]:
+        """
+        导出为扁平CSV文件，供时间线页面使用
+
+        生成 {prefix}.csv（每个文件一行）、{prefix}_by_system.csv、{prefix}_by_region.csv、{prefix}_hourly.csv
+
+        Args:
+            output_dir: 输出目录
+            prefix: 文件名前缀
+
+        Returns:
+            List[str]: 生成的文件路径
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+
+        events_path = os.path.join(output_dir, f"{prefix}.csv")
+        durations = self.durations
+        with open(events_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['file', 'system', 'k_index', 'utc_time', 'start_time', 'end_time', 'duration_s'])
+            for name, system, k_index, utc, start, end, duration in zip(
+                    self.file, self.system, self.k_index, self.utc, self.start, self.end, durations):
+                writer.writerow([name, system, k_index,
+                                 '' if np.isnat(utc) else str(utc).replace('T', ' '),
+                                 '' if np.isnat(start) else str(start).replace('T', ' '),
+                                 '' if np.isnat(end) else str(end).replace('T', ' '),
+                                 '' if np.isnan(duration) else f"{duration:.3f}"])
+        paths.append(events_path)
+
+        for by, suffix in (('system', 'by_system'), ('k_index', 'by_region')):
+            paths.append(self._write_rows(os.path.join(output_dir, f"{prefix}_{suffix}.csv"), self.aggregate_durations(by)))
+        paths.append(self._write_rows(os.path.join(output_dir, f"{prefix}_hourly.csv"), self.hourly_throughput()))
+        return paths
+
+    @staticmethod
+    def _write_rows(path: str, rows: List[Dict[str, object]]) -> str:
+        fieldnames = []
+        for row in rows:
+            for key in row:
+                if key not in fieldnames:
+                    fieldnames.append(key)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({key: f"{value:.3f}" if isinstance(value, float) else value for key, value in row.items()})
+        return path
@@ -12,21 +12,52 @@ from datetime import datetime, timedelta
 from typing import List, Optional, Set, Dict, Tuple
 import argparse
 
+import numpy as np
+
+from log_event_table import LogEventTable
+from log_index_store import LogIndexStore
+
 
 class LogFileFinder:
     """日志文件查找器类"""
-    
-    def __init__(self, log_directory: str = r"D:\kats\logs\log_core_pool"):
+
+    # 预编译的正则，所有实例共用
+    DATE_PATTERNS = [
+        re.compile(r'(\d{4}-\d{2}-\d{2})'),  # YYYY-MM-DD
+        re.compile(r'(\d{4}_\d{2}_\d{2})'),  # YYYY_MM_DD
+        re.compile(r'(\d{8})'),              # YYYYMMDD
+        re.compile(r'(\d{4}\d{2}\d{2})'),    # YYYYMMDD (无分隔符)
+    ]
+    TIMESTAMP_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}')
+    FIT_PATTERN = re.compile(r'GY\d_K\d{3}-.*?\.fit', re.IGNORECASE)
+    K_INDEX_PATTERN = re.compile(r'K\d{3}-\d{1}', re.IGNORECASE)
+    UTC_PATTERN = re.compile(r'UTC(\d{8}_\d{6})', re.IGNORECASE)
+    SYSTEM_PATTERN = re.compile(r'GY\d{1}', re.IGNORECASE)
+    # 增量索引在转成大写的字节数据上查找，结果与 FIT_PATTERN / TIMESTAMP_PATTERN 相同
+    FIT_PATTERN_UPPER_BYTES = re.compile(rb'GY\d_K\d{3}-.*?\.FIT')
+    TIMESTAMP_PATTERN_BYTES = re.compile(rb'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}')
+
+    def __init__(self, log_directory: str = r"D:\kats\logs\log_core_pool", index_db: Optional[str] = None, use_index: bool = True):
         """
         初始化日志文件查找器
 
         Args:
             log_directory: 日志文件目录路径
+            index_db: 日志增量索引数据库路径，默认为脚本目录下的 log_index.db
+            use_index: 是否使用增量索引，False时每次完整扫描日志文件
         """
         self.log_directory = log_directory
         self.file_pattern = "autoredux_server_*.log"
         self.k_map_file = "k_map.txt"
         self.k_map_data = self._load_k_map()
+
+        self.log_index = None
+        if use_index:
+            index_db = index_db or os.path.join(os.path.dirname(os.path.abspath(__file__)), "log_index.db")
+            self.log_index = LogIndexStore(index_db, self.FIT_PATTERN_UPPER_BYTES, self.TIMESTAMP_PATTERN_BYTES)
+
+        # 处理时间统计CSV的导出目录，为None时不导出
+        self.stats_export_dir = None
     
     def find_log_files(self) -> List[str]:
         """
@@ -59,15 +90,8 @@ class LogFileFinder:
             提取的日期对象，如果无法提取则返回None
         """
         # 尝试匹配常见的日期格式
-        patterns = [
-            r'(\d{4}-\d{2}-\d{2})',  # YYYY-MM-DD
-            r'(\d{4}_\d{2}_\d{2})',  # YYYY_MM_DD
-            r'(\d{8})',              # YYYYMMDD
-            r'(\d{4}\d{2}\d{2})',    # YYYYMMDD (无分隔符)
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, filename)
+        for pattern in self.DATE_PATTERNS:
+            match = pattern.search(filename)
             if match:
                 date_str = match.group(1)
                 try:
@@ -229,8 +253,7 @@ class LogFileFinder:
         Returns:
             提取的时间戳字符串，如果未找到则返回None
         """
-        timestamp_pattern = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}')
-        match = timestamp_pattern.search(line)
+        match = self.TIMESTAMP_PATTERN.match(line)
         return match.group(0) if match else None
 
     def parse_timestamp(self, timestamp_str: str) -> Optional[datetime]:
@@ -261,9 +284,18 @@ class LogFileFinder:
         Returns:
             时间差的字符串表示
         """
-        time_diff = end_time - start_time
-        total_seconds = time_diff.total_seconds()
+        return self.format_duration((end_time - start_time).total_seconds())
 
+    def format_duration(self, total_seconds: float) -> str:
+        """
+        把秒数格式化为时长字符串
+
+        Args:
+            total_seconds: 秒数
+
+        Returns:
+            时长的字符串表示
+        """
         if total_seconds < 60:
             return f"{total_seconds:.3f}秒"
         elif total_seconds < 3600:
@@ -280,6 +312,8 @@ class LogFileFinder:
         """
         从日志文件中提取匹配 GY*_K*.fit 模式的文件名，并记录开始/结束时间
 
+        启用增量索引时只解析上次索引后追加的内容，结果从索引中读取
+
         Args:
             log_filename: 日志文件名
 
@@ -292,13 +326,43 @@ class LogFileFinder:
             print(f"错误: 日志文件 {log_path} 不存在")
             return set()
 
-        fit_files = set()
-        fit_pattern = re.compile(r'GY\d_K\d{3}-.*?\.fit', re.IGNORECASE)
-
         # 初始化文件时间存储（如果不存在）
         if not hasattr(self, 'fit_file_times'):
             self.fit_file_times = {}
 
+        if self.log_index is not None:
+            try:
+                self.log_index.update(log_path)
+                indexed_times = self.log_index.get_fit_times(log_path)
+            except Exception as e:
+                print(f"更新日志索引 {log_filename} 时出错: {e}")
+                return set()
+
+            if not self.fit_file_times:
+                self.fit_file_times = {fit_name: dict(time_info) for fit_name, time_info in indexed_times.items()}
+            else:
+                for fit_name, time_info in indexed_times.items():
+                    if fit_name not in self.fit_file_times:
+                        self.fit_file_times[fit_name] = {}
+                    self.fit_file_times[fit_name].update(time_info)
+            return set(indexed_times)
+
+        return self._scan_fit_files_from_log(log_path, log_filename)
+
+    def _scan_fit_files_from_log(self, log_path: str, log_filename: str) -> Set[str]:
+        """
+        逐行完整扫描日志文件（不使用增量索引时）
+
+        Args:
+            log_path: 日志文件完整路径
+            log_filename: 日志文件名
+
+        Returns:
+            匹配的fit文件名集合（去重）
+        """
+        fit_files = set()
+        fit_pattern = self.FIT_PATTERN
+
         try:
             with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
                 for line_num, line in enumerate(f, 1):
@@ -394,8 +458,7 @@ class LogFileFinder:
         Returns:
             提取的K索引，如果未找到则返回None
         """
-        k_pattern = re.compile(r'K\d{3}-\d{1}', re.IGNORECASE)
-        match = k_pattern.search(filename)
+        match = self.K_INDEX_PATTERN.search(filename)
         return match.group(0).upper() if match else None
 
     def get_coordinates_for_k_index(self, k_index: str, system: str = None) -> Optional[Tuple[str, str]]:
@@ -430,8 +493,7 @@ class LogFileFinder:
         Returns:
             提取的UTC日期时间字符串，如果未找到则返回None
         """
-        utc_pattern = re.compile(r'UTC(\d{8}_\d{6})', re.IGNORECASE)
-        match = utc_pattern.search(filename)
+        match = self.UTC_PATTERN.search(filename)
         return match.group(1) if match else None
 
     def format_utc_datetime(self, utc_str: str) -> Optional[str]:
@@ -468,8 +530,7 @@ class LogFileFinder:
         Returns:
             提取的系统名称，如GY1、GY2等，如果未找到则返回None
         """
-        system_pattern = re.compile(r'GY\d{1}', re.IGNORECASE)
-        match = system_pattern.search(filename)
+        match = self.SYSTEM_PATTERN.search(filename)
         return match.group(0).upper() if match else None
 
     def extract_fit_files_from_multiple_logs(self, log_filenames: List[str]) -> Set[str]:
@@ -730,66 +791,50 @@ class LogFileFinder:
         Args:
             fit_files: FIT文件名集合
         """
-        time_data = []
-
-        for filename in fit_files:
-            utc_raw = self.extract_utc_datetime_from_filename(filename)
-            if utc_raw:
-                utc_formatted = self.format_utc_datetime(utc_raw)
-                if utc_formatted:
-                    time_data.append((filename, utc_raw, utc_formatted))
+        table = LogEventTable(getattr(self, 'fit_file_times', {}), fit_files)
+        order = table.sorted_by_utc()
 
-        if not time_data:
+        if len(order) == 0:
             print("\n未找到包含UTC时间信息的文件")
             return
 
-        # 按时间排序
-        time_data.sort(key=lambda x: x[1])
+        utc_sorted = table.utc[order]
+        utc_strings = np.datetime_as_string(utc_sorted, unit='s')
 
         print(f"\n时间分析 (按时间排序):")
         print("-" * 140)
         print(f"{'序号':<4} {'UTC时间':<19} {'文件名':<35} {'系统':<6} {'天区索引':<8} {'坐标(RA, DEC)':<20}")
         print("-" * 140)
 
-        for i, (filename, utc_raw, utc_formatted) in enumerate(time_data, 1):
-            # 获取系统名称
-            system_name = self.extract_system_name_from_filename(filename)
-            system_str = system_name if system_name else "N/A"
+        systems = table.system[order]
+        k_indices = table.k_index[order]
+        for i, (filename, utc_string, system_name, k_index) in enumerate(zip(table.file[order], utc_strings, systems, k_indices), 1):
+            utc_formatted = utc_string.replace('T', ' ')
 
-            # 获取天区索引和坐标信息
-            k_index = self.extract_k_index_from_filename(filename)
-            k_index_str = k_index if k_index else "N/A"
-            system_name = self.extract_system_name_from_filename(filename)
-
-            if k_index:
-                coordinates = self.get_coordinates_for_k_index(k_index, system_name)
+            if k_index != 'N/A':
+                coordinates = self.get_coordinates_for_k_index(k_index, None if system_name == 'N/A' else system_name)
                 coord_str = f"{coordinates[0]}, {coordinates[1]}" if coordinates else "坐标未找到"
             else:
                 coord_str = "N/A"
 
-            print(f"{i:<4} {utc_formatted:<19} {filename:<35} {system_str:<6} {k_index_str:<8} {coord_str:<20}")
+            print(f"{i:<4} {utc_formatted:<19} {filename:<35} {system_name:<6} {k_index:<8} {coord_str:<20}")
 
-        if len(time_data) > 1:
-            earliest = time_data[0][2]
-            latest = time_data[-1][2]
+        if len(order) > 1:
+            earliest = utc_strings[0].replace('T', ' ')
+            latest = utc_strings[-1].replace('T', ' ')
             print(f"\n时间范围: {earliest} 到 {latest}")
-            print(f"总时间跨度: {len(time_data)} 个文件")
+            print(f"总时间跨度: {len(order)} 个文件")
 
         # 按日期分组统计
-        date_groups = {}
-        for filename, utc_raw, utc_formatted in time_data:
-            date_part = utc_formatted.split(' ')[0]  # 提取日期部分
-            if date_part not in date_groups:
-                date_groups[date_part] = []
-            date_groups[date_part].append(filename)
-
-        if len(date_groups) > 1:
+        dates, date_counts = np.unique(utc_sorted.astype('datetime64[D]'), return_counts=True)
+
+        if len(dates) > 1:
             print(f"\n按日期分组:")
             print("-" * 40)
-            for date, files in sorted(date_groups.items()):
-                print(f"{date}: {len(files)} 个文件")
+            for date, count in zip(dates, date_counts):
+                print(f"{date}: {count} 个文件")
 
-        print(f"\n总共 {len(time_data)} 个文件包含UTC时间信息")
+        print(f"\n总共 {len(order)} 个文件包含UTC时间信息")
 
     def display_system_analysis(self, fit_files: Set[str]):
         """
@@ -852,7 +897,7 @@ class LogFileFinder:
 
     def display_processing_time_analysis(self, fit_files: Set[str]):
         """
-        显示处理时间分析
+        显示处理时间分析，包含百分位数和按系统的统计
 
         Args:
             fit_files: FIT文件名集合
@@ -863,54 +908,60 @@ class LogFileFinder:
             print("未找到包含开始/结束时间信息的文件")
             return
 
-        processing_data = []
+        table = LogEventTable(self.fit_file_times, fit_files)
+        order = table.sorted_by_duration()
 
-        for filename in fit_files:
-            if filename in self.fit_file_times:
-                time_info = self.fit_file_times[filename]
-                start_time = time_info.get('start')
-                end_time = time_info.get('end')
-
-                if start_time and end_time:
-                    start_dt = self.parse_timestamp(start_time)
-                    end_dt = self.parse_timestamp(end_time)
-                    if start_dt and end_dt:
-                        duration = self.calculate_time_difference(start_dt, end_dt)
-                        duration_seconds = (end_dt - start_dt).total_seconds()
-                        processing_data.append((filename, start_time, end_time, duration, duration_seconds))
-
-        if not processing_data:
+        if len(order) == 0:
             print(f"\n处理时间分析:")
             print("-" * 60)
             print("未找到完整的开始/结束时间对")
             return
 
-        # 按处理时长排序
-        processing_data.sort(key=lambda x: x[4])  # 按秒数排序
+        durations = table.durations[order]
 
         print(f"\n处理时间分析 (按处理时长排序):")
         print("-" * 120)
         print(f"{'序号':<4} {'文件名':<35} {'开始时间':<23} {'结束时间':<23} {'处理时长':<15}")
         print("-" * 120)
 
-        total_duration = 0
-        for i, (filename, start_time, end_time, duration, duration_seconds) in enumerate(processing_data, 1):
-            print(f"{i:<4} {filename:<35} {start_time:<23} {end_time:<23} {duration:<15}")
-            total_duration += duration_seconds
+        for i, (filename, start_time, end_time, duration_seconds) in enumerate(
+                zip(table.file[order], table.start_raw[order], table.end_raw[order], durations), 1):
+            print(f"{i:<4} {filename:<35} {start_time:<23} {end_time:<23} {self.format_duration(duration_seconds):<15}")
 
         # 统计信息
-        if processing_data:
-            avg_duration = total_duration / len(processing_data)
-            min_duration = min(processing_data, key=lambda x: x[4])
-            max_duration = max(processing_data, key=lambda x: x[4])
+        total_duration = float(durations.sum())
+        avg_duration = total_duration / len(durations)
+        percentiles = table.duration_percentiles()
+
+        print(f"\n处理时间统计:")
+        print("-" * 60)
+        print(f"总文件数: {len(durations)}")
+        print(f"总处理时间: {self.format_duration(total_duration)}")
+        print(f"平均处理时间: {self.format_duration(avg_duration)}")
+        print(f"最短处理时间: {self.format_duration(durations[0])} ({table.file[order[0]]})")
+        print(f"最长处理时间: {self.format_duration(durations[-1])} ({table.file[order[-1]]})")
+        print("百分位数: " + ", ".join(f"P{p:g} {self.format_duration(value)}" for p, value in percentiles.items()))
+
+        print("\n按系统统计处理时间:")
+        print("-" * 100)
+        print(f"{'系统':<8} {'完成数':<8} {'平均':<14} {'P50':<14} {'P95':<14} {'P99':<14} {'最长':<14}")
+        print("-" * 100)
+        for row in table.aggregate_durations('system'):
+            if not row['complete']:
+                continue
+            print(f"{row['system']:<8} {row['complete']:<8} {self.format_duration(row['mean_s']):<14} "
+                  f"{self.format_duration(row['p50_s']):<14} {self.format_duration(row['p95_s']):<14} "
+                  f"{self.format_duration(row['p99_s']):<14} {self.format_duration(row['max_s']):<14}")
 
-            print(f"\n处理时间统计:")
-            print("-" * 60)
-            print(f"总文件数: {len(processing_data)}")
-            print(f"总处理时间: {self.calculate_time_difference(datetime.min, datetime.min + timedelta(seconds=total_duration))}")
-            print(f"平均处理时间: {self.calculate_time_difference(datetime.min, datetime.min + timedelta(seconds=avg_duration))}")
-            print(f"最短处理时间: {min_duration[3]} ({min_duration[0]})")
-            print(f"最长处理时间: {max_duration[3]} ({max_duration[0]})")
+        hourly = table.hourly_throughput()
+        if hourly:
+            peak = max(hourly, key=lambda row: row['completed'])
+            print(f"\n每小时吞吐量: 平均 {len(durations) / len(hourly):.1f} 个/小时, "
+                  f"峰值 {peak['completed']} 个/小时 ({peak['hour']})")
+
+        if self.stats_export_dir:
+            paths = table.export_csv(self.stats_export_dir)
+            print(f"\n处理时间统计已导出: {', '.join(paths)}")
 
     def generate_stellarium_script(self, ssc_data: List[Dict], output_filename: str = "stellarium_log_generated.ssc"):
         """
@@ -1501,11 +1552,21 @@ def main():
                        help='在最新日志文件中搜索FIT文件')
     parser.add_argument('--search-fit-recent', '-fr', action='store_true',
                        help='在最近30天的日志文件中搜索FIT文件')
+    parser.add_argument('--index-db', help='日志增量索引数据库路径 (默认: 脚本目录下的 log_index.db)')
+    parser.add_argument('--no-index', action='store_true',
+                       help='不使用增量索引，每次完整扫描日志文件')
+    parser.add_argument('--rebuild-index', action='store_true',
+                       help='清空增量索引后重新解析所有日志文件')
+    parser.add_argument('--export-stats', metavar='DIR',
+                       help='把处理时间统计（每个文件、按系统、按天区、每小时吞吐量）导出为CSV到指定目录')
     
     args = parser.parse_args()
     
     # 创建日志文件查找器实例
-    finder = LogFileFinder(args.dir)
+    finder = LogFileFinder(args.dir, index_db=args.index_db, use_index=not args.no_index)
+    if args.rebuild_index and finder.log_index is not None:
+        finder.log_index.reset()
+    finder.stats_export_dir = args.export_stats
     
     if args.date:
         # 查找指定日期的文件
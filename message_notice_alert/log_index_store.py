@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志增量索引
+记录每个日志文件已解析到的字节偏移和文件标识（inode、mtime、文件头），
+只解析新追加的内容，把每个FIT文件的开始/结束时间保存在SQLite中
+"""
+
+import os
+import re
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+
+# 用于识别文件被轮转或重写的文件头长度
+HEAD_SIGNATURE_SIZE = 1024
+# 每次读取的字节数
+READ_CHUNK_SIZE = 8 * 1024 * 1024
+
+START_KEYWORD = "开始".encode('utf-8')
+END_KEYWORD = "结束".encode('utf-8')
+
+
+class LogIndexStore:
+    """基于SQLite的日志增量索引"""
+
+    def __init__(self, db_path: str, fit_pattern: re.Pattern, timestamp_pattern: re.Pattern):
+        """
+        初始化索引
+
+        Args:
+            db_path: 索引数据库路径
+            fit_pattern: 匹配FIT文件名的字节正则，在转成大写的数据上查找（不区分大小写的正则无法使用前缀加速）
+            timestamp_pattern: 匹配行首时间戳的字节正则
+        """
+        self.db_path = db_path
+        self.fit_pattern = fit_pattern
+        self.timestamp_pattern = timestamp_pattern
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS log_files ('
+                          'log_path TEXT PRIMARY KEY, inode INTEGER, mtime_ns INTEGER, size INTEGER, '
+                          'offset INTEGER, head BLOB)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS fit_times ('
+                          'log_path TEXT, fit_name TEXT, start_time TEXT, end_time TEXT, '
+                          'PRIMARY KEY (log_path, fit_name)) WITHOUT ROWID')
+        self.conn.commit()
+        # 最近一次读取的结果: log_path -> FIT文件时间，文件没有变化时直接返回
+        self._memory: Dict[str, Dict[str, Dict[str, str]]] = {}
+
+    def close(self):
+        self.conn.close()
+
+    def reset(self):
+        """清空索引，下次全部重新解析"""
+        with self.conn:
+            self.conn.execute('DELETE FROM log_files')
+            self.conn.execute('DELETE FROM fit_times')
+        self._memory = {}
+
+    def update(self, log_path: str) -> Tuple[int, bool]:
+        """
+        解析日志文件自上次索引后追加的内容
+
+        Args:
+            log_path: 日志文件完整路径
+
+        Returns:
+            (本次解析的字节数, 是否从头重新解析)
+        """
+        st = os.stat(log_path)
+        row = self.conn.execute('SELECT inode, mtime_ns, size, offset, head FROM log_files WHERE log_path = ?',
+                                (log_path,)).fetchone()
+
+        with open(log_path, 'rb') as f:
+            head = f.read(HEAD_SIGNATURE_SIZE)
+            offset = 0
+            rebuilt = True
+            if row is not None:
+                inode, mtime_ns, size, offset, old_head = row
+                if inode == st.st_ino and mtime_ns == st.st_mtime_ns and size == st.st_size:
+                    return 0, False
+                # inode变化、文件变短或文件头被改写，说明文件被轮转/重写，需要从头解析
+                if inode == st.st_ino and st.st_size >= offset and head[:len(old_head)] == old_head:
+                    rebuilt = False
+                else:
+                    offset = 0
+
+            # 只收集新内容中的时间，写入时与已有记录合并
+            times: Dict[str, List[Optional[str]]] = {}
+            f.seek(offset)
+            parsed_bytes = 0
+            pending = b''
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                data = pending + chunk
+                # 只处理完整的行，最后不完整的一行留到下次
+                last_newline = data.rfind(b'\n')
+                if last_newline < 0:
+                    pending = data
+                    continue
+                pending = data[last_newline + 1:]
+                complete = data[:last_newline + 1]
+                self._parse_lines(complete, times)
+                parsed_bytes += len(complete)
+
+        new_offset = offset + parsed_bytes
+        memory = self._memory.get(log_path)
+        if rebuilt or memory is None:
+            self._memory.pop(log_path, None)
+        else:
+            # 内存中的结果与写入数据库的合并规则相同，不需要重新读取
+            for fit_name, (start_time, end_time) in times.items():
+                time_info = memory.setdefault(fit_name, {})
+                if start_time:
+                    time_info['start'] = start_time
+                if end_time:
+                    time_info['end'] = end_time
+        with self.conn:
+            if rebuilt:
+                self.conn.execute('DELETE FROM fit_times WHERE log_path = ?', (log_path,))
+            # 新内容中的时间覆盖旧值，新内容没有记录的时间保留旧值
+            self.conn.executemany('INSERT INTO fit_times (log_path, fit_name, start_time, end_time) '
+                                  'VALUES (?, ?, ?, ?) '
+                                  'ON CONFLICT (log_path, fit_name) DO UPDATE SET '
+                                  'start_time = COALESCE(excluded.start_time, start_time), '
+                                  'end_time = COALESCE(excluded.end_time, end_time)',
+                                  [(log_path, fit_name, t[0], t[1]) for fit_name, t in times.items()])
+            self.conn.execute('INSERT OR REPLACE INTO log_files (log_path, inode, mtime_ns, size, offset, head) '
+                              'VALUES (?, ?, ?, ?, ?, ?)',
+                              (log_path, st.st_ino, st.st_mtime_ns, st.st_size, new_offset, head))
+        return parsed_bytes, rebuilt
+
+    def _parse_lines(self, data: bytes, times: Dict[str, List[Optional[str]]]):
+        """
+        解析一段完整的行，更新 times: FIT文件名 -> [开始时间, 结束时间]
+
+        先在整段数据上查找FIT文件名，只检查含有FIT文件名的行，避免逐行循环；
+        在字节上处理，大写转换不改变长度，匹配位置可以直接用于原始数据
+        """
+        upper = data.upper()
+        line_end = -1
+        kind = None
+        timestamp = None
+        skip_line = False
+        for match in self.fit_pattern.finditer(upper):
+            position = match.start()
+            if position >= line_end:
+                # 进入新的一行
+                line_start = data.rfind(b'\n', 0, position) + 1
+                line_end = data.find(b'\n', position)
+                if line_end < 0:
+                    line_end = len(data)
+                line = data[line_start:line_end]
+                kind = None
+                skip_line = False
+                if START_KEYWORD in line or END_KEYWORD in line:
+                    ts_match = self.timestamp_pattern.match(line)
+                    if ts_match:
+                        timestamp = ts_match.group(0).decode('ascii')
+                        kind = 0 if START_KEYWORD in line else 1
+                    else:
+                        # 与原来的逐行扫描相同: 含开始/结束但没有时间戳的行不记录文件名
+                        skip_line = True
+            if skip_line:
+                continue
+
+            fit_name = data[position:match.end()].decode('utf-8', errors='ignore')
+            entry = times.get(fit_name)
+            if entry is None:
+                entry = [None, None]
+                times[fit_name] = entry
+            if kind is not None:
+                entry[kind] = timestamp
+
+    def get_fit_times(self, log_path: str) -> Dict[str, Dict[str, str]]:
+        """
+        获取日志文件中的FIT文件及开始/结束时间
+
+        Returns:
+            FIT文件名 -> {'start': 开始时间, 'end': 结束时间}（没有记录的时间不包含）
+        """
+        if log_path in self._memory:
+            return self._memory[log_path]
+        result = {}
+        for fit_name, start_time, end_time in self.conn.execute(
+                'SELECT fit_name, start_time, end_time FROM fit_times WHERE log_path = ?', (log_path,)):
+            time_info = {}
+            if start_time:
+                time_info['start'] = start_time
+            if end_time:
+                time_info['end'] = end_time
+            result[fit_name] = time_info
+        self._memory[log_path] = result
+        return result
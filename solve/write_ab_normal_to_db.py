@@ -7,14 +7,16 @@ import numpy as np
 from numpy.linalg import inv
 
 from solve.download_solve_pipline_astap import plane_normal_vector
+from tools.sky_index import has_sky_index, update_sky_index
 
 # 连接到SQLite数据库
 conn = sqlite3.connect('fits_wcs.db')
 cursor = conn.cursor()
+sky_index = has_sky_index(conn)
 # cursor.execute('''
 #     SELECT id,center_v_x,center_v_y,center_v_z, a_v_x,a_v_y,a_v_z,b_v_x,b_v_y,b_v_z FROM image_info WHERE status = 100 and id = 2266  limit 1
 cursor.execute('''
-    SELECT id,center_v_x,center_v_y,center_v_z, a_v_x,a_v_y,a_v_z,b_v_x,b_v_y,b_v_z FROM image_info WHERE status = 100 
+    SELECT id,center_v_x,center_v_y,center_v_z, a_v_x,a_v_y,a_v_z,b_v_x,b_v_y,b_v_z,center_a_theta,center_b_theta FROM image_info WHERE status = 100 
 ''')
 result = cursor.fetchall()
 o_center = [0, 0, 0]
@@ -34,6 +36,9 @@ for idx, s_item in enumerate(result):
     sql_str = f'UPDATE image_info SET a_n_x={plane_normal_vector_a[0]},a_n_y={plane_normal_vector_a[1]},a_n_z={plane_normal_vector_a[2]},b_n_x={plane_normal_vector_b[0]},b_n_y={plane_normal_vector_b[1]},b_n_z={plane_normal_vector_b[2]} WHERE id = {s_item[0]}'
     print(sql_str)
     cursor.execute(sql_str)
+    if sky_index:
+        update_sky_index(cursor, s_item[0], img_center, plane_normal_vector_a, plane_normal_vector_b,
+                         s_item[10], s_item[11])
 
 conn.commit()
 cursor.close()
@@ -0,0 +1,522 @@
+import argparse
+import ast
+import asyncio
+import bisect
+import collections
+import json
+import logging
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# pip install stomp.py
+import stomp
+
+# 统一的警报转发: GCN Kafka (EP WXT / SVOM ECLAIRs), MQTT (EP WXT) 和 文件回放 多个来源同时接收,
+# 每条消息只解析一次得到 Alert, 按警报 id 去重, 通过一个持久的 STOMP 连接发出观测任务.
+# 记录每条警报 接收 -> 发出 的耗时直方图.
+# 替代 ep_alert.py 与 test_gcn_kafka_example.py 中各自解析并且每条消息新建一次 STOMP 连接的做法.
+# gcn_kafka / paho-mqtt 只在使用对应来源时导入, 回放模式不需要.
+
+TOPIC_HEARTBEAT = 'gcn.heartbeat'
+TOPIC_EP_WXT = 'gcn.notices.einstein_probe.wxt.alert'
+TOPIC_SVOM_ECLAIRS = 'gcn.notices.svom.voevent.eclairs'
+KAFKA_TOPICS = [TOPIC_HEARTBEAT, TOPIC_SVOM_ECLAIRS, TOPIC_EP_WXT]
+
+KIND_HEARTBEAT = 'heartbeat'
+KIND_EP_KAFKA = 'ep_kafka'
+KIND_SVOM = 'svom'
+KIND_EP_MQTT = 'ep_mqtt'
+KIND_BY_TOPIC = {
+    TOPIC_HEARTBEAT: KIND_HEARTBEAT,
+    TOPIC_EP_WXT: KIND_EP_KAFKA,
+    TOPIC_SVOM_ECLAIRS: KIND_SVOM,
+}
+
+# 每 10 个 gcn 心跳发一次设备状态
+STATUS_EVERY_HEARTBEATS = 10
+DEDUP_TTL_S = 24 * 3600
+DEDUP_MAX_SIZE = 100000
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+logger = logging.getLogger('alert_router')
+
+# 原始消息, received_at 为 time.perf_counter()
+RawMessage = collections.namedtuple('RawMessage', ['kind', 'topic', 'payload', 'received_at'])
+# 解析后的警报; serial 为同一暴发的通报序号 (SVOM Pkt_Ser_Num), 与 alert_id 一起用于去重
+Alert = collections.namedtuple('Alert', ['mission', 'alert_id', 'serial', 'ra', 'dec', 'task_tag', 'forward',
+                                         'received_at'])
+
+
+def _text(payload):
+    return payload.decode('utf-8', errors='replace') if isinstance(payload, bytes) else payload
+
+
+def parse_ep_kafka(payload, received_at):
+    value = json.loads(_text(payload))
+    return Alert('EP', str(value['id'][0]), '', float(value['ra']), float(value['dec']), 'EP', True, received_at)
+
+
+def parse_svom_voevent(payload, received_at):
+    root = ET.fromstring(payload if isinstance(payload, bytes) else payload.encode('utf-8'))
+    # Position2D 及其子元素不在命名空间中
+    position = root.find('.//Position2D')
+    if position is None:
+        raise ValueError("Position2D not found in XML")
+    value2 = position.find('Value2')
+    if value2 is None or value2.find('C1') is None or value2.find('C2') is None:
+        raise ValueError("C1 or C2 not found in Value2")
+    ra = float(value2.find('C1').text)
+    dec = float(value2.find('C2').text)
+    params = {}
+    for param in root.iter():
+        if param.tag.endswith('Param') and param.get('name'):
+            params.setdefault(param.get('name'), param.get('value'))
+    burst_id = params.get('Burst_Id')
+    if burst_id is None:
+        raise ValueError("Burst_Id not found in XML")
+    return Alert('SVOM', burst_id, params.get('Pkt_Ser_Num', ''), ra, dec, 'SVOM', True, received_at)
+
+
+def parse_ep_mqtt(payload, received_at):
+    payload_str = _text(payload)
+    try:
+        value = json.loads(payload_str)
+    except json.JSONDecodeError:
+        value = ast.literal_eval(payload_str)
+    hr = float(value['hr'])
+    rate = float(value['netRate'])
+    # 与 ep_alert.py 相同的转发条件
+    forward = (hr > 0.04) & (rate < 2.01)
+    return Alert('EP', str(value['object']), '', float(value['ra']), float(value['dec']), 'WXT', forward,
+                 received_at)
+
+
+PARSERS = {
+    KIND_EP_KAFKA: parse_ep_kafka,
+    KIND_SVOM: parse_svom_voevent,
+    KIND_EP_MQTT: parse_ep_mqtt,
+}
+
+
+def load_msg_format():
+    return {
+        "task_Dec_deg": 0,
+        "task_Ra_deg": 0,
+        "task_status": "",
+        "filterBinningIntervalCount": [],
+        "task_command": "",
+        "task_sets": 0,
+        "task_start_time": "",
+        "task_plan_text": "",
+        "target_eqp": "---",
+        "task_targets": [],
+        "task_end_time": "",
+        "taskName": "---",
+        "task_type": "",
+        "task_level": "1000"
+    }
+
+
+def load_msg_status_format():
+    return {
+        "messageTime": "",
+        "msgType": "gcn_kafka",
+        "deviceName": "gcn_kafka",
+        "deviceStatus": "OK",
+        "deviceColor": "#FFAA00",
+        "sqm-val": "",
+        "messageColor": "green"
+    }
+
+
+def time_str_now():
+    now = datetime.now()
+    return f'{now.strftime("%Y-%m-%d_%H-%M-%S")}-{now.microsecond // 1000:03d}'
+
+
+def task_message(alert, target_eqp):
+    message = load_msg_format()
+    message['task_Dec_deg'] = alert.dec
+    message['task_Ra_deg'] = alert.ra
+    message['target_eqp'] = target_eqp
+    message['taskName'] = f'GRB_{time_str_now()}_{alert.task_tag}_{alert.alert_id}'
+    return message
+
+
+class LatencyHistogram:
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS, max_samples=10000):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.samples = collections.deque(maxlen=max_samples)
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.samples.append(ms)
+
+    def percentile(self, p):
+        if not self.samples:
+            return float('nan')
+        values = sorted(self.samples)
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+    def summary(self):
+        total = sum(self.counts)
+        buckets = '  '.join(f'<={edge}:{count}' for edge, count in zip(self.buckets_ms, self.counts) if count)
+        if self.counts[-1]:
+            buckets += f'  >{self.buckets_ms[-1]}:{self.counts[-1]}'
+        return (f'n {total}  p50 {self.percentile(50):.2f}ms  p95 {self.percentile(95):.2f}ms  '
+                f'max {max(self.samples) if self.samples else float("nan"):.2f}ms  [{buckets}]')
+
+
+class Deduplicator:
+    def __init__(self, ttl_s=DEDUP_TTL_S, max_size=DEDUP_MAX_SIZE):
+        self.ttl_s = ttl_s
+        self.max_size = max_size
+        self.seen_at = collections.OrderedDict()
+
+    def seen(self, key):
+        """
+        key 已经出现过 (未过期) 时返回 True, 否则记录并返回 False
+        """
+        now = time.time()
+        while self.seen_at:
+            oldest_key, oldest_time = next(iter(self.seen_at.items()))
+            if now - oldest_time < self.ttl_s and len(self.seen_at) < self.max_size:
+                break
+            self.seen_at.popitem(last=False)
+        if key in self.seen_at:
+            return True
+        self.seen_at[key] = now
+        return False
+
+
+class StompSink:
+    """
+    持久的 STOMP 连接, 发送在单独的线程中串行执行, 不阻塞事件循环; 发送失败时重连并重发一次
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.conn = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stomp')
+        self.connects = 0
+
+    def _connect(self):
+        if self.conn is not None and self.conn.is_connected():
+            return
+        self._disconnect()
+        conn = stomp.Connection([(self.host, self.port)])
+        conn.connect(wait=True)
+        self.conn = conn
+        self.connects += 1
+
+    def _disconnect(self):
+        if self.conn is not None:
+            try:
+                self.conn.disconnect()
+            except Exception:
+                pass
+            self.conn = None
+
+    def _send(self, destination, body):
+        try:
+            self._connect()
+            self.conn.send(body=body, destination=destination)
+        except Exception as e:
+            logger.warning(f'STOMP send failed, reconnect: {type(e).__name__}: {e}')
+            self._disconnect()
+            self._connect()
+            self.conn.send(body=body, destination=destination)
+
+    async def send(self, destination, body):
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._send, destination, body)
+
+    def close(self):
+        self.executor.submit(self._disconnect).result()
+        self.executor.shutdown()
+
+
+class ReplaySource:
+    """
+    从文件回放 (alert.example.json / eclairs-wakeup.xml), 用于本地测试
+    unique          每轮改写警报 id, 使各轮不被去重
+    duplicate_every 每 N 条多发一条相同的消息, 用于检查去重
+    """
+
+    def __init__(self, paths, repeat=1, interval=0.0, unique=True, duplicate_every=0):
+        self.payloads = [self._load(path) for path in paths]
+        self.repeat = repeat
+        self.interval = interval
+        self.unique = unique
+        self.duplicate_every = duplicate_every
+
+    @staticmethod
+    def _load(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            text = file.read()
+        if text.lstrip().startswith('<'):
+            return KIND_SVOM, TOPIC_SVOM_ECLAIRS, text
+        # alert.example.json 在 json 之后还有其他内容, 只取第一个对象
+        value, _ = json.JSONDecoder().raw_decode(text.lstrip())
+        return KIND_EP_KAFKA, TOPIC_EP_WXT, json.dumps(value)
+
+    @staticmethod
+    def _with_id(kind, payload, suffix):
+        if kind == KIND_SVOM:
+            return re.sub(r'(name="Burst_Id"\s+value=")([^"]*)', lambda m: f'{m.group(1)}{m.group(2)}_{suffix}',
+                          payload)
+        value = json.loads(payload)
+        value['id'] = [f'{value["id"][0]}_{suffix}']
+        return json.dumps(value)
+
+    async def messages(self):
+        count = 0
+        for i in range(self.repeat):
+            for kind, topic, payload in self.payloads:
+                if self.unique:
+                    payload = self._with_id(kind, payload, i)
+                yield RawMessage(kind, topic, payload, time.perf_counter())
+                count += 1
+                if self.duplicate_every and count % self.duplicate_every == 0:
+                    yield RawMessage(kind, topic, payload, time.perf_counter())
+                await asyncio.sleep(self.interval)
+
+
+class KafkaSource:
+    def __init__(self, kafka_config, topics=KAFKA_TOPICS):
+        self.kafka_config = kafka_config
+        self.topics = list(topics)
+
+    async def messages(self):
+        # pip install gcn-kafka
+        from gcn_kafka import Consumer
+        consumer = Consumer(client_id=self.kafka_config['client_id'],
+                            client_secret=self.kafka_config['client_secret'])
+        consumer.subscribe(self.topics)
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='kafka')
+        try:
+            while True:
+                batch = await loop.run_in_executor(executor, lambda: consumer.consume(timeout=1))
+                received_at = time.perf_counter()
+                for message in batch:
+                    if message.error():
+                        logger.warning(f'kafka error: {message.error()}')
+                        continue
+                    topic = message.topic()
+                    yield RawMessage(KIND_BY_TOPIC.get(topic, topic), topic, message.value(), received_at)
+        finally:
+            executor.shutdown(wait=False)
+
+
+class MqttSource:
+    def __init__(self, mqtt_config):
+        self.mqtt_config = mqtt_config
+
+    async def messages(self):
+        # paho-mqtt 1.6.1 / 2.1.0
+        import paho.mqtt.client as mqtt
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        topics = [(t['name'], t['qos']) for t in self.mqtt_config['topics']]
+
+        def on_connect(client, userdata, flags, rescode):
+            if rescode == 0:
+                # 重连后也重新订阅
+                client.subscribe(topics)
+                logger.info(f'mqtt connected, subscribing {topics}')
+            else:
+                logger.warning(f'mqtt bad connection, code={rescode}')
+
+        def on_message(client, userdata, msg):
+            loop.call_soon_threadsafe(queue.put_nowait,
+                                      RawMessage(KIND_EP_MQTT, msg.topic, msg.payload, time.perf_counter()))
+
+        client = mqtt.Client(client_id="HMT_ep", transport='tcp')
+        client.on_connect = on_connect
+        client.on_message = on_message
+        client.reconnect_delay_set(min_delay=1, max_delay=120)
+        client.username_pw_set(username=self.mqtt_config['username'], password=self.mqtt_config['password'])
+        client.connect(host=self.mqtt_config['host'], port=self.mqtt_config['port'],
+                       keepalive=self.mqtt_config.get('keepalive', 60))
+        client.loop_start()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            client.loop_stop()
+            client.disconnect()
+
+
+class AlertRouter:
+    def __init__(self, sink, target_eqp, topic_path, status_topic_path=None, dedup=None, log_dir='./'):
+        """
+        sink        StompSink (或有 async send(destination, body) 的对象)
+        target_eqp  任务消息中的 target_eqp
+        topic_path  任务消息的 STOMP 目的地
+        status_topic_path  设备状态消息的目的地, 为 None 时不发
+        log_dir     转发的 MQTT EP 警报按原方式追加到 EP_WXT{object}.log
+        """
+        self.sink = sink
+        self.target_eqp = target_eqp
+        self.topic_path = topic_path
+        self.status_topic_path = status_topic_path
+        self.dedup = dedup or Deduplicator()
+        self.log_dir = log_dir
+        self.heartbeats = 0
+        self.stats = collections.Counter()
+        self.latency = collections.defaultdict(LatencyHistogram)
+
+    async def run(self, sources):
+        """
+        同时接收各来源的消息, 逐条处理; 所有来源结束 (回放) 后返回
+        """
+        queue = asyncio.Queue()
+        done = object()
+
+        async def pump(source):
+            try:
+                async for raw in source.messages():
+                    await queue.put(raw)
+            except Exception as e:
+                logger.exception(f'source {type(source).__name__} stopped: {type(e).__name__}: {e}')
+            finally:
+                await queue.put(done)
+
+        tasks = [asyncio.ensure_future(pump(source)) for source in sources]
+        remaining = len(tasks)
+        try:
+            while remaining:
+                raw = await queue.get()
+                if raw is done:
+                    remaining -= 1
+                    continue
+                await self.handle(raw)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def handle(self, raw):
+        self.stats['received'] += 1
+        if raw.kind == KIND_HEARTBEAT:
+            await self._heartbeat()
+            return
+        parser = PARSERS.get(raw.kind)
+        if parser is None:
+            self.stats['other'] += 1
+            logger.warning(f'topic={raw.topic} not handled')
+            return
+        try:
+            alert = parser(raw.payload, raw.received_at)
+        except Exception as e:
+            self.stats['bad'] += 1
+            logger.exception(f'Error parsing message topic={raw.topic}: {type(e).__name__}: {e} | {_text(raw.payload)}')
+            if raw.kind == KIND_EP_MQTT:
+                self._write_bad_payload(raw, e)
+            return
+        # 先做转发条件判断: 未通过的消息不记入去重, 同一目标后续满足条件的更新仍然转发
+        if not alert.forward:
+            self.stats['skipped'] += 1
+            logger.warning(f'skip {alert.mission} {alert.alert_id}')
+            return
+        if raw.kind == KIND_EP_MQTT:
+            # 与 ep_alert.py 相同, 满足条件的 EP 消息都记入 EP_WXT{object}.log, 不管是否重复、是否发送成功
+            try:
+                with open(os.path.join(self.log_dir, f'EP_WXT{alert.alert_id}.log'), 'a+', encoding='utf-8') as f:
+                    f.write(_text(raw.payload) + '\n')
+            except Exception as wf:
+                logger.error(f'Failed to write EP_WXT log: {type(wf).__name__}: {wf}')
+        if self.dedup.seen((alert.mission, alert.alert_id, alert.serial)):
+            self.stats['duplicate'] += 1
+            return
+        message = task_message(alert, self.target_eqp)
+        try:
+            # 与原脚本一致, 发送 dict 的 str
+            await self.sink.send(self.topic_path, str(message))
+        except Exception as e:
+            self.stats['failed'] += 1
+            logger.exception(f'Failed to send {message["taskName"]}: {type(e).__name__}: {e}')
+            return
+        self.latency[f'{alert.mission}/{raw.kind}'].add((time.perf_counter() - alert.received_at) * 1000)
+        self.stats['published'] += 1
+        logger.warning(f'Forwarded: {message["taskName"]}')
+
+    def _write_bad_payload(self, raw, e):
+        # 与 ep_alert.py 相同, 无法解析的 EP 消息追加到 EP_bd.log
+        try:
+            with open(os.path.join(self.log_dir, 'EP_bd.log'), 'a+', encoding='utf-8') as f:
+                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} | topic={raw.topic} | {type(e).__name__}: {e} | "
+                        f"{_text(raw.payload)}\n")
+        except Exception as wf:
+            logger.error(f'Failed to write bad payload to EP_bd.log: {type(wf).__name__}: {wf}')
+
+    async def _heartbeat(self):
+        self.heartbeats += 1
+        if self.status_topic_path and self.heartbeats % STATUS_EVERY_HEARTBEATS == 0:
+            status = load_msg_status_format()
+            status['messageTime'] = time_str_now()
+            try:
+                await self.sink.send(self.status_topic_path, str(status))
+            except Exception as e:
+                logger.exception(f'Failed to send status: {type(e).__name__}: {e}')
+
+    def summary(self):
+        lines = [f'{dict(self.stats)}']
+        for name in sorted(self.latency):
+            lines.append(f'{name:<14} {self.latency[name].summary()}')
+        return '\n'.join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='GCN Kafka / MQTT / 回放 警报转发到 STOMP')
+    parser.add_argument('--config', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'))
+    parser.add_argument('--kafka', action='store_true', help='接收 GCN Kafka')
+    parser.add_argument('--mqtt', action='store_true', help='接收 EP MQTT')
+    parser.add_argument('--replay', nargs='+', help='回放文件 (json / VOEvent xml)')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--interval', type=float, default=0.0, help='回放间隔 (秒)')
+    parser.add_argument('--stomp-host', help='覆盖配置中的 server_address')
+    parser.add_argument('--stomp-port', type=int, help='覆盖配置中的 server_port')
+    return parser.parse_args()
+
+
+async def run_router(args, config):
+    kafka_config = config.get('kafka', {})
+    sources = []
+    if args.kafka:
+        sources.append(KafkaSource(kafka_config))
+    if args.mqtt:
+        sources.append(MqttSource(config['mqtt']))
+    if args.replay:
+        sources.append(ReplaySource(args.replay, repeat=args.repeat, interval=args.interval))
+    if not sources:
+        raise SystemExit('no source, use --kafka / --mqtt / --replay')
+    sink = StompSink(args.stomp_host or kafka_config.get('server_address', '127.0.0.1'),
+                     args.stomp_port or kafka_config.get('server_port', 61613))
+    router = AlertRouter(sink, kafka_config.get('target_eqp', 'test'), kafka_config.get('topic_path', '/topic/TEST_TASK'),
+                         kafka_config.get('status_topic_path'))
+    try:
+        await router.run(sources)
+    finally:
+        sink.close()
+        print(router.summary())
+    return router
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    config = {}
+    if os.path.exists(args.config):
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    asyncio.run(run_router(args, config))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import ast
+import asyncio
+import json
+import logging
+import os
+import time
+
+import stomp
+
+from test_gcn.alert_router import AlertRouter, ReplaySource, StompSink, parse_ep_kafka, parse_svom_voevent, \
+    task_message, PARSERS
+from test_schedule.bench_send_message import FakeStompServer, wait_for
+
+# 用 alert.example.json / eclairs-wakeup.xml 回放, 本地假 STOMP 服务器代替 ActiveMQ
+# 对比 原脚本 (每条任务消息一次 CONNECT/SEND/DISCONNECT) 与 AlertRouter (持久连接) 的 接收 -> 发出 耗时,
+# 并检查重复警报只发一次, 发出的消息与原格式 (dict 的 str) 一致
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPLAY_FILES = [os.path.join(HERE, 'alert.example.json'), os.path.join(HERE, 'eclairs-wakeup.xml')]
+TOPIC_PATH = '/topic/TEST_TASK'
+
+
+def legacy_forward(port, raw):
+    # 原来的 send_message: 每条消息一次连接
+    alert = PARSERS[raw.kind](raw.payload, raw.received_at)
+    conn = stomp.Connection([('127.0.0.1', port)])
+    conn.connect(wait=True)
+    conn.send(body=str(task_message(alert, 'test')), destination=TOPIC_PATH)
+    conn.disconnect()
+    return (time.perf_counter() - raw.received_at) * 1000
+
+
+async def replay_all(source):
+    return [raw async for raw in source.messages()]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200, help='回放轮数, 每轮两条警报')
+    parser.add_argument('--interval', type=float, default=0.002, help='逐条到达的间隔 (秒)')
+    parser.add_argument('--duplicate-every', type=int, default=5, help='每 N 条多发一条重复警报')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    server = FakeStompServer()
+    port = server.server_address[1]
+
+    # 原方式: 逐条同步处理
+    raws = asyncio.run(replay_all(ReplaySource(REPLAY_FILES, repeat=args.repeat)))
+    legacy_ms = []
+    t0 = time.perf_counter()
+    for raw in raws:
+        legacy_ms.append(legacy_forward(port, raw._replace(received_at=time.perf_counter())))
+    legacy_s = time.perf_counter() - t0
+    assert wait_for(lambda: len(server.messages) == len(raws), 5)
+    print(f'legacy  {len(raws)} alerts  {legacy_s:.2f}s  p50 {percentile(legacy_ms, 50):.2f}ms  '
+          f'p95 {percentile(legacy_ms, 95):.2f}ms  connections {server.connections}')
+
+    # 逐条到达 (间隔 --interval) 时的 接收 -> 发出 耗时
+    server.messages.clear()
+    server.connections = 0
+    sink = StompSink('127.0.0.1', port)
+    router = AlertRouter(sink, 'test', TOPIC_PATH)
+    source = ReplaySource(REPLAY_FILES, repeat=args.repeat, interval=args.interval)
+    asyncio.run(router.run([source]))
+    sink.close()
+    assert router.stats['published'] == len(raws), router.stats
+    print(f'router  paced {args.interval * 1000:.0f}ms  connections {sink.connects}')
+    print(router.summary())
+
+    # 突发: 全部同时到达, 含重复警报
+    sink = StompSink('127.0.0.1', port)
+    router = AlertRouter(sink, 'test', TOPIC_PATH)
+    source = ReplaySource(REPLAY_FILES, repeat=args.repeat, duplicate_every=args.duplicate_every)
+    t0 = time.perf_counter()
+    asyncio.run(router.run([source]))
+    router_s = time.perf_counter() - t0
+    sink.close()
+    assert router.stats['published'] == len(raws), router.stats
+    assert router.stats['duplicate'] == len(raws) // args.duplicate_every, router.stats
+    assert wait_for(lambda: len(server.messages) == len(raws) * 2, 5)
+    print(f'router  burst {router.stats["received"]} alerts  {router_s:.2f}s  {dict(router.stats)}')
+
+    # 发出的消息: dict 的 str, 坐标与 taskName 与原脚本一致
+    with open(REPLAY_FILES[1], 'r', encoding='utf-8') as f:
+        svom = parse_svom_voevent(f.read(), 0)
+    with open(REPLAY_FILES[0], 'r', encoding='utf-8') as f:
+        ep = parse_ep_kafka(json.dumps(json.JSONDecoder().raw_decode(f.read().lstrip())[0]), 0)
+    sent = [ast.literal_eval(body) for body in server.messages[:2]]
+    assert (sent[0]['task_Ra_deg'], sent[0]['task_Dec_deg']) == (ep.ra, ep.dec)
+    assert sent[0]['taskName'].endswith(f'_EP_{ep.alert_id}_0')
+    assert (sent[1]['task_Ra_deg'], sent[1]['task_Dec_deg']) == (svom.ra, svom.dec)
+    assert sent[1]['taskName'].endswith(f'_SVOM_{svom.alert_id}_0')
+    print(f'sample  {sent[1]["taskName"]}  ra {sent[1]["task_Ra_deg"]}  dec {sent[1]["task_Dec_deg"]}')
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from tools.async_download import DOWNLOAD_NOT_FOUND, DOWNLOAD_OK, FITS_BLOCK, download_many
+
+# 本地 http.server 代替归档服务器, 对比 wget 进程 与 进程内 asyncio 下载 的吞吐
+# 同时检查 404 返回码, .part 续传 (Range) 和校验失败时不留下文件
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    # HTTP/1.1 keep-alive, 支持 Range: bytes=n-
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+    range_requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        RangeRequestHandler.connections.add(self.client_address)
+
+    def send_head(self):
+        range_header = self.headers.get('Range')
+        if not range_header:
+            return super().send_head()
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        size = os.path.getsize(path)
+        start = int(range_header.split('=')[1].split('-')[0])
+        if start >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+        RangeRequestHandler.range_requests += 1
+        file = open(path, 'rb')
+        file.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Range', f'bytes {start}-{size - 1}/{size}')
+        self.send_header('Content-Length', str(size - start))
+        self.end_headers()
+        return file
+
+
+def make_fits(path, blocks):
+    data_size = FITS_BLOCK * (blocks - 1)
+    cards = ['SIMPLE  =                    T', 'BITPIX  =                    8', 'NAXIS   =                    1',
+             f'NAXIS1  = {data_size:>20}', 'END']
+    with open(path, 'wb') as file:
+        file.write(''.join(card.ljust(80) for card in cards).encode('ascii').ljust(FITS_BLOCK))
+        file.write(os.urandom(data_size))
+
+
+def wget_download(url, save_path):
+    # 原来的方式: 每个文件一个 wget 进程
+    with subprocess.Popen(["wget", "-O", save_path, "-nd", "--no-check-certificate", url],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc_down:
+        stdout_data, stderr_data = proc_down.communicate()
+        if proc_down.returncode == 0:
+            return 1
+        if stderr_data.decode().__contains__('ERROR 404'):
+            return 404
+        return 301
+
+
+def same_files(src_dir, dst_dir, names):
+    for name in names:
+        with open(os.path.join(src_dir, name), 'rb') as a, open(os.path.join(dst_dir, name), 'rb') as b:
+            if a.read() != b.read():
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=60)
+    parser.add_argument('--blocks', type=int, default=700, help='每个文件的 2880 字节块数 (700 约 2MB)')
+    parser.add_argument('--workers', type=int, default=3, help='wget 线程数 (p_02 为 3)')
+    parser.add_argument('--per-host', type=int, default=8)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_download_')
+    src_dir = os.path.join(root, 'src')
+    os.makedirs(src_dir)
+    names = [f'{i}.fits' for i in range(args.files)]
+    for name in names:
+        make_fits(os.path.join(src_dir, name), args.blocks)
+    with open(os.path.join(src_dir, 'bad.fits'), 'wb') as file:
+        file.write(b'<html>not fits</html>'.ljust(FITS_BLOCK))
+
+    handler = lambda *a, **kw: RangeRequestHandler(*a, directory=src_dir, **kw)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}/'
+    total_mb = args.files * args.blocks * FITS_BLOCK / 1e6
+
+    try:
+        if shutil.which('wget'):
+            wget_dir = os.path.join(root, 'wget')
+            os.makedirs(wget_dir)
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                codes = list(executor.map(lambda name: wget_download(base + name, os.path.join(wget_dir, name)),
+                                          names))
+            wget_s = time.perf_counter() - t0
+            assert all(code == 1 for code in codes)
+            print(f'wget   x{args.workers}    {wget_s:.2f}s  {total_mb / wget_s:.1f} MB/s')
+        else:
+            print('wget not found, skip')
+
+        async_dir = os.path.join(root, 'async')
+        os.makedirs(async_dir)
+        RangeRequestHandler.connections.clear()
+        t0 = time.perf_counter()
+        codes = asyncio.run(download_many([(base + name, os.path.join(async_dir, name)) for name in names],
+                                          per_host=args.per_host))
+        async_s = time.perf_counter() - t0
+        assert all(code == DOWNLOAD_OK for code in codes), codes
+        assert same_files(src_dir, async_dir, names)
+        print(f'async  x{args.per_host}    {async_s:.2f}s  {total_mb / async_s:.1f} MB/s  '
+              f'connections {len(RangeRequestHandler.connections)} for {args.files} files')
+
+        # 返回码与 wget 一致
+        codes = asyncio.run(download_many([(base + 'missing.fits', os.path.join(async_dir, 'missing.fits')),
+                                           (base + 'bad.fits', os.path.join(async_dir, 'bad.fits'))]))
+        assert codes == [DOWNLOAD_NOT_FOUND, 301], codes
+        assert not os.path.exists(os.path.join(async_dir, 'bad.fits'))
+        assert not os.path.exists(os.path.join(async_dir, 'bad.fits.part'))
+        print(f'codes  missing -> {codes[0]}  not fits -> {codes[1]}')
+
+        # 续传: 留下前一半作为 .part
+        resume_path = os.path.join(async_dir, 'resume.fits')
+        with open(os.path.join(src_dir, names[0]), 'rb') as file:
+            content = file.read()
+        with open(resume_path + '.part', 'wb') as file:
+            file.write(content[:len(content) // 2])
+        RangeRequestHandler.range_requests = 0
+        codes = asyncio.run(download_many([(base + names[0], resume_path)]))
+        with open(resume_path, 'rb') as file:
+            assert codes == [DOWNLOAD_OK] and file.read() == content
+        assert RangeRequestHandler.range_requests == 1
+        print(f'resume ok  ({len(content) // 2} of {len(content)} bytes from .part)')
+    finally:
+        server.shutdown()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
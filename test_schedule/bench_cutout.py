@@ -0,0 +1,197 @@
+import argparse
+import math
+import os
+import shutil
+import tempfile
+import time
+
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from astropy import wcs
+from astropy.coordinates import SkyCoord
+from astropy.io import fits
+from matplotlib.patches import Circle
+
+from tools.cutout import (Frame, cut_array, cut_stamps, frames_world_to_pixel, render_stamp, stamp_origin,
+                          write_cube, write_png_strip)
+
+# 合成 --frames 帧 4800x3211 uint16 (BZERO = 32768, 与相机输出相同) 和每帧的 WCS 头字符串 (.txt), 目标在各帧的
+# 不同位置 (其中一帧靠近边缘, 一帧为 RICE 压缩, 一帧带 SIP), 对比:
+#   full     sources/0.2_get_sub_img.py: 每帧 wcs.WCS(line).world_to_pixel, fits.open(...)[0].data 读入整幅后截取,
+#            matplotlib 300 dpi 保存
+#   cutout   tools/cutout.py: 向量化 WCS, 只读需要的行段, PIL 保存
+# 并检查像素坐标与 astropy 一致, stamp 与整幅截取的结果相同
+
+WIDTH = 4800
+HEIGHT = 3211
+TARGET = (245.727, -16.183)
+
+
+def frame_wcs(rng, index, edge=False, sip=False):
+    frame = wcs.WCS(naxis=2)
+    frame.wcs.ctype = ['RA---TAN-SIP', 'DEC--TAN-SIP'] if sip else ['RA---TAN', 'DEC--TAN']
+    scale = 0.000823
+    angle = rng.uniform(-0.05, 0.05) + (math.pi if index % 2 else 0)
+    frame.wcs.cd = scale * np.array([[-math.cos(angle), math.sin(angle)], [math.sin(angle), math.cos(angle)]])
+    frame.wcs.crpix = [(WIDTH + 1) / 2, (HEIGHT + 1) / 2]
+    if edge:
+        # 目标在左边缘外侧 60 像素内
+        frame.wcs.crval = [TARGET[0], TARGET[1]]
+        frame.wcs.crpix = [WIDTH - 60 if index % 2 else 60, (HEIGHT + 1) / 2]
+    else:
+        frame.wcs.crval = [TARGET[0] + rng.uniform(-1.2, 1.2), TARGET[1] + rng.uniform(-0.8, 0.8)]
+    if sip:
+        frame.sip = wcs.Sip(np.array([[0, 0, 2e-7], [0, 1e-7, 0], [3e-7, 0, 0]]), np.zeros((3, 3)), None, None,
+                            frame.wcs.crpix)
+        return frame.to_header_string(relax=True)
+    return frame.to_header_string()
+
+
+def make_frames(root, count):
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        data = rng.integers(900, 1200, (HEIGHT, WIDTH), dtype=np.uint16)
+        header_string = frame_wcs(rng, i, edge=(i == 1), sip=(i == 3))
+        path = os.path.join(root, f'{1001 + i}.fits')
+        if i == 2:
+            fits.HDUList([fits.PrimaryHDU(), fits.CompImageHDU(data, compression_type='RICE_1')]).writeto(path)
+        else:
+            fits.PrimaryHDU(data).writeto(path)
+        with open(os.path.join(root, f'{1001 + i}.txt'), 'w', encoding='utf-8') as file:
+            file.write(header_string)
+        frames.append(Frame(str(1001 + i), path, header_string))
+    return frames
+
+
+def legacy_cut(frame, width, height, png_path=None):
+    # sources/0.2_get_sub_img.py 的循环体
+    pix_xy = wcs.WCS(frame.wcs).world_to_pixel(SkyCoord(ra=TARGET[0], dec=TARGET[1], unit='deg'))
+    hdu = fits.open(frame.path)
+    data = hdu[-1].data
+    hdu.close()
+    data_height, data_width = data.shape
+    center_x, center_y = pix_xy[0], pix_xy[1]
+    start_x = math.floor(max(center_x - width // 2, 0))
+    end_x = math.floor(min(center_x + width // 2 + width % 2, data_width))
+    start_y = math.floor(max(center_y - height // 2, 0))
+    end_y = math.floor(min(center_y + height // 2 + height % 2, data_height))
+    x_offset = math.floor(abs(min(center_x - width // 2, 0)))
+    y_offset = math.floor(abs(min(center_y - height // 2, 0)))
+    region = data[start_y:end_y, start_x:end_x]
+    new_image = np.zeros((height, width), dtype=data.dtype)
+    new_image[y_offset:y_offset + region.shape[0], x_offset:x_offset + region.shape[1]] = region
+    if png_path is not None:
+        fig, ax = plt.subplots()
+        ax.imshow(new_image, cmap='gray')
+        ax.add_patch(Circle((center_x - start_x + x_offset, center_y - start_y + y_offset), 10, edgecolor='red',
+                            facecolor='none'))
+        plt.savefig(png_path, dpi=300, format='png', bbox_inches='tight')
+        plt.close(fig)
+    return new_image, data.nbytes
+
+
+def read_chars():
+    # 本进程 read() 读取的字节数 (Linux)
+    try:
+        with open('/proc/self/io') as file:
+            for line in file:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=8)
+    parser.add_argument('--width', type=int, default=400)
+    parser.add_argument('--height', type=int, default=300)
+    parser.add_argument('--headers', type=int, default=2000, help='向量化 WCS 计时用的头数')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_cutout_')
+    try:
+        frames = make_frames(root, args.frames)
+        headers = [frame.wcs for frame in frames]
+
+        # 像素坐标与 astropy 一致
+        xs, ys = frames_world_to_pixel(headers, *TARGET)
+        for frame, x, y in zip(frames, xs, ys):
+            expected = wcs.WCS(frame.wcs).all_world2pix(TARGET[0], TARGET[1], 0)
+            assert abs(x - expected[0]) < 1e-6 and abs(y - expected[1]) < 1e-6, (frame.frame_id, x, y, expected)
+        many = [headers[i % len(headers)] for i in range(args.headers)]
+        t0 = time.perf_counter()
+        for header in many:
+            wcs.WCS(header).world_to_pixel(SkyCoord(ra=TARGET[0], dec=TARGET[1], unit='deg'))
+        astropy_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        frames_world_to_pixel(many, *TARGET)
+        vector_s = time.perf_counter() - t0
+        print(f'WCS for {args.headers} frames: astropy loop {astropy_s:.3f}s  vectorized {vector_s:.3f}s  '
+              f'x{astropy_s / vector_s:.0f}')
+
+        # 整幅读入 (先各读一遍, 两种方式都在页缓存中)
+        legacy_times, legacy_bytes, legacy_stamps = [], [], []
+        for frame in frames:
+            t0 = time.perf_counter()
+            stamp, nbytes = legacy_cut(frame, args.width, args.height)
+            legacy_times.append(time.perf_counter() - t0)
+            legacy_bytes.append(nbytes)
+            legacy_stamps.append(stamp)
+
+        t0 = time.perf_counter()
+        chars = read_chars()
+        stamps = cut_stamps(frames, *TARGET, width=args.width, height=args.height)
+        cutout_s = time.perf_counter() - t0
+        chars = read_chars() - chars if chars is not None else None
+
+        for frame, stamp, legacy_stamp, x, y in zip(frames, stamps, legacy_stamps, xs, ys):
+            with fits.open(frame.path) as hdulist:
+                full = hdulist[-1].data.astype(np.float32)
+            assert (stamp.x0, stamp.y0) == stamp_origin(x, y, args.width, args.height)
+            assert np.array_equal(stamp.data, cut_array(full, stamp.x0, stamp.y0, args.width, args.height))
+            if stamp.x0 >= 0 and stamp.y0 >= 0:
+                # 不在边缘时与原脚本的截取相同
+                assert np.array_equal(stamp.data, legacy_stamp.astype(np.float32)), frame.frame_id
+        edge = stamps[1]
+        assert edge.x0 < 0 or edge.x0 + args.width > WIDTH
+        assert any(stamp.bytes_read is None for stamp in stamps)
+
+        bytes_read = [stamp.bytes_read for stamp in stamps if stamp.bytes_read is not None]
+        print(f'{args.frames} frames {WIDTH}x{HEIGHT} uint16, {args.width}x{args.height} stamps')
+        print(f'full     {np.mean(legacy_times) * 1000:8.1f} ms/stamp  {np.mean(legacy_bytes) / 1e6:8.2f} MB/stamp')
+        print(f'cutout   {cutout_s / len(frames) * 1000:8.1f} ms/stamp  {np.mean(bytes_read) / 1e6:8.3f} MB/stamp '
+              f'(uncompressed)  read() total {chars / 1e6 if chars is not None else float("nan"):.2f} MB  '
+              f'x{np.mean(legacy_times) / (cutout_s / len(frames)):.0f}')
+
+        # 输出: matplotlib 300 dpi 与 PIL
+        t0 = time.perf_counter()
+        for frame in frames[:3]:
+            legacy_cut(frame, args.width, args.height, os.path.join(root, f'{frame.frame_id}_legacy.png'))
+        legacy_png_s = (time.perf_counter() - t0) / 3
+        t0 = time.perf_counter()
+        for stamp in stamps:
+            render_stamp(stamp).save(os.path.join(root, f'{stamp.frame_id}.png'), compress_level=1)
+        pil_s = (time.perf_counter() - t0) / len(stamps)
+        t0 = time.perf_counter()
+        write_png_strip(os.path.join(root, 'strip.png'), stamps, columns=4)
+        strip_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        write_cube(os.path.join(root, 'cube.fits'), stamps, *TARGET)
+        cube_s = time.perf_counter() - t0
+        with fits.open(os.path.join(root, 'cube.fits')) as hdulist:
+            assert hdulist[0].data.shape == (len(frames), args.height, args.width)
+            assert list(hdulist['STAMPS'].data['FRAME_ID']) == [frame.frame_id for frame in frames]
+        print(f'png      full+matplotlib 300dpi {legacy_png_s * 1000:.0f} ms/stamp  cutout+PIL {pil_s * 1000:.1f} ms/stamp'
+              f'  strip {strip_s * 1000:.1f} ms  cube {cube_s * 1000:.1f} ms')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
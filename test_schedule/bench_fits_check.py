@@ -0,0 +1,107 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from astropy.io import fits
+
+from tools.fits_check import check_fits_dir, check_fits_structure
+from tools.fits_header import FITS_BLOCK
+
+# 对比原 fits_file_check (astropy 打开并 len(hdul[0].data), 读取并解码整幅图) 与 只解析头的快速校验
+# 同时确认截断/补齐错误/数据损坏的文件都能被检出
+
+
+def astropy_check(fits_file_path):
+    # 原来的检查
+    try:
+        with fits.open(fits_file_path) as hdul:
+            return len(hdul[0].data) > 0
+    except Exception:
+        return False
+
+
+def make_files(dir_path, count, shape):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        data = rng.integers(0, 65535, size=shape, dtype=np.uint16)
+        path = os.path.join(dir_path, f'{i}.fits')
+        fits.PrimaryHDU(data).writeto(path, checksum=True)
+        paths.append(path)
+    return paths
+
+
+def make_broken(dir_path, src_path):
+    with open(src_path, 'rb') as file:
+        content = file.read()
+    broken = {
+        'truncated': content[:len(content) - FITS_BLOCK * 3],
+        'bad_padding': content[:-100],
+        # 数据区中间改一个字节, 长度不变, 只有校验和能发现
+        'corrupted': content[:len(content) // 2] + bytes([content[len(content) // 2] ^ 0xFF]) +
+                     content[len(content) // 2 + 1:],
+        'not_fits': b'<html>404</html>'.ljust(FITS_BLOCK),
+    }
+    paths = {}
+    for name, data in broken.items():
+        path = os.path.join(dir_path, f'broken_{name}.fits')
+        with open(path, 'wb') as file:
+            file.write(data)
+        paths[name] = path
+    return paths
+
+
+def timed(func, paths):
+    t0 = time.perf_counter()
+    results = [func(path) for path in paths]
+    return time.perf_counter() - t0, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--size', type=int, default=2048, help='图像边长 (uint16)')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_fits_check_')
+    try:
+        paths = make_files(root, args.files, (args.size, args.size))
+        mb = sum(os.path.getsize(path) for path in paths) / 1e6
+
+        astropy_s, results = timed(astropy_check, paths)
+        assert all(results)
+        fast_s, results = timed(lambda path: check_fits_structure(path)[0], paths)
+        assert all(results)
+        sample_s, results = timed(lambda path: check_fits_structure(path, sample_blocks=8)[0], paths)
+        assert all(results)
+        checksum_s, results = timed(lambda path: check_fits_structure(path, verify_checksum=True)[0], paths)
+        assert all(results)
+        print(f'{args.files} files  {mb:.0f} MB')
+        print(f'astropy len(data)   {astropy_s * 1000 / args.files:8.2f} ms/file')
+        print(f'header + length     {fast_s * 1000 / args.files:8.2f} ms/file  x{astropy_s / fast_s:.0f}')
+        print(f'  + sample 8 blocks {sample_s * 1000 / args.files:8.2f} ms/file')
+        print(f'  + DATASUM/CHECKSUM {checksum_s * 1000 / args.files:7.2f} ms/file')
+
+        broken = make_broken(root, paths[0])
+        for name, path in broken.items():
+            ok, reason = check_fits_structure(path)
+            ok_checksum, reason_checksum = check_fits_structure(path, verify_checksum=True)
+            print(f'{name:<12} astropy {astropy_check(path)!s:<5}  fast {ok!s:<5}  checksum {ok_checksum!s:<5}  '
+                  f'{reason_checksum}')
+            assert not ok_checksum
+            if name != 'corrupted':
+                assert not ok
+
+        t0 = time.perf_counter()
+        results = check_fits_dir(root)
+        print(f'batch  {len(results)} files  failed {sum(1 for _, ok, _ in results if not ok)}  '
+              f'{time.perf_counter() - t0:.3f}s')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import email.utils
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from tools.index_crawler import crawl_roots, format_crawl_stats
+
+# 本地静态目录树代替归档服务器, 对比 wget --spider -r (原 scan_by_day_path) 与 索引页爬取 的结果和耗时,
+# 以及目录未修改时带缓存重扫的耗时
+
+
+class IndexRequestHandler(SimpleHTTPRequestHandler):
+    # 目录索引页带 ETag/Last-Modified, 支持 If-None-Match 返回 304
+    protocol_version = 'HTTP/1.1'
+    requests_304 = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isdir(path) or not self.path.endswith('/'):
+            return super().send_head()
+        mtime = int(os.stat(path).st_mtime)
+        etag = f'"{mtime:x}-{len(os.listdir(path)):x}"'
+        if self.headers.get('If-None-Match') == etag:
+            IndexRequestHandler.requests_304 += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+        # 200 时 ETag/Last-Modified 在 end_headers 中加上
+        return self.list_directory(path)
+
+    def end_headers(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.endswith('/') and getattr(self, '_status', 200) == 200:
+            mtime = int(os.stat(path).st_mtime)
+            self.send_header('ETag', f'"{mtime:x}-{len(os.listdir(path)):x}"')
+            self.send_header('Last-Modified', email.utils.formatdate(mtime, usegmt=True))
+        super().end_headers()
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+
+def make_tree(root, day, dirs_per_system, files_per_dir):
+    for gy in range(1, 7):
+        day_dir = os.path.join(root, 'psp', 'KATS', f'GY{gy}-DATA', day)
+        for k in range(dirs_per_system):
+            sub = os.path.join(day_dir, f'K{k:03d}')
+            os.makedirs(sub, exist_ok=True)
+            for i in range(files_per_dir):
+                name = f'GY{gy}_K{k:03d}-{i}_UTC{day}_{i:06d}_C.fit'
+                open(os.path.join(sub, name), 'wb').close()
+            open(os.path.join(sub, f'GY{gy}_K{k:03d}_fiel_UTC{day}_000000.fit'), 'wb').close()
+            open(os.path.join(sub, f'GY{gy}_K{k:03d}_UTC{day}_000000_FZ.fits'), 'wb').close()
+            open(os.path.join(sub, 'readme.txt'), 'wb').close()
+        for skip_dir in ('Calibration', 'Flat'):
+            sub = os.path.join(day_dir, skip_dir)
+            os.makedirs(sub, exist_ok=True)
+            for i in range(files_per_dir):
+                open(os.path.join(sub, f'{skip_dir}_{i}.fit'), 'wb').close()
+
+
+def wget_spider(download_url_root):
+    # 原 scan_by_day_path 的 wget --spider 与 stderr 解析
+    process = subprocess.Popen(["wget", "-N", "--spider", "-nd", '--user-agent', 'MyCustomUserAgent',
+                                "-r", "-np", "-nH", "-R", "index.html", "-P", tempfile.gettempdir(), "--level=0",
+                                "--no-check-certificate", download_url_root],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    file_url_list = []
+    for line in process.stderr:
+        line = line.strip()
+        if line.startswith(b"--") and (line.endswith(b".fts") or line.endswith(b".fit") or line.endswith(b".fits")):
+            url = re.findall(b'https?://\\S+', line)[0].decode('utf-8')
+            if any(pattern in url for pattern in ('Calibration', '_FZ', 'Flat', 'fiel')):
+                continue
+            file_url_list.append(url)
+    process.wait()
+    return file_url_list
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dirs', type=int, default=10, help='每个系统的子目录数')
+    parser.add_argument('--files', type=int, default=40, help='每个子目录的文件数')
+    args = parser.parse_args()
+
+    day = '20240101'
+    root = tempfile.mkdtemp(prefix='bench_crawler_')
+    make_tree(root, day, args.dirs, args.files)
+    handler = lambda *a, **kw: IndexRequestHandler(*a, directory=root, **kw)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    roots = [f'{base}/psp/KATS/GY{gy}-DATA/{day}/' for gy in range(1, 7)]
+    cache_path = os.path.join(root, 'index_cache.json')
+    expected = 6 * args.dirs * args.files
+
+    try:
+        if shutil.which('wget'):
+            t0 = time.perf_counter()
+            wget_urls = []
+            for download_url_root in roots:
+                wget_urls.extend(wget_spider(download_url_root))
+            wget_s = time.perf_counter() - t0
+            print(f'wget --spider  {len(wget_urls)} files  {wget_s:.2f}s (serial GY1-GY6)')
+        else:
+            wget_urls = None
+            print('wget not found, skip')
+
+        results, stats = crawl_roots(roots, cache_path=cache_path)
+        crawl_urls = [url for download_url_root in roots for url in results[download_url_root]]
+        print(f'crawl  first   {format_crawl_stats(stats)}')
+        assert len(crawl_urls) == expected, len(crawl_urls)
+        if wget_urls is not None:
+            assert sorted(crawl_urls) == sorted(wget_urls)
+            print('crawl == wget --spider')
+
+        IndexRequestHandler.requests_304 = 0
+        results, stats = crawl_roots(roots, cache_path=cache_path)
+        print(f'crawl  cached  {format_crawl_stats(stats)}')
+        assert stats['not_modified'] == stats['pages'] == IndexRequestHandler.requests_304
+        assert [url for download_url_root in roots for url in results[download_url_root]] == crawl_urls
+
+        # 新增一个文件, 只有它所在的目录重新读取
+        new_name = f'GY1_K000-new_UTC{day}_235959_C.fit'
+        open(os.path.join(root, 'psp', 'KATS', 'GY1-DATA', day, 'K000', new_name), 'wb').close()
+        future = time.time() + 10
+        os.utime(os.path.join(root, 'psp', 'KATS', 'GY1-DATA', day, 'K000'), (future, future))
+        results, stats = crawl_roots(roots, cache_path=cache_path)
+        print(f'crawl  +1 file {format_crawl_stats(stats)}')
+        assert stats['files'] == expected + 1 and stats['pages'] - stats['not_modified'] == 1
+    finally:
+        server.shutdown()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
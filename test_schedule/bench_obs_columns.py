@@ -0,0 +1,113 @@
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import time
+
+from tools.image_obs_columns import backfill_obs_columns, create_obs_indexes, latest_obs_date, migrate_obs_columns
+
+# 合成多百万行 image_info, 对比 file_path like / substr(id) 全表扫描 与 obs 列索引查询, 并统计迁移回填耗时
+
+
+def create_db(db_path, rows, nights, seed):
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE image_info (id INTEGER PRIMARY KEY AUTOINCREMENT, file_path TEXT NOT NULL, '
+                 'wcs_info TEXT, status DECIMAL)')
+    per_night = rows // nights
+    day0 = datetime.date(2023, 1, 1)
+    batch = []
+    for night in range(nights):
+        day = (day0 + datetime.timedelta(days=night)).strftime('%Y%m%d')
+        for i in range(per_night):
+            gy = rng.randint(1, 6)
+            k = rng.randint(1, 120)
+            seconds = i * 2
+            hms = f'{seconds // 3600 % 24:02d}{seconds // 60 % 60:02d}{seconds % 60:02d}'
+            file_path = (f'https://download.china-vo.org/psp/KATS/GY{gy}-DATA/{day}/K{k:03d}/'
+                         f'GY{gy}_K{k:03d}-{rng.randint(1, 4)}_No%20Filter_60S_Bin2_UTC{day}_{hms}_-20C_{i}.fit')
+            batch.append((file_path, rng.choice((0, 1, 100))))
+            if len(batch) >= 100000:
+                conn.executemany('INSERT INTO image_info (file_path, status) VALUES (?, ?)', batch)
+                batch = []
+    if batch:
+        conn.executemany('INSERT INTO image_info (file_path, status) VALUES (?, ?)', batch)
+    conn.commit()
+    return conn
+
+
+def timed(conn, sql, params=(), repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = conn.execute(sql, params).fetchall()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=3000000)
+    parser.add_argument('--nights', type=int, default=1000)
+    parser.add_argument('--db', default='bench_obs_columns.db')
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    conn = create_db(args.db, args.rows, args.nights, 1)
+    print(f'rows {args.rows}  nights {args.nights}  create {time.perf_counter() - t0:.1f}s')
+
+    night = conn.execute('SELECT file_path FROM image_info ORDER BY id LIMIT 1 OFFSET ?',
+                         (args.rows // 2,)).fetchone()[0].split('UTC')[1][:8]
+    queries_before = {
+        'night (p_02)': ('select id,file_path from  image_info where file_path like ? limit 5000', (f'%UTC{night}%',)),
+        'latest date (t_01)': ('select substr(id, 5, 8) AS id_substring from  image_info '
+                               'order by id_substring desc limit 1', ()),
+        'night + status': ('select id from image_info where file_path like ? and status = 0', (f'%UTC{night}%',)),
+        'system + k zone': ('select id from image_info where file_path like ?', ('%GY3_K011-%',)),
+    }
+    timings_before = {name: timed(conn, sql, params) for name, (sql, params) in queries_before.items()}
+    print(f'before queries done  {time.perf_counter() - t0:.1f}s')
+
+    t0 = time.perf_counter()
+    migrate_obs_columns(conn, create_indexes=False)
+    migrate_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    backfill_obs_columns(conn, progress=False)
+    backfill_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    create_obs_indexes(conn)
+    index_s = time.perf_counter() - t0
+    conn.execute('ANALYZE')
+    print(f'migrate {migrate_s:.2f}s  backfill {backfill_s:.1f}s  index {index_s:.1f}s')
+
+    queries_after = {
+        'night (p_02)': ('select id,file_path from  image_info where obs_date = ? limit 5000', (int(night),)),
+        'night + status': ('select id from image_info where obs_date = ? and status = 0', (int(night),)),
+        'system + k zone': ('select id from image_info where system_id = 3 and k_zone = 11', ()),
+    }
+    timings_after = {name: timed(conn, sql, params) for name, (sql, params) in queries_after.items()}
+    t0 = time.perf_counter()
+    latest = latest_obs_date(conn)
+    timings_after['latest date (t_01)'] = (time.perf_counter() - t0, [(latest,)])
+
+    print(f'{"query":<22} {"before(ms)":>12} {"after(ms)":>12} {"rows":>8}')
+    for name, (before_s, before_rows) in timings_before.items():
+        after_s, after_rows = timings_after[name]
+        if name == 'night (p_02)':
+            # 有 limit 时两种写法取到的行可能不同, 只比较行数
+            assert len(before_rows) == len(after_rows), f'{name} 结果不一致'
+        elif name != 'latest date (t_01)':
+            # 原 t_01 按 substr(id, 5, 8) 取最新日期, 合成数据的 id 是自增的, 这里只比较耗时
+            assert sorted(before_rows) == sorted(after_rows), f'{name} 结果不一致'
+        print(f'{name:<22} {before_s * 1000:>12.2f} {after_s * 1000:>12.3f} {len(after_rows):>8}')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
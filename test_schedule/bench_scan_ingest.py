@@ -0,0 +1,106 @@
+import argparse
+import os
+import random
+import re
+import sqlite3
+import time
+
+from tools.image_ingest import ingest_image_urls, format_ingest_stats
+
+# 合成一晚六个系统的扫描 url, 对比原 t_01 逐行 SELECT + INSERT + commit 与批量入库
+
+
+def make_urls(count, day, rng):
+    urls = []
+    for i in range(count):
+        gy = i % 6 + 1
+        seconds = i * 3
+        urls.append(f'https://download.china-vo.org/psp/KATS/GY{gy}-DATA/{day}/'
+                    f'K{rng.randint(1, 120):03d}/GY{gy}_K{rng.randint(1, 120):03d}-{rng.randint(1, 4)}_No%20Filter_60S_Bin2_'
+                    f'UTC{day}_{seconds // 3600 % 24:02d}{seconds // 60 % 60:02d}{seconds % 60:02d}_-20C_{i}.fit')
+    return urls
+
+
+def create_db(db_path, existing_urls):
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE image_info (id INTEGER PRIMARY KEY AUTOINCREMENT, file_path TEXT NOT NULL, '
+                 'wcs_info TEXT, status DECIMAL)')
+    conn.commit()
+    conn.close()
+    if existing_urls:
+        ingest_image_urls(db_path, existing_urls)
+
+
+def legacy_ingest(db_path, url_list):
+    # 原实现 (去掉逐行 print)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    date_time_pattern = re.compile(r"UTC(\d{8})_(\d{6})_")
+    gy_pattern = re.compile(r"GY(\d)")
+    k_pattern = re.compile(r"K(\d+)")
+    insert_counter = 0
+    for item in url_list:
+        cursor.execute('SELECT 1 FROM image_info WHERE file_path = ?', (item,))
+        if not cursor.fetchone():
+            match = date_time_pattern.search(item)
+            year_month_day = match.group(1)
+            hour_minute_second = match.group(2)
+            match = gy_pattern.search(item)
+            gy_sys_id = match.group(1) if match else ''
+            match = k_pattern.search(item)
+            k_id = match.group(1) if match else ''
+            cursor.execute(f'INSERT INTO image_info (id, file_path, status) VALUES ({gy_sys_id}{k_id}'
+                           f'{year_month_day}{hour_minute_second},"{item}",{0})')
+            insert_counter += 1
+        conn.commit()
+    cursor.close()
+    conn.close()
+    return insert_counter
+
+
+def table_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('SELECT id, file_path, status FROM image_info ORDER BY id').fetchall()
+    conn.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=20000, help='一晚的 url 数')
+    parser.add_argument('--existing', type=float, default=0.3, help='已在库中的比例')
+    parser.add_argument('--dir', default='bench_scan_ingest')
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    rng = random.Random(1)
+    urls = make_urls(args.count, '20250823', rng)
+    existing = urls[:int(len(urls) * args.existing)]
+
+    legacy_db = os.path.join(args.dir, 'legacy.db')
+    bulk_db = os.path.join(args.dir, 'bulk.db')
+    create_db(legacy_db, existing)
+    create_db(bulk_db, existing)
+
+    t0 = time.perf_counter()
+    legacy_inserted = legacy_ingest(legacy_db, urls)
+    legacy_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    stats = ingest_image_urls(bulk_db, urls)
+    bulk_s = time.perf_counter() - t0
+
+    assert legacy_inserted == stats['inserted'], '写入行数不一致'
+    assert table_rows(legacy_db) == table_rows(bulk_db), '写入结果不一致'
+
+    print(f'url {len(urls)}  existing {len(existing)}')
+    print(f'legacy   {legacy_s:8.3f}s  inserted {legacy_inserted}')
+    print(f'bulk     {bulk_s:8.3f}s  {format_ingest_stats(stats)}')
+    print(f'speedup  {legacy_s / bulk_s:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import socket
+import socketserver
+import threading
+import time
+
+import stomp
+
+from tools.send_message import StatusPublisher
+
+# 本地假 STOMP 服务器代替 ActiveMQ, 对比 原来每条消息一次 CONNECT/SEND/DISCONNECT 与 共用持久连接的批量发布,
+# 并检查服务器重启后的重连, 以及积压时的合并/丢弃计数
+
+DESTINATION = '/topic/chat.general'
+
+
+class FakeStompHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.clients.add(self.request)
+            server.connections += 1
+        buffer = b''
+        try:
+            while True:
+                data = self.request.recv(65536)
+                if not data:
+                    break
+                buffer += data
+                while b'\x00' in buffer:
+                    frame, buffer = buffer.split(b'\x00', 1)
+                    self.handle_frame(frame.lstrip(b'\r\n'))
+        except OSError:
+            pass
+        finally:
+            with server.lock:
+                server.clients.discard(self.request)
+
+    def handle_frame(self, frame):
+        head, _, body = frame.partition(b'\n\n')
+        lines = head.decode('utf-8').split('\n')
+        command = lines[0].strip()
+        headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+        if command in ('CONNECT', 'STOMP'):
+            self.request.sendall(b'CONNECTED\nversion:1.1\nheart-beat:0,0\n\n\x00')
+        elif command == 'SEND':
+            with self.server.lock:
+                self.server.messages.append(body.decode('utf-8'))
+            if 'receipt' in headers:
+                self.request.sendall(f'RECEIPT\nreceipt-id:{headers["receipt"]}\n\n\x00'.encode('utf-8'))
+        elif command == 'DISCONNECT':
+            if 'receipt' in headers:
+                self.request.sendall(f'RECEIPT\nreceipt-id:{headers["receipt"]}\n\n\x00'.encode('utf-8'))
+
+
+class FakeStompServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port=0):
+        super().__init__(('127.0.0.1', port), FakeStompHandler)
+        self.lock = threading.Lock()
+        self.clients = set()
+        self.messages = []
+        self.connections = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        with self.lock:
+            for client in list(self.clients):
+                try:
+                    client.shutdown(socket.SHUT_RDWR)
+                    client.close()
+                except OSError:
+                    pass
+
+
+def legacy_send_amq(port, fits_file, stage, result):
+    # 原来的 send_amq: 每条消息一次连接
+    conn = stomp.Connection([('127.0.0.1', port)])
+    conn.connect(wait=True)
+    conn.send(body=json.dumps({"fits": fits_file, "stage": stage, "result": result}), destination=DESTINATION)
+    conn.disconnect()
+
+
+def messages(count, frames=None):
+    frames = frames or count
+    statuses = ('default', 'success')
+    return [(f'{i % frames}.fits', 2 + i // frames % 3, statuses[i // frames // 3 % 2]) for i in range(count)]
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--legacy', type=int, default=200)
+    parser.add_argument('--count', type=int, default=5000)
+    args = parser.parse_args()
+
+    server = FakeStompServer()
+    port = server.server_address[1]
+
+    t0 = time.perf_counter()
+    for fits_file, stage, result in messages(args.legacy):
+        legacy_send_amq(port, fits_file, stage, result)
+    legacy_s = time.perf_counter() - t0
+    assert wait_for(lambda: len(server.messages) == args.legacy, 5)
+    print(f'legacy     {args.legacy} msgs  {legacy_s * 1e6 / args.legacy:8.1f} us/msg blocking in caller  '
+          f'connections {server.connections}')
+
+    server.messages.clear()
+    server.connections = 0
+    publisher = StatusPublisher(port=port)
+    t0 = time.perf_counter()
+    for fits_file, stage, result in messages(args.count):
+        publisher.publish(json.dumps({"fits": fits_file, "stage": stage, "result": result}), key=(fits_file, stage))
+    caller_s = time.perf_counter() - t0
+    assert publisher.flush(30)
+    total_s = time.perf_counter() - t0
+    assert len(server.messages) == args.count
+    print(f'publisher  {args.count} msgs  {caller_s * 1e6 / args.count:8.1f} us/msg in caller  '
+          f'all delivered after {total_s:.2f}s  connections {server.connections}  {publisher.stats}')
+
+    # 服务器重启: 期间的消息在重连后送达
+    server.stop()
+    time.sleep(0.2)
+    for fits_file, stage, result in messages(100):
+        publisher.publish(json.dumps({"fits": fits_file, "stage": stage, "result": result}), key=(fits_file, stage))
+    time.sleep(0.5)
+    server = FakeStompServer(port)
+    delivered = wait_for(lambda: len(server.messages) == 100, 30)
+    print(f'restart    delivered {len(server.messages)} / 100  {publisher.stats}')
+    assert delivered
+    publisher.close()
+
+    # 积压: 服务器不可用时, 队列一半后合并同帧同阶段的状态, 满了丢弃
+    server.stop()
+    publisher = StatusPublisher(port=port, max_pending=100)
+    for fits_file, stage, result in messages(600, frames=40):
+        publisher.publish(json.dumps({"fits": fits_file, "stage": stage, "result": result}), key=(fits_file, stage))
+    stats = dict(publisher.stats)
+    print(f'backlog    600 msgs, max_pending 100  {stats}')
+    assert stats['queued'] + stats['coalesced'] + stats['dropped'] == 600
+    assert stats['coalesced'] > 0 and stats['dropped'] > 0
+    publisher.close(timeout=0.5)
+
+
+if __name__ == '__main__':
+    main()
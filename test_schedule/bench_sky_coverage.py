@@ -0,0 +1,55 @@
+import argparse
+import math
+import random
+import time
+
+import numpy as np
+
+from test_schedule.bench_sky_index import create_db, search_sql
+from tools.sky_coverage import coverage_matrix, load_frame_vectors
+
+# 多目标批量覆盖查询 benchmark: 逐目标 SQL 全表扫描 vs 分块矩阵乘法
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量覆盖查询 benchmark')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--targets', type=int, default=10000)
+    parser.add_argument('--sql-targets', type=int, default=20, help='逐个 SQL 查询的目标数, 用于估算和校验')
+    parser.add_argument('--db', default='bench_sky_coverage.db')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    conn = create_db(args.db, args.rows, args.seed)
+    print(f'create db: {args.rows} rows  {time.perf_counter() - t0:.1f}s')
+
+    rng = random.Random(args.seed + 1)
+    radec = np.array([(rng.uniform(0, 360), math.degrees(math.asin(rng.uniform(-0.3, 1.0))))
+                      for _ in range(args.targets)])
+
+    t0 = time.perf_counter()
+    frames = load_frame_vectors(conn)
+    load_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    matrix = coverage_matrix(frames, radec)
+    batch_time = time.perf_counter() - t0
+    print(f'load frames: {load_time:.2f}s   batch {args.targets} targets: {batch_time:.2f}s   hits: {matrix.nnz}')
+
+    sql_time = 0
+    mismatch = 0
+    for i in range(args.sql_targets):
+        t0 = time.perf_counter()
+        sql_result = search_sql(conn, radec[i, 0], radec[i, 1])
+        sql_time += time.perf_counter() - t0
+        batch_ids = frames.ids[matrix[i].indices]
+        if sorted(r[0] for r in sql_result) != sorted(batch_ids.tolist()):
+            mismatch += 1
+    per_target = sql_time / args.sql_targets
+    print(f'sql per target: {per_target * 1000:.1f} ms   estimated {args.targets} targets: {per_target * args.targets:.1f}s')
+    print(f'speedup: {per_target * args.targets / (load_time + batch_time):.1f}x   mismatch: {mismatch}')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import math
+import os
+import random
+import sqlite3
+import time
+
+from tools.sky_index import build_sky_index, radec_to_vector, search_point
+
+# 合成 image_info 数据库, 对比原 SQL 全表扫描 与 HTM 索引查询
+
+
+def random_frame(rng):
+    ra = rng.uniform(0, 360)
+    dec = math.degrees(math.asin(rng.uniform(-0.3, 1.0)))
+    c = radec_to_vector(ra, dec)
+    # 切平面正交基, 随机旋转
+    east = (-math.sin(math.radians(ra)), math.cos(math.radians(ra)), 0.0)
+    north = (c[1] * east[2] - c[2] * east[1], c[2] * east[0] - c[0] * east[2], c[0] * east[1] - c[1] * east[0])
+    rot = rng.uniform(0, math.pi)
+    a_n = tuple(math.cos(rot) * e + math.sin(rot) * n for e, n in zip(east, north))
+    b_n = tuple(-math.sin(rot) * e + math.cos(rot) * n for e, n in zip(east, north))
+    return c, a_n, b_n, rng.uniform(1.5, 1.7), rng.uniform(1.0, 1.2)
+
+
+def create_db(db_path, rows, seed):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('CREATE TABLE image_info (id INTEGER PRIMARY KEY AUTOINCREMENT, file_path TEXT NOT NULL, '
+                   'wcs_info TEXT, center_v_x DOUBLE, center_v_y DOUBLE, center_v_z DOUBLE, '
+                   'center_a_theta DOUBLE, center_b_theta DOUBLE, status DECIMAL, '
+                   'a_n_x DOUBLE, a_n_y DOUBLE, a_n_z DOUBLE, b_n_x DOUBLE, b_n_y DOUBLE, b_n_z DOUBLE)')
+    batch = []
+    for i in range(rows):
+        c, a_n, b_n, a_theta, b_theta = random_frame(rng)
+        batch.append((f'https://example/GY1_K001-1_UTC20250101_000000_{i}.fit', '-', c[0], c[1], c[2],
+                      a_theta, b_theta, 100, a_n[0], a_n[1], a_n[2], b_n[0], b_n[1], b_n[2]))
+        if len(batch) == 100000:
+            cursor.executemany('INSERT INTO image_info (file_path, wcs_info, center_v_x, center_v_y, center_v_z, '
+                               'center_a_theta, center_b_theta, status, a_n_x, a_n_y, a_n_z, b_n_x, b_n_y, b_n_z) '
+                               'VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)', batch)
+            batch = []
+    if batch:
+        cursor.executemany('INSERT INTO image_info (file_path, wcs_info, center_v_x, center_v_y, center_v_z, '
+                           'center_a_theta, center_b_theta, status, a_n_x, a_n_y, a_n_z, b_n_x, b_n_y, b_n_z) '
+                           'VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)', batch)
+    conn.commit()
+    cursor.close()
+    return conn
+
+
+def search_sql(conn, ra, dec):
+    x, y, z = radec_to_vector(ra, dec)
+    sql = f'select id,file_path,wcs_info,center_a_theta, ' \
+          f'abs(90-(degrees(acos((({x}*t.a_n_x) +({y}*t.a_n_y)+({z}*t.a_n_z) ))))) as ta,center_b_theta, ' \
+          f'abs(90-(degrees(acos((({x}*t.b_n_x) +({y}*t.b_n_y)+({z}*t.b_n_z) ))))) as tb, ' \
+          f'degrees(acos((({x}*t.center_v_x) +({y}*t.center_v_y)+({z}*t.center_v_z) ))) as tc ' \
+          f'from  image_info as t ' \
+          f'where t.status=100 and t.center_a_theta>ta and t.center_b_theta>tb and tc<90'
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    result = cursor.fetchall()
+    cursor.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTM 天区索引 benchmark')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--db', default='bench_sky_index.db')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    conn = create_db(args.db, args.rows, args.seed)
+    print(f'create db: {args.rows} rows  {time.perf_counter() - t0:.1f}s')
+
+    t0 = time.perf_counter()
+    build_sky_index(conn)
+    print(f'build index: {time.perf_counter() - t0:.1f}s')
+
+    rng = random.Random(args.seed + 1)
+    sql_time = 0
+    index_time = 0
+    mismatch = 0
+    for q in range(args.queries):
+        ra = rng.uniform(0, 360)
+        dec = math.degrees(math.asin(rng.uniform(-0.3, 1.0)))
+        t0 = time.perf_counter()
+        sql_result = search_sql(conn, ra, dec)
+        sql_time += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        index_result = search_point(conn, ra, dec)
+        index_time += time.perf_counter() - t0
+        if sorted(r[0] for r in sql_result) != sorted(r[0] for r in index_result):
+            mismatch += 1
+        print(f'{q}: ({ra:.4f} {dec:.4f})  sql {len(sql_result)}  index {len(index_result)}')
+    print(f'sql   avg: {sql_time / args.queries * 1000:.2f} ms')
+    print(f'index avg: {index_time / args.queries * 1000:.2f} ms')
+    print(f'speedup: {sql_time / index_time:.1f}x   mismatch: {mismatch}')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
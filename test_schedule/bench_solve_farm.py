@@ -0,0 +1,127 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from astropy.io import fits
+
+from tools.solve_farm import (SOLVE_FAILED, SOLVE_OK, SOLVE_TIMEOUT, SolveFarm, SolveHint, StubSolver,
+                              parse_wcs_file)
+
+# 用 StubSolver (每次"解算"耗时 --delay 秒后复制固定的 .wcs) 代替 ASTAP, 在 Linux 上检查解算调度:
+# 1 个进程逐帧解算 (原 max_process = 1) 与 N 个进程同时解算的吞吐, 超时时整个进程组被杀掉,
+# 失败时加大半径重试, 以及硬链接到工作目录解算后不留下文件
+
+
+def make_fixture(path, size):
+    # 与 ASTAP 写出的 .wcs 相同: 每行一张卡片, 用 CD 矩阵
+    center = (size + 1) / 2
+    cards = [('CTYPE1', "'RA---TAN'"), ('CTYPE2', "'DEC--TAN'"), ('CRPIX1', center), ('CRPIX2', center),
+             ('CRVAL1', 150.0), ('CRVAL2', 21.0), ('CD1_1', -0.0008), ('CD1_2', 0.0), ('CD2_1', 0.0),
+             ('CD2_2', 0.0008)]
+    with open(path, 'w') as file:
+        for keyword, value in cards:
+            file.write(f'{keyword:<8}= {value:>20} / \n')
+        file.write('END\n')
+
+
+def make_frames(dir_path, count, size):
+    paths = []
+    for i in range(count):
+        path = os.path.join(dir_path, f'{1001 + i}.fits')
+        fits.PrimaryHDU(np.zeros((size, size), dtype=np.uint16)).writeto(path)
+        paths.append(path)
+    return paths
+
+
+def items(paths):
+    hint = SolveHint(10.0, 21.0)
+    return [(os.path.splitext(os.path.basename(path))[0], path, hint) for path in paths]
+
+
+def alive(pid):
+    # 僵尸进程 (已被杀掉但未回收) 不算
+    try:
+        with open(f'/proc/{pid}/stat') as file:
+            return file.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+    except OSError:
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+        return True
+
+
+def run(farm, paths):
+    t0 = time.perf_counter()
+    results = list(farm.solve_many(items(paths)))
+    return time.perf_counter() - t0, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=24)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--delay', type=float, default=0.5, help='每帧解算耗时 (秒)')
+    parser.add_argument('--size', type=int, default=256)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_solve_farm_')
+    try:
+        fixture = os.path.join(root, 'fixture.wcs')
+        make_fixture(fixture, args.size)
+        frame_dir = os.path.join(root, 'frames')
+        os.makedirs(frame_dir)
+        paths = make_frames(frame_dir, args.frames, args.size)
+        solver = StubSolver(fixture, delay=args.delay)
+
+        serial_s, results = run(SolveFarm(solver, workers=1), paths)
+        assert all(result.status == SOLVE_OK for result in results)
+        farm = SolveFarm(solver, workers=args.workers)
+        farm_s, results = run(farm, paths)
+        assert all(result.status == SOLVE_OK for result in results)
+        assert results[0].header == parse_wcs_file(fixture)
+        assert sorted(os.listdir(frame_dir)) == sorted(os.path.basename(path) for path in paths)
+        print(f'{args.frames} frames  {args.delay}s per solve')
+        print(f'1 process    {serial_s:6.2f}s  {args.frames / serial_s:6.1f} frames/s')
+        print(f'{args.workers} processes  {farm_s:6.2f}s  {args.frames / farm_s:6.1f} frames/s  '
+              f'x{serial_s / farm_s:.1f}  {dict(farm.stats)}')
+
+        # 超时: 卡住的解算器和它启动的子进程都被杀掉, 不重试
+        farm = SolveFarm(StubSolver(fixture, delay=0.0, hang_ids={'1001'}), workers=2, timeout=1.0)
+        elapsed, results = run(farm, paths[:2])
+        hung = [result for result in results if result.frame_id == '1001'][0]
+        child_file = os.path.splitext(paths[0])[0] + '.wcs.child'
+        time.sleep(0.2)
+        with open(child_file) as file:
+            child_pid = int(file.read())
+        os.remove(child_file)
+        print(f'timeout      {hung.status}  attempts {hung.attempts}  {hung.elapsed:.2f}s  '
+              f'child alive {alive(child_pid)}')
+        assert hung.status == SOLVE_TIMEOUT and hung.attempts == 1 and not alive(child_pid)
+
+        # 半径 30 失败, 180 成功; 总是失败的帧尝试每个半径
+        farm = SolveFarm(StubSolver(fixture, min_radius=100, fail_ids={'1002'}), workers=args.workers)
+        _, results = run(farm, paths[:4])
+        by_id = {result.frame_id: result for result in results}
+        print(f'retry        {[(r.frame_id, r.status, r.radius, r.attempts) for r in results]}  {dict(farm.stats)}')
+        assert by_id['1002'].status == SOLVE_FAILED and by_id['1002'].attempts == 2
+        assert all(r.status == SOLVE_OK and r.radius == 180 for k, r in by_id.items() if k != '1002')
+
+        # 硬链接到工作目录解算, 结束后工作目录为空, 原文件不变
+        work_dir = os.path.join(root, 'work')
+        farm = SolveFarm(solver, workers=args.workers, work_dir=work_dir)
+        link_s, results = run(farm, paths)
+        assert all(result.status == SOLVE_OK for result in results)
+        assert os.listdir(work_dir) == [] and all(os.path.exists(path) for path in paths)
+        print(f'work_dir     {link_s:6.2f}s  hard-linked, nothing left behind')
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import time
+
+from tools.stage_pipeline import PipelineStage, StagePipeline
+
+# 用固定耗时的模拟阶段对比 job_01 的逐阶段批处理 与 流式流水线 的总耗时和单帧端到端延迟
+# 下载 (I/O, 3 线程) -> 检查 (CPU, 进程) -> 解算 (CPU, 进程) -> 写库 (单线程)
+
+
+def io_wait(seconds):
+    time.sleep(seconds)
+
+
+def cpu_spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def download(item):
+    io_wait(item['download_s'])
+    return True
+
+
+def check(item):
+    cpu_spin(item['check_s'])
+    return item
+
+
+def solve(item):
+    # ASTAP 是外部进程, 主要是等待
+    io_wait(item['solve_s'])
+    return item
+
+
+def write_db(item):
+    io_wait(0.002)
+    return item
+
+
+def run_batch(items, workers):
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        list(executor.map(download, items))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(check, items))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(solve, items))
+    for item in items:
+        write_db(item)
+    # 逐阶段批处理时每一帧都要等到最后一个阶段全部完成
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    items = [{'frame_id': i, 'download_s': 0.03, 'check_s': 0.02, 'solve_s': 0.05} for i in range(args.frames)]
+    batch_s = run_batch(items, args.workers)
+
+    stages = [
+        PipelineStage('download', download, workers=3, after=lambda item, ok: item if ok else None),
+        PipelineStage('check', check, workers=args.workers, kind='process'),
+        PipelineStage('solve', solve, workers=args.workers, kind='process'),
+        PipelineStage('solve_db', write_db),
+    ]
+    metrics = StagePipeline(stages, queue_size=8, key=lambda item: item['frame_id']).run(iter(items))
+    latencies = sorted(metrics.latency.values())
+    print(f'batch     total {batch_s:.2f}s  (every frame waits for the whole batch: latency ~{batch_s:.2f}s)')
+    print(f'pipeline  total {metrics.finished_at - metrics.started_at:.2f}s  '
+          f'first frame done after {latencies[0]:.2f}s')
+    print(metrics.summary())
+
+
+if __name__ == '__main__':
+    main()
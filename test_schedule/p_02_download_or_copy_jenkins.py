@@ -5,68 +5,91 @@ import sqlite3
 from concurrent.futures import ThreadPoolExecutor
 
 from tools.fits_check import copy_or_download
+from tools.image_obs_columns import frames_by_obs_date
 import ctypes
 
 from tools.send_message import send_amq, ProcessStatus
+from tools.stage_state import StageStateStore, STAGE_DOWNLOAD, STAGE_SOLVE, STATUS_DONE, STATUS_FAILED
+
+# 下载在共享的 asyncio 下载器中进行, 线程只等待结果; 每个线程同时只有一个请求,
+# 线程数即对天文台服务器的并发数, 与原来的 3 相同
+DOWNLOAD_WORKERS = 3
 
 
 def output_debug_string(message):
     ctypes.windll.kernel32.OutputDebugStringW(message)
 
 
-def worker_download_fits(db_search_result, folder_name):
+def download_frame(frame_id, url, folder_name):
+    """
+    下载/拷贝一帧到 e:/fix_data/{folder_name}/{frame_id}.fits, 返回是否成功
+    """
     temp_download_path = f'e:/fix_data/{folder_name}/'
     file_in_disk_path_root = 'e:/'
-    save_file_dir = temp_download_path
+    file_name = "{}.fits".format(frame_id)
+    save_file_path = os.path.join(temp_download_path, file_name)
+    file_in_disk_path = os.path.join(file_in_disk_path_root, file_name)
+
+    print(f'[{frame_id}]:{file_name}')
+    output_debug_string(f"download: {frame_id}.fits， {file_name}")
+    send_amq(f'{frame_id}.fits', 2, ProcessStatus.DEFAULT)
+    success = copy_or_download(save_file_path, url, file_in_disk_path)
+    if success:
+        send_amq(f'{frame_id}.fits', 2, ProcessStatus.SUCCESS)
+    return success
+
 
+def record_download(store, frame_id, attempt, success):
+    if success:
+        store.finish(frame_id, STAGE_DOWNLOAD, attempt, STATUS_DONE, record=f'{frame_id},ok')
+    else:
+        store.finish(frame_id, STAGE_DOWNLOAD, attempt, STATUS_FAILED)
+
+
+def worker_download_fits(db_search_result, folder_name, store):
+    save_file_dir = f'e:/fix_data/{folder_name}/'
     if not os.path.exists(save_file_dir):
         os.makedirs(save_file_dir, exist_ok=True)
 
-    def download_task(d_item):
-        file_name = "{}.fits".format(d_item[0])
-        file_name_txt_ok = "{}_ok.txt".format(d_item[0])
-        file_name_txt_solve = "{}_solve.txt".format(d_item[0])
-
-        save_file_path = os.path.join(temp_download_path, file_name)
-        save_file_path_ok = os.path.join(temp_download_path, file_name_txt_ok)
-        save_file_path_solve = os.path.join(temp_download_path, file_name_txt_solve)
-
-        file_in_disk_path = os.path.join(file_in_disk_path_root, file_name)
-
-        print(f'[{d_item[0]}]:{file_name}')
-        download_code = 0
-        output_debug_string(f"download: {d_item[0]}.fits， {file_name}")
-        send_amq(f'{d_item[0]}.fits', 2, ProcessStatus.DEFAULT)
-        if os.path.exists(save_file_path_solve):
-            send_amq(f'{d_item[0]}.fits', 2, ProcessStatus.SKIP)
-            return
-        if os.path.exists(save_file_path_ok):
-            send_amq(f'{d_item[0]}.fits', 2, ProcessStatus.SKIP)
-            return
-        success = copy_or_download(save_file_path, d_item[1], file_in_disk_path)
-        if success:
-            with open(save_file_path_ok, 'w', encoding='utf-8') as file:
-                file.write(f'{d_item[0]},ok')
-            send_amq(f'{d_item[0]}.fits', 2, ProcessStatus.SUCCESS)
-
-    with ThreadPoolExecutor(max_workers=3) as executor:
+    # 已下载或已解算的帧不领取
+    claimed = dict(store.claim(STAGE_DOWNLOAD, folder_name, frame_ids=[d_item[0] for d_item in db_search_result],
+                               skip_if_done=(STAGE_SOLVE,)))
+
+    def download_task(d_item, attempt):
+        success = False
+        try:
+            success = download_frame(d_item[0], d_item[1], folder_name)
+        finally:
+            record_download(store, d_item[0], attempt, success)
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
         for i, d_item in enumerate(db_search_result):
-            executor.submit(download_task, d_item)
+            if d_item[0] not in claimed:
+                send_amq(f'{d_item[0]}.fits', 2, ProcessStatus.SKIP)
+                continue
+            executor.submit(download_task, d_item, claimed[d_item[0]])
             print(f'[{i} / {len(db_search_result)}]')
 
 
-def run_02_download(date_str):
+def search_frames_by_date(date_str):
     db_path = '../thread_test/fits_wcs_recent.db'
     conn_search = sqlite3.connect(db_path)
-    cursor_search = conn_search.cursor()
-    # todo limit date
-    sql_search = f'select id,file_path from  image_info where file_path like "%UTC{date_str}%" limit 5000'
-    print(f'---search sql    {sql_search}')
-    cursor_search.execute(sql_search)
-    db_search_result = cursor_search.fetchall()
-    cursor_search.close()
+    # obs_date 列有 (obs_date, status) 索引, 不再用 file_path like "%UTC{date_str}%" 扫全表;
+    # 旧库 obs_date 未回填完时退回 like 查询
+    print(f'---search obs_date  [{date_str}]')
+    db_search_result = frames_by_obs_date(conn_search, date_str)
     conn_search.close()
-    worker_download_fits(db_search_result, date_str)
+    return db_search_result
+
+
+def run_02_download(date_str):
+    db_search_result = search_frames_by_date(date_str)
+    store = StageStateStore()
+    try:
+        worker_download_fits(db_search_result, date_str, store)
+    finally:
+        store.release_claims()
+        store.close()
 
 
 def parse_args():
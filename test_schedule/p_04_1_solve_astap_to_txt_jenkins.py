@@ -1,20 +1,18 @@
 import argparse
-import concurrent
 import datetime
-import multiprocessing
 import os
-import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import numpy as np
 from astropy.coordinates import SkyCoord
-from astropy.io import fits
-import subprocess
 from astropy import wcs
 from solve.test_name_to_ra_dec import get_ra_dec_from_path
 import ctypes
 
+from tools.fits_header import read_header
 from tools.send_message import ProcessStatus, send_amq
+from tools.solve_farm import (DEFAULT_WORKERS, SOLVE_MISSING, SOLVE_NO_WCS, SOLVE_OK, AstapSolver, SolveFarm,
+                              SolveHint)
+from tools.stage_state import StageStateStore, STAGE_DOWNLOAD, STAGE_SOLVE, STATUS_DONE, STATUS_FAILED
 
 
 def output_debug_string(message):
@@ -23,6 +21,10 @@ def output_debug_string(message):
 
 fits_list = []
 
+solve_bin_path = r'E:/astap/astap.exe'
+SOLVE_WORKERS = DEFAULT_WORKERS
+SOLVE_TIMEOUT_S = 60
+
 
 def vector_plane_angle(e, n):
     # 计算向量E和法向量N的点积
@@ -60,125 +62,67 @@ def plane_normal_vector(p1, p2, p3):
     return normalize_vector(n)
 
 
-def worker_check_fits(d_item, folder_name):
-    temp_download_path = f'e:/fix_data/{folder_name}/'
+def solve_hint(frame_id):
+    # 由帧号中的天区号得到 K 天区中心, 作为解算的搜索起点
+    fack_url_path = f'K{frame_id[1:4]}_K{frame_id[1:4]}'
+    astap_ra_h, astap_dec = get_ra_dec_from_path(fack_url_path)
+    return SolveHint(astap_ra_h, astap_dec)
 
-    solve_bin_path = r'E:/astap/astap.exe'
-    solve_file_path_root = r'E:/test_download/astap/'
-    file_name = "{}.fits".format(d_item[0])
-    file_name_wcs = "{}.wcs".format(d_item[0])
-    file_name_ini = "{}.ini".format(d_item[0])
-    wcs_file_path = os.path.join(solve_file_path_root, file_name_wcs)
-    ini_file_path = os.path.join(solve_file_path_root, file_name_ini)
-    download_file_path = os.path.join(temp_download_path, file_name)
-    solve_file_path = os.path.join(solve_file_path_root, file_name)
-    file_name_txt = "{}_solve.txt".format(d_item[0])
-    save_file_path_txt = os.path.join(temp_download_path, file_name_txt)
+
+_solve_farm = None
+
+
+def get_solve_farm():
+    global _solve_farm
+    if _solve_farm is None:
+        _solve_farm = SolveFarm(AstapSolver(solve_bin_path), workers=SOLVE_WORKERS, timeout=SOLVE_TIMEOUT_S)
+    return _solve_farm
+
+
+def worker_check_fits(d_item, folder_name, farm=None):
+    temp_download_path = f'e:/fix_data/{folder_name}/'
+    download_file_path = os.path.join(temp_download_path, "{}.fits".format(d_item[0]))
     print(f'process:  / /     '
           f'{d_item[0]}.fits    {d_item[1]}   ')
     output_debug_string(f"solve: {d_item[0]}.fits， {d_item[1]}")
-    # 拷贝文件
-    try:
-        shutil.copy(download_file_path, solve_file_path)
-    except IOError:
-        print(f'-1  file not found{download_file_path}')
-        return
-    fack_url_path = f'K{d_item[0][1:4]}_K{d_item[0][1:4]}'
-    astap_ra_h, astap_dec = get_ra_dec_from_path(fack_url_path)
-    astap_dec_spd = astap_dec + 90
-    process = subprocess.Popen([solve_bin_path, '-ra', str(astap_ra_h), '-spd', str(astap_dec_spd),
-                                # process = subprocess.Popen([solve_bin_path, '-ra', '106', '-spd', '141',
-                                '-s', '1000',
-                                '-z', '1', '-fov', '2', '-D', 'd50', '-r', '180', '-f',
-                                solve_file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    # print("the commandline is {}".format(process.args))
-    print(" ".join(process.args))
-    print("子进程PID:", process.pid)
+    result = (farm or get_solve_farm()).solve(d_item[0], download_file_path, solve_hint(d_item[0]))
+    return solve_record(d_item, folder_name, result)
 
-    try:
-        process.communicate(timeout=60)
-        # process.wait(6)
-        process.wait(timeout=60)
-    except subprocess.TimeoutExpired:
-        print("子进程超时，将被终止")
-        try:
-            os.kill(process.pid, 9)  # 发送SIGKILL信号（9）来强制终止进程
-        except ProcessLookupError:
-            print("子进程已经退出")
-        except Exception as e:
-            print(f"子进程已经退出 pid:{process.pid}  path {d_item[0]}.fits {e}")
-            os.kill(process.pid, 9)  # 发送SIGKILL信号（9）来强制终止进程
-    if process.returncode == 0:
-        # print("tycho was successful.")
-        if not os.path.exists(wcs_file_path):
-            print(f'-1  file not found{wcs_file_path}')
-            os.remove(solve_file_path)
-            return
-    else:
-        print(f'astap error {download_file_path}')
-        with open(save_file_path_txt, 'w', encoding='utf-8') as file:
-            file.write(f'{file_name_txt},{d_item[0]},{101}')
-        os.remove(solve_file_path)
-        os.remove(ini_file_path)
-        return
-    # 检测wcs
-
-    # 读取文本文件并解析每一行以提取头信息
-
-    header_dict = {}
-    with open(wcs_file_path, 'r') as file:
-        for line in file:
-            line = line.strip()
-            if line and not line.startswith('END') and '=' in line:
-                if '/' in line:
-                    comment_index = line.index('/')
-                    line = line[:comment_index]
-                line = line.replace("'", "")
-                key, value = line.split('=', 1)
-                key = key.strip()
-                value = value.strip()
-
-                # 尝试将值转换为适当的数据类型
-                try:
-                    value = float(value) if '.' in value else int(value)
-                except ValueError:
-                    # 如果转换失败，保留原始字符串值
-                    pass
-
-                header_dict[key] = value
-
-    wcs_info = wcs.WCS(header_dict)
-
-    # print(wcs_info)
-    header_string = wcs_info.to_header_string()
-    # print(header_string)
-    # wcs_info_load = wcs.WCS(header_string)
-    # print('-----------------')
-    # print(wcs_info.wcs.crval)
-    # print(f'{len(wcs_info.wcs.crpix)}    {wcs_info.wcs.crpix}')
+
+def solve_record(d_item, folder_name, result):
+    """
+    由 SolveResult 计算 {id}_solve.txt 的记录: 成功为 24 个字段 (状态 100); 解算失败/超时为状态 101;
+    文件不存在或没有得到可用的 wcs 时返回 None
+    """
+    temp_download_path = f'e:/fix_data/{folder_name}/'
+    download_file_path = os.path.join(temp_download_path, "{}.fits".format(d_item[0]))
+    file_name_txt = "{}_solve.txt".format(d_item[0])
+    if result.status == SOLVE_MISSING:
+        print(f'-1  file not found{download_file_path}')
+        return None
+    if result.status == SOLVE_NO_WCS:
+        print(f'-1  wcs not found {download_file_path}')
+        return None
+    if result.status != SOLVE_OK:
+        print(f'astap error {download_file_path}  {result.status}  radius {result.radius}  '
+              f'attempts {result.attempts}')
+        return f'{file_name_txt},{d_item[0]},{101}'
+
+    wcs_info = wcs.WCS(result.header)
     if wcs_info.wcs.crpix[0] < 2 or wcs_info.wcs.crpix[1] < 2:
         print(f'wcs chk error {download_file_path}')
-        with open(save_file_path_txt, 'w', encoding='utf-8') as file:
-            file.write(f'{file_name_txt},{d_item[0]},{101}')
-        os.remove(solve_file_path)
-        os.remove(ini_file_path)
-        return
+        return f'{file_name_txt},{d_item[0]},{101}'
     try:
         print(wcs_info.wcs.cd)
     except Exception as e:
         print(f"错误: {e}")
         print(f'-------- skip wcs.cd error  {d_item[0]}    {d_item[1]} ---------')
-        os.remove(solve_file_path)
-        os.remove(ini_file_path)
-        os.remove(wcs_file_path)
-        return
-    # print('-----------------')
-
-    with fits.open(solve_file_path) as fits_hdul:
-        hdul = fits_hdul
-        image_data = hdul[0].data
-    # 获取图像的宽度和高度
-    width, height = image_data.shape[1], image_data.shape[0]
+        return None
+
+    # 获取图像的宽度和高度, 只读头, 不加载像素
+    with open(download_file_path, 'rb') as fits_file:
+        cards, _ = read_header(fits_file)
+    width, height = int(cards['NAXIS1']), int(cards['NAXIS2'])
     # print(f'x: {width}  y:{height}    x/2 {(width + 1) / 2}   y/2 {(height + 1) / 2}')
     # 获取x y中点
     ra_mid_x, dec_mid_x = wcs_info.wcs_pix2world((width + 1) / 2, 0, 1)
@@ -218,69 +162,65 @@ def worker_check_fits(d_item, folder_name):
     # print(
     #     f"img corner to y_plan deg: {theta_deg_corner_to_y}   {coord_mid_y}  {cartesian_mid_y}  to {cartesian_img_center} ")
 
-    with open(save_file_path_txt, 'w', encoding='utf-8') as file:
-        file.write(f'{file_name_txt},{d_item[0]},{100},{wcs_info.to_header_string()},{cartesian_img_center.x},'
-                   f'{cartesian_img_center.y},{cartesian_img_center.z},'
-                   f'{cartesian_mid_x.x},{cartesian_mid_x.y},{cartesian_mid_x.z},'
-                   f'{theta_deg_corner_to_x},'
-                   f'{cartesian_mid_y.x},{cartesian_mid_y.y},{cartesian_mid_y.z},'
-                   f'{theta_deg_corner_to_y},'
-                   f'{plane_normal_vector_x[0]},{plane_normal_vector_x[1]},{plane_normal_vector_x[2]},'
-                   f'{plane_normal_vector_y[0]},{plane_normal_vector_y[1]},{plane_normal_vector_y[2]},'
-                   f'{d_item[0]}')
+    # 24个字段, 与原 {id}_solve.txt 相同
+    record = (f'{file_name_txt},{d_item[0]},{100},{wcs_info.to_header_string()},{cartesian_img_center.x},'
+              f'{cartesian_img_center.y},{cartesian_img_center.z},'
+              f'{cartesian_mid_x.x},{cartesian_mid_x.y},{cartesian_mid_x.z},'
+              f'{theta_deg_corner_to_x},'
+              f'{cartesian_mid_y.x},{cartesian_mid_y.y},{cartesian_mid_y.z},'
+              f'{theta_deg_corner_to_y},'
+              f'{plane_normal_vector_x[0]},{plane_normal_vector_x[1]},{plane_normal_vector_x[2]},'
+              f'{plane_normal_vector_y[0]},{plane_normal_vector_y[1]},{plane_normal_vector_y[2]},'
+              f'{d_item[0]}')
     # print(sql_str)
 
-    # 删除文件
-    os.remove(solve_file_path)
-    os.remove(wcs_file_path)
-    os.remove(ini_file_path)
     send_amq(f'{d_item[0]}.fits', 4, ProcessStatus.SUCCESS)
     print(f'process:  / / {len(fits_list)}    '
           f'{d_item[0]}.fits    {d_item[0]}  ')
+    return record
+
+
+def record_solve(store, frame_id, attempt, record):
+    # 返回 record 的 (原来写出了 {id}_solve.txt) 记为完成, 其余记为失败, 下次重新解算
+    if record is None:
+        store.finish(frame_id, STAGE_SOLVE, attempt, STATUS_FAILED)
+    else:
+        store.finish(frame_id, STAGE_SOLVE, attempt, STATUS_DONE, record=record,
+                     metrics={'status': int(record.split(',')[2])})
 
 
-def run_p_04_1_solve_astap_to_txt(folder_name, max_workers=8):
+def run_p_04_1_solve_astap_to_txt(folder_name, max_workers=SOLVE_WORKERS):
     temp_download_path = f'e:/fix_data/{folder_name}/'
-    if not os.path.exists(temp_download_path):
-        return
-    files = os.listdir(temp_download_path)
-    for file_index, fits_file in enumerate(files):
-        if fits_file.endswith('.fits'):
-            fits_full_path = os.path.join(temp_download_path, fits_file)
-            fits_name = os.path.splitext(fits_file)
-            assert len(fits_name) == 2
-            fits_list.append([fits_name[0], fits_full_path])
-
-    print(f'len: {len(fits_list)}')
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
+    # 已下载、未解算的帧, 一次查询领取, 不再 os.listdir 和逐帧检查 {id}_solve.txt
+    store = StageStateStore()
+    try:
+        for frame_id, attempt in store.claim(STAGE_SOLVE, folder_name, requires=STAGE_DOWNLOAD):
+            fits_list.append([str(frame_id), os.path.join(temp_download_path, f'{frame_id}.fits'), attempt])
+
+        print(f'len: {len(fits_list)}')
+        # max_workers 个 ASTAP 进程同时解算, 结果在本线程中计算记录并写入 stage state
+        farm = SolveFarm(AstapSolver(solve_bin_path), workers=max_workers, timeout=SOLVE_TIMEOUT_S)
+        items_by_id = {}
+        solve_items = []
         for search_item in fits_list:
-            file_name_txt_solve = "{}_solve.txt".format(search_item[0])
-            file_name_download = "{}.fits".format(search_item[0])
-            save_file_path_txt_solve = os.path.join(temp_download_path, file_name_txt_solve)
-            save_file_path_download = os.path.join(temp_download_path, file_name_download)
             send_amq(f'{search_item[0]}.fits', 4, ProcessStatus.DEFAULT)
-            if os.path.exists(save_file_path_txt_solve):
-                send_amq(f'{search_item[0]}.fits', 4, ProcessStatus.SKIP)
-                print(f'ss  {save_file_path_txt_solve}')
-            else:
-                if os.path.exists(save_file_path_download):
-                    print(f'++')
-                    future = executor.submit(worker_check_fits, search_item, folder_name)
-                    futures.append(future)
-                else:
-                    print(f'--')
-        timeout = 60
-        try:
-            for future_item in as_completed(futures, timeout=timeout):
-
-                result = future_item.result()
-                print(result)
-        except concurrent.futures.TimeoutError:
-            print("任务执行超时")
-            future_item.cancel()
-        except Exception as e:
-            print(f"任务出现异常: {e}")
+            print(f'++')
+            items_by_id[search_item[0]] = search_item
+            solve_items.append((search_item[0], search_item[1], solve_hint(search_item[0])))
+        for result in farm.solve_many(solve_items):
+            search_item = items_by_id[result.frame_id]
+            record = None
+            try:
+                record = solve_record(search_item, folder_name, result)
+                print(record)
+            except Exception as e:
+                print(f"任务出现异常: {e}")
+            finally:
+                record_solve(store, int(search_item[0]), search_item[2], record)
+        print(f'solve: {dict(farm.stats)}')
+    finally:
+        store.release_claims()
+        store.close()
 
 
 def parse_args():
@@ -1,6 +1,8 @@
 import os
 import sqlite3
 
+from tools.sky_index import has_sky_index, update_sky_index
+
 
 def run_p_04_2_solve_from_txt(folder_name):
 
@@ -11,6 +13,8 @@ def run_p_04_2_solve_from_txt(folder_name):
     cursor = conn.cursor()
     if not os.path.exists(temp_txt_path):
         return
+    # 数据库已建 HTM 索引时同步更新
+    sky_index = has_sky_index(conn)
     files = os.listdir(temp_txt_path)
     for file_index, file in enumerate(files):
         if file.endswith('_solve.txt'):
@@ -45,6 +49,10 @@ def run_p_04_2_solve_from_txt(folder_name):
                 conn.commit()
                 print(f'{file_index} / {len(files)}')
             cursor.execute(sql_str)
+            if sky_index and cursor.rowcount > 0:
+                update_sky_index(cursor, int(parts[23]), [float(v) for v in parts[6:9]],
+                                 [float(v) for v in parts[17:20]], [float(v) for v in parts[20:23]],
+                                 float(parts[12]), float(parts[16]))
             # if file_index > 100:
             #     break
     conn.commit()
@@ -1,58 +1,68 @@
 import argparse
 import datetime
-import os
 import sqlite3
 
 from tools.send_message import send_amq, ProcessStatus
+from tools.stage_state import StageStateStore, STAGE_SOLVE
+from tools.sky_index import has_sky_index, update_sky_index
+
+
+def write_solve_record(cursor, line, sky_index):
+    """
+    把一条解算结果 (原 {id}_solve.txt 的内容, 24个字段) 写入 image_info, 数据库有 HTM 索引时同步更新
+    解算失败 (状态不是100) 的不写入, 返回 False
+    """
+    parts = line.split(',')
+    len_parts = len(parts)
+    if len_parts != 24:
+        for i, item in enumerate(parts):
+            print(f'{i}:  {item}')
+    if parts[2] != '100':
+        send_amq(f'{parts[1]}.fits', 42, ProcessStatus.FAILED)
+        return False
+    assert len_parts == 24
+    wcs_txt = f'{parts[3]},{parts[4]},{parts[5]}'
+    # print(wcs_txt)
+    send_amq(f'{parts[23]}.fits', 42, ProcessStatus.DEFAULT)
+    sql_str = f'UPDATE image_info SET status={parts[2]}, wcs_info ="{wcs_txt}", center_v_x={parts[6]},' \
+              f' center_v_y={parts[7]}, center_v_z={parts[8]},' \
+              f' a_v_x={parts[9]}, a_v_y={parts[10]}, a_v_z={parts[11]},' \
+              f'center_a_theta={parts[12]},' \
+              f' b_v_x={parts[13]}, b_v_y={parts[14]}, b_v_z={parts[15]}, ' \
+              f'center_b_theta={parts[16]},' \
+              f'a_n_x={parts[17]}, a_n_y={parts[18]},a_n_z={parts[19]},' \
+              f'b_n_x={parts[20]}, b_n_y={parts[21]},b_n_z={parts[22]}' \
+              f'  WHERE id = {parts[23]} and status != 100'
+    print(sql_str)
+    cursor.execute(sql_str)
+    if sky_index and cursor.rowcount > 0:
+        update_sky_index(cursor, int(parts[23]), [float(v) for v in parts[6:9]],
+                         [float(v) for v in parts[17:20]], [float(v) for v in parts[20:23]],
+                         float(parts[12]), float(parts[16]))
+    send_amq(f'{parts[23]}.fits', 42, ProcessStatus.SUCCESS)
+    return True
 
 
 def run_p_04_2_solve_from_txt(folder_name):
 
     # 连接到SQLite数据库
     db_path = '../thread_test/fits_wcs_recent.db'
-    temp_txt_path = f'e:/fix_data/{folder_name}/'
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    if not os.path.exists(temp_txt_path):
-        return
-    files = os.listdir(temp_txt_path)
-    for file_index, file in enumerate(files):
-        if file.endswith('_solve.txt'):
-            txt_full_path = os.path.join(temp_txt_path, file)
-            with open(txt_full_path, 'r', encoding='utf-8') as txt_file:
-                line = txt_file.readline()
-                parts = line.split(',')
-                # print(parts)
-                # print(parts[20])
-            len_parts = len(parts)
-            if len_parts != 24:
-                for i, item in enumerate(parts):
-                    print(f'{i}:  {item}')
-            if parts[2] != '100':
-                print(f'ss: {file_index}')
-                send_amq(f'{parts[1]}.fits', 42, ProcessStatus.FAILED)
-                continue
-            assert len_parts == 24
-            wcs_txt = f'{parts[3]},{parts[4]},{parts[5]}'
-            # print(wcs_txt)
-            send_amq(f'{parts[23]}.fits', 42, ProcessStatus.DEFAULT)
-            sql_str = f'UPDATE image_info SET status={parts[2]}, wcs_info ="{wcs_txt}", center_v_x={parts[6]},' \
-                      f' center_v_y={parts[7]}, center_v_z={parts[8]},' \
-                      f' a_v_x={parts[9]}, a_v_y={parts[10]}, a_v_z={parts[11]},' \
-                      f'center_a_theta={parts[12]},' \
-                      f' b_v_x={parts[13]}, b_v_y={parts[14]}, b_v_z={parts[15]}, ' \
-                      f'center_b_theta={parts[16]},' \
-                      f'a_n_x={parts[17]}, a_n_y={parts[18]},a_n_z={parts[19]},' \
-                      f'b_n_x={parts[20]}, b_n_y={parts[21]},b_n_z={parts[22]}' \
-                      f'  WHERE id = {parts[23]} and status != 100'
-            print(sql_str)
-            if file_index % 2 == 0:
-                conn.commit()
-                print(f'{file_index} / {len(files)}')
-            cursor.execute(sql_str)
-            # if file_index > 100:
-            #     break
-            send_amq(f'{parts[23]}.fits', 42, ProcessStatus.SUCCESS)
+    # 数据库已建 HTM 索引时同步更新
+    sky_index = has_sky_index(conn)
+    # 解算结果从 stage state 读取, 内容与原 {id}_solve.txt 相同 (24个字段)
+    store = StageStateStore()
+    records = store.done_records(STAGE_SOLVE, folder_name)
+    store.close()
+    for file_index, (frame_id, line) in enumerate(records):
+        if file_index % 2 == 0:
+            conn.commit()
+            print(f'{file_index} / {len(records)}')
+        if not write_solve_record(cursor, line, sky_index):
+            print(f'ss: {file_index}')
+        # if file_index > 100:
+        #     break
     conn.commit()
     cursor.close()
     conn.close()
@@ -0,0 +1,184 @@
+import argparse
+import datetime
+import os
+import sqlite3
+
+import schedule
+import time
+
+from test_schedule.p_02_download_or_copy_jenkins import (DOWNLOAD_WORKERS, download_frame, record_download,
+                                                          search_frames_by_date)
+from test_schedule.p_03_1_download_check_to_txt_jenkins import check_frame, record_check
+from test_schedule.p_03_2_check_from_txt_jenkins import write_check_record
+from test_schedule.p_04_1_solve_astap_to_txt_jenkins import SOLVE_WORKERS, worker_check_fits, record_solve
+from test_schedule.p_04_2_solve_from_txt_jenkins import write_solve_record
+from test_schedule.p_04_3_solve_from_txt_jenkins import clean_solved_frame
+from test_schedule.t_01_scan_jenkins import run_01_scan
+from tools.sky_index import has_sky_index
+from tools.stage_state import StageStateStore, STAGE_CHECK, STAGE_DOWNLOAD, STAGE_SOLVE
+from tools.stage_pipeline import PipelineStage, StagePipeline
+
+# job_01 的流式版本: 扫描后逐帧经过 下载 -> 检查 -> 写检查结果 -> 解算 -> 写解算结果 -> 清理,
+# 各阶段同时进行, 一帧不必等整晚的数据都完成上一阶段.
+# 下载和写库是线程阶段, sep 检查是进程阶段; ASTAP 解算本身在子进程中 (tools/solve_farm.py), 解算阶段的线程只等待它;
+# check_db / solve_db / clean 三个写库阶段各用自己的连接同时写同一个库, 连接设置 busy timeout,
+# 库被另一个阶段锁住时等待而不是立即报 database is locked.
+
+db_path = '../thread_test/fits_wcs_recent.db'
+
+CHECK_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+QUEUE_SIZE = 16
+# 写库连接等待锁的秒数
+DB_TIMEOUT = 30
+
+
+def check_stage(item):
+    # 进程中执行
+    return check_frame([str(item['frame_id']), item['fits_path']], item['folder'])
+
+
+def solve_stage(item):
+    return worker_check_fits([str(item['frame_id']), item['fits_path']], item['folder'])
+
+
+def build_pipeline(folder_name, store):
+    # 每个写库阶段在自己的线程里使用自己的连接
+    check_conn = sqlite3.connect(db_path, timeout=DB_TIMEOUT, check_same_thread=False)
+    solve_conn = sqlite3.connect(db_path, timeout=DB_TIMEOUT, check_same_thread=False)
+    clean_conn = sqlite3.connect(db_path, timeout=DB_TIMEOUT, check_same_thread=False)
+    sky_index = has_sky_index(solve_conn)
+
+    def after_download(item, success):
+        record_download(store, item['frame_id'], item['download_attempt'], success)
+        return item if success else None
+
+    def claim_check(item):
+        claimed = store.claim(STAGE_CHECK, folder_name, frame_ids=[item['frame_id']], requires=STAGE_DOWNLOAD,
+                              skip_if_done=(STAGE_SOLVE,))
+        item['check_attempt'] = claimed[0][1] if claimed else None
+        return item['check_attempt'] is not None
+
+    def after_check(item, result):
+        record_check(store, item['frame_id'], item['check_attempt'], result)
+        item['check_record'] = result[0] if result is not None else None
+        return item
+
+    def write_check(item):
+        write_check_record(check_conn.cursor(), item['check_record'])
+        check_conn.commit()
+        return item
+
+    def claim_solve(item):
+        claimed = store.claim(STAGE_SOLVE, folder_name, frame_ids=[item['frame_id']], requires=STAGE_DOWNLOAD)
+        item['solve_attempt'] = claimed[0][1] if claimed else None
+        return item['solve_attempt'] is not None
+
+    def after_solve(item, record):
+        record_solve(store, item['frame_id'], item['solve_attempt'], record)
+        if record is None:
+            return None
+        item['solve_record'] = record
+        return item
+
+    def write_solve(item):
+        item['solve_written'] = write_solve_record(solve_conn.cursor(), item['solve_record'], sky_index)
+        solve_conn.commit()
+        return item
+
+    def clean(item):
+        clean_solved_frame(clean_conn.cursor(), folder_name, item['solve_record'])
+        return item
+
+    stages = [
+        PipelineStage('download', lambda item: download_frame(item['frame_id'], item['url'], folder_name),
+                      workers=DOWNLOAD_WORKERS, when=lambda item: item['download_attempt'] is not None,
+                      after=after_download),
+        PipelineStage('check', check_stage, workers=CHECK_WORKERS, kind='process', when=claim_check,
+                      after=after_check),
+        PipelineStage('check_db', write_check, when=lambda item: item.get('check_record') is not None),
+        PipelineStage('solve', solve_stage, workers=SOLVE_WORKERS, when=claim_solve,
+                      after=after_solve),
+        PipelineStage('solve_db', write_solve, when=lambda item: item.get('solve_record') is not None),
+        PipelineStage('clean', clean, when=lambda item: item.get('solve_written', False)),
+    ]
+    pipeline = StagePipeline(stages, queue_size=QUEUE_SIZE, key=lambda item: item['frame_id'])
+    return pipeline, [check_conn, solve_conn, clean_conn]
+
+
+def frame_source(folder_name, store):
+    """
+    当天需要处理的帧: 一次领取全部需要下载的帧; 已下载但检查/解算未完成的帧 (中断后恢复) 不再下载, 直接进入后续阶段
+    """
+    temp_download_path = f'e:/fix_data/{folder_name}/'
+    os.makedirs(temp_download_path, exist_ok=True)
+    db_search_result = search_frames_by_date(folder_name)
+    solved = {frame_id for frame_id, _ in store.done_records(STAGE_SOLVE, folder_name)}
+    claimed = dict(store.claim(STAGE_DOWNLOAD, folder_name, frame_ids=[d_item[0] for d_item in db_search_result],
+                               skip_if_done=(STAGE_SOLVE,)))
+    downloaded = {frame_id for frame_id, _ in store.done_records(STAGE_DOWNLOAD, folder_name)}
+    print(f'frames {len(db_search_result)}  download {len(claimed)}  downloaded {len(downloaded)}  '
+          f'solved {len(solved)}')
+    for frame_id, url in db_search_result:
+        if frame_id in solved:
+            continue
+        if frame_id not in claimed and frame_id not in downloaded:
+            # 正在由其他进程下载
+            continue
+        yield {
+            'frame_id': frame_id,
+            'url': url,
+            'folder': folder_name,
+            'fits_path': os.path.join(temp_download_path, f'{frame_id}.fits'),
+            'download_attempt': claimed.get(frame_id),
+        }
+
+
+def job_01_pipeline(current_time=None):
+    if current_time is None:
+        current_time = datetime.datetime.now()
+    folder_name = current_time.strftime('%Y%m%d')
+    print(f'run at [{folder_name}]')
+    run_01_scan(folder_name, folder_name)
+    print('-----------  job_01  --------------')
+
+    store = StageStateStore()
+    pipeline, connections = build_pipeline(folder_name, store)
+    try:
+        metrics = pipeline.run(frame_source(folder_name, store))
+    finally:
+        for conn in connections:
+            conn.close()
+        store.release_claims()
+        store.close()
+    print(metrics.summary())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Schedule job with optional time parameter.")
+    parser.add_argument('--time', type=str, help='time in YYYYMMDD format')
+    parser.add_argument('--once', action='store_true', help='只运行一次')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    current_time = None
+    if args.time:
+        try:
+            current_time = datetime.datetime.strptime(args.time, '%Y%m%d')
+        except ValueError:
+            print("Invalid time format. Please use YYYYMMDD.")
+            return
+    job_01_pipeline(current_time)
+    if args.once:
+        return
+
+    schedule.every(10).seconds.do(job_01_pipeline, current_time)
+
+    while True:
+        schedule.run_pending()
+        time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,10 @@ import multiprocessing
 import os
 from astropy.coordinates import SkyCoord
 import sqlite3
-import subprocess
 import argparse
+from tools.async_download import download_file
 from tools.ra_dec_tool import get_ra_dec_from_string
+from tools.sky_index import has_sky_index, search_point
 from datetime import datetime
 
 # 连接到SQLite数据库
@@ -37,15 +38,19 @@ item_cart = item_coord.cartesian
 print(item_cart)
 conn_search = sqlite3.connect(db_path)
 cursor_search = conn_search.cursor()
-search_sql = f'select id,file_path,wcs_info,center_a_theta, ' \
-             f'abs(90-(degrees(acos((({item_cart.x}*t.a_n_x) +({item_cart.y}*t.a_n_y)+({item_cart.z}*t.a_n_z) ))))) as ta,center_b_theta, ' \
-             f'abs(90-(degrees(acos((({item_cart.x}*t.b_n_x) +({item_cart.y}*t.b_n_y)+({item_cart.z}*t.b_n_z) ))))) as tb, ' \
-             f'degrees(acos((({item_cart.x}*t.center_v_x) +({item_cart.y}*t.center_v_y)+({item_cart.z}*t.center_v_z) ))) as tc ' \
-             f'from  image_info as t ' \
-             f'where t.status=100 and t.center_a_theta>ta and t.center_b_theta>tb and tc<90'
-print(f'{search_sql}')
-cursor_search.execute(search_sql)
-db_search_result = cursor_search.fetchall()
+if has_sky_index(conn_search):
+    # 有 HTM 索引时只取候选行 (python -m tools.sky_index <db> 建立索引)
+    db_search_result = search_point(conn_search, ra, dec)
+else:
+    search_sql = f'select id,file_path,wcs_info,center_a_theta, ' \
+                 f'abs(90-(degrees(acos((({item_cart.x}*t.a_n_x) +({item_cart.y}*t.a_n_y)+({item_cart.z}*t.a_n_z) ))))) as ta,center_b_theta, ' \
+                 f'abs(90-(degrees(acos((({item_cart.x}*t.b_n_x) +({item_cart.y}*t.b_n_y)+({item_cart.z}*t.b_n_z) ))))) as tb, ' \
+                 f'degrees(acos((({item_cart.x}*t.center_v_x) +({item_cart.y}*t.center_v_y)+({item_cart.z}*t.center_v_z) ))) as tc ' \
+                 f'from  image_info as t ' \
+                 f'where t.status=100 and t.center_a_theta>ta and t.center_b_theta>tb and tc<90'
+    print(f'{search_sql}')
+    cursor_search.execute(search_sql)
+    db_search_result = cursor_search.fetchall()
 cursor_search.close()
 conn_search.close()
 
@@ -82,19 +87,7 @@ def worker_download_fits(d_queue, r_queue, p_name):
             print(f'[{d_item[0]}]:{file_name}  skip')
             r_queue.put(d_item[0])
             continue
-        download_code = 0
-        with subprocess.Popen(["wget", "-O", save_file_path, "-nd", "--no-check-certificate", d_item[1]],
-                              stdout=subprocess.PIPE, stderr=subprocess.PIPE) \
-                as proc_down:
-            print("the commandline is {}".format(proc_down.args))
-            stdout_data, stderr_data = proc_down.communicate()
-            if proc_down.returncode == 0:
-                download_code = 1
-            else:
-                download_code = 301
-                if stderr_data.decode().__contains__('ERROR 404'):
-                    download_code = 404
-                print(f'xxx')
+        download_code = download_file(d_item[1], save_file_path)
         print(f'download = {download_code}  {save_file_path}')
         r_queue.put(d_item[0])  # 将结果放回结果队列
 
@@ -1,8 +1,9 @@
 import argparse
 import datetime
 import os
-import re
-from solve.scan_by_days import scan_by_day_path
+from solve.scan_by_days import scan_by_day_systems, SYS_NAME_ROOTS
+from tools.image_ingest import ingest_image_urls, format_ingest_stats
+from tools.image_obs_columns import latest_obs_date
 import sqlite3
 import concurrent.futures
 
@@ -76,75 +77,18 @@ def calc_days_list(yyyymmdd_str, day_count_param):
 
 
 def wget_scan(item_yyyy, item_ymd):
+    # 六个系统同时爬取目录索引
+    for sys_name_root in SYS_NAME_ROOTS:
+        send_amq(f'{sys_name_root[:3].lower()}.fits', 1, ProcessStatus.DEFAULT)
+    url_list_by_system = scan_by_day_systems(item_yyyy, item_ymd, recent_data, SYS_NAME_ROOTS)
     file_url_list_all_days = []
-    send_amq(f'gy1.fits', 1, ProcessStatus.DEFAULT)
-    url_list_by_day = scan_by_day_path(item_yyyy, item_ymd, recent_data, sys_name_root='GY1-DATA')
-    file_url_list_all_days.extend(url_list_by_day)
-    send_amq(f'gy2.fits', 1, ProcessStatus.DEFAULT)
-    url_list_by_day = scan_by_day_path(item_yyyy, item_ymd, recent_data, sys_name_root='GY2-DATA')
-    file_url_list_all_days.extend(url_list_by_day)
-    send_amq(f'gy3.fits', 1, ProcessStatus.DEFAULT)
-    url_list_by_day = scan_by_day_path(item_yyyy, item_ymd, recent_data, sys_name_root='GY3-DATA')
-    file_url_list_all_days.extend(url_list_by_day)
-    send_amq(f'gy4.fits', 1, ProcessStatus.DEFAULT)
-    url_list_by_day = scan_by_day_path(item_yyyy, item_ymd, recent_data, sys_name_root='GY4-DATA')
-    file_url_list_all_days.extend(url_list_by_day)
-    send_amq(f'gy5.fits', 1, ProcessStatus.DEFAULT)
-    url_list_by_day = scan_by_day_path(item_yyyy, item_ymd, recent_data, sys_name_root='GY5-DATA')
-    file_url_list_all_days.extend(url_list_by_day)
-    send_amq(f'gy6.fits', 1, ProcessStatus.DEFAULT)
-    url_list_by_day = scan_by_day_path(item_yyyy, item_ymd, recent_data, sys_name_root='GY6-DATA')
-    file_url_list_all_days.extend(url_list_by_day)
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    date_time_pattern = re.compile(r"UTC(\d{8})_(\d{6})_")
-    gy_pattern = re.compile(r"GY(\d)")
-    k_pattern = re.compile(r"K(\d+)")
-    insert_counter = 0
+    for sys_name_root in SYS_NAME_ROOTS:
+        file_url_list_all_days.extend(url_list_by_system[sys_name_root])
 
-    for idx, item in enumerate(file_url_list_all_days):
-        sql_str = f'SELECT 1 FROM image_info WHERE file_path = "{item}"'
-        print(f'{idx}    {item}')
-        cursor.execute(sql_str)
-        print(f'--? [  {item_ymd}  ]:{idx}/ {len(file_url_list_all_days)} {item}  ')
-        result = cursor.fetchone()
-        if not result:
-            print(f'--pass [  {item_ymd}  ]:{idx}/ {len(file_url_list_all_days)} {item}  ')
-            # 使用正则表达式提取年月日时分秒
-            match = date_time_pattern.search(item)
-            if match:
-                year_month_day = match.group(1)  # 年月日
-                hour_minute_second = match.group(2)  # 时分秒
-
-            # 提取"K011"和"GY1"
-            match = gy_pattern.search(item)
-            gy_sys_id = ''
-            k_id = ''
-            if match:
-                gy_sys_id = match.group(1)  # "K011" 或者其他匹配的标识符
-
-            else:
-                print(f'---!!no gy')
-            match = k_pattern.search(item)
-            if match:
-                k_id = match.group(1)
-            else:
-                print(f'---!!no kid')
-            # print(f" Date: {year_month_day} Time: {hour_minute_second}  Identifier: {gy_sys_id}  {k_id}")
-            sql_str = f'INSERT INTO image_info (id, file_path, status) VALUES ({gy_sys_id}{k_id}' \
-                      f'{year_month_day}{hour_minute_second},"{item}",{0})'
-            print(f' [  {item_ymd}  ]:{idx}/ {len(file_url_list_all_days)}  {sql_str}')
-            insert_counter = insert_counter+1
-            cursor.execute(sql_str)
-            # if idx % 10 == 0:
-            #     print(f'{idx}/ {len(file_url_list_all_days)} {item}')
-        else:
-            print(f'--x [  {item_ymd}  ]:{idx}/ {len(file_url_list_all_days)} {item} ')
-        # 提交所有更改
-        conn.commit()
-    cursor.close()
-    conn.close()
+    # 整批解析 id 后在一个事务里批量写入, 已存在的跳过
+    stats = ingest_image_urls(db_path, file_url_list_all_days)
+    print(f'ingest [  {item_ymd}  ]: {format_ingest_stats(stats)}')
+    insert_counter = stats['inserted']
 
     save_fits_list(file_url_list_all_days, item_ymd)
 
@@ -158,16 +102,12 @@ def run_01_scan(start_day, folder_name):
         return
     print(f'scan  {start_day}')
     conn_search_date = sqlite3.connect(db_path)
-    cursor_search_date = conn_search_date.cursor()
-    sql_search_date = f'select substr(id, 5, 8) AS id_substring from  image_info order by id desc limit 1'
-    cursor_search_date.execute(sql_search_date)
-    db_search_result_date = cursor_search_date.fetchall()
-    cursor_search_date.close()
+    # obs_date 索引取最新日期, 不再按 id 排序后截取 substr(id, 5, 8); 旧库会先补列, 未回填完时仍用旧查询
+    max_date_str = latest_obs_date(conn_search_date)
     conn_search_date.close()
-    if not db_search_result_date:
+    if max_date_str is None:
         print(f'no data')
     else:
-        max_date_str = db_search_result_date[0][0]
         if not validate_date(max_date_str):
             print(f'日期无效 {max_date_str}')
             exit(1)
@@ -13,6 +13,7 @@ from astropy import wcs
 
 from solve.test_name_to_ra_dec import get_ra_dec_from_path
 from tools.regex_from_string import get_yyyy_from_path
+from tools.async_download import download_file
 from tools.fits_check import fits_file_check
 
 # 连接到SQLite数据库
@@ -99,27 +100,16 @@ def worker_download_fits(d_queue, r_queue, s_queue, p_name):
         if not os.path.exists(save_file_path):
             print(f'process:[{file_name}]:  {r_queue.qsize()+1}/{s_queue.qsize()} / {len(db_search_result)}    '
                   f'{d_item[0]}    {d_item[1]}   [{p_name}]')
-            download_code = 0
-            with subprocess.Popen(["wget", "-O", save_file_path, "-nd", "--no-check-certificate", d_item[1]],
-                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE) \
-                    as proc_down:
-                print("the commandline is {}".format(proc_down.args))
-                stdout_data, stderr_data = proc_down.communicate()
-                if proc_down.returncode == 0:
-                    download_code = 1
-                else:
-                    download_code = 301
-                    if stderr_data.decode().__contains__('ERROR 404'):
-                        download_code = 404
-
-                        print(f'404   {d_item[0]}')
-                        sql_str = f'UPDATE image_info SET status={download_code} ' \
-                                  f'WHERE id = {d_item[0]}'
-                        cursor.execute(sql_str)
-                        print(f'{sql_str}')
-                        conn.commit()
-
-                print(f'code:{download_code}')
+            download_code = download_file(d_item[1], save_file_path)
+            if download_code == 404:
+                print(f'404   {d_item[0]}')
+                sql_str = f'UPDATE image_info SET status={download_code} ' \
+                          f'WHERE id = {d_item[0]}'
+                cursor.execute(sql_str)
+                print(f'{sql_str}')
+                conn.commit()
+
+            print(f'code:{download_code}')
 
         try:
             with fits.open(save_file_path) as hdul:
@@ -0,0 +1,436 @@
+import asyncio
+import os
+import ssl
+import threading
+from urllib.parse import urljoin, urlsplit
+
+from tools.fits_header import FITS_BLOCK, hdu_data_size, padded_size, parse_header_bytes
+
+# 进程内的 asyncio HTTP 下载, 替代每个文件一个 wget 进程
+# 同一主机的连接 keep-alive 复用 (不再每个文件一次 fork/exec 和 TLS 握手), 每个主机的并发数可配置.
+# 先写到 {path}.part, 中断后用 Range 续传, 边下载边校验, 完成后 os.replace 原子改名.
+# 返回码与原 wget 调用一致: 1 成功, 404 文件不存在, 301 其他失败.
+# 与 wget --no-check-certificate 相同, https 不校验证书.
+
+DOWNLOAD_OK = 1
+DOWNLOAD_FAILED = 301
+DOWNLOAD_NOT_FOUND = 404
+
+DEFAULT_PER_HOST = 6
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 2
+CHUNK_SIZE = 1 << 20
+MAX_REDIRECTS = 5
+# 错误/重定向响应的 body 小于这个长度时读完后复用连接, 否则关闭连接
+MAX_DRAIN = 1 << 16
+PART_SUFFIX = '.part'
+USER_AGENT = 'fits-downloader/1.0'
+
+
+class DownloadError(Exception):
+    def __init__(self, message, code=DOWNLOAD_FAILED, retry=True):
+        super().__init__(message)
+        self.code = code
+        self.retry = retry
+
+
+class FitsStreamCheck:
+    """
+    下载过程中的 FITS 校验: 解析主 HDU 头, 总长度是 2880 的整数倍且不短于主 HDU 的头加数据
+    """
+
+    def __init__(self):
+        self.head = b''
+        self.expected = None
+        self.size = 0
+
+    def feed(self, data):
+        if self.expected is None:
+            self.head += data
+            if len(self.head) >= 9 and not self.head.startswith(b'SIMPLE  ='):
+                raise ValueError('not a FITS file')
+            cards, header_size = parse_header_bytes(self.head[:len(self.head) // FITS_BLOCK * FITS_BLOCK])
+            if cards is not None:
+                self.expected = header_size + padded_size(hdu_data_size(cards))
+                self.head = b''
+        self.size += len(data)
+
+    def finish(self):
+        if self.size == 0 or self.size % FITS_BLOCK != 0:
+            raise ValueError(f'FITS size {self.size} is not a multiple of {FITS_BLOCK}')
+        if self.expected is None:
+            raise ValueError('FITS header without END')
+        if self.size < self.expected:
+            raise ValueError(f'FITS size {self.size} < {self.expected} from header')
+
+
+def _insecure_ssl_context():
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class _HostPool:
+    def __init__(self, scheme, host, port, limit, ssl_context):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context if scheme == 'https' else None
+        self.host_header = host if port in (80, 443) else f'{host}:{port}'
+        self.semaphore = asyncio.Semaphore(limit)
+        self.idle = []
+
+    async def acquire(self, timeout):
+        """
+        返回 (reader, writer, reused), 优先复用空闲连接
+        """
+        while self.idle:
+            reader, writer = self.idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self.ssl_context), timeout)
+        return reader, writer, False
+
+    def release(self, reader, writer, reusable):
+        if reusable and not writer.is_closing():
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+class AsyncDownloader:
+    def __init__(self, per_host=DEFAULT_PER_HOST, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 check=FitsStreamCheck, chunk_size=CHUNK_SIZE):
+        """
+        per_host    每个主机同时进行的请求数 (也是该主机保持的连接数上限)
+        timeout     建立连接/每次读取的超时 (秒), 不是整个文件的超时
+        retries     网络错误后的重试次数, 重试时从 .part 续传
+        check       check() -> 有 feed(data)/finish() 的校验对象, 为 None 时只校验 Content-Length
+        必须在事件循环中创建和使用; 线程中同步调用用 download_file
+        """
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.check = check
+        self.chunk_size = chunk_size
+        self.ssl_context = _insecure_ssl_context()
+        self.pools = {}
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+        self.pools = {}
+
+    def _pool(self, parts):
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        if key not in self.pools:
+            self.pools[key] = _HostPool(scheme, parts.hostname, port, self.per_host, self.ssl_context)
+        return self.pools[key]
+
+    async def fetch(self, url, save_path):
+        """
+        下载 url 到 save_path, 返回 DOWNLOAD_OK / DOWNLOAD_NOT_FOUND / DOWNLOAD_FAILED
+        """
+        last_error = None
+        for attempt in range(self.retries + 1):
+            try:
+                await self._fetch_once(url, save_path)
+                return DOWNLOAD_OK
+            except DownloadError as e:
+                last_error = e
+                if not e.retry:
+                    break
+            except (OSError, EOFError, asyncio.TimeoutError, ValueError) as e:
+                last_error = e
+            print(f'{url} attempt {attempt + 1}: {last_error}')
+        if isinstance(last_error, DownloadError):
+            print(f'{url} code: {last_error.code}  {last_error}')
+            return last_error.code
+        print(f'{url} code: {DOWNLOAD_FAILED}  {last_error}')
+        return DOWNLOAD_FAILED
+
+    async def _fetch_once(self, url, save_path):
+        part_path = save_path + PART_SUFFIX
+        for _ in range(MAX_REDIRECTS + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            parts = urlsplit(url)
+            pool = self._pool(parts)
+            async with pool.semaphore:
+                reader, writer, reused = await pool.acquire(self.timeout)
+                reusable = False
+                try:
+                    try:
+                        status, headers = await self._request(reader, writer, pool, parts, offset)
+                    except (OSError, EOFError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                        if not reused:
+                            raise
+                        # 空闲连接已被服务器关闭, 换新连接重发一次
+                        writer.close()
+                        reader, writer, reused = await pool.acquire(self.timeout)
+                        status, headers = await self._request(reader, writer, pool, parts, offset)
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+
+                    if status in (301, 302, 303, 307, 308) and 'location' in headers:
+                        reusable = keep_alive and await self._drain(reader, headers)
+                        url = urljoin(url, headers['location'])
+                        continue
+                    if status == 416:
+                        # .part 已经不小于文件长度, 重新下载
+                        reusable = keep_alive and await self._drain(reader, headers)
+                        os.remove(part_path)
+                        continue
+                    if status == 404:
+                        reusable = keep_alive and await self._drain(reader, headers)
+                        raise DownloadError('ERROR 404', DOWNLOAD_NOT_FOUND, retry=False)
+                    if status not in (200, 206):
+                        reusable = keep_alive and await self._drain(reader, headers)
+                        raise DownloadError(f'HTTP {status}', retry=status >= 500)
+
+                    if status == 206:
+                        start, total = _parse_content_range(headers.get('content-range', ''))
+                        if start != offset:
+                            os.remove(part_path)
+                            raise DownloadError(f'unexpected range start {start}, expected {offset}')
+                    else:
+                        # 服务器不支持 Range 时从头开始
+                        offset = 0
+                        total = int(headers['content-length']) if 'content-length' in headers else None
+                    await self._receive(reader, headers, part_path, offset, total)
+                    reusable = keep_alive and _has_length(headers)
+                finally:
+                    pool.release(reader, writer, reusable)
+            os.replace(part_path, save_path)
+            return
+        raise DownloadError(f'too many redirects: {url}', retry=False)
+
+    async def get(self, url, headers=None, max_size=64 << 20):
+        """
+        读取一个较小的响应 (如目录索引页) 到内存, 跟随重定向, 网络错误时重试
+        headers 附加的请求头 (如 If-None-Match); 返回 (status, 响应头, body)
+        """
+        last_error = None
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._get_once(url, headers or {}, max_size)
+            except (OSError, EOFError, asyncio.TimeoutError, ValueError) as e:
+                last_error = e
+                print(f'{url} attempt {attempt + 1}: {e}')
+        raise DownloadError(f'{url}: {last_error}')
+
+    async def _get_once(self, url, extra_headers, max_size):
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            pool = self._pool(parts)
+            async with pool.semaphore:
+                reader, writer, reused = await pool.acquire(self.timeout)
+                reusable = False
+                try:
+                    try:
+                        status, headers = await self._request(reader, writer, pool, parts, 0, extra_headers)
+                    except (OSError, EOFError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                        if not reused:
+                            raise
+                        writer.close()
+                        reader, writer, reused = await pool.acquire(self.timeout)
+                        status, headers = await self._request(reader, writer, pool, parts, 0, extra_headers)
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                    if status in (301, 302, 303, 307, 308) and 'location' in headers:
+                        reusable = keep_alive and await self._drain(reader, headers)
+                        url = urljoin(url, headers['location'])
+                        continue
+                    body = bytearray()
+                    if status not in (204, 304):
+                        async for data in self._iter_body(reader, headers):
+                            body += data
+                            if len(body) > max_size:
+                                raise ValueError(f'response larger than {max_size}')
+                    reusable = keep_alive and (_has_length(headers) or status in (204, 304))
+                finally:
+                    pool.release(reader, writer, reusable)
+            return status, headers, bytes(body)
+        raise DownloadError(f'too many redirects: {url}', retry=False)
+
+    async def _request(self, reader, writer, pool, parts, offset, extra_headers=None):
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        lines = [f'GET {path} HTTP/1.1',
+                 f'Host: {pool.host_header}',
+                 f'User-Agent: {USER_AGENT}',
+                 'Accept: */*',
+                 'Accept-Encoding: identity',
+                 'Connection: keep-alive']
+        if offset > 0:
+            lines.append(f'Range: bytes={offset}-')
+        for name, value in (extra_headers or {}).items():
+            lines.append(f'{name}: {value}')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await asyncio.wait_for(writer.drain(), self.timeout)
+
+        status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+        if not status_line:
+            raise EOFError('connection closed before response')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return status, headers
+
+    async def _iter_body(self, reader, headers):
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size_line = await asyncio.wait_for(reader.readline(), self.timeout)
+                size = int(size_line.split(b';')[0].strip(), 16)
+                if size == 0:
+                    while await asyncio.wait_for(reader.readline(), self.timeout) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                async for data in self._iter_length(reader, size):
+                    yield data
+                await asyncio.wait_for(reader.readexactly(2), self.timeout)
+        elif 'content-length' in headers:
+            async for data in self._iter_length(reader, int(headers['content-length'])):
+                yield data
+        else:
+            # 没有长度时读到连接关闭
+            while True:
+                data = await asyncio.wait_for(reader.read(self.chunk_size), self.timeout)
+                if not data:
+                    return
+                yield data
+
+    async def _iter_length(self, reader, length):
+        remaining = length
+        while remaining > 0:
+            data = await asyncio.wait_for(reader.read(min(remaining, self.chunk_size)), self.timeout)
+            if not data:
+                raise EOFError(f'connection closed, {remaining} bytes missing')
+            remaining -= len(data)
+            yield data
+
+    async def _drain(self, reader, headers):
+        """
+        读完并丢弃小的响应 body, 返回连接是否可以复用
+        """
+        if not _has_length(headers):
+            return False
+        if int(headers.get('content-length', 0)) > MAX_DRAIN:
+            return False
+        async for _ in self._iter_body(reader, headers):
+            pass
+        return True
+
+    async def _receive(self, reader, headers, part_path, offset, total):
+        check = self.check() if self.check is not None else None
+        if check is not None and offset > 0:
+            # 续传时已有部分也要经过校验, 不对时删除, 重试时从头下载
+            try:
+                with open(part_path, 'rb') as part_file:
+                    while True:
+                        data = part_file.read(self.chunk_size)
+                        if not data:
+                            break
+                        check.feed(data)
+            except ValueError:
+                os.remove(part_path)
+                raise
+        size = offset
+        try:
+            with open(part_path, 'ab' if offset > 0 else 'wb') as part_file:
+                async for data in self._iter_body(reader, headers):
+                    if check is not None:
+                        _check_content(check.feed, data)
+                    part_file.write(data)
+                    size += len(data)
+            if total is not None and size != total:
+                raise ValueError(f'size {size} != {total}')
+            if check is not None:
+                _check_content(check.finish)
+        except (ValueError, DownloadError):
+            # 内容不对, 续传没有意义, 从头开始
+            os.remove(part_path)
+            raise
+
+
+def _check_content(func, *args):
+    # 校验失败说明服务器上的文件本身不对 (不是 FITS / 长度与头不符), 重新下载也一样, 不重试
+    try:
+        func(*args)
+    except ValueError as e:
+        raise DownloadError(f'bad content: {e}', retry=False) from e
+
+
+def _has_length(headers):
+    return 'content-length' in headers or headers.get('transfer-encoding', '').lower() == 'chunked'
+
+
+def _parse_content_range(value):
+    """
+    'bytes 100-199/1000' -> (100, 1000), 总长度未知 ('*') 时为 None
+    """
+    unit, _, spec = value.partition(' ')
+    byte_range, _, total = spec.partition('/')
+    start = int(byte_range.split('-')[0])
+    return start, (int(total) if total.strip() not in ('', '*') else None)
+
+
+async def download_many(items, per_host=DEFAULT_PER_HOST, **kwargs):
+    """
+    items: [(url, save_path), ...], 全部并发提交 (每个主机同时 per_host 个), 返回与 items 对应的返回码
+    """
+    downloader = AsyncDownloader(per_host=per_host, **kwargs)
+    try:
+        return await asyncio.gather(*(downloader.fetch(url, save_path) for url, save_path in items))
+    finally:
+        downloader.close()
+
+
+_shared_lock = threading.Lock()
+_shared = None
+
+
+def _start_shared(**kwargs):
+    # 后台线程里的事件循环和下载器, 各线程的 download_file 共用同一组连接
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name='async-download', daemon=True).start()
+
+    async def create():
+        return AsyncDownloader(**kwargs)
+
+    return loop, asyncio.run_coroutine_threadsafe(create(), loop).result()
+
+
+def configure_shared(**kwargs):
+    """
+    设置共享下载器的参数 (per_host 等, 同 AsyncDownloader), 需要在第一次 download_file 之前调用
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is not None:
+            raise RuntimeError('shared downloader already started')
+        _shared = _start_shared(**kwargs)
+
+
+def download_file(url, save_path):
+    """
+    同步下载一个文件, 替代 subprocess wget; 可以在多个线程中同时调用, 返回 1 / 404 / 301
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = _start_shared()
+        loop, downloader = _shared
+    return asyncio.run_coroutine_threadsafe(downloader.fetch(url, save_path), loop).result()
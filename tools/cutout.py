@@ -0,0 +1,348 @@
+import argparse
+import math
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy import wcs
+from astropy.io import fits
+from PIL import Image, ImageDraw
+
+from tools.fits_header import FitsFormatError, hdu_data_size, padded_size, parse_header_bytes, read_header
+from tools.ra_dec_tool import get_ra_dec_from_string
+
+# 按天球坐标从多帧 FITS 中截取小图 (stamp), 代替 sources/0.2_get_sub_img.py, sep_flux/test_sep_flux_list.py 中
+# 读入整幅图像 (4800x3211) 再截取 400x300 的做法:
+# - 多帧的 WCS (库中的 wcs_info / .txt 中的头字符串) 一次向量化计算目标的像素坐标;
+#   TAN 投影 (无 SIP) 直接用 numpy 计算, 其他投影逐帧用 astropy
+# - 未压缩的图像由 tools/fits_header 找到数据区位置, 每行 seek + read 只读需要的一段;
+#   压缩图像 (ZIMAGE) 用 astropy 的 section, 只解压需要的块
+# - 超出图像的部分补 fill; stamp 覆盖 [x0, x0 + width), x0 = floor(x) - width // 2, 目标在 stamp 中的位置为 x - x0
+# - 输出 FITS 立方体 (每帧一层, 附 STAMPS 表) 或 PIL 写的 PNG 长条 (每帧一格, 百分位拉伸, 红圈标出目标)
+
+DEFAULT_WIDTH = 400
+DEFAULT_HEIGHT = 300
+MARK_RADIUS = 10
+STRIP_GAP = 2
+
+BITPIX_DTYPES = {8: np.dtype('u1'), 16: np.dtype('>i2'), 32: np.dtype('>i4'), 64: np.dtype('>i8'),
+                 -32: np.dtype('>f4'), -64: np.dtype('>f8')}
+
+# wcs 为头字符串 (如 to_header_string() 的结果), dict 或 astropy Header
+Frame = namedtuple('Frame', ['frame_id', 'path', 'wcs'])
+# 未压缩图像数据区的位置; compressed 为 True 时只有 hdu 有意义, 由 astropy 读取
+ImageLayout = namedtuple('ImageLayout', ['hdu', 'offset', 'shape', 'dtype', 'bscale', 'bzero', 'blank',
+                                         'compressed'])
+# data 为 float32 (height, width); (x0, y0) 为 stamp 左上角 (0 起) 在整幅图像中的像素坐标;
+# (mark_x, mark_y) 为目标在 stamp 中的位置; bytes_read 为读取的数据字节数 (astropy 读取时为 None)
+Stamp = namedtuple('Stamp', ['frame_id', 'data', 'x0', 'y0', 'mark_x', 'mark_y', 'bytes_read'])
+
+
+def wcs_cards(header):
+    """
+    WCS 头 -> {keyword: value 字符串}
+    """
+    if isinstance(header, str):
+        text = header.rstrip('\n')
+        if len(text) % 80:
+            text = text.ljust(len(text) // 80 * 80 + 80)
+        cards, _ = parse_header_bytes(text.encode('ascii', errors='replace') + b'END'.ljust(80))
+        return cards
+    return {key: str(value) for key, value in dict(header).items()}
+
+
+def _float_card(cards, keyword, default):
+    return float(cards[keyword]) if keyword in cards else default
+
+
+def is_plain_tan(cards):
+    # RA---TAN / DEC--TAN, 无 SIP 等畸变, 默认极点
+    return (cards.get('CTYPE1', '').strip() == 'RA---TAN' and cards.get('CTYPE2', '').strip() == 'DEC--TAN' and
+            'A_ORDER' not in cards and _float_card(cards, 'LONPOLE', 180.0) == 180.0 and
+            not any(key.startswith(('PV', 'DP', 'DQ')) for key in cards))
+
+
+def cd_matrix(cards):
+    if 'CD1_1' in cards:
+        return np.array([[_float_card(cards, f'CD{i}_{j}', 0.0) for j in (1, 2)] for i in (1, 2)])
+    pc = np.array([[_float_card(cards, f'PC{i}_{j}', float(i == j)) for j in (1, 2)] for i in (1, 2)])
+    cdelt = np.array([_float_card(cards, 'CDELT1', 1.0), _float_card(cards, 'CDELT2', 1.0)])
+    return cdelt[:, np.newaxis] * pc
+
+
+def tan_world_to_pixel(ra, dec, crval, crpix, cd):
+    """
+    TAN 投影的向量化计算: ra/dec (度) 与 crval (N, 2), crpix (N, 2), cd (N, 2, 2) 按帧广播,
+    返回 0 起的像素坐标 (x, y); 目标在切平面背面时为 nan
+    """
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    ra0 = np.radians(crval[:, 0])
+    dec0 = np.radians(crval[:, 1])
+    cos_dec = np.cos(dec)
+    d_ra = ra - ra0
+    cos_c = np.sin(dec0) * np.sin(dec) + np.cos(dec0) * cos_dec * np.cos(d_ra)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xi = np.degrees(cos_dec * np.sin(d_ra) / cos_c)
+        eta = np.degrees((np.cos(dec0) * np.sin(dec) - np.sin(dec0) * cos_dec * np.cos(d_ra)) / cos_c)
+    offsets = np.linalg.solve(cd, np.stack([xi, eta], axis=-1)[..., np.newaxis])[..., 0]
+    pixel = crpix - 1 + offsets
+    pixel[cos_c <= 0] = np.nan
+    return pixel[:, 0], pixel[:, 1]
+
+
+def frames_world_to_pixel(headers, ra, dec):
+    """
+    (ra, dec) 在每帧中的 0 起像素坐标, 返回长度为帧数的 x, y 数组; ra/dec 可以是标量或每帧一个
+    """
+    cards_list = [wcs_cards(header) for header in headers]
+    count = len(cards_list)
+    ra = np.broadcast_to(np.asarray(ra, dtype=np.float64), (count,))
+    dec = np.broadcast_to(np.asarray(dec, dtype=np.float64), (count,))
+    x = np.full(count, np.nan)
+    y = np.full(count, np.nan)
+    tan = np.array([is_plain_tan(cards) for cards in cards_list], dtype=bool)
+    index = np.flatnonzero(tan)
+    if len(index):
+        crval = np.array([[float(cards_list[i]['CRVAL1']), float(cards_list[i]['CRVAL2'])] for i in index])
+        crpix = np.array([[float(cards_list[i]['CRPIX1']), float(cards_list[i]['CRPIX2'])] for i in index])
+        cd = np.array([cd_matrix(cards_list[i]) for i in index])
+        x[index], y[index] = tan_world_to_pixel(ra[index], dec[index], crval, crpix, cd)
+    for i in np.flatnonzero(~tan):
+        header = headers[i]
+        frame_wcs = wcs.WCS(header if not isinstance(header, dict) else fits.Header(header))
+        x[i], y[i] = frame_wcs.all_world2pix(ra[i], dec[i], 0)
+    return x, y
+
+
+def image_layout(path, hdu=None):
+    """
+    找到图像 HDU 的数据区; hdu 为 None 时取第一个有二维数据的 HDU (.fz 的第一个扩展)
+    """
+    with open(path, 'rb') as file:
+        index = 0
+        while True:
+            try:
+                cards, _ = read_header(file)
+            except FitsFormatError:
+                raise FitsFormatError(f'{path}: no image HDU {"" if hdu is None else hdu}')
+            offset = file.tell()
+            compressed = cards.get('ZIMAGE') == 'T'
+            naxis = int(cards.get('NAXIS', 0))
+            if (hdu is None and (compressed or naxis >= 2)) or hdu == index:
+                if compressed:
+                    return ImageLayout(index, offset, None, None, 1.0, 0.0, None, True)
+                if naxis < 2:
+                    raise FitsFormatError(f'{path}: HDU {index} is not an image')
+                shape = (int(cards['NAXIS2']), int(cards['NAXIS1']))
+                bitpix = int(cards['BITPIX'])
+                blank = int(cards['BLANK']) if 'BLANK' in cards and bitpix > 0 else None
+                return ImageLayout(index, offset, shape, BITPIX_DTYPES[bitpix], _float_card(cards, 'BSCALE', 1.0),
+                                   _float_card(cards, 'BZERO', 0.0), blank, False)
+            file.seek(offset + padded_size(hdu_data_size(cards)))
+            index += 1
+
+
+def stamp_origin(x, y, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT):
+    """
+    以 (x, y) 为中心的 stamp 左上角 (与原脚本 floor(center - width // 2) 相同)
+    """
+    return math.floor(x) - width // 2, math.floor(y) - height // 2
+
+
+def _overlap(start, length, size):
+    # stamp [start, start + length) 与图像 [0, size) 的交集, 在图像和 stamp 中的起止
+    lo, hi = max(start, 0), min(start + length, size)
+    return lo, max(hi, lo), lo - start
+
+
+def cut_array(data, x0, y0, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, fill=0):
+    """
+    从内存中的整幅图像截取, 超出图像的部分补 fill
+    """
+    out = np.full((height, width), fill, dtype=data.dtype)
+    ys0, ys1, oy = _overlap(y0, height, data.shape[0])
+    xs0, xs1, ox = _overlap(x0, width, data.shape[1])
+    out[oy:oy + ys1 - ys0, ox:ox + xs1 - xs0] = data[ys0:ys1, xs0:xs1]
+    return out
+
+
+def read_cutout(path, x0, y0, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, fill=0.0, layout=None):
+    """
+    只读 stamp 需要的像素, 返回 (float32 数据 (已按 BSCALE/BZERO 换算, BLANK 为 nan), 读取的数据字节数)
+    """
+    layout = layout or image_layout(path)
+    out = np.full((height, width), fill, dtype=np.float32)
+    if layout.compressed:
+        with fits.open(path) as hdulist:
+            image = hdulist[layout.hdu]
+            ys0, ys1, oy = _overlap(y0, height, image.shape[0])
+            xs0, xs1, ox = _overlap(x0, width, image.shape[1])
+            if ys1 > ys0 and xs1 > xs0:
+                out[oy:oy + ys1 - ys0, ox:ox + xs1 - xs0] = image.section[ys0:ys1, xs0:xs1]
+        return out, None
+    image_height, image_width = layout.shape
+    ys0, ys1, oy = _overlap(y0, height, image_height)
+    xs0, xs1, ox = _overlap(x0, width, image_width)
+    if ys1 <= ys0 or xs1 <= xs0:
+        return out, 0
+    itemsize = layout.dtype.itemsize
+    raw = np.empty((ys1 - ys0, xs1 - xs0), dtype=layout.dtype)
+    buffer = memoryview(raw).cast('B')
+    span = (xs1 - xs0) * itemsize
+    with open(path, 'rb', buffering=0) as file:
+        if xs0 == 0 and xs1 == image_width:
+            # 整行: 一次读完
+            file.seek(layout.offset + ys0 * image_width * itemsize)
+            file.readinto(buffer)
+        else:
+            for row in range(ys1 - ys0):
+                file.seek(layout.offset + ((ys0 + row) * image_width + xs0) * itemsize)
+                file.readinto(buffer[row * span:(row + 1) * span])
+    values = raw.astype(np.float32)
+    if layout.bscale != 1.0 or layout.bzero != 0.0:
+        values *= layout.bscale
+        values += layout.bzero
+    if layout.blank is not None:
+        values[raw == layout.blank] = np.nan
+    out[oy:oy + ys1 - ys0, ox:ox + xs1 - xs0] = values
+    return out, raw.nbytes
+
+
+def cut_stamps(frames, ra, dec, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, fill=0.0, workers=1):
+    """
+    frames 为 Frame 列表; 返回 Stamp 列表 (顺序与 frames 相同), 目标不在切平面上的帧为 None
+    """
+    xs, ys = frames_world_to_pixel([frame.wcs for frame in frames], ra, dec)
+
+    def cut(args):
+        frame, x, y = args
+        if not (np.isfinite(x) and np.isfinite(y)):
+            return None
+        x0, y0 = stamp_origin(x, y, width, height)
+        data, bytes_read = read_cutout(frame.path, x0, y0, width, height, fill)
+        return Stamp(frame.frame_id, data, x0, y0, x - x0, y - y0, bytes_read)
+
+    jobs = list(zip(frames, xs, ys))
+    if workers <= 1:
+        return [cut(job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(cut, jobs))
+
+
+def load_frames(root):
+    """
+    sources/0.1_get_fits_by_ra_dec.py 下载的目录: 每帧 <id>.fits 和 <id>.txt (一行 WCS 头字符串)
+    """
+    frames = []
+    for file_name in sorted(os.listdir(root)):
+        if file_name.endswith('.txt'):
+            frame_id = file_name[:-len('.txt')]
+            with open(os.path.join(root, file_name), 'r', encoding='utf-8') as txt_file:
+                line = txt_file.readline()
+            frames.append(Frame(frame_id, os.path.join(root, f'{frame_id}.fits'), line))
+    return frames
+
+
+def stretch(data, low=1, high=99):
+    """
+    百分位线性拉伸到 uint8, nan 为 0
+    """
+    finite = data[np.isfinite(data)]
+    if len(finite) == 0:
+        return np.zeros(data.shape, dtype=np.uint8)
+    vmin, vmax = np.percentile(finite, (low, high))
+    scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+    image = np.clip((np.nan_to_num(data, nan=vmin) - vmin) * scale, 0, 255)
+    return image.astype(np.uint8)
+
+
+def render_stamp(stamp, mark_radius=MARK_RADIUS, color=(255, 0, 0)):
+    """
+    灰度 stamp 转 RGB 的 PIL 图像, 用圆圈标出目标
+    """
+    image = Image.fromarray(stretch(stamp.data), mode='L').convert('RGB')
+    if mark_radius:
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((stamp.mark_x - mark_radius, stamp.mark_y - mark_radius, stamp.mark_x + mark_radius,
+                      stamp.mark_y + mark_radius), outline=color)
+    return image
+
+
+def write_png_strip(path, stamps, columns=None, mark_radius=MARK_RADIUS, label=True):
+    """
+    多个 stamp 拼成一张 PNG, 每行 columns 个 (默认全部在一行), 左上角写帧号
+    """
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    if not stamps:
+        raise ValueError('no stamps')
+    height, width = stamps[0].data.shape
+    columns = columns or len(stamps)
+    rows = (len(stamps) + columns - 1) // columns
+    strip = Image.new('RGB', (columns * (width + STRIP_GAP) - STRIP_GAP, rows * (height + STRIP_GAP) - STRIP_GAP))
+    draw = ImageDraw.Draw(strip)
+    for i, stamp in enumerate(stamps):
+        left, top = (i % columns) * (width + STRIP_GAP), (i // columns) * (height + STRIP_GAP)
+        strip.paste(render_stamp(stamp, mark_radius), (left, top))
+        if label:
+            draw.text((left + 3, top + 2), str(stamp.frame_id), fill=(255, 255, 0))
+    strip.save(path, format='PNG', compress_level=1)
+
+
+def write_cube(path, stamps, ra=None, dec=None):
+    """
+    FITS 立方体 (帧, y, x), 第二个 HDU 为每层的帧号和位置
+    """
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    if not stamps:
+        raise ValueError('no stamps')
+    primary = fits.PrimaryHDU(np.stack([stamp.data for stamp in stamps]))
+    if ra is not None:
+        primary.header['TARG_RA'] = (float(ra), 'target RA (deg)')
+        primary.header['TARG_DEC'] = (float(dec), 'target Dec (deg)')
+    table = fits.BinTableHDU.from_columns([
+        fits.Column(name='FRAME_ID', format=f'{max(len(str(s.frame_id)) for s in stamps)}A',
+                    array=[str(s.frame_id) for s in stamps]),
+        fits.Column(name='X0', format='J', array=[s.x0 for s in stamps]),
+        fits.Column(name='Y0', format='J', array=[s.y0 for s in stamps]),
+        fits.Column(name='MARK_X', format='D', array=[s.mark_x for s in stamps]),
+        fits.Column(name='MARK_Y', format='D', array=[s.mark_y for s in stamps]),
+    ], name='STAMPS')
+    fits.HDUList([primary, table]).writeto(path, overwrite=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='从目录中的 <id>.fits + <id>.txt (WCS) 截取目标周围的小图')
+    parser.add_argument('root', help='sources/0.1_get_fits_by_ra_dec.py 下载的目录')
+    parser.add_argument('--radec', default='', help='Ra dec 单位:度, 举例 "10.5 9.1"')
+    parser.add_argument('--Hms', default='', help='举例 "19:06:49.020 +15:00:34.20"')
+    parser.add_argument('--width', type=int, default=DEFAULT_WIDTH)
+    parser.add_argument('--height', type=int, default=DEFAULT_HEIGHT)
+    parser.add_argument('--cube', help='输出 FITS 立方体')
+    parser.add_argument('--png', help='输出 PNG 长条')
+    parser.add_argument('--columns', type=int, default=None, help='PNG 每行的 stamp 数')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    ra, dec = get_ra_dec_from_string(args.Hms, args.radec)
+    frames = load_frames(args.root)
+    t0 = time.perf_counter()
+    stamps = cut_stamps(frames, ra, dec, args.width, args.height, workers=args.workers)
+    elapsed = time.perf_counter() - t0
+    for frame, stamp in zip(frames, stamps):
+        if stamp is None:
+            print(f'{frame.frame_id}  target not on tangent plane')
+        else:
+            print(f'{frame.frame_id}  x0 {stamp.x0}  y0 {stamp.y0}  mark ({stamp.mark_x:.1f}, {stamp.mark_y:.1f})  '
+                  f'read {stamp.bytes_read} bytes')
+    print(f'{len(frames)} frames  {elapsed:.3f}s')
+    if args.cube:
+        write_cube(args.cube, stamps, ra, dec)
+    if args.png:
+        write_png_strip(args.png, stamps, args.columns)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,106 @@
+import argparse
 import os
 import shutil
-import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from astropy.io import fits
+import numpy as np
 
+from tools.async_download import download_file
+from tools.fits_header import FITS_BLOCK, FitsFormatError, hdu_data_size, padded_size, read_header
 
-def fits_file_check(fits_file_path):
+# 只解析头, 由 BITPIX/NAXISn 算出各 HDU 的数据长度, 检查文件长度和 2880 补齐, 不读取/解码像素数据;
+# 可选抽读几个数据块, 或按 DATASUM/CHECKSUM (存在时) 校验和.
+
+# 校验和按块读取的大小
+CHECKSUM_CHUNK = FITS_BLOCK * 1024
+FITS_SUFFIXES = ('.fits', '.fit', '.fts')
+
+
+def _ones_complement_sum(file, offset, length, total=0):
+    # FITS 校验和: 大端 32 位字的反码和
+    file.seek(offset)
+    remaining = length
+    while remaining > 0:
+        data = file.read(min(CHECKSUM_CHUNK, remaining))
+        if not data:
+            raise FitsFormatError('unexpected end of file')
+        remaining -= len(data)
+        total += int(np.frombuffer(data, dtype='>u4').sum(dtype=np.uint64))
+        while total >> 32:
+            total = (total & 0xFFFFFFFF) + (total >> 32)
+    return total
+
+
+def check_fits_structure(fits_file_path, sample_blocks=0, verify_checksum=False, require_data=True):
+    """
+    快速校验, 返回 (是否通过, 说明)
+    sample_blocks   每个 HDU 的数据区均匀抽读的块数
+    verify_checksum 有 DATASUM/CHECKSUM 时校验
+    require_data    主 HDU 必须有数据 (与原来 len(hdul[0].data) 的检查一致)
+    """
     try:
-        with fits.open(fits_file_path) as hdul:
-            # 假设数据在第一个 HDU 中
-            print(len(hdul[0].data))
-            return True
-    except Exception :
-        print(f'False: {fits_file_path}')
-        pass
-    return False
+        size = os.path.getsize(fits_file_path)
+        if size == 0 or size % FITS_BLOCK != 0:
+            return False, f'size {size} is not a multiple of {FITS_BLOCK}'
+        with open(fits_file_path, 'rb') as file:
+            offset = 0
+            hdu_index = 0
+            while offset < size:
+                file.seek(offset)
+                cards, header_size = read_header(file)
+                if hdu_index == 0 and cards.get('SIMPLE') != 'T':
+                    return False, 'SIMPLE != T'
+                if hdu_index > 0 and 'XTENSION' not in cards:
+                    return False, f'HDU {hdu_index} without XTENSION'
+                data_size = hdu_data_size(cards)
+                if hdu_index == 0 and require_data and data_size == 0:
+                    return False, 'no data in primary HDU'
+                data_offset = offset + header_size
+                end = data_offset + padded_size(data_size)
+                if end > size:
+                    return False, f'truncated: HDU {hdu_index} needs {end} bytes, file has {size}'
+                if sample_blocks and data_size:
+                    blocks = padded_size(data_size) // FITS_BLOCK
+                    count = min(sample_blocks, blocks)
+                    for k in range(count):
+                        file.seek(data_offset + (blocks - 1) * k // max(1, count - 1) * FITS_BLOCK)
+                        if len(file.read(FITS_BLOCK)) != FITS_BLOCK:
+                            return False, f'HDU {hdu_index} data block unreadable'
+                if verify_checksum and ('DATASUM' in cards or 'CHECKSUM' in cards):
+                    data_sum = _ones_complement_sum(file, data_offset, padded_size(data_size))
+                    if 'DATASUM' in cards and cards['DATASUM'] and data_sum != int(cards['DATASUM']):
+                        return False, f'HDU {hdu_index} DATASUM {cards["DATASUM"]} != {data_sum}'
+                    if 'CHECKSUM' in cards:
+                        # 头和数据的反码和应为全 1
+                        if _ones_complement_sum(file, offset, header_size, data_sum) != 0xFFFFFFFF:
+                            return False, f'HDU {hdu_index} CHECKSUM mismatch'
+                offset = end
+                hdu_index += 1
+        return True, f'{hdu_index} HDU'
+    except (OSError, ValueError) as e:
+        return False, str(e)
+
+
+def fits_file_check(fits_file_path, sample_blocks=0, verify_checksum=False):
+    ok, reason = check_fits_structure(fits_file_path, sample_blocks, verify_checksum)
+    if not ok:
+        print(f'False: {fits_file_path}  {reason}')
+    return ok
+
+
+def check_fits_dir(dir_path, sample_blocks=0, verify_checksum=False, workers=4):
+    """
+    批量校验目录下 (不含子目录) 的 fits, 返回 [(文件路径, 是否通过, 说明), ...]
+    """
+    paths = sorted(os.path.join(dir_path, name) for name in os.listdir(dir_path)
+                   if name.lower().endswith(FITS_SUFFIXES))
+
+    def check(path):
+        return (path,) + check_fits_structure(path, sample_blocks, verify_checksum)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(check, paths))
 
 
 def copy_or_download(fits_file_full_path, url, copy_file_full_path):
@@ -28,18 +114,8 @@ def copy_or_download(fits_file_full_path, url, copy_file_full_path):
         print(f'{copy_file_full_path}   ->   {fits_file_full_path}')
         shutil.copy(copy_file_full_path, fits_file_full_path)
     else:
-        with subprocess.Popen(["wget", "-O", fits_file_full_path, "-nd", "--no-check-certificate", url],
-                              stdout=subprocess.PIPE, stderr=subprocess.PIPE) \
-                as proc_down:
-            print("the commandline is {}".format(proc_down.args))
-            stdout_data, stderr_data = proc_down.communicate()
-            if proc_down.returncode == 0:
-                download_code = 1
-            else:
-                download_code = 301
-                if stderr_data.decode().__contains__('ERROR 404'):
-                    download_code = 404
-                os.remove(fits_file_full_path)
+        # 进程内下载, 连接复用; 失败时只留下 .part, 不会留下不完整的 fits
+        download_code = download_file(url, fits_file_full_path)
         print(f'{fits_file_full_path} code: {download_code}')
     if os.path.exists(fits_file_full_path):
         # 检查新文件
@@ -48,3 +124,26 @@ def copy_or_download(fits_file_full_path, url, copy_file_full_path):
             return True
     else:
         return False
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='批量快速校验目录下的 fits')
+    parser.add_argument('dir_path')
+    parser.add_argument('--sample', type=int, default=0, help='每个 HDU 抽读的数据块数')
+    parser.add_argument('--checksum', action='store_true', help='有 DATASUM/CHECKSUM 时校验')
+    parser.add_argument('--workers', type=int, default=4)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    t0 = time.perf_counter()
+    results = check_fits_dir(args.dir_path, args.sample, args.checksum, args.workers)
+    failed = [(path, reason) for path, ok, reason in results if not ok]
+    for path, reason in failed:
+        print(f'False: {path}  {reason}')
+    print(f'checked {len(results)}  failed {len(failed)}  {time.perf_counter() - t0:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
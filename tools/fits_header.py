@@ -0,0 +1,103 @@
+# 不依赖 astropy 的 FITS 头解析, 只读头块, 不读取/解码像素数据
+# 用于下载时的流式校验 (tools/async_download.py) 和磁盘文件的快速校验 (tools/fits_check.py)
+
+FITS_BLOCK = 2880
+CARD_SIZE = 80
+
+
+class FitsFormatError(ValueError):
+    pass
+
+
+def padded_size(size):
+    """
+    补齐到 2880 的整数倍
+    """
+    return (size + FITS_BLOCK - 1) // FITS_BLOCK * FITS_BLOCK
+
+
+def _card_value(card):
+    # 'KEYWORD = value / comment', 字符串值在单引号内 ('' 表示一个单引号)
+    if card[8:10] != b'= ':
+        return None
+    text = card[10:].decode('ascii', errors='replace').strip()
+    if text.startswith("'"):
+        value = []
+        i = 1
+        while i < len(text):
+            if text[i] == "'":
+                if i + 1 < len(text) and text[i + 1] == "'":
+                    value.append("'")
+                    i += 2
+                    continue
+                break
+            value.append(text[i])
+            i += 1
+        return ''.join(value).rstrip()
+    return text.split('/', 1)[0].strip()
+
+
+def parse_header_bytes(data):
+    """
+    从头部字节中解析卡片, 找到 END 时返回 (cards, 头长度 (已补齐)), 还没有 END 时返回 (None, 0)
+    cards 为 {keyword: value 字符串}, 没有值的卡片 (COMMENT/HISTORY) 不保存
+    """
+    cards = {}
+    for start in range(0, len(data) - CARD_SIZE + 1, CARD_SIZE):
+        card = data[start:start + CARD_SIZE]
+        keyword = card[:8].decode('ascii', errors='replace').strip()
+        if keyword == 'END':
+            return cards, padded_size(start + CARD_SIZE)
+        value = _card_value(card)
+        if value is not None and keyword not in cards:
+            cards[keyword] = value
+    return None, 0
+
+
+def read_header(file, max_blocks=1000):
+    """
+    从文件当前位置读一个 HDU 的头, 返回 (cards, 头长度)
+    """
+    data = b''
+    for _ in range(max_blocks):
+        block = file.read(FITS_BLOCK)
+        if len(block) < FITS_BLOCK:
+            raise FitsFormatError('header truncated')
+        data += block
+        cards, header_size = parse_header_bytes(data)
+        if cards is not None:
+            return cards, header_size
+    raise FitsFormatError(f'no END card in {max_blocks} blocks')
+
+
+def _int_card(cards, keyword, default=None):
+    if keyword not in cards:
+        if default is None:
+            raise FitsFormatError(f'missing {keyword}')
+        return default
+    try:
+        return int(cards[keyword])
+    except ValueError:
+        raise FitsFormatError(f'bad {keyword} = {cards[keyword]}')
+
+
+def hdu_data_size(cards):
+    """
+    由 BITPIX/NAXISn/PCOUNT/GCOUNT 计算数据区字节数 (未补齐)
+    """
+    bitpix = _int_card(cards, 'BITPIX')
+    if bitpix not in (8, 16, 32, 64, -32, -64):
+        raise FitsFormatError(f'bad BITPIX = {bitpix}')
+    naxis = _int_card(cards, 'NAXIS')
+    if naxis == 0:
+        return 0
+    count = 1
+    # 随机组 (NAXIS1 = 0) 时 NAXIS1 不参与
+    for axis in range(1, naxis + 1):
+        length = _int_card(cards, f'NAXIS{axis}')
+        if axis == 1 and length == 0 and 'GROUPS' in cards:
+            continue
+        count *= length
+    pcount = _int_card(cards, 'PCOUNT', 0)
+    gcount = _int_card(cards, 'GCOUNT', 1)
+    return abs(bitpix) // 8 * gcount * (pcount + count)
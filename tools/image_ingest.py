@@ -0,0 +1,101 @@
+import sqlite3
+import time
+
+from tools.image_obs_columns import DATE_TIME_PATTERN, GY_PATTERN, K_PATTERN, migrate_obs_columns
+
+# t_01 扫描结果批量入库
+# 先一次性从全部 url 解析出 id (GY 系统号 + K 天区号 + UTC 日期时间), 再在一个事务里用参数化的
+# INSERT OR IGNORE ... executemany 写入 image_info, 不再每行 SELECT + INSERT + commit.
+# 已存在的 file_path 由 NOT EXISTS 跳过 (file_path 上建普通索引), id 冲突由 OR IGNORE 跳过.
+# 同时写入 obs_date/obs_time/system_id/k_zone 列 (见 image_obs_columns).
+
+_INSERT_SQL = ('INSERT OR IGNORE INTO image_info (id, file_path, status, obs_date, obs_time, system_id, k_zone) '
+               'SELECT ?, ?, 0, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM image_info WHERE file_path = ?)')
+
+
+def parse_image_row(url):
+    """
+    从文件 url 得到 _INSERT_SQL 的参数行, 没有 UTC 日期时间的返回 None
+    id 格式与原 t_01 扫描相同: {GY号}{K号}{YYYYMMDD}{HHMMSS}, K号保留原字符串 (含前导零)
+    """
+    match = DATE_TIME_PATTERN.search(url)
+    if not match:
+        return None
+    match_gy = GY_PATTERN.search(url)
+    match_k = K_PATTERN.search(url)
+    gy_sys_id = match_gy.group(1) if match_gy else ''
+    k_id = match_k.group(1) if match_k else ''
+    obs_date, obs_time = match.group(1), match.group(2)
+    image_id = int(f'{gy_sys_id}{k_id}{obs_date}{obs_time}')
+    return (image_id, url, int(obs_date), int(obs_time),
+            int(gy_sys_id) if gy_sys_id else None, int(k_id) if k_id else None, url)
+
+
+def parse_image_rows(url_list):
+    """
+    批量解析 url, 返回 (参数行列表, 无法解析的 url 列表)
+    """
+    rows = []
+    invalid = []
+    for url in url_list:
+        row = parse_image_row(url)
+        if row is None:
+            invalid.append(url)
+        else:
+            rows.append(row)
+    return rows, invalid
+
+
+def open_ingest_db(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_image_info_file_path ON image_info (file_path)')
+    migrate_obs_columns(conn)
+    return conn
+
+
+def ingest_image_urls(db_path, url_list):
+    """
+    把扫描到的文件 url 批量写入 image_info
+
+    返回 dict:
+        total      输入 url 数
+        inserted   新写入的行数
+        skipped    已存在 (file_path 或 id 重复) 而跳过的行数
+        invalid    无法解析出 id 的 url 数
+        parse_s    解析耗时 (秒)
+        insert_s   写库耗时 (秒, 含提交)
+    """
+    t0 = time.perf_counter()
+    rows, invalid = parse_image_rows(url_list)
+    t1 = time.perf_counter()
+
+    conn = open_ingest_db(db_path)
+    try:
+        changes_before = conn.total_changes
+        with conn:
+            conn.executemany(_INSERT_SQL, rows)
+        inserted = conn.total_changes - changes_before
+    finally:
+        conn.close()
+    t2 = time.perf_counter()
+
+    for url in invalid:
+        print(f'---!!no utc  {url}')
+    return {
+        'total': len(url_list),
+        'inserted': inserted,
+        'skipped': len(rows) - inserted,
+        'invalid': len(invalid),
+        'parse_s': t1 - t0,
+        'insert_s': t2 - t1,
+    }
+
+
+def format_ingest_stats(stats):
+    rows = stats['inserted'] + stats['skipped']
+    rate = rows / stats['insert_s'] if stats['insert_s'] > 0 else 0.0
+    return (f"total {stats['total']}  inserted {stats['inserted']}  skipped {stats['skipped']}  "
+            f"invalid {stats['invalid']}  parse {stats['parse_s']:.3f}s  insert {stats['insert_s']:.3f}s  "
+            f"({rate:.0f} rows/s)")
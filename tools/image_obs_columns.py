@@ -0,0 +1,158 @@
+import argparse
+import re
+import sqlite3
+import time
+
+# image_info 的观测日期/时间/系统/天区列
+# 由 file_path 用与 t_01 扫描相同的正则得到, 替代 file_path like "%UTC{date}%" 和 substr(id, 5, 8) 这类全表扫描.
+# obs_date  INTEGER  YYYYMMDD
+# obs_time  INTEGER  HHMMSS
+# system_id INTEGER  GY 系统号 (1-6)
+# k_zone    INTEGER  K 天区号 (K011 -> 11)
+# 已有的库需要运行一次本脚本 (python -m tools.image_obs_columns <db>) 回填; 回填前 latest_obs_date /
+# frames_by_obs_date 自动补列并退回旧查询, 结果不变只是慢.
+
+DATE_TIME_PATTERN = re.compile(r"UTC(\d{8})_(\d{6})_")
+GY_PATTERN = re.compile(r"GY(\d)")
+K_PATTERN = re.compile(r"K(\d+)")
+
+OBS_COLUMNS = (
+    ('obs_date', 'INTEGER'),
+    ('obs_time', 'INTEGER'),
+    ('system_id', 'INTEGER'),
+    ('k_zone', 'INTEGER'),
+)
+OBS_INDEXES = (
+    ('idx_image_info_obs_date_status', 'obs_date, status'),
+    ('idx_image_info_system_k_zone', 'system_id, k_zone'),
+)
+BACKFILL_BATCH_SIZE = 50000
+
+
+def derive_obs_columns(file_path):
+    """
+    从 file_path 得到 (obs_date, obs_time, system_id, k_zone), 匹配不到的为 None
+    """
+    match = DATE_TIME_PATTERN.search(file_path)
+    match_gy = GY_PATTERN.search(file_path)
+    match_k = K_PATTERN.search(file_path)
+    return (int(match.group(1)) if match else None,
+            int(match.group(2)) if match else None,
+            int(match_gy.group(1)) if match_gy else None,
+            int(match_k.group(1)) if match_k else None)
+
+
+def migrate_obs_columns(conn, create_indexes=True):
+    """
+    添加缺少的 obs 列, 默认同时建复合索引, 已存在的跳过; 返回新加的列名
+    ADD COLUMN 只改表结构不重写数据, 已有行的新列为 NULL, 需要 backfill_obs_columns 补齐;
+    大表回填时先不建索引, 回填后再 create_obs_indexes, 避免回填时逐行维护索引
+    """
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(image_info)')}
+    added = []
+    with conn:
+        for name, column_type in OBS_COLUMNS:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE image_info ADD COLUMN {name} {column_type}')
+                added.append(name)
+    if create_indexes:
+        create_obs_indexes(conn)
+    return added
+
+
+def create_obs_indexes(conn):
+    with conn:
+        for index_name, columns in OBS_INDEXES:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON image_info ({columns})')
+
+
+def backfill_obs_columns(conn, batch_size=BACKFILL_BATCH_SIZE, progress=True):
+    """
+    给 obs_date 为 NULL 的行按 id 分批补齐 obs 列, 每批一个事务; 返回更新的行数
+    file_path 里没有 UTC 时间的行 obs_date 仍为 NULL, 按 id 游标前进不会重复处理
+    """
+    updated = 0
+    last_id = None
+    while True:
+        if last_id is None:
+            rows = conn.execute('SELECT id, file_path FROM image_info WHERE obs_date IS NULL '
+                                'ORDER BY id LIMIT ?', (batch_size,)).fetchall()
+        else:
+            rows = conn.execute('SELECT id, file_path FROM image_info WHERE obs_date IS NULL AND id > ? '
+                                'ORDER BY id LIMIT ?', (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        params = [derive_obs_columns(file_path or '') + (image_id,) for image_id, file_path in rows]
+        with conn:
+            conn.executemany('UPDATE image_info SET obs_date = ?, obs_time = ?, system_id = ?, k_zone = ? '
+                             'WHERE id = ?', params)
+        updated += len(rows)
+        if progress:
+            print(f'backfill {updated}  last id {last_id}')
+    return updated
+
+
+def obs_columns_ready(conn):
+    """
+    读库前调用: 补上缺少的 obs 列, 返回 obs_date 是否已回填完
+    未回填完 (旧库还没运行本脚本) 时, 查询要退回到 file_path / id 上的旧写法, 否则旧的夜晚查不到帧;
+    索引不在这里建, 由本脚本在回填之后建
+    """
+    migrate_obs_columns(conn, create_indexes=False)
+    # obs_date IS NULL 走 obs_date 索引; 没有 UTC 时间的行回填后仍为 NULL, 不算未回填
+    row = conn.execute("SELECT 1 FROM image_info WHERE obs_date IS NULL AND file_path LIKE '%UTC%' "
+                       "LIMIT 1").fetchone()
+    return row is None
+
+
+def latest_obs_date(conn):
+    """
+    库中最新的观测日期 'YYYYMMDD', 没有数据时为 None (走 obs_date 索引, 不扫表)
+    """
+    if not obs_columns_ready(conn):
+        row = conn.execute('SELECT substr(id, 5, 8) AS id_substring FROM image_info '
+                           'ORDER BY id_substring DESC LIMIT 1').fetchone()
+        return row[0] if row is not None else None
+    row = conn.execute('SELECT max(obs_date) FROM image_info').fetchone()
+    if row is None or row[0] is None:
+        return None
+    return str(row[0])
+
+
+def frames_by_obs_date(conn, date_str, limit=5000):
+    """
+    某一晚的 (id, file_path)
+    """
+    if not obs_columns_ready(conn):
+        return conn.execute('SELECT id, file_path FROM image_info WHERE file_path LIKE ? LIMIT ?',
+                            (f'%UTC{date_str}%', limit)).fetchall()
+    return conn.execute('SELECT id, file_path FROM image_info WHERE obs_date = ? LIMIT ?',
+                        (int(date_str), limit)).fetchall()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='image_info obs 列迁移与回填')
+    parser.add_argument('db_path', help='sqlite 数据库路径')
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    conn = sqlite3.connect(args.db_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    t0 = time.perf_counter()
+    added = migrate_obs_columns(conn, create_indexes=False)
+    print(f'migrate  added {added}  {time.perf_counter() - t0:.3f}s')
+    t0 = time.perf_counter()
+    updated = backfill_obs_columns(conn, args.batch_size)
+    print(f'backfill {updated} rows  {time.perf_counter() - t0:.3f}s')
+    t0 = time.perf_counter()
+    create_obs_indexes(conn)
+    print(f'index    {time.perf_counter() - t0:.3f}s')
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import time
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+from tools.async_download import AsyncDownloader
+
+# 归档目录索引页 (Apache/nginx autoindex) 的爬取, 替代 wget --spider -r 解析 stderr
+# 直接请求并解析 HTML 索引页, 多个根目录 (GY1-GY6) 同时爬, 总并发数有上限.
+# Calibration/_FZ/Flat/fiel 在爬取时过滤, 名字里带这些字样的目录不再进入.
+# 每个目录记录 ETag/Last-Modified 和解析出的子目录/文件, 重扫时带 If-None-Match/If-Modified-Since,
+# 未修改的目录 (304) 直接用缓存的列表.
+
+INDEX_CACHE_PATH = 'e:/fix_data/index_cache.json'
+DEFAULT_CONCURRENCY = 8
+FITS_SUFFIXES = ('.fts', '.fit', '.fits')
+# 与原 scan_by_day_path 相同, url 中包含这些字样的跳过
+SKIP_PATTERNS = ('Calibration', '_FZ', 'Flat', 'fiel')
+
+
+class _LinkParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href' and value:
+                    self.links.append(value)
+
+
+def parse_index(dir_url, body):
+    """
+    解析目录索引页, 返回 (子目录 url 列表, 文件 url 列表); 只保留 dir_url 之下的链接 (同 wget -np)
+    """
+    parser = _LinkParser()
+    parser.feed(body.decode('utf-8', errors='replace'))
+    dirs = []
+    files = []
+    for href in parser.links:
+        if '?' in href or '#' in href:
+            # 排序链接 ?C=N;O=D 等
+            continue
+        url = urljoin(dir_url, href)
+        if not url.startswith(dir_url) or url == dir_url:
+            continue
+        if urlsplit(url).path.endswith('/'):
+            dirs.append(url)
+        else:
+            files.append(url)
+    return sorted(set(dirs)), sorted(set(files))
+
+
+class IndexCrawler:
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, cache_path=INDEX_CACHE_PATH, suffixes=FITS_SUFFIXES,
+                 skip=SKIP_PATTERNS, **kwargs):
+        """
+        concurrency 同时请求的索引页数 (所有根目录共用)
+        cache_path  ETag/Last-Modified 缓存文件, 为 None 时不缓存
+        suffixes    需要的文件后缀
+        skip        url 包含其中任一字样的目录和文件跳过
+        kwargs      传给 AsyncDownloader (timeout, retries)
+        """
+        self.concurrency = concurrency
+        self.cache_path = cache_path
+        self.suffixes = tuple(suffixes)
+        self.skip = tuple(skip)
+        self.kwargs = kwargs
+        self.cache = {}
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as file:
+                    self.cache = json.load(file)
+            except (OSError, ValueError) as e:
+                print(f'index cache {cache_path} ignored: {e}')
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        temp_path = self.cache_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.cache, file)
+        os.replace(temp_path, self.cache_path)
+
+    def _skipped(self, url):
+        return any(pattern in url for pattern in self.skip)
+
+    async def crawl(self, roots):
+        """
+        爬取多个根目录 (url 以 / 结尾), 返回 ({root: [文件 url, ...]}, 统计)
+        """
+        client = AsyncDownloader(per_host=self.concurrency, **self.kwargs)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        stats = {'pages': 0, 'not_modified': 0, 'errors': 0, 'skipped': 0, 'files': 0, 'elapsed_s': 0.0}
+        results = {root: [] for root in roots}
+        t0 = time.perf_counter()
+
+        async def crawl_dir(url, files):
+            if self._skipped(url):
+                stats['skipped'] += 1
+                return
+            cached = self.cache.get(url)
+            headers = {}
+            if cached is not None:
+                if cached.get('etag'):
+                    headers['If-None-Match'] = cached['etag']
+                if cached.get('last_modified'):
+                    headers['If-Modified-Since'] = cached['last_modified']
+            async with semaphore:
+                try:
+                    status, response_headers, body = await client.get(url, headers)
+                except Exception as e:
+                    print(f'index {url} error: {e}')
+                    stats['errors'] += 1
+                    return
+            stats['pages'] += 1
+            if status == 304 and cached is not None:
+                stats['not_modified'] += 1
+                dirs, file_urls = cached['dirs'], cached['files']
+            elif status == 200:
+                dirs, file_urls = parse_index(url, body)
+                etag = response_headers.get('etag')
+                last_modified = response_headers.get('last-modified')
+                if etag or last_modified:
+                    self.cache[url] = {'etag': etag, 'last_modified': last_modified, 'dirs': dirs, 'files': file_urls}
+                else:
+                    self.cache.pop(url, None)
+            else:
+                if status != 404:
+                    print(f'index {url} status {status}')
+                    stats['errors'] += 1
+                return
+            for file_url in file_urls:
+                if not file_url.endswith(self.suffixes):
+                    continue
+                if self._skipped(file_url):
+                    stats['skipped'] += 1
+                    continue
+                files.append(file_url)
+            await asyncio.gather(*(crawl_dir(dir_url, files) for dir_url in dirs))
+
+        try:
+            await asyncio.gather(*(crawl_dir(root, results[root]) for root in roots))
+        finally:
+            client.close()
+        for root in roots:
+            results[root].sort()
+            stats['files'] += len(results[root])
+        stats['elapsed_s'] = time.perf_counter() - t0
+        return results, stats
+
+
+def crawl_roots(roots, **kwargs):
+    """
+    同步调用: 爬取多个根目录并保存缓存, 返回 ({root: [文件 url, ...]}, 统计)
+    """
+    crawler = IndexCrawler(**kwargs)
+    results, stats = asyncio.run(crawler.crawl(list(roots)))
+    crawler.save_cache()
+    return results, stats
+
+
+def format_crawl_stats(stats):
+    return (f'files {stats["files"]}  pages {stats["pages"]}  not modified {stats["not_modified"]}  '
+            f'skip {stats["skipped"]}  errors {stats["errors"]}  {stats["elapsed_s"]:.2f}s')
@@ -1,5 +1,9 @@
 import json
+import threading
+import time
+from collections import OrderedDict
 from enum import Enum
+from multiprocessing.util import Finalize
 
 import stomp
 
@@ -8,6 +12,18 @@ activemq_host = "localhost"
 activemq_port = 61613
 queue_name = "/topic/chat.general"
 
+# 进程内共用的状态消息发布
+# send_amq 只把消息放入队列后立即返回, 后台线程用一个持久连接按批发送, 断开后自动重连.
+# 每批以服务器的 RECEIPT 确认, 连接已断但还没发现时写入的消息会整批重发 (至少一次).
+# 队列积压超过一半时, 同一帧同一阶段尚未发出的旧状态被新状态替换 (合并); 队列满时丢弃新消息.
+MAX_PENDING = 5000
+FLUSH_INTERVAL_S = 0.2
+BATCH_SIZE = 500
+RECONNECT_DELAY_S = 1.0
+RECONNECT_DELAY_MAX_S = 30.0
+# 每批最后一条消息带 receipt, 收到 RECEIPT 才算整批送达, 否则整批重发
+RECEIPT_TIMEOUT_S = 10.0
+
 
 class ProcessStatus(Enum):
     SUCCESS = "success"
@@ -16,38 +32,229 @@ class ProcessStatus(Enum):
     SKIP = "skip"
 
 
-def send(message):
-    try:
-        # 创建连接对象
-        conn = stomp.Connection([(activemq_host, activemq_port)])
-        # 连接到ActiveMQ服务器
-        conn.connect(wait=True)
-        conn.send(body=message, destination=queue_name)
-        print("消息已发送到队列")
-        conn.disconnect()
-    except Exception as ex:
-        print(f'False: {ex}')
-        pass
-    return False
+class _ReceiptListener(stomp.ConnectionListener):
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.receipts = set()
+        self.disconnected = False
 
+    def on_receipt(self, frame):
+        with self.condition:
+            self.receipts.add(frame.headers.get('receipt-id'))
+            self.condition.notify_all()
 
-def send_amq(fits_file, stage=1, status=ProcessStatus.DEFAULT):
-    try:
-        # 创建连接对象
-        conn = stomp.Connection([(activemq_host, activemq_port)])
-        # 连接到ActiveMQ服务器
+    def on_disconnected(self):
+        with self.condition:
+            self.disconnected = True
+            self.condition.notify_all()
+
+    def wait(self, receipt_id, timeout):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while receipt_id not in self.receipts and not self.disconnected:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            if receipt_id in self.receipts:
+                self.receipts.discard(receipt_id)
+                return True
+            return False
+
+
+class StatusPublisher:
+    def __init__(self, host=activemq_host, port=activemq_port, destination=queue_name, max_pending=MAX_PENDING,
+                 coalesce_after=None, flush_interval=FLUSH_INTERVAL_S, batch_size=BATCH_SIZE):
+        """
+        max_pending     队列中最多保留的消息数, 超过时丢弃新消息
+        coalesce_after  队列中消息数达到这个值后开始合并同 key 的消息, 默认 max_pending // 2
+        flush_interval  后台线程每批之间等待的时间 (秒), 用于攒批
+        """
+        self.host = host
+        self.port = port
+        self.destination = destination
+        self.max_pending = max_pending
+        self.coalesce_after = max_pending // 2 if coalesce_after is None else coalesce_after
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.condition = threading.Condition()
+        # 序号 -> (key, body), 按放入顺序发送
+        self.pending = OrderedDict()
+        # key -> 该 key 最新一条未发送消息的序号
+        self.latest = {}
+        self.seq = 0
+        self.in_flight = 0
+        self.stats = {'queued': 0, 'sent': 0, 'coalesced': 0, 'dropped': 0, 'failed': 0, 'connects': 0}
+        self.conn = None
+        self.listener = None
+        self.closed = False
+        self.thread = None
+
+    def publish(self, body, key=None):
+        """
+        非阻塞, 返回消息是否被接收 (放入队列或合并)
+        """
+        with self.condition:
+            if self.closed:
+                self.stats['dropped'] += 1
+                return False
+            if key is not None and key in self.latest and len(self.pending) >= self.coalesce_after:
+                self.pending[self.latest[key]] = (key, body)
+                self.stats['coalesced'] += 1
+                return True
+            if len(self.pending) >= self.max_pending:
+                self.stats['dropped'] += 1
+                return False
+            self.seq += 1
+            self.pending[self.seq] = (key, body)
+            if key is not None:
+                self.latest[key] = self.seq
+            self.stats['queued'] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='status-publisher', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return True
+
+    def flush(self, timeout=5.0):
+        """
+        等待队列中的消息发送完, 返回是否全部发出
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.pending or self.in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self.thread is None:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        self.flush(timeout)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self._disconnect()
+
+    def _take_batch(self):
+        batch = []
+        while self.pending and len(batch) < self.batch_size:
+            seq, (key, body) = self.pending.popitem(last=False)
+            if key is not None and self.latest.get(key) == seq:
+                del self.latest[key]
+            batch.append((seq, key, body))
+        self.in_flight = len(batch)
+        return batch
+
+    def _requeue(self, batch):
+        # 发送失败的消息放回队首, 队列已满的部分丢弃
+        with self.condition:
+            for seq, key, body in reversed(batch):
+                if len(self.pending) >= self.max_pending:
+                    self.stats['dropped'] += 1
+                    continue
+                self.pending[seq] = (key, body)
+                self.pending.move_to_end(seq, last=False)
+                if key is not None and key not in self.latest:
+                    self.latest[key] = seq
+            self.in_flight = 0
+            self.condition.notify_all()
+
+    def _connect(self):
+        if self.conn is not None and self.conn.is_connected():
+            return
+        self._disconnect()
+        conn = stomp.Connection([(self.host, self.port)], reconnect_attempts_max=1)
+        listener = _ReceiptListener()
+        conn.set_listener('receipt', listener)
         conn.connect(wait=True)
-        result = status.value
-        message = json.dumps({
-            "fits": fits_file,
-            "stage": stage,
-            "result": result
-        })
-        conn.send(body=message, destination=queue_name)
-        print(f"-> {message}")
-        conn.disconnect()
-    except Exception as ex:
-        print(f'False: {ex}')
-        pass
-    return False
+        self.conn = conn
+        self.listener = listener
+        self.stats['connects'] += 1
 
+    def _disconnect(self):
+        if self.conn is not None:
+            try:
+                self.conn.disconnect()
+            except Exception:
+                pass
+            self.conn = None
+
+    def _run(self):
+        delay = RECONNECT_DELAY_S
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if self.closed and not self.pending:
+                    return
+                batch = self._take_batch()
+            try:
+                self._connect()
+                receipt_id = f'batch-{batch[-1][0]}'
+                for i, (_, _, body) in enumerate(batch):
+                    headers = {'receipt': receipt_id} if i == len(batch) - 1 else {}
+                    self.conn.send(body=body, destination=self.destination, headers=headers)
+                if not self.listener.wait(receipt_id, RECEIPT_TIMEOUT_S):
+                    raise ConnectionError('no receipt')
+            except Exception as ex:
+                print(f'False: {type(ex).__name__} {ex}')
+                with self.condition:
+                    self.stats['failed'] += 1
+                self._disconnect()
+                self._requeue(batch)
+                with self.condition:
+                    if self.closed:
+                        return
+                    self.condition.wait(delay)
+                delay = min(delay * 2, RECONNECT_DELAY_MAX_S)
+                continue
+            delay = RECONNECT_DELAY_S
+            with self.condition:
+                self.stats['sent'] += len(batch)
+                self.in_flight = 0
+                self.condition.notify_all()
+                # 攒批: 等一会儿再发下一批, 期间的新消息只入队; 已经积压满一批时不等
+                deadline = time.monotonic() + self.flush_interval
+                while not self.closed and len(self.pending) < self.batch_size and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+
+
+_publisher_lock = threading.Lock()
+_publisher = None
+
+
+def get_publisher():
+    """
+    进程内共用的 StatusPublisher, 第一次使用时创建; 进程退出时 (包括进程池的子进程) 尽量发完队列
+    """
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = StatusPublisher()
+            Finalize(_publisher, _publisher.close, args=(2.0,), exitpriority=10)
+        return _publisher
+
+
+def publisher_stats():
+    return dict(get_publisher().stats)
+
+
+def send(message):
+    return get_publisher().publish(message)
+
+
+def send_amq(fits_file, stage=1, status=ProcessStatus.DEFAULT):
+    """
+    发送处理状态, 不等待发送完成; 同一帧同一阶段的状态在积压时会合并
+    """
+    result = status.value
+    message = json.dumps({
+        "fits": fits_file,
+        "stage": stage,
+        "result": result
+    })
+    print(f"-> {message}")
+    return get_publisher().publish(message, key=(fits_file, stage))
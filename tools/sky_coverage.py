@@ -0,0 +1,150 @@
+import collections
+import sqlite3
+
+import numpy as np
+from scipy import sparse
+
+from tools.ra_dec_tool import dms_to_deg, hms_to_deg
+
+# 多目标批量查询: 一次把 image_info 的中心/平面法向量读入 numpy, 用分块矩阵乘法代替逐行 acos.
+# 原 SQL 条件  center_a_theta > abs(90 - degrees(acos(v·a_n)))  等价于  |v·a_n| < sin(center_a_theta)
+#            degrees(acos(v·center_v)) < 90                     等价于  v·center_v > 0
+
+FrameVectors = collections.namedtuple('FrameVectors', ['ids', 'center', 'a_n', 'b_n', 'sin_a', 'sin_b'])
+
+_frame_sql = 'SELECT id, center_v_x, center_v_y, center_v_z, a_n_x, a_n_y, a_n_z, b_n_x, b_n_y, b_n_z, ' \
+             'center_a_theta, center_b_theta FROM image_info ' \
+             'WHERE status = 100 AND a_n_x IS NOT NULL AND b_n_x IS NOT NULL ORDER BY id'
+
+
+def _rows_to_frames(rows):
+    data = np.asarray(rows, dtype=np.float64).reshape(-1, 12)
+    return FrameVectors(ids=data[:, 0].astype(np.int64),
+                        center=np.ascontiguousarray(data[:, 1:4]),
+                        a_n=np.ascontiguousarray(data[:, 4:7]),
+                        b_n=np.ascontiguousarray(data[:, 7:10]),
+                        sin_a=np.sin(np.radians(data[:, 10])),
+                        sin_b=np.sin(np.radians(data[:, 11])))
+
+
+def iter_frame_vectors(conn, chunk_size=100000):
+    # 分块读取, 10^6 张图时不需要一次全部放进内存
+    cursor = conn.cursor()
+    cursor.execute(_frame_sql)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield _rows_to_frames(rows)
+    cursor.close()
+
+
+def load_frame_vectors(conn):
+    cursor = conn.cursor()
+    cursor.execute(_frame_sql)
+    frames = _rows_to_frames(cursor.fetchall())
+    cursor.close()
+    return frames
+
+
+def radec_to_vectors(radec):
+    radec = np.radians(np.asarray(radec, dtype=np.float64).reshape(-1, 2))
+    cos_dec = np.cos(radec[:, 1])
+    return np.column_stack([cos_dec * np.cos(radec[:, 0]), cos_dec * np.sin(radec[:, 0]), np.sin(radec[:, 1])])
+
+
+def _cover_block(targets, frames, start, stop):
+    # 返回 (目标行号, 图列号) , 列号相对 frames 起点
+    mask = targets @ frames.center[start:stop].T > 0
+    dot_a = np.abs(targets @ frames.a_n[start:stop].T)
+    mask &= dot_a < frames.sin_a[start:stop]
+    del dot_a
+    dot_b = np.abs(targets @ frames.b_n[start:stop].T)
+    mask &= dot_b < frames.sin_b[start:stop]
+    del dot_b
+    rows, cols = np.nonzero(mask)
+    return rows, cols + start
+
+
+def coverage_matrix(frames, radec, frame_chunk=4096, target_chunk=2048):
+    # radec: (N, 2) 度, 返回 N x M 的 csr 稀疏矩阵 (bool), 列顺序与 frames.ids 相同
+    # 单块内存约 target_chunk * frame_chunk * 8 字节
+    targets = radec_to_vectors(radec)
+    n_frames = len(frames.ids)
+    all_rows = []
+    all_cols = []
+    for t_start in range(0, len(targets), target_chunk):
+        t_block = targets[t_start:t_start + target_chunk]
+        for f_start in range(0, n_frames, frame_chunk):
+            rows, cols = _cover_block(t_block, frames, f_start, min(f_start + frame_chunk, n_frames))
+            all_rows.append(rows + t_start)
+            all_cols.append(cols)
+    if all_rows:
+        rows = np.concatenate(all_rows)
+        cols = np.concatenate(all_cols)
+    else:
+        rows = cols = np.zeros(0, dtype=np.int64)
+    return sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(len(targets), n_frames))
+
+
+def coverage_matrix_from_db(conn, radec, db_chunk=100000, frame_chunk=4096, target_chunk=2048):
+    # 流式版本: 边读边算, 返回 (稀疏矩阵, 对应列的 image_info.id)
+    blocks = []
+    ids = []
+    for frames in iter_frame_vectors(conn, db_chunk):
+        blocks.append(coverage_matrix(frames, radec, frame_chunk, target_chunk))
+        ids.append(frames.ids)
+    if not blocks:
+        return sparse.csr_matrix((len(radec_to_vectors(radec)), 0), dtype=bool), np.zeros(0, dtype=np.int64)
+    return sparse.hstack(blocks, format='csr'), np.concatenate(ids)
+
+
+def _parse_sexagesimal(ra_str, dec_str):
+    ra_parts = ra_str.replace(':', ' ').split()
+    dec_parts = dec_str.replace(':', ' ').split()
+    ra = hms_to_deg(*ra_parts)
+    dec = dms_to_deg(*dec_parts)
+    # dms_to_deg 对 "-00 xx xx" 判断不到符号
+    if dec_str.strip().startswith('-') and dec > 0:
+        dec = -dec
+    return ra, dec
+
+
+def load_targets_txt(txt_path):
+    # 支持两种格式: "ra dec" (度), 或 classify_fix.txt 的 tab 分隔 "名称 名称 hh mm ss +dd mm ss"
+    names = []
+    radec = []
+    with open(txt_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            fields = line.split('\t')
+            if len(fields) >= 4:
+                names.append(fields[0])
+                radec.append(_parse_sexagesimal(fields[-2], fields[-1]))
+            else:
+                ra, dec = line.split()[:2]
+                names.append(f'{ra}_{dec}')
+                radec.append((float(ra), float(dec)))
+    return names, np.asarray(radec, dtype=np.float64)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='批量查询多个目标被哪些图覆盖')
+    parser.add_argument('db_path', help='fits_wcs_*.db')
+    parser.add_argument('targets', help='目标列表 txt, 如 classify/classify_fix.txt')
+    parser.add_argument('--out', default='coverage.txt', help='输出: 目标名, 覆盖图数, image_info.id 列表')
+    args = parser.parse_args()
+
+    target_names, target_radec = load_targets_txt(args.targets)
+    db_conn = sqlite3.connect(args.db_path)
+    matrix, frame_ids = coverage_matrix_from_db(db_conn, target_radec)
+    db_conn.close()
+    with open(args.out, 'w', encoding='utf-8') as out_file:
+        for row_index, target_name in enumerate(target_names):
+            hit_ids = frame_ids[matrix.indices[matrix.indptr[row_index]:matrix.indptr[row_index + 1]]]
+            out_file.write(f'{target_name},{len(hit_ids)},{" ".join(str(i) for i in hit_ids)}\n')
+    print(f'targets: {len(target_names)}  frames: {len(frame_ids)}  hits: {matrix.nnz}')
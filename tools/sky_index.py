@@ -0,0 +1,291 @@
+import math
+import sqlite3
+
+# image_info 的天区索引 (HTM, hierarchical triangular mesh)
+# 每张图的视场用外接圆 (center_v + 半径) 覆盖到固定层级的三角形上, 写入 image_sky_index 表.
+# 点查询只需算出目标所在三角形的 id, 按索引取出候选行, 再做原来的 center_a_theta/center_b_theta 平面判断.
+
+HTM_DEPTH = 6
+# 外接圆半径额外放宽一点, 避免浮点误差漏掉边缘
+FOOTPRINT_MARGIN_DEG = 0.01
+
+_htm_nodes = {}
+_htm_nodes_depth = -1
+
+_HTM_V = [
+    (0.0, 0.0, 1.0),
+    (1.0, 0.0, 0.0),
+    (0.0, 1.0, 0.0),
+    (-1.0, 0.0, 0.0),
+    (0.0, -1.0, 0.0),
+    (0.0, 0.0, -1.0),
+]
+# S0..S3 = 8..11, N0..N3 = 12..15
+_HTM_ROOTS = [
+    (8, (_HTM_V[1], _HTM_V[5], _HTM_V[2])),
+    (9, (_HTM_V[2], _HTM_V[5], _HTM_V[3])),
+    (10, (_HTM_V[3], _HTM_V[5], _HTM_V[4])),
+    (11, (_HTM_V[4], _HTM_V[5], _HTM_V[1])),
+    (12, (_HTM_V[1], _HTM_V[0], _HTM_V[4])),
+    (13, (_HTM_V[4], _HTM_V[0], _HTM_V[3])),
+    (14, (_HTM_V[3], _HTM_V[0], _HTM_V[2])),
+    (15, (_HTM_V[2], _HTM_V[0], _HTM_V[1])),
+]
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1],
+            a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0])
+
+
+def _normalize(v):
+    n = math.sqrt(_dot(v, v))
+    return v[0] / n, v[1] / n, v[2] / n
+
+
+def _mid(a, b):
+    return _normalize((a[0] + b[0], a[1] + b[1], a[2] + b[2]))
+
+
+def _children(v0, v1, v2):
+    w0 = _mid(v1, v2)
+    w1 = _mid(v0, v2)
+    w2 = _mid(v0, v1)
+    return [(v0, w2, w1), (v1, w0, w2), (v2, w1, w0), (w0, w1, w2)]
+
+
+def _containment(p, tri):
+    # 点到三条边所在大圆的有向距离 (点积) 的最小值, >= 0 时点在三角形内
+    v0, v1, v2 = tri
+    return min(_dot(_cross(v0, v1), p), _dot(_cross(v1, v2), p), _dot(_cross(v2, v0), p))
+
+
+def _best_triangle(p, candidates):
+    # candidates 为 [(htm_id, tri), ...]; 点在边界上由于舍入不在任何一个内时, 取越界最少的一个
+    best_id, best_value = None, None
+    for htm_id, tri in candidates:
+        value = _containment(p, tri)
+        if value >= -1e-15:
+            return htm_id
+        if best_value is None or value > best_value:
+            best_id, best_value = htm_id, value
+    return best_id
+
+
+def _build_nodes(depth):
+    # 预先算好每个三角形的外接圆 (中心向量, 半径 rad), 覆盖查询时只做点积
+    global _htm_nodes, _htm_nodes_depth
+    if _htm_nodes_depth == depth:
+        return _htm_nodes
+    nodes = {}
+    level = _HTM_ROOTS
+    for d in range(depth + 1):
+        next_level = []
+        for htm_id, tri in level:
+            center = _normalize((tri[0][0] + tri[1][0] + tri[2][0],
+                                 tri[0][1] + tri[1][1] + tri[2][1],
+                                 tri[0][2] + tri[1][2] + tri[2][2]))
+            radius = max(math.acos(max(-1.0, min(1.0, _dot(center, v)))) for v in tri)
+            nodes[htm_id] = (tri, center, radius)
+            if d < depth:
+                for k, child in enumerate(_children(*tri)):
+                    next_level.append((htm_id * 4 + k, child))
+        level = next_level
+    _htm_nodes = nodes
+    _htm_nodes_depth = depth
+    return nodes
+
+
+def htm_id_of_vector(v, depth=HTM_DEPTH):
+    nodes = _build_nodes(depth)
+    p = _normalize(v)
+    htm_id = _best_triangle(p, _HTM_ROOTS)
+    for d in range(depth):
+        htm_id = _best_triangle(p, [(htm_id * 4 + k, nodes[htm_id * 4 + k][0]) for k in range(4)])
+    return htm_id
+
+
+def htm_cover_cap(center, radius_rad, depth=HTM_DEPTH):
+    # 返回与圆 (center, radius) 可能相交的全部 depth 层三角形 id, 宁多勿少
+    nodes = _build_nodes(depth)
+    c = _normalize(center)
+    result = []
+    stack = [(root_id, 0) for root_id, _ in _HTM_ROOTS]
+    while stack:
+        htm_id, d = stack.pop()
+        _, t_center, t_radius = nodes[htm_id]
+        dist = math.acos(max(-1.0, min(1.0, _dot(c, t_center))))
+        if dist > radius_rad + t_radius:
+            continue
+        if d == depth:
+            result.append(htm_id)
+        else:
+            stack.extend((htm_id * 4 + k, d + 1) for k in range(4))
+    return result
+
+
+def footprint_radius(a_n, b_n, center_a_theta, center_b_theta):
+    # 视场在切平面上满足 |v·a_n| <= sin(a), |v·b_n| <= sin(b), 角点到中心的角距离即外接圆半径
+    sa = math.sin(math.radians(center_a_theta))
+    sb = math.sin(math.radians(center_b_theta))
+    g = abs(_dot(a_n, b_n))
+    if g > 0.999999:
+        g = 0.999999
+    sin_r2 = (sa * sa + sb * sb + 2 * g * sa * sb) / (1 - g * g)
+    radius = math.asin(min(1.0, math.sqrt(sin_r2)))
+    return radius + math.radians(FOOTPRINT_MARGIN_DEG)
+
+
+def create_sky_index(conn, depth=HTM_DEPTH):
+    cursor = conn.cursor()
+    cursor.execute('CREATE TABLE IF NOT EXISTS image_sky_index_meta (key TEXT PRIMARY KEY, value TEXT)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS image_sky_index '
+                   '(htm_id INTEGER NOT NULL, image_id INTEGER NOT NULL, PRIMARY KEY (htm_id, image_id)) '
+                   'WITHOUT ROWID')
+    cursor.execute('CREATE INDEX IF NOT EXISTS image_sky_index_image_id ON image_sky_index (image_id)')
+    cursor.execute("SELECT value FROM image_sky_index_meta WHERE key = 'htm_depth'")
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute("INSERT INTO image_sky_index_meta (key, value) VALUES ('htm_depth', ?)", (str(depth),))
+    elif int(row[0]) != depth:
+        raise ValueError(f'image_sky_index depth {row[0]} != {depth}, rebuild it with build_sky_index')
+    cursor.close()
+
+
+def has_sky_index(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = 'image_sky_index'")
+    exists = cursor.fetchone()[0] == 1
+    cursor.close()
+    return exists
+
+
+def _footprint_rows(image_id, center_v, a_n, b_n, center_a_theta, center_b_theta, depth):
+    radius = footprint_radius(a_n, b_n, center_a_theta, center_b_theta)
+    return [(htm_id, image_id) for htm_id in htm_cover_cap(center_v, radius, depth)]
+
+
+def update_sky_index(cursor, image_id, center_v, a_n, b_n, center_a_theta, center_b_theta, depth=HTM_DEPTH):
+    # solve 阶段写入 center/平面向量后调用, 与 UPDATE image_info 在同一个事务里
+    cursor.execute('DELETE FROM image_sky_index WHERE image_id = ?', (image_id,))
+    cursor.executemany('INSERT OR IGNORE INTO image_sky_index (htm_id, image_id) VALUES (?, ?)',
+                       _footprint_rows(image_id, center_v, a_n, b_n, center_a_theta, center_b_theta, depth))
+
+
+def build_sky_index(conn, depth=HTM_DEPTH, batch_size=10000):
+    # 全量重建 (已有数据库第一次使用时)
+    cursor = conn.cursor()
+    cursor.execute('DROP TABLE IF EXISTS image_sky_index')
+    cursor.execute('DROP TABLE IF EXISTS image_sky_index_meta')
+    create_sky_index(conn, depth)
+    read_cursor = conn.cursor()
+    read_cursor.execute('SELECT id, center_v_x, center_v_y, center_v_z, a_n_x, a_n_y, a_n_z, '
+                        'b_n_x, b_n_y, b_n_z, center_a_theta, center_b_theta '
+                        'FROM image_info WHERE status = 100 AND a_n_x IS NOT NULL AND b_n_x IS NOT NULL')
+    count = 0
+    while True:
+        rows = read_cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        index_rows = []
+        for r in rows:
+            index_rows.extend(_footprint_rows(r[0], r[1:4], r[4:7], r[7:10], r[10], r[11], depth))
+        cursor.executemany('INSERT OR IGNORE INTO image_sky_index (htm_id, image_id) VALUES (?, ?)', index_rows)
+        count += len(rows)
+        print(f'sky index: {count}')
+    conn.commit()
+    read_cursor.close()
+    cursor.close()
+    return count
+
+
+def _index_depth(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM image_sky_index_meta WHERE key = 'htm_depth'")
+    depth = int(cursor.fetchone()[0])
+    cursor.close()
+    return depth
+
+
+def _plane_test(item_v, row):
+    # 与原 SQL 相同: abs(90 - degrees(acos(v·n))) < theta 且 中心夹角 < 90
+    (image_id, file_path, wcs_info, center_a_theta, center_b_theta,
+     cx, cy, cz, ax, ay, az, bx, by, bz) = row
+    ta = abs(90 - math.degrees(math.acos(max(-1.0, min(1.0, item_v[0] * ax + item_v[1] * ay + item_v[2] * az)))))
+    tb = abs(90 - math.degrees(math.acos(max(-1.0, min(1.0, item_v[0] * bx + item_v[1] * by + item_v[2] * bz)))))
+    tc = math.degrees(math.acos(max(-1.0, min(1.0, item_v[0] * cx + item_v[1] * cy + item_v[2] * cz))))
+    if center_a_theta > ta and center_b_theta > tb and tc < 90:
+        return image_id, file_path, wcs_info, center_a_theta, ta, center_b_theta, tb, tc
+    return None
+
+
+_candidate_columns = 't.id, t.file_path, t.wcs_info, t.center_a_theta, t.center_b_theta, ' \
+                     't.center_v_x, t.center_v_y, t.center_v_z, t.a_n_x, t.a_n_y, t.a_n_z, t.b_n_x, t.b_n_y, t.b_n_z'
+
+
+def radec_to_vector(ra, dec):
+    ra_rad = math.radians(ra)
+    dec_rad = math.radians(dec)
+    return (math.cos(dec_rad) * math.cos(ra_rad),
+            math.cos(dec_rad) * math.sin(ra_rad),
+            math.sin(dec_rad))
+
+
+def search_point(conn, ra, dec):
+    # 返回与 search_get_fits_by_ra_dec.py 原 SQL 相同的列:
+    # (id, file_path, wcs_info, center_a_theta, ta, center_b_theta, tb, tc)
+    item_v = radec_to_vector(ra, dec)
+    htm_id = htm_id_of_vector(item_v, _index_depth(conn))
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {_candidate_columns} FROM image_sky_index AS s '
+                   f'JOIN image_info AS t ON t.id = s.image_id '
+                   f'WHERE s.htm_id = ? AND t.status = 100', (htm_id,))
+    result = []
+    for row in cursor.fetchall():
+        hit = _plane_test(item_v, row)
+        if hit is not None:
+            result.append(hit)
+    cursor.close()
+    return result
+
+
+def search_cone(conn, ra, dec, radius_deg):
+    # 视场外接圆与目标圆相交的图, 返回 (id, file_path, wcs_info, 中心距离 deg)
+    item_v = radec_to_vector(ra, dec)
+    radius = math.radians(radius_deg)
+    htm_ids = htm_cover_cap(item_v, radius, _index_depth(conn))
+    cursor = conn.cursor()
+    result = {}
+    for start in range(0, len(htm_ids), 500):
+        chunk = htm_ids[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'SELECT DISTINCT {_candidate_columns} FROM image_sky_index AS s '
+                       f'JOIN image_info AS t ON t.id = s.image_id '
+                       f'WHERE s.htm_id IN ({placeholders}) AND t.status = 100', chunk)
+        for row in cursor.fetchall():
+            if row[0] in result:
+                continue
+            center_v = row[5:8]
+            dist = math.acos(max(-1.0, min(1.0, _dot(item_v, center_v))))
+            if dist <= radius + footprint_radius(row[8:11], row[11:14], row[3], row[4]):
+                result[row[0]] = (row[0], row[1], row[2], math.degrees(dist))
+    cursor.close()
+    return sorted(result.values(), key=lambda r: r[3])
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='重建 image_info 的 HTM 天区索引')
+    parser.add_argument('db_path', help='fits_wcs_*.db')
+    parser.add_argument('--depth', type=int, default=HTM_DEPTH, help=f'HTM 层级, 默认 {HTM_DEPTH}')
+    args = parser.parse_args()
+    db_conn = sqlite3.connect(args.db_path)
+    total = build_sky_index(db_conn, args.depth)
+    print(f'done: {total}')
+    db_conn.close()
@@ -0,0 +1,262 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 并行的天体测量解算
+# N 个解算进程同时运行 (线程只等待子进程, 解算本身在子进程中), 每次尝试有超时, 超时时杀掉整个进程组;
+# 直接在下载目录中解算, 或硬链接到工作目录 (跨盘时才复制), 不再把每个 FITS 复制到 E:/test_download/astap/;
+# 由调用方给出 K 天区的 RA/Dec 作为搜索起点, 失败的帧用更大的搜索半径重试.
+# 解算器实现 SolverBackend: AstapSolver 调用 ASTAP; StubSolver 复制一个固定的 .wcs, 用于在 Linux 上测试和压测调度.
+
+SOLVE_OK = 'ok'
+# 解算器返回非 0
+SOLVE_FAILED = 'failed'
+SOLVE_TIMEOUT = 'timeout'
+# 解算器返回 0 但没有写出 .wcs
+SOLVE_NO_WCS = 'no_wcs'
+# 输入文件不存在
+SOLVE_MISSING = 'missing'
+
+DEFAULT_WORKERS = max(1, os.cpu_count() or 1)
+DEFAULT_TIMEOUT_S = 60
+# 依次尝试的搜索半径 (度), 第一次只搜 K 天区附近, 失败后搜全天
+DEFAULT_RADII = (30, 180)
+
+# ra_h 为小时, dec 为度
+SolveHint = namedtuple('SolveHint', ['ra_h', 'dec'])
+SolveResult = namedtuple('SolveResult', ['frame_id', 'fits_path', 'status', 'header', 'radius', 'attempts',
+                                         'elapsed', 'returncode'])
+
+
+def parse_wcs_file(wcs_file_path):
+    """
+    读取解算器写出的 .wcs 文本, 返回 {keyword: value}; 数值转为 int/float, 其余保留字符串
+    """
+    header_dict = {}
+    with open(wcs_file_path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith('END') and '=' in line:
+                if '/' in line:
+                    comment_index = line.index('/')
+                    line = line[:comment_index]
+                line = line.replace("'", "")
+                key, value = line.split('=', 1)
+                key = key.strip()
+                value = value.strip()
+                try:
+                    value = float(value) if '.' in value else int(value)
+                except ValueError:
+                    pass
+                header_dict[key] = value
+    return header_dict
+
+
+class SolverBackend:
+    """
+    解算器接口: 给出对一个 FITS 解算的命令行, 以及解算器写出的文件
+    """
+    name = 'solver'
+
+    def command(self, fits_path, hint, radius):
+        raise NotImplementedError
+
+    def wcs_path(self, fits_path):
+        return os.path.splitext(fits_path)[0] + '.wcs'
+
+    def output_files(self, fits_path):
+        return [self.wcs_path(fits_path)]
+
+
+class AstapSolver(SolverBackend):
+    name = 'astap'
+
+    def __init__(self, bin_path=r'E:/astap/astap.exe', search=1000, downsample=1, fov=2, database='d50'):
+        self.bin_path = bin_path
+        self.search = search
+        self.downsample = downsample
+        self.fov = fov
+        self.database = database
+
+    def command(self, fits_path, hint, radius):
+        command = [self.bin_path]
+        if hint is not None:
+            # ASTAP 的 -spd 为南极距
+            command += ['-ra', str(hint.ra_h), '-spd', str(hint.dec + 90)]
+        return command + ['-s', str(self.search), '-z', str(self.downsample), '-fov', str(self.fov),
+                          '-D', self.database, '-r', str(radius), '-f', fits_path]
+
+    def output_files(self, fits_path):
+        base = os.path.splitext(fits_path)[0]
+        return [base + '.wcs', base + '.ini']
+
+
+_STUB_SCRIPT = '''
+import shutil, subprocess, sys, time
+fixture, target, delay, mode = sys.argv[1:5]
+time.sleep(float(delay))
+if mode == 'hang':
+    # 模拟解算器又启动了子进程后卡住, 超时时整个进程组都应被杀掉
+    child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(3600)'])
+    with open(target + '.child', 'w') as file:
+        file.write(str(child.pid))
+    time.sleep(3600)
+if mode == 'fail':
+    sys.exit(1)
+shutil.copyfile(fixture, target)
+'''
+
+
+class StubSolver(SolverBackend):
+    name = 'stub'
+
+    def __init__(self, fixture_wcs, delay=0.0, fail_ids=(), hang_ids=(), min_radius=None):
+        """
+        fixture_wcs 每帧都"解算"出这个 .wcs
+        delay       每次解算耗时 (秒)
+        fail_ids    这些帧 (文件名不含扩展名) 总是失败
+        hang_ids    这些帧卡住直到超时
+        min_radius  半径小于它时失败, 用于检查加大半径重试
+        """
+        self.fixture_wcs = fixture_wcs
+        self.delay = delay
+        self.fail_ids = set(fail_ids)
+        self.hang_ids = set(hang_ids)
+        self.min_radius = min_radius
+
+    def command(self, fits_path, hint, radius):
+        frame_id = os.path.splitext(os.path.basename(fits_path))[0]
+        mode = 'ok'
+        if frame_id in self.hang_ids:
+            mode = 'hang'
+        elif frame_id in self.fail_ids or (self.min_radius is not None and radius < self.min_radius):
+            mode = 'fail'
+        return [sys.executable, '-c', _STUB_SCRIPT, self.fixture_wcs, self.wcs_path(fits_path), str(self.delay),
+                mode]
+
+
+def _popen(command):
+    # 新的进程组, 超时时可以连同解算器启动的子进程一起杀掉
+    if os.name == 'nt':
+        return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def kill_process_group(process):
+    try:
+        if os.name == 'nt':
+            subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    try:
+        process.kill()
+    except OSError:
+        pass
+    process.wait()
+
+
+def stage_input(fits_path, work_dir):
+    """
+    work_dir 为 None 时原地解算; 否则硬链接到 work_dir, 不能硬链接 (跨盘等) 时复制
+    返回 (解算用的路径, 是否需要删除)
+    """
+    if work_dir is None:
+        return fits_path, False
+    os.makedirs(work_dir, exist_ok=True)
+    target = os.path.join(work_dir, os.path.basename(fits_path))
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(fits_path, target)
+    except OSError:
+        shutil.copyfile(fits_path, target)
+    return target, True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class SolveFarm:
+    def __init__(self, solver, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT_S, radii=DEFAULT_RADII,
+                 work_dir=None):
+        """
+        solver   SolverBackend
+        workers  同时运行的解算进程数
+        timeout  每次尝试的超时 (秒), 超时后杀掉进程组, 不再重试
+        radii    依次尝试的搜索半径, 解算失败或没有 .wcs 时用下一个
+        work_dir 为 None 时在 FITS 所在目录解算
+        """
+        self.solver = solver
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.radii = tuple(radii)
+        self.work_dir = work_dir
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def solve(self, frame_id, fits_path, hint=None):
+        """
+        在当前线程中解算一帧, 返回 SolveResult; 解算器写出的文件在返回前删除
+        """
+        t0 = time.perf_counter()
+        if not os.path.exists(fits_path):
+            self._count(SOLVE_MISSING)
+            return SolveResult(frame_id, fits_path, SOLVE_MISSING, None, None, 0, 0.0, None)
+        solve_path, staged = stage_input(fits_path, self.work_dir)
+        outputs = self.solver.output_files(solve_path)
+        status, header, radius, returncode, attempts = SOLVE_FAILED, None, None, None, 0
+        try:
+            for radius in self.radii:
+                attempts += 1
+                for path in outputs:
+                    _remove(path)
+                process = _popen(self.solver.command(solve_path, hint, radius))
+                try:
+                    returncode = process.wait(timeout=self.timeout)
+                except subprocess.TimeoutExpired:
+                    print(f'solve timeout {fits_path}  radius {radius}  pid {process.pid}, kill process group')
+                    kill_process_group(process)
+                    status, returncode = SOLVE_TIMEOUT, process.returncode
+                    break
+                wcs_path = self.solver.wcs_path(solve_path)
+                if returncode == 0 and os.path.exists(wcs_path):
+                    status, header = SOLVE_OK, parse_wcs_file(wcs_path)
+                    break
+                status = SOLVE_FAILED if returncode != 0 else SOLVE_NO_WCS
+                if attempts < len(self.radii):
+                    self._count('retries')
+        finally:
+            for path in outputs:
+                _remove(path)
+            if staged:
+                _remove(solve_path)
+        self._count(status)
+        return SolveResult(frame_id, fits_path, status, header, radius, attempts, time.perf_counter() - t0,
+                           returncode)
+
+    def solve_many(self, items):
+        """
+        items 为 (frame_id, fits_path, hint), 同时解算 workers 帧, 按完成顺序返回 SolveResult
+        """
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='solve') as executor:
+            futures = [executor.submit(self.solve, frame_id, fits_path, hint) for frame_id, fits_path, hint in items]
+            for future in as_completed(futures):
+                yield future.result()
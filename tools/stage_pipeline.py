@@ -0,0 +1,199 @@
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 逐帧流式的多阶段流水线
+# 每个阶段从有界队列取帧, 处理后放入下一阶段的队列, 下载/检查/解算可以同时进行;
+# 队列满时上游阻塞 (背压). 每个阶段有自己的并发数, kind='thread' 在线程中执行 (I/O),
+# kind='process' 由该阶段的线程提交到独立的进程池 (sep/ASTAP 这类 CPU 阶段).
+# 进程阶段的 func 必须是模块级函数, 参数和返回值可以 pickle; after 总是在主进程的阶段线程中执行
+# (写 stage state / 数据库).
+
+_STOP = object()
+
+DEFAULT_QUEUE_SIZE = 16
+
+
+class PipelineStage:
+    def __init__(self, name, func, workers=1, kind='thread', when=None, after=None, queue_size=None):
+        """
+        name    阶段名
+        func    func(item) -> result, 在工作线程或进程中执行
+        workers 并发数
+        kind    'thread' 或 'process'
+        when    when(item) -> bool, 为 False 时跳过本阶段, 帧直接进入下一阶段
+        after   after(item, result) -> item 或 None, 在主进程中执行; 返回 None 表示该帧到此结束
+                默认把 result 作为下一阶段的 item
+        queue_size  本阶段输入队列长度, 默认 DEFAULT_QUEUE_SIZE
+        """
+        if kind not in ('thread', 'process'):
+            raise ValueError(f'unknown stage kind {kind}')
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.kind = kind
+        self.when = when
+        self.after = after
+        self.queue_size = queue_size
+
+
+class _Frame:
+    __slots__ = ('key', 'item', 'entered_at', 'queued_at')
+
+    def __init__(self, key, item):
+        self.key = key
+        self.item = item
+        self.entered_at = time.perf_counter()
+        # 进入当前阶段队列的时间, 用于统计排队等待
+        self.queued_at = self.entered_at
+
+
+def _percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+class PipelineMetrics:
+    def __init__(self, stage_names):
+        self.lock = threading.Lock()
+        self.stage_names = list(stage_names)
+        self.service = {name: [] for name in stage_names}
+        self.wait = {name: [] for name in stage_names}
+        self.skipped = {name: 0 for name in stage_names}
+        self.errors = {name: 0 for name in stage_names}
+        self.dropped = {name: 0 for name in stage_names}
+        # 帧 key -> 端到端耗时 (从进入第一个队列到离开流水线)
+        self.latency = {}
+        self.completed = 0
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+
+    def summary(self):
+        lines = []
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        latencies = list(self.latency.values())
+        lines.append(f'frames {len(latencies)}  completed {self.completed}  elapsed {elapsed:.1f}s  '
+                     f'latency p50 {_percentile(latencies, 50):.2f}s  p95 {_percentile(latencies, 95):.2f}s  '
+                     f'max {max(latencies) if latencies else float("nan"):.2f}s')
+        lines.append(f'{"stage":<12} {"done":>6} {"skip":>6} {"drop":>6} {"err":>5} '
+                     f'{"wait p50":>9} {"svc p50":>9} {"svc p95":>9} {"busy(s)":>9}')
+        for name in self.stage_names:
+            service = self.service[name]
+            lines.append(f'{name:<12} {len(service):>6} {self.skipped[name]:>6} {self.dropped[name]:>6} '
+                         f'{self.errors[name]:>5} {_percentile(self.wait[name], 50):>9.3f} '
+                         f'{_percentile(service, 50):>9.3f} {_percentile(service, 95):>9.3f} {sum(service):>9.1f}')
+        return '\n'.join(lines)
+
+
+class StagePipeline:
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE, key=None):
+        """
+        stages      PipelineStage 列表, 按顺序连接
+        queue_size  各阶段输入队列的默认长度
+        key         key(item) -> 帧标识, 用于端到端耗时统计, 默认用 item 本身
+        """
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.key = key or (lambda item: item)
+
+    def run(self, source):
+        """
+        从 source (可迭代对象, 可以是生成器) 逐帧送入流水线, 全部处理完后返回 PipelineMetrics
+        """
+        metrics = PipelineMetrics([stage.name for stage in self.stages])
+        queues = [queue.Queue(maxsize=stage.queue_size or self.queue_size) for stage in self.stages]
+        pools = [ProcessPoolExecutor(max_workers=stage.workers) if stage.kind == 'process' else None
+                 for stage in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+
+        def leave(frame, completed):
+            with metrics.lock:
+                metrics.latency[frame.key] = time.perf_counter() - frame.entered_at
+                if completed:
+                    metrics.completed += 1
+
+        def forward(index, frame):
+            if index + 1 < len(self.stages):
+                frame.queued_at = time.perf_counter()
+                queues[index + 1].put(frame)
+            else:
+                leave(frame, True)
+
+        def process(index, frame):
+            stage = self.stages[index]
+            waited = time.perf_counter() - frame.queued_at
+            try:
+                if stage.when is not None and not stage.when(frame.item):
+                    with metrics.lock:
+                        metrics.skipped[stage.name] += 1
+                    forward(index, frame)
+                    return
+                start = time.perf_counter()
+                if pools[index] is not None:
+                    result = pools[index].submit(stage.func, frame.item).result()
+                else:
+                    result = stage.func(frame.item)
+                elapsed = time.perf_counter() - start
+                item = stage.after(frame.item, result) if stage.after is not None else result
+            except Exception as e:
+                # when/func/after 出错都只丢弃这一帧, 线程继续处理后面的帧
+                print(f'[{stage.name}] {self.key(frame.item)} error: {e}')
+                with metrics.lock:
+                    metrics.errors[stage.name] += 1
+                leave(frame, False)
+                return
+            with metrics.lock:
+                metrics.service[stage.name].append(elapsed)
+                metrics.wait[stage.name].append(waited)
+            if item is None:
+                with metrics.lock:
+                    metrics.dropped[stage.name] += 1
+                leave(frame, False)
+                return
+            frame.item = item
+            forward(index, frame)
+
+        def worker(index):
+            try:
+                while True:
+                    frame = queues[index].get()
+                    if frame is _STOP:
+                        break
+                    process(index, frame)
+            finally:
+                # 本阶段最后一个线程退出时通知下一阶段; 线程异常退出时也要通知, 否则 run() 一直等待
+                with remaining_lock:
+                    remaining[index] -= 1
+                    last = remaining[index] == 0
+                if last and index + 1 < len(self.stages):
+                    for _ in range(self.stages[index + 1].workers):
+                        queues[index + 1].put(_STOP)
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(target=worker, args=(index,), name=f'{stage.name}-{n}', daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in source:
+                # 第一个队列满时在这里阻塞, source 是生成器时不会提前读出全部数据
+                queues[0].put(_Frame(self.key(item), item))
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_STOP)
+            for thread in threads:
+                thread.join()
+            for pool in pools:
+                if pool is not None:
+                    pool.shutdown()
+        metrics.finished_at = time.perf_counter()
+        return metrics
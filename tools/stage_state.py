@@ -0,0 +1,249 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 各阶段 (下载/检查/解算) 的处理状态
+# 替代 e:/fix_data/{日期}/ 下的 {id}_ok.txt / {id}_chk.txt / {id}_solve.txt, 不再逐帧 os.path.exists 和 os.listdir.
+# stage_attempt 每次尝试一行 (状态, 指标, 起止时间, 原 txt 的内容), stage_state 是每帧每阶段的最新状态.
+# record 保存与原 txt 完全相同的一行 (解算为24个字段), 后续阶段按原来的方式 split(',') 解析, 也可以导出回 txt.
+
+# 与各阶段脚本的 db_path ('../thread_test/fits_wcs_recent.db') 放在同一目录, 可用环境变量 STAGE_STATE_DB 指定
+STAGE_STATE_DB = os.environ.get('STAGE_STATE_DB', os.path.join('..', 'thread_test', 'stage_state.db'))
+
+STAGE_DOWNLOAD = 'download'
+STAGE_CHECK = 'check'
+STAGE_SOLVE = 'solve'
+STAGE_TXT_SUFFIX = {
+    STAGE_DOWNLOAD: '_ok.txt',
+    STAGE_CHECK: '_chk.txt',
+    STAGE_SOLVE: '_solve.txt',
+}
+
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# running 超过这个时间 (秒) 认为进程已退出, 可以重新领取
+STALE_RUNNING_S = 3600
+
+
+class StageStateStore:
+    def __init__(self, db_path=STAGE_STATE_DB):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        # 各阶段用线程池处理, 共用一个连接, 写操作加锁
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.lock = threading.Lock()
+        # 本对象领取后还没有 finish 的尝试: (frame_id, stage) -> attempt, 退出时由 release_claims 记为失败
+        self.open_claims = {}
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS stage_attempt ('
+                          'frame_id INTEGER, stage TEXT, attempt INTEGER, folder TEXT, status TEXT, '
+                          'record TEXT, metrics TEXT, started_at REAL, finished_at REAL, '
+                          'PRIMARY KEY (frame_id, stage, attempt)) WITHOUT ROWID')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS stage_state ('
+                          'frame_id INTEGER, stage TEXT, folder TEXT, status TEXT, attempt INTEGER, '
+                          'record TEXT, updated_at REAL, '
+                          'PRIMARY KEY (frame_id, stage)) WITHOUT ROWID')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_stage_state_folder '
+                          'ON stage_state (folder, stage, status)')
+
+    def close(self):
+        self.conn.close()
+
+    def claim(self, stage, folder, frame_ids=None, requires=None, skip_if_done=(), limit=None,
+              stale_after=STALE_RUNNING_S):
+        """
+        领取需要处理的帧, 一次查询选出并在同一事务里记为 running
+        frame_ids   候选帧 id, 为 None 时从 requires 阶段已完成 (done) 的帧中选
+        requires    前置阶段, 必须已完成
+        skip_if_done  这些阶段已完成的帧跳过 (如解算完成后不再下载/检查)
+        本阶段已完成或正在处理 (未超时) 的帧不领取
+        返回 [(frame_id, attempt), ...]
+        """
+        if frame_ids is None and requires is None:
+            raise ValueError('frame_ids 和 requires 至少需要一个')
+        now = time.time()
+        skip_stages = list(skip_if_done)
+        if frame_ids is not None:
+            source = 'SELECT CAST(value AS INTEGER) AS frame_id FROM json_each(?)'
+            params = [json.dumps([int(frame_id) for frame_id in frame_ids])]
+        else:
+            source = 'SELECT frame_id FROM stage_state WHERE folder = ? AND stage = ? AND status = ?'
+            params = [folder, requires, STATUS_DONE]
+        sql = (f'SELECT c.frame_id, coalesce(cur.attempt, 0) + 1 FROM ({source}) c '
+               f'LEFT JOIN stage_state cur ON cur.frame_id = c.frame_id AND cur.stage = ? '
+               f'WHERE (cur.status IS NULL OR cur.status = ? OR (cur.status = ? AND cur.updated_at < ?)) ')
+        params += [stage, STATUS_FAILED, STATUS_RUNNING, now - stale_after]
+        if frame_ids is not None and requires is not None:
+            sql += ('AND EXISTS (SELECT 1 FROM stage_state r WHERE r.frame_id = c.frame_id '
+                    'AND r.stage = ? AND r.status = ?) ')
+            params += [requires, STATUS_DONE]
+        if skip_stages:
+            sql += (f'AND NOT EXISTS (SELECT 1 FROM stage_state s WHERE s.frame_id = c.frame_id '
+                    f'AND s.stage IN ({",".join("?" * len(skip_stages))}) AND s.status = ?) ')
+            params += skip_stages + [STATUS_DONE]
+        sql += 'ORDER BY c.frame_id'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                claimed = self.conn.execute(sql, params).fetchall()
+                self.conn.executemany('INSERT INTO stage_attempt (frame_id, stage, attempt, folder, status, started_at) '
+                                      'VALUES (?, ?, ?, ?, ?, ?)',
+                                      [(frame_id, stage, attempt, folder, STATUS_RUNNING, now)
+                                       for frame_id, attempt in claimed])
+                self.conn.executemany('INSERT OR REPLACE INTO stage_state '
+                                      '(frame_id, stage, folder, status, attempt, record, updated_at) '
+                                      'VALUES (?, ?, ?, ?, ?, NULL, ?)',
+                                      [(frame_id, stage, folder, STATUS_RUNNING, attempt, now)
+                                       for frame_id, attempt in claimed])
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            for frame_id, attempt in claimed:
+                self.open_claims[(frame_id, stage)] = attempt
+        return claimed
+
+    def finish(self, frame_id, stage, attempt, status, record=None, metrics=None):
+        """
+        记录一次尝试的结果
+        status  STATUS_DONE: 完成 (对应原来写出了 txt), 后续阶段可以读取 record
+                STATUS_FAILED: 未完成 (原来没有写 txt 的情况), 下次可以重新领取
+        """
+        now = time.time()
+        metrics_json = json.dumps(metrics) if metrics is not None else None
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.execute('UPDATE stage_attempt SET status = ?, record = ?, metrics = ?, finished_at = ? '
+                                  'WHERE frame_id = ? AND stage = ? AND attempt = ?',
+                                  (status, record, metrics_json, now, frame_id, stage, attempt))
+                self.conn.execute('UPDATE stage_state SET status = ?, record = ?, updated_at = ? '
+                                  'WHERE frame_id = ? AND stage = ? AND attempt = ?',
+                                  (status, record, now, frame_id, stage, attempt))
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            if self.open_claims.get((frame_id, stage)) == attempt:
+                del self.open_claims[(frame_id, stage)]
+
+    def release_claims(self):
+        """
+        把本对象领取后还没有 finish 的尝试记为失败 (进程崩溃/取消时在各阶段的 finally 中调用),
+        重新运行时可以立即领取, 不必等 STALE_RUNNING_S; 返回记为失败的条数
+        """
+        now = time.time()
+        with self.lock:
+            rows = [(STATUS_FAILED, now, frame_id, stage, attempt, STATUS_RUNNING)
+                    for (frame_id, stage), attempt in self.open_claims.items()]
+            if not rows:
+                return 0
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.conn.executemany('UPDATE stage_attempt SET status = ?, finished_at = ? '
+                                      'WHERE frame_id = ? AND stage = ? AND attempt = ? AND status = ?', rows)
+                self.conn.executemany('UPDATE stage_state SET status = ?, updated_at = ? '
+                                      'WHERE frame_id = ? AND stage = ? AND attempt = ? AND status = ?', rows)
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.open_claims.clear()
+        return len(rows)
+
+    def done_records(self, stage, folder):
+        """
+        某天某阶段已完成的 [(frame_id, record), ...], 替代 os.listdir + 读 txt
+        """
+        return self.conn.execute('SELECT frame_id, record FROM stage_state '
+                                 'WHERE folder = ? AND stage = ? AND status = ? ORDER BY frame_id',
+                                 (folder, stage, STATUS_DONE)).fetchall()
+
+    def attempts(self, frame_id, stage=None):
+        sql = ('SELECT stage, attempt, status, record, metrics, started_at, finished_at FROM stage_attempt '
+               'WHERE frame_id = ?')
+        params = [frame_id]
+        if stage is not None:
+            sql += ' AND stage = ?'
+            params.append(stage)
+        return self.conn.execute(sql + ' ORDER BY stage, attempt', params).fetchall()
+
+    def export_txt(self, folder, txt_dir, stages=tuple(STAGE_TXT_SUFFIX)):
+        """
+        按原来的目录结构导出 {id}_ok.txt / {id}_chk.txt / {id}_solve.txt, 返回写出的文件数
+        """
+        os.makedirs(txt_dir, exist_ok=True)
+        count = 0
+        for stage in stages:
+            for frame_id, record in self.done_records(stage, folder):
+                with open(os.path.join(txt_dir, f'{frame_id}{STAGE_TXT_SUFFIX[stage]}'), 'w', encoding='utf-8') as file:
+                    file.write(record or '')
+                count += 1
+        return count
+
+    def import_txt(self, folder, txt_dir):
+        """
+        把已有的 txt 导入为已完成状态 (切换前正在处理的日期), 已有记录的帧不覆盖, 返回导入的条数
+        """
+        if not os.path.exists(txt_dir):
+            return 0
+        rows = []
+        now = time.time()
+        for file in os.listdir(txt_dir):
+            for stage, suffix in STAGE_TXT_SUFFIX.items():
+                if file.endswith(suffix) and file[:-len(suffix)].isdigit():
+                    with open(os.path.join(txt_dir, file), 'r', encoding='utf-8') as txt_file:
+                        record = txt_file.readline()
+                    rows.append((int(file[:-len(suffix)]), stage, folder, record, now))
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                before = self.conn.total_changes
+                self.conn.executemany('INSERT OR IGNORE INTO stage_state '
+                                      '(frame_id, stage, folder, status, attempt, record, updated_at) '
+                                      f'VALUES (?, ?, ?, \'{STATUS_DONE}\', 1, ?, ?)', rows)
+                imported = self.conn.total_changes - before
+                self.conn.executemany('INSERT OR IGNORE INTO stage_attempt '
+                                      '(frame_id, stage, attempt, folder, status, record, started_at, finished_at) '
+                                      f'VALUES (?, ?, 1, ?, \'{STATUS_DONE}\', ?, ?, ?)',
+                                      [row + (row[-1],) for row in rows])
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+        return imported
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='stage state 与原 txt 之间的导入导出')
+    parser.add_argument('action', choices=('export', 'import'))
+    parser.add_argument('--time', type=str, required=True, help='time in YYYYMMDD format')
+    parser.add_argument('--db', default=STAGE_STATE_DB)
+    parser.add_argument('--dir', help='txt 目录, 默认 e:/fix_data/{time}/')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    txt_dir = args.dir or f'e:/fix_data/{args.time}/'
+    store = StageStateStore(args.db)
+    if args.action == 'export':
+        print(f'export {store.export_txt(args.time, txt_dir)} -> {txt_dir}')
+    else:
+        print(f'import {store.import_txt(args.time, txt_dir)} <- {txt_dir}')
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
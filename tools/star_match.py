@@ -0,0 +1,91 @@
+from collections import namedtuple
+
+import numpy as np
+from astropy.io import ascii, fits
+from scipy.spatial import cKDTree
+
+# 两个星表按像素坐标做最近邻匹配 (cKDTree), 代替对每颗星计算到所有星距离的 O(N·M) 循环.
+# - match_nearest: 每颗星 1 在半径内最近的星 2, 可选互为最近 (mutual)
+# - fwhm_radius: 由 FWHM 决定匹配半径 (配准越不可靠, 半径应越大)
+# - gather_columns: 按 SOURCE_NUMBER 一次取出 Source Extractor 表的多列
+# - read_psf_stars / fratio_match: diff 中 get_fratio 的实现, 返回 (x, y, fratio, dx, dy)
+
+DEFAULT_RADIUS = 5.0
+DEFAULT_FWHM_FACTOR = 1.5
+
+SEX_COLUMNS = ('ALPHAWIN_J2000', 'DELTAWIN_J2000', 'FWHM_IMAGE', 'ELONGATION', 'X_IMAGE', 'Y_IMAGE')
+
+# PSFEx 使用的星 (psfcat) 及其在 Source Extractor 表 (sexcat) 中对应的各列
+PsfStars = namedtuple('PsfStars', ['number', 'x', 'y', 'norm', 'ra', 'dec', 'fwhm', 'elongation', 'x_sex',
+                                   'y_sex'])
+
+
+def gather_columns(data, names, number):
+    """
+    data[name][number - 1] 对每个 name 一次取出 (number 从 1 开始)
+    """
+    index = np.asarray(number, dtype=np.int64) - 1
+    return [np.asarray(data[name])[index] for name in names]
+
+
+def fwhm_radius(fwhm_1, fwhm_2=None, factor=DEFAULT_FWHM_FACTOR, min_radius=1.0):
+    """
+    匹配半径: factor 倍的 FWHM 中值, 不小于 min_radius
+    """
+    fwhm = np.asarray(fwhm_1, dtype=np.float64).ravel()
+    if fwhm_2 is not None:
+        fwhm = np.concatenate([fwhm, np.asarray(fwhm_2, dtype=np.float64).ravel()])
+    fwhm = fwhm[np.isfinite(fwhm) & (fwhm > 0)]
+    if len(fwhm) == 0:
+        return max(min_radius, DEFAULT_RADIUS)
+    return max(min_radius, factor * float(np.median(fwhm)))
+
+
+def _points(x, y):
+    points = np.column_stack([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)])
+    finite = np.flatnonzero(np.isfinite(points).all(axis=1))
+    return points[finite], finite
+
+
+def match_nearest(x1, y1, x2, y2, radius=DEFAULT_RADIUS, mutual=False):
+    """
+    对每颗星 1 找距离小于 radius 的最近的星 2, 返回 (index_1, index_2, distance).
+    mutual 为 False 时与原循环相同, 多颗星 1 可以匹配到同一颗星 2;
+    mutual 为 True 时只保留互为最近的一对.
+    """
+    points_1, finite_1 = _points(x1, y1)
+    points_2, finite_2 = _points(x2, y2)
+    empty = np.zeros(0, dtype=np.int64)
+    if len(points_1) == 0 or len(points_2) == 0:
+        return empty, empty, np.zeros(0)
+    distance, nearest = cKDTree(points_2).query(points_1, distance_upper_bound=radius)
+    # 半径内没有星时 distance 为 inf, nearest 为 len(points_2)
+    found = np.flatnonzero(np.isfinite(distance))
+    index_1, index_2, distance = found, nearest[found], distance[found]
+    if mutual and len(found):
+        _, back = cKDTree(points_1).query(points_2[index_2], distance_upper_bound=radius)
+        keep = back == index_1
+        index_1, index_2, distance = index_1[keep], index_2[keep], distance[keep]
+    return finite_1[index_1], finite_2[index_2], distance
+
+
+def read_psf_stars(psfcat, sexcat):
+    table = ascii.read(psfcat, format='sextractor')
+    number = np.asarray(table['SOURCE_NUMBER'])
+    with fits.open(sexcat) as hdulist:
+        ra, dec, fwhm, elongation, x_sex, y_sex = gather_columns(hdulist[2].data, SEX_COLUMNS, number)
+    return PsfStars(number, np.asarray(table['X_IMAGE']), np.asarray(table['Y_IMAGE']),
+                    np.asarray(table['NORM_PSF']), ra, dec, fwhm, elongation, x_sex, y_sex)
+
+
+def fratio_match(sci, ref, radius=DEFAULT_RADIUS, mutual=False):
+    """
+    sci, ref 为 PsfStars; radius 为 None 时由两者的 FWHM 决定.
+    返回匹配星在科学图像上的 x, y, 归一化流量比 fratio, 以及位置误差 dx, dy (两者 FWHM 的较大值)
+    """
+    if radius is None:
+        radius = fwhm_radius(sci.fwhm, ref.fwhm)
+    i_sci, i_ref, _ = match_nearest(sci.x_sex, sci.y_sex, ref.x_sex, ref.y_sex, radius, mutual)
+    select = np.maximum(sci.fwhm[i_sci], ref.fwhm[i_ref])
+    return (np.asarray(sci.x)[i_sci], np.asarray(sci.y)[i_sci], sci.norm[i_sci] / ref.norm[i_ref],
+            select, select.copy())